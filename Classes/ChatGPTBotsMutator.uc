@@ -90,6 +90,9 @@ var float FirstCheckTime;
 const MAX_GAME_WAIT_TIME = 30.0;
 
 var string GameId;
+// Game-scoped token returned by the proxy server in PostGame response.
+// Sent in every request to let the server verify game ownership cheaply.
+var string GameToken;
 
 // Team index to post the initial greeting message from the LLM with.
 var() int InitialGreetingTeamIndex;
@@ -256,6 +259,7 @@ function PostGame_OnComplete(HttpSock Sender)
     {
         GameId = Sender.ReturnData[0];
         `cgblog("received GameId:" @ GameId);
+        GameToken = Sender.ReturnData[2];
 
         Greeting = Sender.ReturnData[1]; // TODO: check this is what we want!
         CGBProxy.PlayerReplicationInfo.Team = WorldInfo.Game.GameReplicationInfo.Teams[InitialGreetingTeamIndex];
@@ -655,6 +659,14 @@ function CheckGameIsGoodToGo()
     }
 }
 
+function AddGameTokenHeader()
+{
+    if (GameToken != "")
+    {
+        Sock.AddHeader("X-Game-Token", GameToken);
+    }
+}
+
 function HTTPGet(string Url, optional float Timeout = 2.0)
 {
     if (Sock == None)
@@ -664,6 +676,7 @@ function HTTPGet(string Url, optional float Timeout = 2.0)
 
     `cgblog("sending HTTP GET request to: " $ Url);
     Sock.AddHeader("Authorization", "Bearer " $ Config.GetApiKey());
+    AddGameTokenHeader();
     Sock.Get(Url);
     SetCancelOpenLinkTimer(Timeout);
 }
@@ -677,6 +690,7 @@ function HTTPPost(string Url, optional string PostData, optional float Timeout =
 
     `cgblog("sending HTTP POST request to: " $ Url);
     Sock.AddHeader("Authorization", "Bearer " $ Config.GetApiKey());
+    AddGameTokenHeader();
     Sock.Post(Url, PostData);
     SetCancelOpenLinkTimer(Timeout);
 }
@@ -690,6 +704,7 @@ function HTTPPut(string Url, optional string PutData, optional float Timeout = 2
 
     `cgblog("sending HTTP PUT request to: " $ Url);
     Sock.AddHeader("Authorization", "Bearer " $ Config.GetApiKey());
+    AddGameTokenHeader();
     Sock.Put(Url, PutData);
     SetCancelOpenLinkTimer(Timeout);
 }
@@ -703,6 +718,7 @@ function HTTPDelete(string Url, optional float Timeout = 2.0)
 
     `cgblog("sending HTTP DELETE request to: " $ Url);
     Sock.AddHeader("Authorization", "Bearer " $ Config.GetApiKey());
+    AddGameTokenHeader();
     Sock.Delete(Url);
     SetCancelOpenLinkTimer(Timeout);
 }
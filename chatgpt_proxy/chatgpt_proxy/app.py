@@ -26,37 +26,79 @@
 import asyncio
 import dataclasses
 import datetime
+import json
+import math
 import multiprocessing as mp
 import os
 import secrets
+from dataclasses import dataclass
 from http import HTTPStatus
 from multiprocessing.synchronize import Event as EventType
-from pprint import pprint
 
 import asyncpg
 import httpx
 import openai
 import sanic
-from py_markdown_table.markdown_table import markdown_table
+from openai.types.responses import Response as OpenAIResponse
+from openai.types.responses import ResponseFormatTextJSONSchemaConfigParam
 from sanic import Blueprint
 from sanic.response import HTTPResponse
 
 from chatgpt_proxy.auth import auth
 from chatgpt_proxy.auth import check_and_inject_game
-from chatgpt_proxy.auth import is_real_game_server
-from chatgpt_proxy.cache import app_cache
-from chatgpt_proxy.cache import db_cache
+from chatgpt_proxy.cache import cache_stats
+from chatgpt_proxy.cache import close_caches
+from chatgpt_proxy.cache import start_caches
+from chatgpt_proxy.cache.cache import make_redis_client
+from chatgpt_proxy.db import InvalidationListener
+from chatgpt_proxy.db import WriteBehindBuffer
+from chatgpt_proxy.db import game_event_locks
 from chatgpt_proxy.db import pool_acquire
 from chatgpt_proxy.db import queries
+from chatgpt_proxy.db import statements
+from chatgpt_proxy.db.maintenance import run_db_maintenance
+from chatgpt_proxy.db.models import Game
+from chatgpt_proxy.db.models import GameChatMessage
+from chatgpt_proxy.db.models import GameEventBatch
+from chatgpt_proxy.db.models import GameKill
 from chatgpt_proxy.db.models import GameObjectiveState
+from chatgpt_proxy.db.models import GamePlayer
+from chatgpt_proxy.db.models import GameScoreboard
 from chatgpt_proxy.db.models import SayType
 from chatgpt_proxy.db.models import Team
+from chatgpt_proxy.game_state import GameState
+from chatgpt_proxy.game_state import game_states
+from chatgpt_proxy.llm import CircuitOpen
+from chatgpt_proxy.llm import JobStatus
+from chatgpt_proxy.llm import LocalRateBucket
+from chatgpt_proxy.llm import ModelRateLimited
+from chatgpt_proxy.llm import RateBucket
+from chatgpt_proxy.llm import RateGovernor
+from chatgpt_proxy.llm import RateLimitExceeded
+from chatgpt_proxy.llm import RedisRateBucket
+from chatgpt_proxy.llm import RequestCoordinator
+from chatgpt_proxy.llm import ResilientClient
+from chatgpt_proxy.llm import ServerKey
+from chatgpt_proxy.llm import get_job
+from chatgpt_proxy.llm import parse_retry_after
+from chatgpt_proxy.llm import start_job
+from chatgpt_proxy.llm import stop_jobs
 from chatgpt_proxy.log import logger
+from chatgpt_proxy.prompt import AssembledPrompt
+from chatgpt_proxy.prompt import PromptAssembler
+from chatgpt_proxy.prompt import PromptSection
+from chatgpt_proxy.prompt import chat_messages_table
+from chatgpt_proxy.prompt import estimate_tokens
+from chatgpt_proxy.prompt import kills_table
+from chatgpt_proxy.prompt import objectives_table
+from chatgpt_proxy.prompt import players_table
+from chatgpt_proxy.scheduler import Scheduler
 from chatgpt_proxy.types import App
 from chatgpt_proxy.types import Context
 from chatgpt_proxy.types import Request
 from chatgpt_proxy.utils import get_remote_addr
 from chatgpt_proxy.utils import is_prod_env
+from chatgpt_proxy.utils import read_body
 from chatgpt_proxy.utils import utcnow
 
 # TODO: This breaks with nest_asyncio, which is also unmaintained!
@@ -75,12 +117,11 @@ from chatgpt_proxy.utils import utcnow
 api_v1 = Blueprint("api", version_prefix="/api/v", version=1)
 
 
-def db_maintenance_process(stop_event: EventType) -> None:
-    asyncio.run(db_maintenance(stop_event))
-
-
-def refresh_steam_web_api_cache_process(stop_event: EventType) -> None:
-    asyncio.run(refresh_steam_web_api_cache(stop_event))
+def background_jobs_process(stop_event: EventType) -> None:
+    try:
+        asyncio.run(run_background_jobs(stop_event))
+    except KeyboardInterrupt:
+        pass
 
 
 max_ast_literal_eval_size = 1000
@@ -95,25 +136,51 @@ def make_api_v1_app(name: str = "ChatGPTProxy") -> App:
     # We don't expect UScript side to send large requests.
     _app.config.REQUEST_MAX_SIZE = 1500
     _app.config.REQUEST_MAX_HEADER_SIZE = 1500
+    # Batched game events are allowed to be larger, see post_game_events.
+    _app.config.EVENTS_REQUEST_MAX_SIZE = _app.config.get("EVENTS_REQUEST_MAX_SIZE", 16384)
+    # Full scoreboard, see put_game_players.
+    _app.config.PLAYERS_REQUEST_MAX_SIZE = _app.config.get("PLAYERS_REQUEST_MAX_SIZE", 8192)
     _app.config.OAS = not is_prod_env
     _app.config.SECRET = os.environ["SANIC_SECRET"]
     _app.config.JWT_ISSUER = auth.jwt_issuer
     _app.config.JWT_AUDIENCE = auth.jwt_audience
+    # Buffer kill and chat message inserts and write them in bulk.
+    # Can be enabled with the SANIC_WRITE_BEHIND environment variable.
+    _app.config.WRITE_BEHIND = _app.config.get("WRITE_BEHIND", False)
+    _app.config.WRITE_BEHIND_MAX_ROWS = _app.config.get("WRITE_BEHIND_MAX_ROWS", 200)
+    _app.config.WRITE_BEHIND_MAX_DELAY = _app.config.get("WRITE_BEHIND_MAX_DELAY", 0.250)
+    # Where periodic background jobs are run:
+    #   - "process": all jobs in a single separate process (default).
+    #   - "worker": in every worker process, using the worker's database pool.
+    #     NOTE: database maintenance only runs on one node at a time,
+    #     but every worker may refresh the Steam server list snapshot.
+    _app.config.BACKGROUND_JOBS = _app.config.get("BACKGROUND_JOBS", "process")
+    # Keep recent events of each game in worker memory for prompt building,
+    # see chatgpt_proxy.game_state. NOTE: the state is per worker, only enable
+    # it if all requests of a game are handled by the same worker, e.g. when
+    # running a single worker.
+    _app.config.GAME_STATE = _app.config.get("GAME_STATE", False)
+    # OpenAI API rate limit tracking, see chatgpt_proxy.llm.governor:
+    #   - "worker": rate limits are tracked in every worker separately (default).
+    #   - "redis": rate limits are tracked in Redis, shared by all workers.
+    _app.config.RATE_GOVERNOR = _app.config.get("RATE_GOVERNOR", "worker")
+    # OpenAI models, see chatgpt_proxy.llm.resilience. Calls are routed to
+    # the fallback model when the primary model is slow or failing.
+    # An empty fallback model disables the fallback.
+    _app.config.OPENAI_MODEL = _app.config.get("OPENAI_MODEL", openai_model)
+    _app.config.OPENAI_FALLBACK_MODEL = _app.config.get("OPENAI_FALLBACK_MODEL", openai_fallback_model)
+    # Send a duplicate of calls running longer than the p95 latency.
+    _app.config.OPENAI_HEDGE = _app.config.get("OPENAI_HEDGE", True)
 
     @_app.main_process_ready
     async def main_process_ready(app_: App, _):
-        app_.manager.manage(
-            name="DatabaseMaintenanceProcess",
-            func=db_maintenance_process,
-            kwargs={"stop_event": app_.shared_ctx.bg_process_event},
-            transient=True,
-        )
-        app_.manager.manage(
-            "SteamWebAPICacheRefreshProcess",
-            func=refresh_steam_web_api_cache_process,
-            kwargs={"stop_event": app_.shared_ctx.bg_process_event},
-            transient=True,
-        )
+        if app_.config.BACKGROUND_JOBS == "process":
+            app_.manager.manage(
+                name="BackgroundJobsProcess",
+                func=background_jobs_process,
+                kwargs={"stop_event": app_.shared_ctx.bg_process_event},
+                transient=True,
+            )
 
     @_app.main_process_start
     async def main_process_start(app_: App, _):
@@ -126,42 +193,120 @@ def make_api_v1_app(name: str = "ChatGPTProxy") -> App:
 
     @_app.before_server_start
     async def before_server_start(app_: App, _):
+        start_caches()
+
         api_key = os.environ.get("OPENAI_API_KEY")
-        client = openai.AsyncOpenAI(api_key=api_key)
+        # NOTE: failed calls are retried with the fallback model instead.
+        client = openai.AsyncOpenAI(api_key=api_key, max_retries=0)
         app_.ctx.client = client
-        app_.ext.dependency(client)
+        app_.ctx.llm = ResilientClient(
+            client=client,
+            model=app_.config.OPENAI_MODEL,
+            fallback_model=app_.config.OPENAI_FALLBACK_MODEL or None,
+            timeout=openai_timeout,
+            hedge=app_.config.OPENAI_HEDGE,
+        )
+        app_.ext.dependency(app_.ctx.llm)
 
         db_url = os.environ.get("DATABASE_URL")
-        pool = await asyncpg.create_pool(dsn=db_url)
+        pool = await asyncpg.create_pool(
+            dsn=db_url,
+            init=statements.init_connection,
+        )
         app_.ctx.pg_pool = pool
         app_.ext.dependency(pool)
 
+        app_.ctx.write_behind_buffer = None
+        if app_.config.WRITE_BEHIND:
+            app_.ctx.write_behind_buffer = WriteBehindBuffer(
+                pool=pool,
+                max_rows=app_.config.WRITE_BEHIND_MAX_ROWS,
+                max_delay=app_.config.WRITE_BEHIND_MAX_DELAY,
+                on_flush=game_states.add_events if app_.config.GAME_STATE else None,
+            )
+            app_.ctx.write_behind_buffer.start()
+
         app_.ctx.http_client = httpx.AsyncClient()
         app_.ext.dependency(app_.ctx.http_client)
 
+        bucket: RateBucket
+        if app_.config.RATE_GOVERNOR == "redis":
+            bucket = RedisRateBucket(make_redis_client())
+        else:
+            bucket = LocalRateBucket()
+        app_.ctx.rate_governor = RateGovernor(bucket=bucket)
+        app_.ext.dependency(app_.ctx.rate_governor)
+
+        # Dedicated connection for cache invalidation notifications.
+        app_.ctx.invalidation_listener = InvalidationListener(dsn=db_url)
+        app_.ctx.invalidation_listener.subscribe(auth.handle_invalidation)
+        app_.ctx.invalidation_listener.subscribe(queries.handle_invalidation)
+        app_.ctx.invalidation_listener.start()
+
+        app_.ctx.scheduler = None
+        if app_.config.BACKGROUND_JOBS == "worker":
+            app_.ctx.scheduler = make_background_scheduler(pool, app_.ctx.http_client)
+            app_.ctx.scheduler.start()
+
     @_app.before_server_stop
     async def before_server_stop(app_: App, _):
+        # NOTE: LLM jobs need the OpenAI client, the database pool and the caches.
+        await stop_jobs()
+        if app_.ctx.scheduler:
+            await app_.ctx.scheduler.stop()
+        if app_.ctx.invalidation_listener:
+            await app_.ctx.invalidation_listener.stop()
         if app_.ctx.client:
             await app_.ctx.client.close()
+        # NOTE: must be flushed before the pool is closed.
+        if app_.ctx.write_behind_buffer:
+            await app_.ctx.write_behind_buffer.close()
         if app_.ctx.pg_pool:
             await app_.ctx.pg_pool.close()
         if app_.ctx.http_client:
             await app_.ctx.http_client.aclose()
-
-        await app_cache.close()
-        await db_cache.close()
+        if app_.ctx.rate_governor:
+            if isinstance(app_.ctx.rate_governor.bucket, RedisRateBucket):
+                await app_.ctx.rate_governor.bucket.client.aclose()
+            logger.info("rate governor: {}", app_.ctx.rate_governor.stats())
+        if app_.ctx.llm:
+            logger.info("LLM client: {}, latency p50, p95: {}",
+                        app_.ctx.llm.stats(), app_.ctx.llm.latency_percentiles())
+
+        for namespace, stats in cache_stats().items():
+            logger.info("cache {}: {}", namespace, stats)
+        logger.info("message coordinator: {}", message_coordinator.stats())
+        await close_caches()
 
     _app.blueprint(api_v1)
 
     return _app
 
 
-# TODO: dynamic model selection?
 openai_model = "gpt-5-nano"
+# Non-reasoning model, faster than the reasoning primary model.
+openai_fallback_model = "gpt-4.1-nano"
 openai_timeout = 60.0  # TODO: this might be way too low?
+# Estimated output tokens of a call, for rate limiting.
+openai_output_tokens_estimate = 256
 
 prompt_max_game_chat_msgs = 30
 prompt_max_game_kills = 30
+# Estimated, see chatgpt_proxy.prompt.tokens.
+prompt_max_tokens = 1024
+# Shares of the prompt token budget left after the instruction.
+prompt_section_weights = {
+    "scoreboard": 2.0,
+    "objectives": 1.0,
+    "kills": 3.0,
+    "chat_messages": 3.0,
+}
+prompt_assembler = PromptAssembler(max_tokens=prompt_max_tokens)
+# Messages of a game that arrive within the merge window, or while
+# the previous LLM call of the game is running, are answered with a
+# single LLM call, see message_coordinator.
+message_merge_window = 0.05
+message_max_batch_size = 4
 
 # TODO: example prompt (the first one per game session).
 # TODO: this should only be sent from the UScript side after a small
@@ -201,55 +346,215 @@ Since the beginning of the game, the following additional events have happened:
 game_expiration = datetime.timedelta(hours=5)
 api_key_deletion_leeway = datetime.timedelta(minutes=5)
 db_maintenance_interval = 30.0
-steam_web_api_cache_refresh_interval = datetime.timedelta(minutes=30).total_seconds()
+db_maintenance_jitter = 5.0
+db_maintenance_timeout = 60.0
+db_maintenance_batch_size = 500
+# Maximum time spent deleting rows per maintenance cycle.
+db_maintenance_time_budget = 10.0
+steam_server_list_refresh_interval = datetime.timedelta(minutes=10).total_seconds()
+steam_server_list_refresh_jitter = 30.0
+steam_server_list_refresh_timeout = 60.0
+background_jobs_stop_poll_interval = 0.5
 
 game_id_length = 24
 
+# Value of the Prefer header to run LLM queries as jobs, see RFC 7240.
+prefer_respond_async = "respond-async"
+
+
+def prefers_async(request: Request) -> bool:
+    prefer = request.headers.get("Prefer", "")
+    return any(
+        preference.strip().lower() == prefer_respond_async
+        for preference in prefer.split(",")
+    )
+
+
+def rate_limited_response(e: RateLimitExceeded | CircuitOpen) -> HTTPResponse:
+    logger.info("shedding OpenAI API call: {}", e)
+    return HTTPResponse(
+        status=HTTPStatus.SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+
+async def create_openai_response(
+        llm: ResilientClient,
+        governor: RateGovernor,
+        key: ServerKey,
+        tokens: int,
+        **kwargs,
+) -> OpenAIResponse:
+    """Create an OpenAI response within the rate limits, see RateGovernor.
+    The call is queued by the game server key, tokens is an estimate of
+    the tokens used by the call. Raises RateLimitExceeded if the call
+    would have to wait too long or is rate limited by OpenAI, and
+    CircuitOpen if all the models are failing, see ResilientClient.
+    """
+    # NOTE: hedged duplicate calls are not taken from the rate
+    # governor, they are accounted for by the rate limit headers.
+    # NOTE: the rate limits are per model, the governor only tracks the
+    # primary model. Fallback model calls are still taken from it, but
+    # don't update it.
+    await governor.acquire(key, tokens)
+    try:
+        model_resp = await llm.create(**kwargs)
+    except ModelRateLimited as e:
+        if e.model == llm.model:
+            await governor.update(e.headers, tokens, used_tokens=None)
+        raise RateLimitExceeded(retry_after=parse_retry_after(e.headers)) from e
+
+    resp = model_resp.response
+    if model_resp.model == llm.model:
+        await governor.update(
+            model_resp.headers,
+            tokens,
+            used_tokens=resp.usage.total_tokens if resp.usage else None,
+        )
+    return resp
+
+
+def get_game_state(request: Request, game_id: str) -> GameState | None:
+    """Return the in-memory state of the game,
+    or None if the game state is disabled.
+    """
+    if not request.app.config.GAME_STATE:
+        return None
+    return game_states.get_or_create(game_id)
 
-async def get_kills_markdown_table(
+
+async def get_new_kills(
         conn: asyncpg.Connection,
-        game_id: str,
-        from_time: datetime.datetime,
-) -> str:
-    candidate_kills = await queries.select_game_kills(
+        game: Game,
+        after_id: int,
+        state: GameState | None,
+) -> list[GameKill]:
+    """Newest kills of the game not included in the previous
+    query, i.e., with an ID greater than after_id.
+    """
+    if state is not None:
+        kills = state.new_kills(after_id, prompt_max_game_kills)
+        if kills is not None:
+            return kills
+
+    kills = await queries.select_new_game_kills(
         conn=conn,
-        game_id=game_id,
-        kill_time_from=from_time,
+        game_id=game.id,
+        after_id=after_id,
+        kill_time_from=game.start_time,
         limit=prompt_max_game_kills,
     )
-    pprint(candidate_kills)
+    if state is not None:
+        state.kills.seed(after_id, kills, prompt_max_game_kills)
+    return kills
 
-    kills_table = ""
-    if candidate_kills:
-        kills_table = markdown_table([
-            kill.as_markdown_dict()
-            for kill in candidate_kills
-        ]).get_markdown()
-        pprint(kills_table)
 
-    return kills_table
-
-
-async def get_chat_messages_markdown_table(
+async def get_new_chat_messages(
         conn: asyncpg.Connection,
-        from_time: datetime.datetime,
-) -> str:
-    candidate_msgs = await queries.select_game_chat_messages(
+        game: Game,
+        after_id: int,
+        state: GameState | None,
+) -> list[GameChatMessage]:
+    """Newest chat messages of the game not included in the
+    previous query, i.e., with an ID greater than after_id.
+    """
+    if state is not None:
+        msgs = state.new_chat_messages(after_id, prompt_max_game_chat_msgs)
+        if msgs is not None:
+            return msgs
+
+    msgs = await queries.select_new_game_chat_messages(
         conn=conn,
-        send_time_from=from_time,
+        game_id=game.id,
+        after_id=after_id,
+        send_time_from=game.start_time,
         limit=prompt_max_game_chat_msgs,
     )
-    pprint(candidate_msgs)
+    if state is not None:
+        state.chat_messages.seed(after_id, msgs, prompt_max_game_chat_msgs)
+    return msgs
+
 
-    msgs_table = ""
-    if candidate_msgs:
-        msgs_table = markdown_table([
-            msg.as_markdown_dict()
-            for msg in candidate_msgs
-        ]).get_markdown()
-        pprint(msgs_table)
+async def get_scoreboard(
+        conn: asyncpg.Connection,
+        game_id: str,
+        state: GameState | None,
+) -> GameScoreboard:
+    if state is not None:
+        scoreboard = state.scoreboard
+        if scoreboard is not None:
+            return scoreboard
 
-    return msgs_table
+    scoreboard = await queries.select_game_players(conn=conn, game_id=game_id)
+    if state is not None:
+        state.set_scoreboard(scoreboard)
+    return scoreboard
+
+
+async def get_objective_state(
+        conn: asyncpg.Connection,
+        game_id: str,
+        state: GameState | None,
+) -> GameObjectiveState | None:
+    if state is not None and state.objective_state is not None:
+        return state.objective_state
+
+    objective_state = await queries.select_game_objective_state(conn=conn, game_id=game_id)
+    if state is not None and objective_state is not None:
+        state.set_objective_state(objective_state)
+    return objective_state
+
+
+def make_game_message_prompt(
+        instruction: str,
+        scoreboard: GameScoreboard,
+        objective_state: GameObjectiveState | None,
+        kills: list[GameKill],
+        msgs: list[GameChatMessage],
+) -> AssembledPrompt:
+    sections: list[PromptSection] = []
+
+    # NOTE: row ranks decide which rows are included if there is no room
+    # for all of them, the rows are rendered in their original order.
+    players = sorted(scoreboard.players, key=lambda p: (p.team, -p.score, p.name))
+    header, rows = players_table(players)
+    sections.append(PromptSection(
+        name="scoreboard",
+        header=f"Current scoreboard:\n{header}",
+        rows=rows,
+        ranks=[player.score for player in players],
+        weight=prompt_section_weights["scoreboard"],
+    ))
+
+    if objective_state is not None:
+        header, rows = objectives_table(objective_state.objectives)
+        sections.append(PromptSection(
+            name="objectives",
+            header=f"Current objective state:\n{header}",
+            rows=rows,
+            ranks=[0] * len(rows),
+            weight=prompt_section_weights["objectives"],
+        ))
+
+    # Newer events rank higher.
+    header, rows = kills_table(kills)
+    sections.append(PromptSection(
+        name="kills",
+        header=f"Kills since the previous message, in chronological order:\n{header}",
+        rows=rows,
+        weight=prompt_section_weights["kills"],
+    ))
+    header, rows = chat_messages_table(msgs)
+    sections.append(PromptSection(
+        name="chat_messages",
+        header=f"Chat messages since the previous message, in chronological order:\n{header}",
+        rows=rows,
+        weight=prompt_section_weights["chat_messages"],
+    ))
+
+    sections.append(PromptSection(name="instruction", header=instruction, required=True))
+
+    return prompt_assembler.assemble(sections)
 
 
 @api_v1.get("/game/<game_id:str>")
@@ -282,7 +587,8 @@ async def get_game(
 async def post_game(
         request: Request,
         pg_pool: asyncpg.Pool,
-        client: openai.AsyncOpenAI,
+        llm: ResilientClient,
+        governor: RateGovernor,
 ) -> HTTPResponse:
     try:
         data = request.body.decode("utf-8")
@@ -292,10 +598,19 @@ async def post_game(
         logger.debug("error parsing game data: {}: {}", type(e).__name__, e)
         return HTTPResponse(status=HTTPStatus.BAD_REQUEST)
 
+    # Shed the call before creating a game for it.
+    try:
+        governor.check()
+        llm.check()
+    except (RateLimitExceeded, CircuitOpen) as e:
+        return rate_limited_response(e)
+
     now = utcnow()
     game_id = secrets.token_hex(game_id_length)
     addr = get_remote_addr(request)
 
+    # NOTE: the connection is not held while waiting for the LLM,
+    # to avoid draining the pool with slow OpenAI API calls.
     async with pool_acquire(pg_pool) as conn:
         async with conn.transaction():
             await queries.insert_game(
@@ -309,14 +624,24 @@ async def post_game(
                 openai_previous_response_id=None,
             )
 
-        # TODO: Send initial game state to the LLM, and ask it for a short greeting message.
+    if request.app.config.GAME_STATE:
+        game_states.get_or_create(game_id, new_game=True)
+
+    # TODO: Send initial game state to the LLM, and ask it for a short greeting message.
+    prompt = "Write a short poem of 100 letters or less."  # TODO
+    try:
+        openai_resp = await create_openai_response(
+            llm=llm,
+            governor=governor,
+            key=(addr, game_port),
+            tokens=estimate_tokens(prompt) + openai_output_tokens_estimate,
+            input=prompt,
+        )
+    except (RateLimitExceeded, CircuitOpen) as e:
+        return rate_limited_response(e)
+
+    async with pool_acquire(pg_pool) as conn:
         async with conn.transaction():
-            prompt = "Write a short poem of 100 letters or less."  # TODO
-            openai_resp = await client.responses.create(
-                model=openai_model,
-                input=prompt,
-                timeout=openai_timeout,
-            )
             await queries.insert_openai_query(
                 game_id=game_id,
                 conn=conn,
@@ -327,11 +652,30 @@ async def post_game(
                 response_length=len(openai_resp.output_text),
                 openai_response_id=openai_resp.id,
             )
+            await queries.update_game(
+                conn=conn,
+                game_id=game_id,
+                openai_previous_response_id=openai_resp.id,
+            )
 
-    greeting = openai_resp.output_text
+    greeting = openai_resp.output_text.replace("\n", " ")
+
+    # Game token allows the game server to prove game ownership
+    # without a database lookup in the following requests.
+    game_token = auth.make_game_token(
+        secret=request.app.config.SECRET,
+        game=Game(
+            id=game_id,
+            level=level,
+            start_time=now,
+            game_server_address=addr,
+            game_server_port=game_port,
+        ),
+        expires_at=now + game_expiration,
+    )
 
     return sanic.text(
-        f"{game_id}\n{greeting}",
+        f"{game_id}\n{greeting}\n{game_token}",
         status=HTTPStatus.CREATED,
         # TODO: use url_for!
         headers={"Location": f"{api_v1.version_prefix}{api_v1.version}/game/{game_id}"},
@@ -381,85 +725,314 @@ async def post_game_message(
         request: Request,
         game_id: str,
         pg_pool: asyncpg.Pool,
-        client: openai.AsyncOpenAI,
+        llm: ResilientClient,
+        governor: RateGovernor,
 ) -> HTTPResponse:
     # TODO: full implementation! Prompt building!
 
-    game = request.ctx.game
+    # NOTE: the game exists, see check_and_inject_game. The previous
+    # OpenAI query of the game is only read in run_game_message_batch.
+    try:
+        data_in = request.body.decode("utf-8").split("\n")
+        say_type = SayType(data_in[0])
+        say_team = Team(data_in[1])
+        say_name = data_in[2]
+        prompt_in = data_in[3]
+    except Exception as e:
+        logger.info("error parsing game message data: {}: {}", type(e).__name__, e)
+        # TODO: debug log stack trace or something?
+        return HTTPResponse(status=HTTPStatus.BAD_REQUEST)
+
+    try:
+        governor.check()
+        llm.check()
+    except (RateLimitExceeded, CircuitOpen) as e:
+        return rate_limited_response(e)
+
+    message = GameMessage(
+        say_type=say_type,
+        say_team=say_team,
+        say_name=say_name,
+        text=prompt_in,
+        pg_pool=pg_pool,
+        llm=llm,
+        governor=governor,
+        state=get_game_state(request, game_id),
+    )
+
+    async def reply() -> str:
+        # NOTE: messages of a game are answered one LLM call at a
+        # time, possibly merged with other messages of the game.
+        msg = await message_coordinator.submit(game_id, message)
+        return f"{say_type}\n{say_team}\n{say_name}\n{msg}"
+
+    # The client may not wait for the LLM, in which case the reply
+    # is polled from get_game_message with the returned job ID.
+    if prefers_async(request):
+        job_id = await start_job(scope=game_id, coro_func=reply)
+        return sanic.text(
+            job_id,
+            status=HTTPStatus.ACCEPTED,
+            headers={
+                # TODO: use url_for!
+                "Location": f"{api_v1.version_prefix}{api_v1.version}"
+                            f"/game/{game_id}/message/{job_id}",
+                "Preference-Applied": prefer_respond_async,
+            },
+        )
 
-    previous_response_id: str | None = game.openai_previous_response_id
-    if previous_response_id is None:
-        logger.warning("unable to handle request for game with no openai_previous_response_id")
+    try:
+        resp_data = await reply()
+    except (RateLimitExceeded, CircuitOpen) as e:
+        return rate_limited_response(e)
+    except (NoPreviousQuery, InvalidReplies) as e:
+        logger.warning("unable to handle game message: {}", e)
         return HTTPResponse(status=HTTPStatus.SERVICE_UNAVAILABLE)
 
-    level: str = game.level
+    return sanic.text(
+        resp_data,
+        status=HTTPStatus.OK,
+    )
 
-    async with pool_acquire(pg_pool) as conn:
-        previous_query = await queries.select_openai_query(
-            conn=conn,
-            openai_response_id=previous_response_id,
-        )
-        if not previous_query:
-            logger.warning("cannot find OpenAI query for id: {}", previous_response_id)
-            return HTTPResponse(status=HTTPStatus.SERVICE_UNAVAILABLE)
-
-        try:
-            data_in = request.body.decode("utf-8").split("\n")
-            say_type = SayType(data_in[0])
-            say_team = Team(data_in[1])
-            say_name = data_in[2]
-            prompt_in = data_in[3]
-        except Exception as e:
-            logger.info("error parsing game message data: {}: {}", type(e).__name__, e)
-            # TODO: debug log stack trace or something?
-            return HTTPResponse(status=HTTPStatus.BAD_REQUEST)
-
-        # TODO: have some maximum upper limit for total prompt length.
-        prompt = ""  # TODO
-
-        kills_table = await get_kills_markdown_table(
+
+class NoPreviousQuery(Exception):
+    """The game has no previous OpenAI query to continue from,
+    e.g. because it has not been initialized yet.
+    """
+
+
+class InvalidReplies(Exception):
+    """The LLM response has no usable replies to the game messages,
+    e.g. it was a refusal or was cut off by max_output_tokens.
+    """
+
+
+@dataclass(slots=True, frozen=True)
+class GameMessage:
+    """Message from a player to the LLM, see post_game_message."""
+    say_type: SayType
+    say_team: Team
+    say_name: str
+    text: str
+    pg_pool: asyncpg.Pool
+    llm: ResilientClient
+    governor: RateGovernor
+    state: GameState | None
+
+    def instruction(self) -> str:
+        return (f"{self.say_name} ({self.say_team.name} team, "
+                f"{self.say_type.name} chat) says:\n{self.text}")
+
+
+def make_game_message_instruction(messages: list[GameMessage]) -> str:
+    if len(messages) == 1:
+        return messages[0].instruction()
+
+    lines = [f"{len(messages)} players sent messages at the same time. "
+             "Reply to each of them, reply_N being the reply to message N."]
+    lines.extend(
+        f"Message {i}: {message.instruction()}"
+        for i, message in enumerate(messages, start=1)
+    )
+    return "\n".join(lines)
+
+
+def make_game_message_replies_format(num_replies: int) -> ResponseFormatTextJSONSchemaConfigParam:
+    """Structured output format of the replies to merged messages."""
+    properties = {f"reply_{i}": {"type": "string"} for i in range(1, num_replies + 1)}
+    return {
+        "type": "json_schema",
+        "name": "replies",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+            "additionalProperties": False,
+        },
+    }
+
+
+async def run_game_message_batch(game_id: str, messages: list[GameMessage]) -> list[str]:
+    """Reply to a batch of messages of a game with a single LLM call."""
+    first = messages[0]
+
+    async with pool_acquire(first.pg_pool) as conn:
+        # NOTE: the previous query is read again here, after the
+        # previous batch of the game has replaced it.
+        game = await queries.select_game(conn=conn, game_id=game_id)
+        previous_response_id = game.openai_previous_response_id if game else None
+        previous_query = None
+        if previous_response_id is not None:
+            previous_query = await queries.select_openai_query(
+                conn=conn,
+                openai_response_id=previous_response_id,
+            )
+        if game is None or previous_response_id is None or previous_query is None:
+            raise NoPreviousQuery(f"game {game_id}: no previous OpenAI query")
+
+        # NOTE: only events newer than the ones included in the previous
+        # query are sent. They are read from the in-memory game state when
+        # possible, falling back to the database, which also seeds the state.
+        state = first.state
+        kills = await get_new_kills(
             conn=conn,
-            game_id=game.id,
-            from_time=previous_query.time,
+            game=game,
+            after_id=previous_query.last_game_kill_id,
+            state=state,
         )
-        msgs_table = await get_chat_messages_markdown_table(
+        msgs = await get_new_chat_messages(
             conn=conn,
-            from_time=previous_query.time,
+            game=game,
+            after_id=previous_query.last_game_chat_message_id,
+            state=state,
         )
+        scoreboard = await get_scoreboard(conn=conn, game_id=game_id, state=state)
+        objective_state = await get_objective_state(conn=conn, game_id=game_id, state=state)
+
+    # NOTE: events left out of the prompt for lack of room are
+    # not sent later either, the watermarks cover all candidates.
+    last_game_kill_id = max(
+        [previous_query.last_game_kill_id] + [kill.id for kill in kills])
+    last_game_chat_message_id = max(
+        [previous_query.last_game_chat_message_id] + [msg.id for msg in msgs])
+
+    prompt = make_game_message_prompt(
+        instruction=make_game_message_instruction(messages),
+        scoreboard=scoreboard,
+        objective_state=objective_state,
+        kills=kills,
+        msgs=msgs,
+    )
+    logger.debug(
+        "game {}: prompt: {} tokens, {} message(s), {}",
+        game_id,
+        prompt.tokens,
+        len(messages),
+        ", ".join(f"{section.name}={section.rows_included}/{section.rows_total}"
+                  for section in prompt.sections),
+    )
+
+    return await query_game_message(
+        pg_pool=first.pg_pool,
+        llm=first.llm,
+        governor=first.governor,
+        game=game,
+        previous_response_id=previous_response_id,
+        prompt=prompt,
+        num_replies=len(messages),
+        last_game_kill_id=last_game_kill_id,
+        last_game_chat_message_id=last_game_chat_message_id,
+    )
+
+
+message_coordinator: RequestCoordinator[GameMessage, str] = RequestCoordinator(
+    run=run_game_message_batch,
+    merge_window=message_merge_window,
+    max_batch_size=message_max_batch_size,
+)
 
-        # TODO: format prompt here, taking maximum length into account!
-        #   E.g.: (rough drafts):
-        # Format kills table -> remove length from remaining budget.
-        # Calculate budget for remaining fields (weighted budgets).
-        max_chat_messages_to_add = 0  # Calculate budget.
-        max_kills_to_add = 0  # Calculate budget.
 
+async def query_game_message(
+        pg_pool: asyncpg.Pool,
+        llm: ResilientClient,
+        governor: RateGovernor,
+        game: Game,
+        previous_response_id: str,
+        prompt: AssembledPrompt,
+        num_replies: int,
+        last_game_kill_id: int,
+        last_game_chat_message_id: int,
+) -> list[str]:
+    """Query the LLM for replies to game messages and store
+    the query, returning the single line replies.
+    """
+    # TODO: how to best use instruction param here?
+    # NOTE: the connection is released while waiting for the LLM.
+    resp = await create_openai_response(
+        llm=llm,
+        governor=governor,
+        key=(game.game_server_address, game.game_server_port),
+        tokens=prompt.tokens + num_replies * openai_output_tokens_estimate,
+        input=prompt.text,
+        previous_response_id=previous_response_id,
+        text=(
+            {"format": make_game_message_replies_format(num_replies)}
+            if num_replies > 1 else openai.NOT_GIVEN
+        ),
+    )
+
+    # NOTE: the response is only stored as the game's previous query,
+    # advancing the watermarks, if the replies can be delivered.
+    replies = parse_game_message_replies(resp, num_replies)
+
+    async with pool_acquire(pg_pool) as conn:
         async with conn.transaction():
-            # TODO: how to best use instruction param here?
-            resp = await client.responses.create(
-                model=openai_model,
-                input=prompt,
-                previous_response_id=previous_response_id,
-                timeout=openai_timeout,
-            )
             await queries.insert_openai_query(
                 conn=conn,
-                game_id=game_id,
+                game_id=game.id,
                 time=utcnow(),
                 game_server_address=game.game_server_address,
                 game_server_port=game.game_server_port,
-                request_length=len(prompt),
+                request_length=len(prompt.text),
                 response_length=len(resp.output_text),
                 openai_response_id=resp.id,
+                last_game_kill_id=last_game_kill_id,
+                last_game_chat_message_id=last_game_chat_message_id,
+            )
+            await queries.update_game(
+                conn=conn,
+                game_id=game.id,
+                openai_previous_response_id=resp.id,
             )
 
-    msg = resp.output_text.replace("\n", " ")
-    resp_data = f"{say_type}\n{say_team}\n{say_name}\n{msg}"
+    return [reply.replace("\n", " ") for reply in replies]
 
-    return sanic.text(
-        resp_data,
-        status=HTTPStatus.OK,
-    )
+
+def parse_game_message_replies(resp: OpenAIResponse, num_replies: int) -> list[str]:
+    """Return the replies of a response to num_replies game messages, see
+    make_game_message_replies_format. Raises InvalidReplies if the response
+    is incomplete, a refusal, or does not match the replies format.
+    """
+    if resp.status is not None and resp.status != "completed":
+        reason = resp.incomplete_details.reason if resp.incomplete_details else None
+        raise InvalidReplies(f"response {resp.id}: status={resp.status}, reason={reason}")
+
+    output_text = resp.output_text
+    if not output_text:
+        raise InvalidReplies(f"response {resp.id}: no output text, refusal?")
+    if num_replies == 1:
+        return [output_text]
+
+    try:
+        data = json.loads(output_text)
+        replies = [data[f"reply_{i}"] for i in range(1, num_replies + 1)]
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise InvalidReplies(
+            f"response {resp.id}: invalid replies: {type(e).__name__}: {e}") from e
+    if not all(isinstance(reply, str) for reply in replies):
+        raise InvalidReplies(f"response {resp.id}: invalid replies: not strings")
+    return replies
+
+
+@api_v1.get("/game/<game_id:str>/message/<job_id:str>")
+@check_and_inject_game
+async def get_game_message(
+        _: Request,
+        game_id: str,
+        job_id: str,
+) -> HTTPResponse:
+    """Poll the reply of a game message posted with
+    "Prefer: respond-async", see post_game_message.
+    """
+    job = await get_job(scope=game_id, job_id=job_id)
+    if job is None:
+        return HTTPResponse(status=HTTPStatus.NOT_FOUND)
+    if job.status == JobStatus.Pending:
+        return sanic.text(str(job.status), status=HTTPStatus.ACCEPTED)
+    if job.status == JobStatus.Failed:
+        return HTTPResponse(status=HTTPStatus.SERVICE_UNAVAILABLE)
+    return sanic.text(job.result or "", status=HTTPStatus.OK)
 
 
 @api_v1.post("/game/<game_id:str>/kill")
@@ -486,19 +1059,50 @@ async def post_game_kill(
         logger.debug("failed to parse game kill data: {}: {}", type(e).__name__, e)
         return sanic.HTTPResponse(status=HTTPStatus.BAD_REQUEST)
 
-    async with pool_acquire(pg_pool) as conn:
-        async with conn.transaction():
-            await queries.insert_game_kill(
-                conn=conn,
-                game_id=game_id,
-                kill_time=kill_time,
-                killer_name=killer_name,
-                victim_name=victim_name,
-                killer_team=killer_team,
-                victim_team=victim_team,
-                damage_type=damage_type,
-                kill_distance_m=kill_distance_m,
-            )
+    buffer = request.app.ctx.write_behind_buffer
+    if buffer:
+        buffer.add_game_kill(
+            game_id=game_id,
+            kill_time=kill_time,
+            killer_name=killer_name,
+            victim_name=victim_name,
+            killer_team=killer_team,
+            victim_team=victim_team,
+            damage_type=damage_type,
+            kill_distance_m=kill_distance_m,
+        )
+    else:
+        # NOTE: see chatgpt_proxy.db.locks.
+        async with game_event_locks.hold([game_id]):
+            async with pool_acquire(pg_pool) as conn:
+                async with conn.transaction():
+                    await queries.lock_games_for_events(conn=conn, game_ids=[game_id])
+                    kill_id = await queries.insert_game_kill(
+                        conn=conn,
+                        game_id=game_id,
+                        kill_time=kill_time,
+                        killer_name=killer_name,
+                        victim_name=victim_name,
+                        killer_team=killer_team,
+                        victim_team=victim_team,
+                        damage_type=damage_type,
+                        kill_distance_m=kill_distance_m,
+                    )
+
+            # NOTE: buffered kills are added to the game state once written.
+            state = get_game_state(request, game_id)
+            if state is not None:
+                state.add_kills([GameKill(
+                    id=kill_id,
+                    game_id=game_id,
+                    kill_time=kill_time,
+                    killer_name=killer_name,
+                    victim_name=victim_name,
+                    killer_team=killer_team,
+                    victim_team=victim_team,
+                    damage_type=damage_type,
+                    kill_distance_m=kill_distance_m,
+                )])
 
     return sanic.HTTPResponse(status=HTTPStatus.NO_CONTENT)
 
@@ -533,6 +1137,16 @@ async def put_game_player(
                 score=score,
             )
 
+    state = get_game_state(request, game_id)
+    if state is not None:
+        state.upsert_players([GamePlayer(
+            game_id=game_id,
+            id=player_id,
+            name=name,
+            team=team,
+            score=score,
+        )])
+
     status = HTTPStatus.CREATED if created else HTTPStatus.NO_CONTENT
     return sanic.HTTPResponse(status=status)
 
@@ -540,27 +1154,63 @@ async def put_game_player(
 @api_v1.delete("/game/<game_id:str>/player/<player_id:int>")
 @check_and_inject_game
 async def delete_game_player(
-        _: Request,
+        request: Request,
         game_id: str,
         player_id: int,
         pg_pool: asyncpg.Pool,
 ) -> HTTPResponse:
     async with pool_acquire(pg_pool) as conn:
-        if not await queries.game_player_exists(
-                conn=conn,
-                game_id=game_id,
-                player_id=player_id,
-        ):
-            return HTTPResponse(status=HTTPStatus.NOT_FOUND)
+        deleted = await queries.delete_game_player(
+            conn=conn,
+            game_id=game_id,
+            player_id=player_id,
+        )
 
-        async with conn.transaction():
-            await queries.delete_game_player(
-                conn=conn,
-                game_id=game_id,
-                player_id=player_id,
-            )
+    state = get_game_state(request, game_id)
+    if state is not None:
+        state.delete_players([player_id])
 
-    return HTTPResponse(status=HTTPStatus.NO_CONTENT)
+    status = HTTPStatus.NO_CONTENT if deleted else HTTPStatus.NOT_FOUND
+    return HTTPResponse(status=status)
+
+
+# NOTE: streamed to bypass the app wide REQUEST_MAX_SIZE,
+# the body size is limited by PLAYERS_REQUEST_MAX_SIZE instead.
+@api_v1.put("/game/<game_id:str>/players", stream=True)
+@check_and_inject_game
+async def put_game_players(
+        request: Request,
+        game_id: str,
+        pg_pool: asyncpg.Pool,
+) -> HTTPResponse:
+    body = await read_body(request, request.app.config.PLAYERS_REQUEST_MAX_SIZE)
+    if body is None:
+        return sanic.HTTPResponse(status=HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+    try:
+        scoreboard = GameScoreboard.from_wire_format(
+            game_id=game_id,
+            wire_format_data=body.decode("utf-8"),
+        )
+    except Exception as e:
+        logger.debug("failed to parse game scoreboard data: {}: {}", type(e).__name__, e)
+        return sanic.HTTPResponse(status=HTTPStatus.BAD_REQUEST)
+
+    async with pool_acquire(pg_pool) as conn:
+        created, updated, removed = await queries.reconcile_game_players(
+            conn=conn,
+            scoreboard=scoreboard,
+        )
+
+    state = get_game_state(request, game_id)
+    if state is not None:
+        state.set_scoreboard(scoreboard)
+
+    logger.debug(
+        "game {}: players created={}, updated={}, removed={}",
+        game_id, created, updated, removed,
+    )
+    return sanic.text(f"{created}\n{updated}\n{removed}")
 
 
 @api_v1.post("/game/<game_id:str>/chat_message")
@@ -578,20 +1228,49 @@ async def post_game_chat_message(
         player_team = Team(parts[1])
         say_type = SayType(parts[2])
         msg = parts[3]
-        async with pool_acquire(pg_pool) as conn:
-            async with conn.transaction():
-                await queries.insert_game_chat_message(
-                    conn=conn,
+    except Exception as e:
+        logger.debug("failed to parse chat message data: {}: {}", type(e).__name__, e)
+        return sanic.HTTPResponse(status=HTTPStatus.BAD_REQUEST)
+
+    send_time = utcnow()
+    buffer = request.app.ctx.write_behind_buffer
+    if buffer:
+        buffer.add_game_chat_message(
+            game_id=game_id,
+            message=msg,
+            send_time=send_time,
+            sender_name=player_name,
+            sender_team=player_team,
+            channel=say_type,
+        )
+    else:
+        # NOTE: see chatgpt_proxy.db.locks.
+        async with game_event_locks.hold([game_id]):
+            async with pool_acquire(pg_pool) as conn:
+                async with conn.transaction():
+                    await queries.lock_games_for_events(conn=conn, game_ids=[game_id])
+                    msg_id = await queries.insert_game_chat_message(
+                        conn=conn,
+                        game_id=game_id,
+                        message=msg,
+                        send_time=send_time,
+                        sender_name=player_name,
+                        sender_team=player_team,
+                        channel=say_type,
+                    )
+
+            # NOTE: buffered chat messages are added to the game state once written.
+            state = get_game_state(request, game_id)
+            if state is not None:
+                state.add_chat_messages([GameChatMessage(
+                    id=msg_id,
                     game_id=game_id,
                     message=msg,
-                    send_time=utcnow(),
+                    send_time=send_time,
                     sender_name=player_name,
                     sender_team=player_team,
                     channel=say_type,
-                )
-    except Exception as e:
-        logger.debug("failed to parse chat message data: {}: {}", type(e).__name__, e)
-        return sanic.HTTPResponse(status=HTTPStatus.BAD_REQUEST)
+                )])
 
     return sanic.HTTPResponse(
         status=HTTPStatus.NO_CONTENT,
@@ -638,63 +1317,154 @@ async def put_game_objective_state(
                 state=obj_state,
             )
 
+    state = get_game_state(request, game_id)
+    if state is not None:
+        state.set_objective_state(obj_state)
+
     status = HTTPStatus.CREATED if created else HTTPStatus.NO_CONTENT
     return sanic.HTTPResponse(status=status)
 
 
-async def db_maintenance(stop_event: EventType) -> None:
-    # TODO: try to reduce the levels of nestedness.
+# NOTE: streamed to bypass the app wide REQUEST_MAX_SIZE,
+# the body size is limited by EVENTS_REQUEST_MAX_SIZE instead.
+@api_v1.post("/game/<game_id:str>/events", stream=True)
+@check_and_inject_game
+async def post_game_events(
+        request: Request,
+        game_id: str,
+        pg_pool: asyncpg.Pool,
+) -> HTTPResponse:
+    game = request.ctx.game
 
-    pool: asyncpg.Pool | None = None
+    body = await read_body(request, request.app.config.EVENTS_REQUEST_MAX_SIZE)
+    if body is None:
+        return sanic.HTTPResponse(status=HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
 
     try:
-        db_url = os.environ.get("DATABASE_URL")
-        pool = await asyncpg.create_pool(dsn=db_url, min_size=1, max_size=1)
-
-        while not stop_event.wait(db_maintenance_interval):
-            async with pool_acquire(pool) as conn:
-                async with conn.transaction():
-                    result = await queries.delete_completed_games(conn, game_expiration)
-                    logger.info("delete_completed_games: {}", result)
+        batch = GameEventBatch.from_wire_format(
+            game_id=game_id,
+            game_start_time=game.start_time,
+            send_time=utcnow(),
+            wire_format_data=body.decode("utf-8"),
+            max_objective_state_size=max_ast_literal_eval_size,
+        )
+    except Exception as e:
+        logger.debug("failed to parse game events data: {}: {}", type(e).__name__, e)
+        return sanic.HTTPResponse(status=HTTPStatus.BAD_REQUEST)
 
-                async with conn.transaction():
-                    result = await queries.delete_old_api_keys(
-                        conn,
-                        leeway=api_key_deletion_leeway,
+    kills: list[GameKill] = []
+    chat_messages: list[GameChatMessage] = []
+    # NOTE: see chatgpt_proxy.db.locks.
+    async with game_event_locks.hold([game_id]):
+        async with pool_acquire(pg_pool) as conn:
+            async with conn.transaction():
+                if batch.kills or batch.chat_messages:
+                    await queries.lock_games_for_events(conn=conn, game_ids=[game_id])
+                if batch.kills:
+                    kills = await queries.insert_game_kills(conn=conn, kills=batch.kills)
+                if batch.chat_messages:
+                    chat_messages = await queries.insert_game_chat_messages(
+                        conn=conn,
+                        chat_messages=batch.chat_messages,
+                    )
+                if batch.deleted_player_ids:
+                    await queries.delete_game_players(
+                        conn=conn,
+                        game_id=game_id,
+                        player_ids=batch.deleted_player_ids,
+                    )
+                if batch.players:
+                    await queries.upsert_game_players(conn=conn, players=batch.players)
+                if batch.objective_state:
+                    await queries.upsert_game_objective_state(
+                        conn=conn,
+                        state=batch.objective_state,
                     )
-                    logger.info("delete_old_api_keys: {}", result)
 
-    except KeyboardInterrupt:
-        if pool:
-            await pool.close()
+        state = get_game_state(request, game_id)
+        if state is not None:
+            state.apply_batch(batch, kills=kills, chat_messages=chat_messages)
 
+    logger.debug("game {}: stored {} events", game_id, len(batch))
+    return sanic.HTTPResponse(status=HTTPStatus.NO_CONTENT)
 
-async def refresh_steam_web_api_cache(stop_event: EventType) -> None:
-    pool: asyncpg.Pool | None = None
 
-    try:
-        db_url = os.environ.get("DATABASE_URL")
-        pool = await asyncpg.create_pool(dsn=db_url, min_size=1, max_size=1)
-
-        while not stop_event.wait(steam_web_api_cache_refresh_interval):
-            async with pool_acquire(pool) as conn:
-                api_keys = await queries.select_game_server_api_keys(conn)
-                logger.info("refreshing Steam Web API cache for {} keys", len(api_keys))
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                tasks = [
-                    is_real_game_server(
-                        client=client,
-                        game_server_address=api_key["game_server_address"],
-                        game_server_port=api_key["game_server_port"],
-                    )
-                    for api_key in api_keys
-                ]
-                await asyncio.gather(*tasks)
+async def db_maintenance(pool: asyncpg.Pool) -> None:
+    async with pool_acquire(pool) as conn:
+        result = await run_db_maintenance(
+            conn,
+            game_expiration=game_expiration,
+            api_key_deletion_leeway=api_key_deletion_leeway,
+            batch_size=db_maintenance_batch_size,
+            time_budget=db_maintenance_time_budget,
+        )
 
-    except KeyboardInterrupt:
-        await app_cache.close()
-        if pool:
-            await pool.close()
+    if result is None:
+        logger.info("db_maintenance: skipped, running on another node")
+        return
+
+    logger.info(
+        "db_maintenance: deleted {} games, {} API keys in {:.3f} s{}",
+        result.deleted_games,
+        result.deleted_api_keys,
+        result.duration,
+        "" if result.complete else " (time budget exceeded)",
+    )
+
+
+async def refresh_steam_server_list(http_client: httpx.AsyncClient) -> None:
+    snapshot = await auth.refresh_steam_server_list(
+        http_client,
+        # Another worker may have already refreshed the shared snapshot.
+        min_age=steam_server_list_refresh_interval / 2,
+    )
+    if snapshot is not None:
+        logger.info("Steam server list snapshot: {} servers, {:.0f} s old",
+                    len(snapshot), snapshot.age)
+
+
+def make_background_scheduler(
+        pool: asyncpg.Pool,
+        http_client: httpx.AsyncClient,
+) -> Scheduler:
+    scheduler = Scheduler()
+    scheduler.add_job(
+        name="db_maintenance",
+        func=lambda: db_maintenance(pool),
+        interval=db_maintenance_interval,
+        jitter=db_maintenance_jitter,
+        timeout=db_maintenance_timeout,
+    )
+    scheduler.add_job(
+        name="refresh_steam_server_list",
+        func=lambda: refresh_steam_server_list(http_client),
+        interval=steam_server_list_refresh_interval,
+        jitter=steam_server_list_refresh_jitter,
+        timeout=steam_server_list_refresh_timeout,
+        run_at_start=True,
+    )
+    return scheduler
+
+
+async def run_background_jobs(stop_event: EventType) -> None:
+    db_url = os.environ.get("DATABASE_URL")
+    pool = await asyncpg.create_pool(dsn=db_url, min_size=1, max_size=2)
+    start_caches()
+    http_client = httpx.AsyncClient(timeout=steam_server_list_refresh_timeout)
+    scheduler = make_background_scheduler(pool, http_client)
+    scheduler.start()
+
+    try:
+        # NOTE: polled instead of stop_event.wait() to not block the event loop.
+        while not stop_event.is_set():
+            await asyncio.sleep(background_jobs_stop_poll_interval)
+    finally:
+        await scheduler.stop()
+        for name, stats in scheduler.stats().items():
+            logger.info("job {}: {}", name, stats)
+        await close_caches()
+        await http_client.aclose()
+        await pool.close()
 
 
 @api_v1.on_request
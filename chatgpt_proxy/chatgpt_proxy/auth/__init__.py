@@ -1,15 +1,39 @@
+from .auth import VerifiedTokenCache
 from .auth import check_and_inject_game
 from .auth import check_token
+from .auth import game_token_header
+from .auth import handle_invalidation
+from .auth import invalidate_verified_tokens
 from .auth import is_real_game_server
 from .auth import jwt_audience
+from .auth import jwt_game_audience
 from .auth import jwt_issuer
 from .auth import load_config
+from .auth import make_game_token
+from .auth import refresh_steam_server_list
+from .auth import revalidate_game_server
+from .auth import verified_token_cache
+from .auth import verify_game_token
+from .server_list import ServerListSnapshot
+from .server_list import server_list_index
 
 __all__ = [
+    "ServerListSnapshot",
+    "VerifiedTokenCache",
     "check_and_inject_game",
     "check_token",
+    "game_token_header",
+    "handle_invalidation",
+    "invalidate_verified_tokens",
     "is_real_game_server",
     "jwt_audience",
+    "jwt_game_audience",
     "jwt_issuer",
     "load_config",
+    "make_game_token",
+    "refresh_steam_server_list",
+    "revalidate_game_server",
+    "server_list_index",
+    "verified_token_cache",
+    "verify_game_token",
 ]
@@ -22,22 +22,32 @@
 
 """Provides authentication and authorization for the chatgpt_proxy API server."""
 
+import asyncio
 import datetime
 import hashlib
 import ipaddress
 import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from functools import wraps
 from hmac import compare_digest
 from http import HTTPStatus
 from inspect import isawaitable
+from typing import Any
 from typing import Callable
+from typing import Coroutine
 
-import aiocache
 import asyncpg
 import httpx
 import jwt
 import sanic
 
+from chatgpt_proxy.auth import server_list
+from chatgpt_proxy.cache import app_cache
+from chatgpt_proxy.db import Invalidation
+from chatgpt_proxy.db import InvalidationKind
+from chatgpt_proxy.db import models
 from chatgpt_proxy.db import pool_acquire
 from chatgpt_proxy.db import queries
 from chatgpt_proxy.log import logger
@@ -46,8 +56,11 @@ from chatgpt_proxy.utils import get_remote_addr
 
 jwt_issuer = "ChatGPTProxy"
 jwt_audience = "ChatGPTProxy"
+# Game tokens use a separate audience to make sure game server
+# API keys and game tokens can never be used in place of each other.
+jwt_game_audience = "ChatGPTProxy-Game"
 
-_server_list_url = "https://api.steampowered.com/IGameServersService/GetServerList/v1/"
+game_token_header = "X-Game-Token"
 
 _steam_web_api_key: str | None = None
 
@@ -59,27 +72,155 @@ def load_config() -> None:
 
 load_config()
 
+# Verified game servers are re-verified in the background after
+# ttl_is_real_game_server, and dropped after ttl_stale_is_real_game_server.
 ttl_is_real_game_server = datetime.timedelta(minutes=60).total_seconds()
+ttl_stale_is_real_game_server = datetime.timedelta(hours=6).total_seconds()
+_steam_lock_ttl = 15.0
+_steam_lock_poll_interval = 0.1
+_steam_inflight: dict[str, asyncio.Task[bool]] = {}
+
+# Verified tokens are cached per worker process. API keys added or removed
+# by other processes (gen_api_key, database maintenance) invalidate cached
+# tokens through the database invalidation bus, see handle_invalidation.
+ttl_verified_token = datetime.timedelta(minutes=60).total_seconds()
+max_verified_tokens = 4096
+
+
+@dataclass(slots=True, frozen=True)
+class VerifiedToken:
+    game_server_address: ipaddress.IPv4Address
+    game_server_port: int
+    expires_at: float  # time.monotonic() deadline.
+
+
+class VerifiedTokenCache:
+    """Bounded TTL LRU cache of verified JWTs, keyed by the
+    SHA-256 digest of the token. A cached entry never outlives
+    the token's exp claim or the API key's expires_at.
+    """
+
+    def __init__(self, max_size: int = max_verified_tokens, ttl: float = ttl_verified_token):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, VerifiedToken] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token_hash: bytes) -> VerifiedToken | None:
+        entry = self._entries.get(token_hash)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if time.monotonic() >= entry.expires_at:
+            del self._entries[token_hash]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token_hash)
+        self.hits += 1
+        return entry
+
+    def put(
+            self,
+            token_hash: bytes,
+            game_server_address: ipaddress.IPv4Address,
+            game_server_port: int,
+            token_exp: datetime.datetime,
+            api_key_expires_at: datetime.datetime,
+    ) -> None:
+        # Convert the wall clock deadlines to monotonic time once here
+        # to keep lookups cheap.
+        now_wall = datetime.datetime.now(tz=datetime.timezone.utc)
+        now_mono = time.monotonic()
+        valid_for = min(
+            self.ttl,
+            (token_exp - now_wall).total_seconds(),
+            (api_key_expires_at - now_wall).total_seconds(),
+        )
+        if valid_for <= 0:
+            return
 
+        self._entries[token_hash] = VerifiedToken(
+            game_server_address=game_server_address,
+            game_server_port=game_server_port,
+            expires_at=now_mono + valid_for,
+        )
+        self._entries.move_to_end(token_hash)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(
+            self,
+            game_server_address: ipaddress.IPv4Address | None = None,
+            game_server_port: int | None = None,
+    ) -> int:
+        """Drop cached tokens for the given game server, or all
+        cached tokens if no server is given. Returns the number
+        of dropped entries.
+        """
+        if game_server_address is None and game_server_port is None:
+            num = len(self._entries)
+            self._entries.clear()
+            return num
+
+        drop = [
+            token_hash
+            for token_hash, entry in self._entries.items()
+            if ((game_server_address is None or entry.game_server_address == game_server_address)
+                and (game_server_port is None or entry.game_server_port == game_server_port))
+        ]
+        for token_hash in drop:
+            del self._entries[token_hash]
+        return len(drop)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+verified_token_cache = VerifiedTokenCache()
+
+
+def invalidate_verified_tokens(
+        game_server_address: ipaddress.IPv4Address | None = None,
+        game_server_port: int | None = None,
+) -> int:
+    num = verified_token_cache.invalidate(
+        game_server_address=game_server_address,
+        game_server_port=game_server_port,
+    )
+    logger.debug("invalidated {} verified token(s) for {}:{}",
+                 num, game_server_address, game_server_port)
+    return num
+
+
+def handle_invalidation(invalidation: Invalidation) -> None:
+    """Callback for InvalidationListener."""
+    if invalidation.kind == InvalidationKind.All:
+        invalidate_verified_tokens()
+    elif invalidation.kind == InvalidationKind.ApiKey:
+        game_server_address, game_server_port = invalidation.game_server
+        invalidate_verified_tokens(
+            game_server_address=game_server_address,
+            game_server_port=game_server_port,
+        )
 
-# TODO: waiting for updated aiocache + valkey-glide support on Windows!
-#   - In the meanwhile, only use memory cache!
-#   - See pyproject.toml for more details!
-@aiocache.cached(
-    # cache=app_cache,
-    cache=aiocache.Cache.MEMORY,
-    ttl=ttl_is_real_game_server,
-    # NOTE: Only cache the result if the server was successfully verified.
-    skip_cache_func=lambda x: x is False,
-)
-async def is_real_game_server(
+
+async def _query_steam_server_list(
         client: httpx.AsyncClient,
         game_server_address: ipaddress.IPv4Address,
         game_server_port: int,
-) -> bool:
+) -> bool | None:
+    """Returns None if the Steam Web API could not be queried."""
     try:
         resp = await client.get(
-            _server_list_url,
+            server_list.server_list_url,
             params={
                 "key": _steam_web_api_key,
                 "filter": f"\\gamedir\\rs2\\gameaddr\\{game_server_address}:{game_server_port}",
@@ -98,17 +239,164 @@ async def is_real_game_server(
     except Exception as e:
         logger.debug("unable to verify {}:{} is a real RS2 server: {}: {}",
                      game_server_address, game_server_port, type(e).__name__, e)
-        return False
+        return None
 
 
-async def check_token(request: Request, pg_pool: asyncpg.Pool) -> bool:
-    if not request.token:
-        logger.debug("JWT validation failed: no token")
+def _steam_cache_key(
+        game_server_address: ipaddress.IPv4Address,
+        game_server_port: int,
+) -> str:
+    return f"steam_verified:{game_server_address}:{game_server_port}"
+
+
+async def _try_lock(key: str, ttl: float) -> bool:
+    try:
+        await app_cache.add(key, 1, ttl=ttl)
+        return True
+    except ValueError:
         return False
 
+
+async def revalidate_game_server(
+        client: httpx.AsyncClient,
+        game_server_address: ipaddress.IPv4Address,
+        game_server_port: int,
+) -> bool | None:
+    """Query the Steam Web API and update the shared verification cache.
+    Verified servers are stored, servers Steam does not know are removed.
+    On Steam Web API errors (None), the cache is left as is.
+    """
+    key = _steam_cache_key(game_server_address, game_server_port)
+    ok = await _query_steam_server_list(client, game_server_address, game_server_port)
+    if ok:
+        await app_cache.set(key, time.time(), ttl=ttl_stale_is_real_game_server)
+    elif ok is False:
+        await app_cache.delete(key)
+    return ok
+
+
+async def _verify_game_server(
+        client: httpx.AsyncClient,
+        game_server_address: ipaddress.IPv4Address,
+        game_server_port: int,
+) -> bool:
+    key = _steam_cache_key(game_server_address, game_server_port)
+    lock_key = f"{key}:lock"
+
+    while not await _try_lock(lock_key, ttl=_steam_lock_ttl):
+        # Another worker is already querying Steam, wait for its result.
+        # If the lock is released (or expires) without a verified result,
+        # try to take it over. The lock is only deleted by its holder.
+        deadline = time.monotonic() + _steam_lock_ttl
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_steam_lock_poll_interval)
+            if await app_cache.get(key) is not None:
+                return True
+            if not await app_cache.exists(lock_key):
+                break
+
+    try:
+        return bool(await revalidate_game_server(
+            client, game_server_address, game_server_port))
+    finally:
+        await app_cache.delete(lock_key)
+
+
+def _single_flight(
+        key: str,
+        coro_func: Callable[[], Coroutine[Any, Any, bool]],
+) -> asyncio.Task[bool]:
+    task = _steam_inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(coro_func())
+        _steam_inflight[key] = task
+        task.add_done_callback(lambda _: _steam_inflight.pop(key, None))
+    return task
+
+
+async def _revalidate_in_background(
+        client: httpx.AsyncClient,
+        game_server_address: ipaddress.IPv4Address,
+        game_server_port: int,
+) -> bool:
+    key = _steam_cache_key(game_server_address, game_server_port)
+    # Only a single worker revalidates a stale entry.
+    if not await _try_lock(f"{key}:revalidate", ttl=_steam_lock_ttl):
+        return True
+    await revalidate_game_server(client, game_server_address, game_server_port)
+    return True
+
+
+async def is_real_game_server(
+        client: httpx.AsyncClient,
+        game_server_address: ipaddress.IPv4Address,
+        game_server_port: int,
+) -> bool:
+    """Check that the game server is listed by the Steam Web API.
+
+    Results are cached in the shared app_cache. Within ttl_is_real_game_server
+    of the last successful verification, no Steam Web API request is made.
+    After that, until ttl_stale_is_real_game_server, the cached result is
+    still used, while the server is re-verified in the background.
+
+    Concurrent verifications of the same server are coalesced into a single
+    Steam Web API request per worker, and workers wait for each other's
+    in-progress verification.
+
+    Servers found in the local server list snapshot are verified without
+    touching the shared cache, see refresh_steam_server_list.
+    """
+    if await server_list.server_list_index.contains(game_server_address, game_server_port):
+        return True
+
+    key = _steam_cache_key(game_server_address, game_server_port)
+    verified_at = await app_cache.get(key)
+
+    if verified_at is not None:
+        if time.time() - float(verified_at) >= ttl_is_real_game_server:
+            _single_flight(
+                f"{key}:revalidate",
+                lambda: _revalidate_in_background(
+                    client, game_server_address, game_server_port),
+            )
+        return True
+
+    task = _single_flight(
+        key,
+        lambda: _verify_game_server(client, game_server_address, game_server_port),
+    )
+    # NOTE: shielded, cancelling one waiting request must
+    # not cancel the verification other requests wait for.
+    return await asyncio.shield(task)
+
+
+async def refresh_steam_server_list(
+        client: httpx.AsyncClient,
+        min_age: float = 0.0,
+) -> server_list.ServerListSnapshot | None:
+    if not _steam_web_api_key:
+        logger.debug("STEAM_WEB_API_KEY not set, not refreshing Steam server list")
+        return None
+    return await server_list.refresh_server_list(
+        client=client,
+        steam_web_api_key=_steam_web_api_key,
+        min_age=min_age,
+    )
+
+
+async def _verify_token(
+        request: Request,
+        pg_pool: asyncpg.Pool,
+        req_token: str,
+        req_token_hash: bytes,
+        client_addr: ipaddress.IPv4Address,
+) -> tuple[ipaddress.IPv4Address, int] | None:
+    """Fully verify the request token against the secret and the
+    database. Stores the result in verified_token_cache on success.
+    """
     try:
         token = jwt.decode(
-            jwt=request.token,
+            jwt=req_token,
             key=request.app.config.SECRET,
             options={"require": ["exp", "iss", "sub", "aud"]},
             algorithms=["HS256"],
@@ -117,7 +405,7 @@ async def check_token(request: Request, pg_pool: asyncpg.Pool) -> bool:
         )
     except jwt.exceptions.PyJWTError as e:
         logger.debug("JWT validation failed: {}: {}", type(e).__name__, e)
-        return False
+        return None
 
     # JWT subject should be IP:port.
     sub: str = token["sub"]
@@ -128,13 +416,10 @@ async def check_token(request: Request, pg_pool: asyncpg.Pool) -> bool:
 
     # Small extra step of security since we can't use HTTPS.
     # In any case, this is not really secure, but better than nothing.
-    client_addr = get_remote_addr(request)
-    logger.debug("client_addr: {}", client_addr)
     if client_addr != addr:
         logger.debug("JWT validation failed: (client_addr != addr): {} != {}", client_addr, addr)
-        return False
+        return None
 
-    # TODO: we should cache this in memory (LRU) or diskcache.
     async with pool_acquire(pg_pool) as conn:
         api_key = await queries.select_game_server_api_key(
             conn=conn,
@@ -142,17 +427,58 @@ async def check_token(request: Request, pg_pool: asyncpg.Pool) -> bool:
             game_server_port=port,
         )
 
-        logger.debug("api_key: {}", api_key)
+    logger.debug("api_key: {}", api_key)
 
-        if not api_key:
-            logger.debug("JWT validation failed: no API key for {}:{}", addr, port)
-            return False
+    if not api_key:
+        logger.debug("JWT validation failed: no API key for {}:{}", addr, port)
+        return None
+
+    db_api_key_hash: bytes = api_key["api_key_hash"]
+    if not compare_digest(req_token_hash, db_api_key_hash):
+        logger.debug("JWT validation failed: stored hash does not match token hash")
+        return None
+
+    verified_token_cache.put(
+        token_hash=req_token_hash,
+        game_server_address=addr,
+        game_server_port=port,
+        token_exp=datetime.datetime.fromtimestamp(token["exp"], tz=datetime.timezone.utc),
+        api_key_expires_at=api_key["expires_at"],
+    )
 
-        req_token_hash = hashlib.sha256(request.token.encode("utf-8")).digest()
-        db_api_key_hash: bytes = api_key["api_key_hash"]
-        if not compare_digest(req_token_hash, db_api_key_hash):
-            logger.debug("JWT validation failed: stored hash does not match token hash")
+    return addr, port
+
+
+async def check_token(request: Request, pg_pool: asyncpg.Pool) -> bool:
+    if not request.token:
+        logger.debug("JWT validation failed: no token")
+        return False
+
+    req_token_hash = hashlib.sha256(request.token.encode("utf-8")).digest()
+    client_addr = get_remote_addr(request)
+    logger.debug("client_addr: {}", client_addr)
+
+    cached = verified_token_cache.get(req_token_hash)
+    if cached is not None:
+        addr = cached.game_server_address
+        port = cached.game_server_port
+        # The address check is cheap and depends on the request,
+        # so it is done even for previously verified tokens.
+        if client_addr != addr:
+            logger.debug("JWT validation failed: (client_addr != addr): {} != {}",
+                         client_addr, addr)
+            return False
+    else:
+        verified = await _verify_token(
+            request=request,
+            pg_pool=pg_pool,
+            req_token=request.token,
+            req_token_hash=req_token_hash,
+            client_addr=client_addr,
+        )
+        if verified is None:
             return False
+        addr, port = verified
 
     if _steam_web_api_key is None:
         logger.warning("Steam Web API key is not set, "
@@ -174,7 +500,73 @@ async def check_token(request: Request, pg_pool: asyncpg.Pool) -> bool:
     return True
 
 
+def make_game_token(
+        secret: str,
+        game: models.Game,
+        expires_at: datetime.datetime,
+) -> str:
+    """Issue a signed, game-scoped token for the game server that
+    created the game. The token carries the immutable game fields
+    needed for the ownership check, allowing check_and_inject_game
+    to skip the database.
+    """
+    return jwt.encode(
+        key=secret,
+        algorithm="HS256",
+        payload={
+            "iss": jwt_issuer,
+            "aud": jwt_game_audience,
+            "sub": game.id,
+            "exp": int(expires_at.timestamp()),
+            "lvl": game.level,
+            "addr": str(game.game_server_address),
+            "port": game.game_server_port,
+            "start": game.start_time.isoformat(),
+        },
+    )
+
+
+def verify_game_token(
+        secret: str,
+        game_token: str,
+        game_id: str,
+) -> models.Game | None:
+    """Returns a partial Game (no stop_time or openai_previous_response_id)
+    built from the token claims, or None if the token is invalid.
+    """
+    try:
+        claims = jwt.decode(
+            jwt=game_token,
+            key=secret,
+            options={"require": ["exp", "iss", "sub", "aud"]},
+            algorithms=["HS256"],
+            audience=jwt_game_audience,
+            issuer=jwt_issuer,
+        )
+        if claims["sub"] != game_id:
+            logger.debug("game token validation failed: sub != game_id: {} != {}",
+                         claims["sub"], game_id)
+            return None
+
+        return models.Game(
+            id=game_id,
+            level=claims["lvl"],
+            start_time=datetime.datetime.fromisoformat(claims["start"]),
+            game_server_address=ipaddress.IPv4Address(claims["addr"]),
+            game_server_port=int(claims["port"]),
+        )
+    except Exception as e:
+        logger.debug("game token validation failed: {}: {}", type(e).__name__, e)
+        return None
+
+
 def check_and_inject_game(func: Callable) -> Callable:
+    """Check the requesting game server owns the game and inject it
+    in request.ctx.game. When the request carries a game token, the
+    game is built from the token claims and is only partial, handlers
+    that need the mutable game fields must query them separately.
+    """
+
     def decorator(f: Callable) -> Callable:
         @wraps(f)
         async def game_owner_checked_handler(
@@ -193,34 +585,51 @@ def check_and_inject_game(func: Callable) -> Callable:
                 )
                 return sanic.HTTPResponse("Unauthorized.", status=HTTPStatus.UNAUTHORIZED)
 
-            async with pool_acquire(request.app.ctx.pg_pool) as conn:
-                game = await queries.select_game(conn=conn, game_id=game_id)
+            game: models.Game | None
+            game_token = request.headers.get(game_token_header)
+            if game_token:
+                game = verify_game_token(
+                    secret=request.app.config.SECRET,
+                    game_token=game_token,
+                    game_id=game_id,
+                )
+                if not game:
+                    return sanic.HTTPResponse("Unauthorized.", status=HTTPStatus.UNAUTHORIZED)
+            else:
+                async with pool_acquire(request.app.ctx.pg_pool) as conn:
+                    game = await queries.select_game_cached(conn=conn, game_id=game_id)
                 if not game:
                     logger.debug("no game found for game_id: {}", game_id)
                     return sanic.HTTPResponse(status=HTTPStatus.NOT_FOUND)
 
-                if game.game_server_address != request.ctx.jwt_game_server_address:
-                    logger.debug(
-                        "unauthorized: token address != DB address: {} != {}",
-                        game.game_server_address,
-                        request.ctx.jwt_game_server_address,
-                    )
-                    return sanic.HTTPResponse("Unauthorized.", status=HTTPStatus.UNAUTHORIZED)
-
-                if game.game_server_port != request.ctx.jwt_game_server_port:
-                    logger.debug(
-                        "unauthorized: token port != DB port: {} != {}",
-                        game.game_server_port,
-                        request.ctx.jwt_game_server_port,
-                    )
-                    return sanic.HTTPResponse("Unauthorized.", status=HTTPStatus.UNAUTHORIZED)
+            if game.game_server_address != request.ctx.jwt_game_server_address:
+                logger.debug(
+                    "unauthorized: token address != game address: {} != {}",
+                    game.game_server_address,
+                    request.ctx.jwt_game_server_address,
+                )
+                return sanic.HTTPResponse("Unauthorized.", status=HTTPStatus.UNAUTHORIZED)
 
-                request.ctx.game = game
+            if game.game_server_port != request.ctx.jwt_game_server_port:
+                logger.debug(
+                    "unauthorized: token port != game port: {} != {}",
+                    game.game_server_port,
+                    request.ctx.jwt_game_server_port,
+                )
+                return sanic.HTTPResponse("Unauthorized.", status=HTTPStatus.UNAUTHORIZED)
 
-            response = f(request, game_id=game_id, *args, **kwargs)
-            if isawaitable(response):
-                return await response
-            return response  # pragma: no coverage
+            request.ctx.game = game
+
+            try:
+                response = f(request, game_id=game_id, *args, **kwargs)
+                if isawaitable(response):
+                    return await response
+                return response  # pragma: no coverage
+            except asyncpg.ForeignKeyViolationError as e:
+                # Game token outlived the game, e.g. the game was
+                # already deleted during database maintenance.
+                logger.debug("game {} no longer exists: {}: {}", game_id, type(e).__name__, e)
+                return sanic.HTTPResponse(status=HTTPStatus.NOT_FOUND)
 
         return game_owner_checked_handler
 
@@ -0,0 +1,216 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Local snapshot index of the Steam Web API RS2 server list.
+
+The full server list is downloaded in a single sweep by a background job
+and stored in the shared app_cache as a compact, sorted array of packed
+(IPv4 address, game port) pairs. Workers keep a decoded copy of the latest
+snapshot and answer game server verification lookups locally.
+"""
+
+import base64
+import datetime
+import ipaddress
+import os
+import struct
+import time
+from dataclasses import dataclass
+from dataclasses import field
+
+import httpx
+
+from chatgpt_proxy.cache import app_cache
+from chatgpt_proxy.log import logger
+
+# Can be pointed to a local fake for load testing, see chatgpt_proxy.bench.
+steam_web_api_url = os.environ.get("STEAM_WEB_API_URL", "https://api.steampowered.com").rstrip("/")
+server_list_url = f"{steam_web_api_url}/IGameServersService/GetServerList/v1/"
+server_list_filter = "\\gamedir\\rs2"
+# NOTE: GetServerList has no paging cursor, so the sweep is done as
+# a single request with a limit well above the RS2 server count.
+server_list_limit = 20_000
+
+server_list_cache_key = "steam_server_list"
+# Snapshots older than this are not trusted.
+ttl_server_list = datetime.timedelta(hours=2).total_seconds()
+# How often workers check the shared cache for a newer snapshot.
+server_list_reload_interval = 30.0
+
+_packed_server = struct.Struct("!IH")
+
+
+def pack_server(address: ipaddress.IPv4Address, port: int) -> int:
+    return (int(address) << 16) | port
+
+
+@dataclass(slots=True, frozen=True)
+class ServerListSnapshot:
+    servers: frozenset[int]  # pack_server() values.
+    updated_at: float  # time.time() of the sweep.
+    complete: bool = True
+
+    def __len__(self) -> int:
+        return len(self.servers)
+
+    def __contains__(self, server: tuple[ipaddress.IPv4Address, int]) -> bool:
+        return pack_server(*server) in self.servers
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.updated_at
+
+    def to_cache_value(self) -> dict:
+        data = b"".join(
+            _packed_server.pack(server >> 16, server & 0xFFFF)
+            for server in sorted(self.servers)
+        )
+        return {
+            "updated_at": self.updated_at,
+            "complete": self.complete,
+            "servers": base64.b64encode(data).decode("ascii"),
+        }
+
+    @classmethod
+    def from_cache_value(cls, value: dict) -> "ServerListSnapshot":
+        data = base64.b64decode(value["servers"])
+        return cls(
+            servers=frozenset(
+                (address << 16) | port
+                for address, port in _packed_server.iter_unpack(data)
+            ),
+            updated_at=float(value["updated_at"]),
+            complete=bool(value["complete"]),
+        )
+
+    @classmethod
+    def from_steam_servers(cls, servers: list[dict], updated_at: float) -> "ServerListSnapshot":
+        packed = set()
+        for server in servers:
+            try:
+                address = ipaddress.IPv4Address(server["addr"].rsplit(":", 1)[0])
+                packed.add(pack_server(address, int(server["gameport"])))
+            except (KeyError, ValueError, AttributeError) as e:
+                logger.debug("skipping invalid server list entry: {}: {}: {}",
+                             server, type(e).__name__, e)
+        return cls(
+            servers=frozenset(packed),
+            updated_at=updated_at,
+            complete=len(servers) < server_list_limit,
+        )
+
+
+@dataclass(slots=True)
+class ServerListIndex:
+    """Per-worker copy of the shared server list snapshot."""
+    snapshot: ServerListSnapshot | None = None
+    reload_interval: float = server_list_reload_interval
+    max_age: float = ttl_server_list
+    hits: int = 0
+    misses: int = 0
+    _checked_at: float = field(default=float("-inf"))
+
+    async def get(self) -> ServerListSnapshot | None:
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            # NOTE: set before awaiting so that concurrent
+            # lookups don't all hit the shared cache.
+            self._checked_at = now
+            try:
+                value = await app_cache.get(server_list_cache_key)
+            except Exception as e:
+                logger.warning("failed to load server list snapshot: {}: {}",
+                               type(e).__name__, e)
+                value = None
+            if value is not None and (self.snapshot is None
+                                      or float(value["updated_at"]) != self.snapshot.updated_at):
+                self.snapshot = ServerListSnapshot.from_cache_value(value)
+
+        if self.snapshot is not None and self.snapshot.age > self.max_age:
+            return None
+        return self.snapshot
+
+    async def contains(self, address: ipaddress.IPv4Address, port: int) -> bool:
+        snapshot = await self.get()
+        if snapshot is not None and (address, port) in snapshot:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def set(self, snapshot: ServerListSnapshot) -> None:
+        self.snapshot = snapshot
+        self._checked_at = time.monotonic()
+
+    def clear(self) -> None:
+        self.snapshot = None
+        self.hits = 0
+        self.misses = 0
+        self._checked_at = float("-inf")
+
+
+server_list_index = ServerListIndex()
+
+
+async def refresh_server_list(
+        client: httpx.AsyncClient,
+        steam_web_api_key: str,
+        min_age: float = 0.0,
+) -> ServerListSnapshot | None:
+    """Download the full RS2 server list and store it in the shared cache.
+    If another worker stored a snapshot younger than min_age, that snapshot
+    is used instead. Returns None if the server list could not be fetched.
+    """
+    if min_age > 0:
+        value = await app_cache.get(server_list_cache_key)
+        if value is not None and time.time() - float(value["updated_at"]) < min_age:
+            snapshot = ServerListSnapshot.from_cache_value(value)
+            server_list_index.set(snapshot)
+            return snapshot
+
+    try:
+        resp = await client.get(
+            server_list_url,
+            params={
+                "key": steam_web_api_key,
+                "filter": server_list_filter,
+                "limit": server_list_limit,
+            },
+        )
+        resp.raise_for_status()
+        servers = resp.json()["response"].get("servers", [])
+    except Exception as e:
+        logger.warning("failed to fetch Steam Web API server list: {}: {}",
+                       type(e).__name__, e)
+        return None
+
+    snapshot = ServerListSnapshot.from_steam_servers(servers, updated_at=time.time())
+    if not snapshot.complete:
+        logger.warning("Steam Web API server list truncated at {} servers", len(servers))
+
+    await app_cache.set(
+        server_list_cache_key,
+        snapshot.to_cache_value(),
+        ttl=ttl_server_list,
+    )
+    server_list_index.set(snapshot)
+    return snapshot
@@ -0,0 +1,33 @@
+from .fake_openai import FakeModel
+from .fake_openai import FakeResponsesAPI
+from .fake_openai import LatencyDistribution
+from .fake_openai import constant_latency
+from .fake_openai import lognormal_latency
+from .fake_openai import uniform_latency
+from .fake_server import make_fake_server_app
+from .fake_steam import FakeSteamWebAPI
+from .load import LoadResult
+from .load import Route
+from .load import RouteStats
+from .load import SimulatedGameServer
+from .load import format_report
+from .load import provision_api_keys
+from .load import run_load
+
+__all__ = [
+    "FakeModel",
+    "FakeResponsesAPI",
+    "FakeSteamWebAPI",
+    "LatencyDistribution",
+    "LoadResult",
+    "Route",
+    "RouteStats",
+    "SimulatedGameServer",
+    "constant_latency",
+    "format_report",
+    "lognormal_latency",
+    "make_fake_server_app",
+    "provision_api_keys",
+    "run_load",
+    "uniform_latency",
+]
@@ -0,0 +1,208 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Local fake of the OpenAI Responses API create endpoint, with
+configurable latency distributions and error rates per model.
+
+Only the fields used by chatgpt_proxy are meaningful in the responses.
+Requests with a JSON schema text format are answered with a JSON object
+with a string for each property of the schema.
+"""
+
+import asyncio
+import collections
+import json
+import math
+import random
+from collections.abc import Callable
+from dataclasses import dataclass
+from dataclasses import field
+
+import httpx
+import openai
+import openai.types.responses as openai_responses
+import openai.types.responses.response_usage as response_usage
+
+from chatgpt_proxy.utils import utcnow
+
+fake_base_url = "http://fake-openai.test/v1"
+
+# Returns a response latency in seconds.
+LatencyDistribution = Callable[[random.Random], float]
+
+# Standard normal quantile of the 99th percentile.
+_z_99 = 2.3263
+
+
+def constant_latency(latency: float) -> LatencyDistribution:
+    return lambda _: latency
+
+
+def uniform_latency(low: float, high: float) -> LatencyDistribution:
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal_latency(median: float, p99: float) -> LatencyDistribution:
+    """Long-tailed latency, typical of LLM APIs."""
+    mu = math.log(median)
+    sigma = (math.log(p99) - mu) / _z_99
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+@dataclass(slots=True)
+class FakeModel:
+    latency: LatencyDistribution = field(default_factory=lambda: constant_latency(0.0))
+    # Fraction of requests answered with 500 Internal Server Error.
+    error_rate: float = 0.0
+    # Fraction of requests answered with 429 Too Many Requests.
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+
+
+class FakeResponsesAPI:
+    def __init__(
+            self,
+            models: dict[str, FakeModel] | None = None,
+            default_model: FakeModel | None = None,
+            seed: int | None = None,
+    ):
+        # Behavior of each model, models not listed here use default_model.
+        self.models = dict(models or {})
+        self.default_model = default_model or FakeModel()
+        # Latencies of the next requests, overriding the model latencies.
+        self.next_latencies: list[float] = []
+        self.requests: collections.Counter[str] = collections.Counter()
+        self.num_requests = 0
+        self._rng = random.Random(seed)
+
+    def make_response(
+            self,
+            model: str,
+            response_id: str,
+            output_text: str,
+            input_tokens: int,
+    ) -> dict:
+        output_tokens = len(output_text) // 4 + 1
+        response = openai_responses.Response(
+            id=response_id,
+            model=model,
+            created_at=utcnow().timestamp(),
+            object="response",
+            error=None,
+            instructions=None,
+            parallel_tool_calls=False,
+            tool_choice="auto",
+            tools=[],
+            output=[
+                openai_responses.ResponseOutputMessage(
+                    id=f"msg_{response_id}",
+                    content=[
+                        openai_responses.ResponseOutputText(
+                            annotations=[],
+                            text=output_text,
+                            type="output_text",
+                        ),
+                    ],
+                    role="assistant",
+                    status="completed",
+                    type="message",
+                ),
+            ],
+            usage=openai_responses.ResponseUsage(
+                input_tokens=input_tokens,
+                input_tokens_details=response_usage.InputTokensDetails(cached_tokens=0),
+                output_tokens=output_tokens,
+                output_tokens_details=response_usage.OutputTokensDetails(reasoning_tokens=0),
+                total_tokens=input_tokens + output_tokens,
+            ),
+        )
+        return response.model_dump(mode="json")
+
+    @staticmethod
+    def make_output_text(model: str, body: dict) -> str:
+        text_format = (body.get("text") or {}).get("format") or {}
+        if text_format.get("type") == "json_schema":
+            properties = text_format["schema"].get("properties", {})
+            return json.dumps({name: f"{model} says hello" for name in properties})
+        return f"{model} says hello"
+
+    @staticmethod
+    def error(status_code: int, type_: str, headers: dict[str, str] | None = None) -> httpx.Response:
+        return httpx.Response(
+            status_code,
+            headers=headers,
+            json={
+                "error": {
+                    "message": f"fake {type_}",
+                    "type": type_,
+                    "param": None,
+                    "code": None,
+                },
+            },
+        )
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        model_name = body["model"]
+        model = self.models.get(model_name, self.default_model)
+        self.num_requests += 1
+        self.requests[model_name] += 1
+        response_id = f"fake_{self.num_requests}"
+
+        if self.next_latencies:
+            latency = self.next_latencies.pop(0)
+        else:
+            latency = model.latency(self._rng)
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+        roll = self._rng.random()
+        if roll < model.rate_limit_rate:
+            return self.error(429, "rate_limit_exceeded", headers={
+                "retry-after": str(model.retry_after),
+            })
+        if roll < model.rate_limit_rate + model.error_rate:
+            return self.error(500, "server_error")
+
+        return httpx.Response(
+            200,
+            json=self.make_response(
+                model=model_name,
+                response_id=response_id,
+                output_text=self.make_output_text(model_name, body),
+                input_tokens=len(str(body.get("input", ""))) // 4 + 1,
+            ),
+        )
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handler)
+
+    def client(self) -> openai.AsyncOpenAI:
+        """In-process client, see chatgpt_proxy.bench.fake_server
+        for serving the fake API over HTTP.
+        """
+        return openai.AsyncOpenAI(
+            api_key="fake",
+            base_url=fake_base_url,
+            http_client=httpx.AsyncClient(transport=self.transport()),
+            max_retries=0,
+        )
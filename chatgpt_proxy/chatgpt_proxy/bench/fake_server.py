@@ -0,0 +1,145 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Serves the fake OpenAI Responses API and Steam Web API GetServerList
+over HTTP, for load testing a running app with chatgpt_proxy.bench.load.
+
+Run with:
+
+    python -m chatgpt_proxy.bench.fake_server --servers 50
+
+And point the app to it with the environment variables:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8088/v1
+    OPENAI_API_KEY=fake
+    STEAM_WEB_API_URL=http://127.0.0.1:8088
+    STEAM_WEB_API_KEY=fake
+"""
+
+import asyncio
+import ipaddress
+from collections.abc import Awaitable
+from collections.abc import Callable
+
+import click
+import httpx
+import sanic
+from sanic import HTTPResponse
+from sanic import Request
+
+from chatgpt_proxy.bench.fake_openai import FakeModel
+from chatgpt_proxy.bench.fake_openai import FakeResponsesAPI
+from chatgpt_proxy.bench.fake_openai import lognormal_latency
+from chatgpt_proxy.bench.fake_steam import FakeSteamWebAPI
+
+Handler = Callable[[httpx.Request], Awaitable[httpx.Response]]
+
+# Headers set by Sanic for the response.
+_skipped_headers = {"content-length", "content-type", "transfer-encoding", "connection"}
+
+
+async def _forward(request: Request, handler: Handler) -> HTTPResponse:
+    resp = await handler(httpx.Request(
+        method=request.method,
+        url=request.url,
+        headers=dict(request.headers),
+        content=request.body,
+    ))
+    return HTTPResponse(
+        body=resp.content,
+        status=resp.status_code,
+        headers={k: v for k, v in resp.headers.items() if k.lower() not in _skipped_headers},
+        content_type=resp.headers.get("content-type"),
+    )
+
+
+def make_fake_server_app(
+        responses_api: FakeResponsesAPI,
+        steam_web_api: FakeSteamWebAPI,
+        steam_latency: float = 0.0,
+        name: str = "ChatGPTProxyBenchFakes",
+) -> sanic.Sanic:
+    app = sanic.Sanic(name)
+
+    async def steam_handler(request: httpx.Request) -> httpx.Response:
+        if steam_latency > 0:
+            await asyncio.sleep(steam_latency)
+        return steam_web_api.handler(request)
+
+    @app.post("/v1/responses")
+    async def create_response(request: Request) -> HTTPResponse:
+        return await _forward(request, responses_api.handler)
+
+    @app.get("/IGameServersService/GetServerList/v1/")
+    async def get_server_list(request: Request) -> HTTPResponse:
+        return await _forward(request, steam_handler)
+
+    return app
+
+
+@click.command()
+@click.option("--host", type=str, default="127.0.0.1")
+@click.option("--port", type=int, default=8088)
+@click.option("--servers", "-n", type=int, default=50,
+              help="Number of game servers in the server list.")
+@click.option("--server-address", type=ipaddress.IPv4Address,
+              default=ipaddress.IPv4Address("127.0.0.1"))
+@click.option("--first-port", type=int, default=7777,
+              help="Game port of the first game server, the rest use the following ports.")
+@click.option("--latency-median", type=float, default=1.5,
+              help="Median Responses API latency in seconds.")
+@click.option("--latency-p99", type=float, default=8.0,
+              help="99th percentile Responses API latency in seconds.")
+@click.option("--error-rate", type=float, default=0.0)
+@click.option("--rate-limit-rate", type=float, default=0.0)
+@click.option("--steam-latency", type=float, default=0.050)
+@click.option("--seed", type=int, default=None)
+def main(
+        host: str,
+        port: int,
+        servers: int,
+        server_address: ipaddress.IPv4Address,
+        first_port: int,
+        latency_median: float,
+        latency_p99: float,
+        error_rate: float,
+        rate_limit_rate: float,
+        steam_latency: float,
+        seed: int | None,
+) -> None:
+    responses_api = FakeResponsesAPI(
+        default_model=FakeModel(
+            latency=lognormal_latency(latency_median, latency_p99),
+            error_rate=error_rate,
+            rate_limit_rate=rate_limit_rate,
+        ),
+        seed=seed,
+    )
+    steam_web_api = FakeSteamWebAPI(
+        servers=[(server_address, first_port + i) for i in range(servers)],
+    )
+    app = make_fake_server_app(responses_api, steam_web_api, steam_latency=steam_latency)
+    app.run(host=host, port=port, single_process=True, access_log=False)
+
+
+if __name__ == "__main__":
+    main()
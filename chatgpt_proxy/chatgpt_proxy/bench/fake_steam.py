@@ -0,0 +1,120 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Local fake of the Steam Web API IGameServersService/GetServerList
+endpoint. Supports the gamedir and gameaddr filters and the limit
+parameter, which are the only ones used by chatgpt_proxy.
+"""
+
+import asyncio
+import ipaddress
+import threading
+
+import httpx
+
+
+class FakeSteamWebAPI:
+    def __init__(
+            self,
+            servers: list[tuple[ipaddress.IPv4Address, int]] | None = None,
+            api_key: str | None = None,
+    ):
+        self.servers = list(servers or [])
+        self.api_key = api_key
+        self.num_requests = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_servers(
+            num: int,
+            first_address: ipaddress.IPv4Address = ipaddress.IPv4Address("10.0.0.1"),
+            port: int = 7777,
+    ) -> list[tuple[ipaddress.IPv4Address, int]]:
+        return [(first_address + i, port) for i in range(num)]
+
+    @staticmethod
+    def parse_filter(filter_: str) -> dict[str, str]:
+        parts = filter_.split("\\")[1:]
+        return dict(zip(parts[0::2], parts[1::2]))
+
+    def server_info(self, address: ipaddress.IPv4Address, port: int) -> dict:
+        return {
+            "addr": f"{address}:27015",
+            "gameport": port,
+            "steamid": "90000000000000000",
+            "name": f"Fake RS2 server {address}:{port}",
+            "appid": 418460,
+            "gamedir": "RS2",
+            "version": "1094",
+            "product": "RS2",
+            "region": 255,
+            "players": 0,
+            "max_players": 64,
+            "bots": 0,
+            "map": "VNTE-CuChi",
+            "secure": True,
+            "dedicated": True,
+            "os": "w",
+            "gametype": "ROGame.ROGameInfoTerritories",
+        }
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            self.num_requests += 1
+
+        params = request.url.params
+        if self.api_key is not None and params.get("key") != self.api_key:
+            return httpx.Response(403)
+
+        filters = self.parse_filter(params.get("filter", ""))
+        servers = self.servers
+        if filters.get("gamedir", "rs2").lower() != "rs2":
+            servers = []
+        if "gameaddr" in filters:
+            address, _, port = filters["gameaddr"].rpartition(":")
+            servers = [
+                server for server in servers
+                if str(server[0]) == address and str(server[1]) == port
+            ]
+
+        limit = int(params.get("limit", 100))
+        return httpx.Response(
+            200,
+            json={
+                "response": {
+                    "servers": [self.server_info(*server) for server in servers[:limit]],
+                },
+            },
+        )
+
+    def transport(self, latency: float = 0.0) -> httpx.MockTransport:
+        """Transport for httpx.AsyncClient, optionally simulating
+        network latency for every request.
+        """
+        if latency <= 0:
+            return httpx.MockTransport(self.handler)
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(latency)
+            return self.handler(request)
+
+        return httpx.MockTransport(handler)
@@ -0,0 +1,410 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Load generator simulating game servers running the ChatGPTBots
+mutator against a running chatgpt_proxy app.
+
+Like the mutator's request queue, every simulated game server sends
+its requests one at a time, with a random think time between them:
+a new game, its initial players, then a mix of kills, player score
+updates, chat messages and messages to the LLM, and finally the end
+of the game. Per-route p50/p99 latencies and throughput are reported.
+
+API keys of the simulated game servers are inserted into the app's
+database. Run the app against the fakes of chatgpt_proxy.bench.fake_server,
+then run with:
+
+    DATABASE_URL=... SANIC_SECRET=... python -m chatgpt_proxy.bench.load --servers 50
+
+NOTE: the app sees all the simulated game servers at the same address,
+with a separate game port each. The app must not run in the production
+environment, where the address is taken from a proxy header.
+"""
+
+import asyncio
+import datetime
+import ipaddress
+import math
+import os
+import random
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from dataclasses import field
+from enum import StrEnum
+
+import asyncpg
+import click
+import httpx
+
+from chatgpt_proxy.auth import auth
+from chatgpt_proxy.db.models import SayType
+from chatgpt_proxy.db.models import Team
+from chatgpt_proxy.gen_api_key import insert_api_key
+from chatgpt_proxy.log import logger
+from chatgpt_proxy.utils import utcnow
+
+default_base_url = "http://127.0.0.1:8000/api/v1/"
+default_players_per_game = 32
+# Mean time between the requests of a game server, in seconds.
+default_think_time = 0.5
+default_requests_per_game = 500
+# Messages wait for the LLM.
+default_timeout = 120.0
+api_key_ttl = datetime.timedelta(days=1)
+
+levels = ["VNTE-CuChi", "VNSK-Riverbed", "VNTE-Hill937", "VNSU-AnLaoValley", "VNTE-HueCity"]
+damage_types = [
+    "RODmgType_M16A1Bullet",
+    "RODmgType_AK47Bullet",
+    "RODmgType_M79Grenade",
+    "RODmgType_MD82Mine",
+    "RODmgType_MattockBash",
+]
+chat_lines = ["gg", "need ammo", "push B!", "where is the commander?", "nice shot", "lol"]
+messages = [
+    "who is winning?",
+    "which objective should we attack next?",
+    "roast the other team",
+    "who has the most kills?",
+]
+
+
+class Route(StrEnum):
+    PostGame = "POST /game"
+    PutPlayer = "PUT /game/<id>/player/<id>"
+    PostKill = "POST /game/<id>/kill"
+    PostChatMessage = "POST /game/<id>/chat_message"
+    PostMessage = "POST /game/<id>/message"
+    PutGame = "PUT /game/<id>"
+
+
+# Relative frequencies of the requests during a game.
+traffic_mix = {
+    Route.PostKill: 10,
+    Route.PutPlayer: 10,
+    Route.PostChatMessage: 3,
+    Route.PostMessage: 1,
+}
+
+
+@dataclass(slots=True)
+class RouteStats:
+    latencies: list[float] = field(default_factory=list)
+    # Failed requests and responses with status >= 400.
+    errors: int = 0
+
+    def percentile(self, p: float) -> float:
+        """Nearest-rank percentile of the latencies, p in (0, 1]."""
+        if not self.latencies:
+            return math.nan
+        latencies = sorted(self.latencies)
+        return latencies[max(0, math.ceil(p * len(latencies)) - 1)]
+
+
+@dataclass(slots=True)
+class LoadResult:
+    stats: dict[Route, RouteStats]
+    elapsed: float
+
+
+def format_report(result: LoadResult) -> str:
+    lines = [f"{'route':<32} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}"]
+    total = RouteStats()
+    for route in Route:
+        stats = result.stats.get(route)
+        if stats is None or not stats.latencies:
+            continue
+        total.latencies.extend(stats.latencies)
+        total.errors += stats.errors
+        lines.append(_format_row(route, stats, result.elapsed))
+    lines.append(_format_row("total", total, result.elapsed))
+    return "\n".join(lines)
+
+
+def _format_row(name: str, stats: RouteStats, elapsed: float) -> str:
+    return (f"{name:<32} {len(stats.latencies):>9} {stats.errors:>7} "
+            f"{len(stats.latencies) / elapsed:>8.1f} "
+            f"{stats.percentile(0.50) * 1000:>9.1f} {stats.percentile(0.99) * 1000:>9.1f}")
+
+
+@dataclass(slots=True)
+class _Player:
+    id: int
+    name: str
+    team: Team
+    score: int = 0
+
+
+class SimulatedGameServer:
+    def __init__(
+            self,
+            client: httpx.AsyncClient,
+            port: int,
+            stats: dict[Route, RouteStats],
+            rng: random.Random,
+            players: int = default_players_per_game,
+            think_time: float = default_think_time,
+            requests_per_game: int = default_requests_per_game,
+    ):
+        self.client = client
+        self.port = port
+        self.stats = stats
+        self.rng = rng
+        self.players = players
+        self.think_time = think_time
+        self.requests_per_game = requests_per_game
+
+    async def run(self, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            await self.play_game(deadline)
+
+    async def think(self) -> None:
+        if self.think_time > 0:
+            await asyncio.sleep(self.rng.expovariate(1.0 / self.think_time))
+
+    async def request(
+            self,
+            route: Route,
+            method: str,
+            path: str,
+            content: str | None = None,
+            headers: dict[str, str] | None = None,
+    ) -> httpx.Response | None:
+        stats = self.stats.setdefault(route, RouteStats())
+        resp: httpx.Response | None = None
+        start = time.perf_counter()
+        try:
+            resp = await self.client.request(method, path, content=content, headers=headers)
+            if resp.status_code >= 400:
+                stats.errors += 1
+        except httpx.HTTPError as e:
+            logger.debug("{} failed: {}: {}", route, type(e).__name__, e)
+            stats.errors += 1
+        stats.latencies.append(time.perf_counter() - start)
+        return resp
+
+    async def play_game(self, deadline: float) -> None:
+        level = self.rng.choice(levels)
+        resp = await self.request(Route.PostGame, "POST", "game", f"{level}\n{self.port}")
+        if resp is None or resp.status_code != 201:
+            await self.think()
+            return
+
+        game_id, _, game_token = resp.text.split("\n")
+        headers = {auth.game_token_header: game_token}
+        start = time.monotonic()
+        players = [
+            _Player(id=i, name=f"Player{i}", team=Team.North if i % 2 else Team.South)
+            for i in range(self.players)
+        ]
+
+        for player in players:
+            await self.put_player(game_id, headers, player)
+
+        routes = list(traffic_mix)
+        weights = list(traffic_mix.values())
+        for _ in range(self.requests_per_game):
+            if time.monotonic() >= deadline:
+                break
+            await self.think()
+            route = self.rng.choices(routes, weights)[0]
+            if route == Route.PostKill:
+                killer, victim = self.rng.sample(players, 2)
+                killer.score += 10
+                await self.request(
+                    route, "POST", f"game/{game_id}/kill",
+                    f"{time.monotonic() - start}\n{killer.name}\n{victim.name}\n"
+                    f"{killer.team}\n{victim.team}\n{self.rng.choice(damage_types)}\n"
+                    f"{self.rng.uniform(1.0, 300.0):.2f}",
+                    headers,
+                )
+            elif route == Route.PutPlayer:
+                await self.put_player(game_id, headers, self.rng.choice(players))
+            elif route == Route.PostChatMessage:
+                player = self.rng.choice(players)
+                await self.request(
+                    route, "POST", f"game/{game_id}/chat_message",
+                    f"{player.name}\n{player.team}\n{SayType.ALL}\n{self.rng.choice(chat_lines)}",
+                    headers,
+                )
+            elif route == Route.PostMessage:
+                player = self.rng.choice(players)
+                await self.request(
+                    route, "POST", f"game/{game_id}/message",
+                    f"{SayType.ALL}\n{player.team}\n{player.name}\n{self.rng.choice(messages)}",
+                    headers,
+                )
+
+        await self.request(Route.PutGame, "PUT", f"game/{game_id}",
+                           f"{time.monotonic() - start}", headers)
+
+    async def put_player(self, game_id: str, headers: dict[str, str], player: _Player) -> None:
+        await self.request(
+            Route.PutPlayer, "PUT", f"game/{game_id}/player/{player.id}",
+            f"{player.name}\n{player.team}\n{player.score}",
+            headers,
+        )
+
+
+async def provision_api_keys(
+        conn: asyncpg.Connection,
+        secret: str,
+        address: ipaddress.IPv4Address,
+        ports: Sequence[int],
+) -> list[str]:
+    """Create an API key for each simulated game server."""
+    expires_at = utcnow() + api_key_ttl
+    return [
+        await insert_api_key(
+            conn=conn,
+            game_server_address=address,
+            game_server_port=port,
+            secret=secret,
+            issuer=auth.jwt_issuer,
+            audience=auth.jwt_audience,
+            expires_at=expires_at,
+            name=f"chatgpt_proxy.bench {address}:{port}",
+        )
+        for port in ports
+    ]
+
+
+async def run_load(
+        base_url: str,
+        servers: Sequence[tuple[int, str]],
+        duration: float,
+        players: int = default_players_per_game,
+        think_time: float = default_think_time,
+        requests_per_game: int = default_requests_per_game,
+        timeout: float = default_timeout,
+        seed: int | None = None,
+) -> LoadResult:
+    """Run the simulated game servers, (game port, API key) pairs,
+    against the app at base_url for duration seconds.
+    """
+    stats: dict[Route, RouteStats] = {}
+    rng = random.Random(seed)
+    # NOTE: a client per game server, like separate game server processes.
+    clients = [
+        httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout,
+        )
+        for _, api_key in servers
+    ]
+    game_servers = [
+        SimulatedGameServer(
+            client=client,
+            port=port,
+            stats=stats,
+            rng=random.Random(rng.random()),
+            players=players,
+            think_time=think_time,
+            requests_per_game=requests_per_game,
+        )
+        for client, (port, _) in zip(clients, servers)
+    ]
+
+    start = time.monotonic()
+    try:
+        await asyncio.gather(*(server.run(start + duration) for server in game_servers))
+    finally:
+        await asyncio.gather(*(client.aclose() for client in clients))
+    return LoadResult(stats=stats, elapsed=time.monotonic() - start)
+
+
+async def async_main(
+        base_url: str,
+        num_servers: int,
+        server_address: ipaddress.IPv4Address,
+        first_port: int,
+        duration: float,
+        players: int,
+        think_time: float,
+        requests_per_game: int,
+        seed: int | None,
+) -> LoadResult:
+    ports = [first_port + i for i in range(num_servers)]
+    conn = await asyncpg.connect(os.environ["DATABASE_URL"])
+    try:
+        api_keys = await provision_api_keys(
+            conn=conn,
+            secret=os.environ["SANIC_SECRET"],
+            address=server_address,
+            ports=ports,
+        )
+    finally:
+        await conn.close()
+
+    return await run_load(
+        base_url=base_url,
+        servers=list(zip(ports, api_keys)),
+        duration=duration,
+        players=players,
+        think_time=think_time,
+        requests_per_game=requests_per_game,
+        seed=seed,
+    )
+
+
+@click.command()
+@click.option("--url", type=str, default=default_base_url, help="API base URL.")
+@click.option("--servers", "-n", type=int, default=50, help="Number of game servers.")
+@click.option("--server-address", type=ipaddress.IPv4Address,
+              default=ipaddress.IPv4Address("127.0.0.1"),
+              help="Game server address, as seen by the app.")
+@click.option("--first-port", type=int, default=7777,
+              help="Game port of the first game server, the rest use the following ports.")
+@click.option("--duration", "-d", type=float, default=60.0, help="Duration in seconds.")
+@click.option("--players", type=int, default=default_players_per_game)
+@click.option("--think-time", type=float, default=default_think_time)
+@click.option("--requests-per-game", type=int, default=default_requests_per_game)
+@click.option("--seed", type=int, default=None)
+def main(
+        url: str,
+        servers: int,
+        server_address: ipaddress.IPv4Address,
+        first_port: int,
+        duration: float,
+        players: int,
+        think_time: float,
+        requests_per_game: int,
+        seed: int | None,
+) -> None:
+    result = asyncio.run(async_main(
+        base_url=url,
+        num_servers=servers,
+        server_address=server_address,
+        first_port=first_port,
+        duration=duration,
+        players=players,
+        think_time=think_time,
+        requests_per_game=requests_per_game,
+        seed=seed,
+    ))
+    print(format_report(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,31 @@
+from .cache import CacheLimits
 from .cache import CacheNamespace
 from .cache import app_cache
+from .cache import cache_limits
+from .cache import cache_stats
+from .cache import close_caches
 from .cache import db_cache
+from .cache import start_caches
+from .decorators import CachedQuery
+from .decorators import cached_query
+from .memory import BoundedMemoryCache
+from .memory import CacheStats
+from .memory import EvictionPolicy
+from .tiered import TieredCache
 
 __all__ = [
+    "BoundedMemoryCache",
+    "CacheLimits",
     "CacheNamespace",
+    "CacheStats",
+    "CachedQuery",
+    "EvictionPolicy",
+    "TieredCache",
     "app_cache",
+    "cache_limits",
+    "cache_stats",
+    "cached_query",
+    "close_caches",
     "db_cache",
+    "start_caches",
 ]
@@ -21,11 +21,20 @@
 # SOFTWARE.
 
 import os
+from dataclasses import dataclass
 from enum import StrEnum
 
 import aiocache
 import redis.asyncio as redis
-
+from aiocache.serializers import BaseSerializer
+from aiocache.serializers import JsonSerializer
+from aiocache.serializers import PickleSerializer
+
+from chatgpt_proxy.cache.memory import BoundedMemoryCache
+from chatgpt_proxy.cache.memory import CacheStats
+from chatgpt_proxy.cache.memory import EvictionPolicy
+from chatgpt_proxy.cache.tiered import RedisInvalidationChannel
+from chatgpt_proxy.cache.tiered import TieredCache
 from chatgpt_proxy.log import logger
 from chatgpt_proxy.utils import is_prod_env
 
@@ -36,22 +45,91 @@ class CacheNamespace(StrEnum):
     App = "app"
 
 
-_default_cache = "redis" if is_prod_env else "memory"
+@dataclass(slots=True, frozen=True)
+class CacheLimits:
+    # Default TTL of entries, None means no expiration.
+    ttl: float | None
+    # Limits of the in-process memory cache, or the L1 of a tiered cache.
+    max_entries: int
+    max_bytes: int
+    eviction: EvictionPolicy
+    # Maximum time an entry is kept in L1 without checking L2.
+    l1_ttl: float
+
+
+cache_limits: dict[CacheNamespace, CacheLimits] = {
+    # Query results, kept short since not all writers invalidate them.
+    CacheNamespace.Database: CacheLimits(
+        ttl=60.0,
+        max_entries=16384,
+        max_bytes=32 * 1024 * 1024,
+        eviction=EvictionPolicy.TinyLFU,
+        l1_ttl=5.0,
+    ),
+    CacheNamespace.App: CacheLimits(
+        ttl=None,
+        max_entries=16384,
+        max_bytes=16 * 1024 * 1024,
+        eviction=EvictionPolicy.LRU,
+        l1_ttl=30.0,
+    ),
+}
+
+# NOTE: database query results are arbitrary Python objects.
+_serializers: dict[CacheNamespace, type[BaseSerializer]] = {
+    CacheNamespace.Database: PickleSerializer,
+    CacheNamespace.App: JsonSerializer,
+}
+
+_default_cache = "tiered" if is_prod_env else "memory"
 _cache_method = os.getenv("CHATGPT_PROXY_CACHE_METHOD", _default_cache).lower().strip()
 
 
-def setup_memory_cache(namespace: CacheNamespace) -> aiocache.SimpleMemoryCache:
-    return aiocache.SimpleMemoryCache(
+def setup_memory_cache(namespace: CacheNamespace) -> BoundedMemoryCache:
+    limits = cache_limits[namespace]
+    return BoundedMemoryCache(
+        max_entries=limits.max_entries,
+        max_bytes=limits.max_bytes,
+        eviction=limits.eviction,
         namespace=namespace,
+        ttl=limits.ttl,
     )
 
 
-def setup_redis_cache(namespace: CacheNamespace) -> aiocache.RedisCache:
+def make_redis_client() -> redis.Redis:
     redis_url = os.environ["REDIS_URL"]
-    redis_client = redis.Redis.from_url(redis_url)
-    return aiocache.RedisCache(
-        redis_client,
+    return redis.Redis.from_url(redis_url)
+
+
+def setup_redis_cache(
+        namespace: CacheNamespace,
+        redis_client: redis.Redis | None = None,
+) -> aiocache.RedisCache:
+    cache = aiocache.RedisCache(
+        namespace=namespace,
+        serializer=_serializers[namespace](),
+        ttl=cache_limits[namespace].ttl,
+    )
+    # NOTE: aiocache 0.12 does not accept a client instance
+    # and only supports host/port configuration, replace the
+    # client it creates to support all REDIS_URL formats.
+    cache.client = redis_client or make_redis_client()
+    return cache
+
+
+def setup_tiered_cache(namespace: CacheNamespace) -> TieredCache:
+    limits = cache_limits[namespace]
+    redis_client = make_redis_client()
+    return TieredCache(
+        l2=setup_redis_cache(namespace, redis_client),
+        channel=RedisInvalidationChannel(redis_client),
+        l1_max_entries=limits.max_entries,
+        l1_max_bytes=limits.max_bytes,
+        l1_eviction=limits.eviction,
+        l1_ttl=limits.l1_ttl,
         namespace=namespace,
+        serializer=_serializers[namespace](),
+        ttl=limits.ttl,
     )
 
 
@@ -62,21 +140,21 @@ app_cache: aiocache.BaseCache
 def setup_cache(namespace: CacheNamespace) -> aiocache.BaseCache:
     global _cache_method
 
-    if _cache_method == "redis":
+    if _cache_method in ("redis", "tiered"):
         if "REDIS_URL" not in os.environ and not is_prod_env:
             logger.warning(
-                f"requested {namespace} cache method is 'redis', but no REDIS_URL is set, "
-                f"falling back to in-memory cache (is_prod_env={is_prod_env})"
+                f"requested {namespace} cache method is '{_cache_method}', but no REDIS_URL "
+                f"is set, falling back to in-memory cache (is_prod_env={is_prod_env})"
             )
             cache = setup_memory_cache(namespace)
+        elif _cache_method == "tiered":
+            cache = setup_tiered_cache(namespace)
         else:
             cache = setup_redis_cache(namespace)
-        pass  # TODO
     elif _cache_method == "memory":
         cache = setup_memory_cache(namespace)
-        pass  # TODO
     else:
-        logger.error("invalid cache method: '{}', defaulting to memory")
+        logger.error("invalid cache method: '{}', defaulting to memory", _cache_method)
         _cache_method = "memory"
         cache = setup_memory_cache(namespace)
     return cache
@@ -85,6 +163,32 @@ def setup_cache(namespace: CacheNamespace) -> aiocache.BaseCache:
 db_cache = setup_cache(CacheNamespace.Database)
 app_cache = setup_cache(CacheNamespace.App)
 
+
+def start_caches() -> None:
+    """Start the L1 invalidation listeners of tiered caches and the
+    expiry sweeps of memory caches. Must be called from the event
+    loop the caches are used in.
+    """
+    for cache in (db_cache, app_cache):
+        if isinstance(cache, (TieredCache, BoundedMemoryCache)):
+            cache.start()
+
+
+def cache_stats() -> dict[str, CacheStats]:
+    """In-process cache statistics per namespace. For tiered
+    caches, these are the statistics of the L1 cache.
+    """
+    return {
+        str(cache.namespace): cache.stats()
+        for cache in (db_cache, app_cache)
+        if isinstance(cache, (TieredCache, BoundedMemoryCache))
+    }
+
+
+async def close_caches() -> None:
+    await app_cache.close()
+    await db_cache.close()
+
 # NOTE: this does not work here, so instead we'll close the cache when
 # the Sanic application exits.
 # asyncio_atexit.register(cache.close)
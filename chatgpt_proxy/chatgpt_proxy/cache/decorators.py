@@ -0,0 +1,140 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Caching decorators."""
+
+import inspect
+from functools import wraps
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Generic
+from typing import ParamSpec
+from typing import TypeVar
+
+import aiocache
+
+from chatgpt_proxy.cache import cache as cache_module
+from chatgpt_proxy.log import logger
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# Arguments of database query functions that do not affect the result.
+_default_ignored_args = ("conn", "timeout")
+
+
+class CachedQuery(Generic[P, R]):
+    """Query function wrapped by cached_query."""
+
+    def __init__(
+            self,
+            func: Callable[P, Awaitable[R]],
+            ttl: float | None,
+            cache: aiocache.BaseCache | None,
+            skip_cache_func: Callable[[R], bool],
+            ignored_args: tuple[str, ...],
+    ):
+        self.func = func
+        self.ttl = ttl
+        self._cache = cache
+        self.skip_cache_func = skip_cache_func
+        self.ignored_args = ignored_args
+        self._signature = inspect.signature(func)
+        wraps(func)(self)
+
+    @property
+    def cache(self) -> aiocache.BaseCache:
+        # NOTE: resolved lazily to allow replacing db_cache.
+        return self._cache if self._cache is not None else cache_module.db_cache
+
+    def cache_key(self, *args: Any, **kwargs: Any) -> str:
+        """Cache key for the given call arguments. Arguments that are
+        not part of the key, such as conn, can be omitted.
+        """
+        bound = self._signature.bind_partial(*args, **kwargs)
+        bound.apply_defaults()
+        key_args = ",".join(
+            f"{name}={value}"
+            for name, value in bound.arguments.items()
+            if name not in self.ignored_args
+        )
+        return f"{self.func.__name__}({key_args})"
+
+    async def __call__(self, *args: P.args, **kwargs: P.kwargs) -> R:
+        key = self.cache_key(*args, **kwargs)
+        try:
+            value = await self.cache.get(key)
+            if value is not None:
+                return value
+        except Exception as e:
+            logger.warning("cached_query {}: cache get failed: {}: {}", key, type(e).__name__, e)
+
+        result = await self.func(*args, **kwargs)
+
+        if not self.skip_cache_func(result):
+            try:
+                if self.ttl is None:
+                    await self.cache.set(key, result)
+                else:
+                    await self.cache.set(key, result, ttl=self.ttl)
+            except Exception as e:
+                logger.warning("cached_query {}: cache set failed: {}: {}",
+                               key, type(e).__name__, e)
+        return result
+
+    async def invalidate(self, *args: Any, **kwargs: Any) -> None:
+        key = self.cache_key(*args, **kwargs)
+        try:
+            await self.cache.delete(key)
+        except Exception as e:
+            logger.warning("cached_query {}: cache delete failed: {}: {}",
+                           key, type(e).__name__, e)
+
+
+def cached_query(
+        ttl: float | None = None,
+        cache: aiocache.BaseCache | None = None,
+        skip_cache_func: Callable[[Any], bool] = lambda result: result is None,
+        ignored_args: tuple[str, ...] = _default_ignored_args,
+) -> Callable[[Callable[P, Awaitable[R]]], CachedQuery[P, R]]:
+    """Cache the results of a database query function in db_cache
+    (by default), keyed by the function name and its arguments,
+    excluding ignored_args. Results for which skip_cache_func
+    returns True (None by default) are not cached. If ttl is None,
+    the default TTL of the cache is used.
+
+    Cache errors are logged and the query is executed as is. Use
+    the invalidate method of the decorated function to drop cached
+    results, e.g. ``await select_game.invalidate(game_id=game_id)``.
+    """
+
+    def decorator(func: Callable[P, Awaitable[R]]) -> CachedQuery[P, R]:
+        return CachedQuery(
+            func=func,
+            ttl=ttl,
+            cache=cache,
+            skip_cache_func=skip_cache_func,
+            ignored_args=ignored_args,
+        )
+
+    return decorator
@@ -0,0 +1,414 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Bounded, size-aware in-process cache storage.
+
+BoundedStore limits the number of entries and their estimated total size
+in bytes. When full, entries are evicted in LRU order. With the TinyLFU
+eviction policy, a new entry is only admitted if it has been accessed
+more often recently than the LRU entry it would evict, which keeps
+frequently used entries cached during scans of one-off keys (e.g. a flood
+of requests from spoofed addresses).
+
+Expired entries are removed lazily on access and by periodic sweeps.
+"""
+
+import asyncio
+import dataclasses
+import heapq
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from enum import StrEnum
+from typing import Any
+from typing import Callable
+
+import aiocache
+from aiocache.serializers import NullSerializer
+
+from chatgpt_proxy.log import logger
+
+default_sweep_interval = 10.0
+# Maximum number of expired entries removed per sweep.
+default_sweep_batch_size = 1000
+
+MISSING = object()
+
+
+class EvictionPolicy(StrEnum):
+    LRU = "lru"
+    TinyLFU = "tinylfu"
+
+
+@dataclasses.dataclass(slots=True)
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Entries removed to make room for new entries.
+    evictions: int = 0
+    expirations: int = 0
+    # New entries not stored, either too large or not admitted by TinyLFU.
+    rejections: int = 0
+    entries: int = 0
+    resident_bytes: int = 0
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """Rough estimate of the memory used by value, in bytes."""
+    size = sys.getsizeof(value)
+    if _depth >= 3 or isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(
+            estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1)
+            for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(v, _depth + 1) for v in value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return size + sum(
+            estimate_size(getattr(value, field.name), _depth + 1)
+            for field in dataclasses.fields(value)
+        )
+    return size
+
+
+_halve = bytes(i >> 1 for i in range(256))
+
+
+class FrequencySketch:
+    """Count-min sketch of recent access frequencies for TinyLFU.
+    Counters saturate at 15 and are halved every sample_size
+    increments, so that old popularity fades out.
+    """
+
+    _depth = 4
+    _seeds = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5)
+    _max_count = 15
+
+    def __init__(self, capacity: int):
+        width = 64
+        while width < 8 * capacity:
+            width *= 2
+        self._bits = width.bit_length() - 1
+        self._table = [bytearray(width) for _ in range(self._depth)]
+        self.sample_size = 10 * capacity
+        self.additions = 0
+
+    def _indexes(self, key: str) -> list[int]:
+        # NOTE: hash() of str is randomized per process, use a stable
+        # hash so that collisions do not depend on PYTHONHASHSEED.
+        h = zlib.crc32(key.encode("utf-8"))
+        return [
+            (((h ^ seed) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> (64 - self._bits)
+            for seed in self._seeds
+        ]
+
+    def increment(self, key: str) -> None:
+        for row, index in zip(self._table, self._indexes(key)):
+            if row[index] < self._max_count:
+                row[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._age()
+
+    def frequency(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self._table, self._indexes(key)))
+
+    def _age(self) -> None:
+        self._table = [row.translate(_halve) for row in self._table]
+        self.additions //= 2
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Any, expires_at: float | None, size: int):
+        self.value = value
+        self.expires_at = expires_at  # time.monotonic() deadline.
+        self.size = size
+
+
+class BoundedStore:
+    """Synchronous bounded key-value store, see module docstring.
+    A limit of None means unlimited.
+    """
+
+    def __init__(
+            self,
+            max_entries: int | None = None,
+            max_bytes: int | None = None,
+            eviction: EvictionPolicy = EvictionPolicy.LRU,
+            sizeof: Callable[[Any], int] = estimate_size,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.sizeof = sizeof
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._expiry_heap: list[tuple[float, str]] = []
+        self._sketch = (
+            FrequencySketch(max_entries or 1024)
+            if eviction == EvictionPolicy.TinyLFU
+            else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> _Entry | None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.stats.entries -= 1
+            self.stats.resident_bytes -= entry.size
+        return entry
+
+    def _live_entry(self, key: str, now: float | None = None) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and (now or time.monotonic()) >= entry.expires_at:
+            self._remove(key)
+            self.stats.expirations += 1
+            return None
+        return entry
+
+    def get(self, key: str) -> Any:
+        """Returns MISSING if there is no live entry for key."""
+        if self._sketch is not None:
+            self._sketch.increment(key)
+        entry = self._live_entry(key)
+        if entry is None:
+            self.stats.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return entry.value
+
+    def contains(self, key: str) -> bool:
+        return self._live_entry(key) is not None
+
+    def _over_limits(self, num_entries: int, num_bytes: int) -> bool:
+        return ((self.max_entries is not None and num_entries > self.max_entries)
+                or (self.max_bytes is not None and num_bytes > self.max_bytes))
+
+    def set(self, key: str, value: Any, ttl: float | None = None, force: bool = False) -> bool:
+        """Store value, expiring in ttl seconds (never if ttl is None or 0).
+        With TinyLFU, new keys may not be admitted, unless force is True.
+        Returns False if the value was not stored.
+        """
+        size = self.sizeof(key) + self.sizeof(value)
+        if self._over_limits(1, size):
+            self._remove(key)
+            self.stats.rejections += 1
+            return False
+
+        if self._sketch is not None:
+            self._sketch.increment(key)
+        admitted = self._remove(key) is not None or force or self._sketch is None
+        if self._over_limits(len(self._entries) + 1, self.stats.resident_bytes + size):
+            self.sweep()
+        while self._over_limits(len(self._entries) + 1, self.stats.resident_bytes + size):
+            victim = next(iter(self._entries))
+            # NOTE: admission is only checked against the first victim.
+            if not admitted:
+                assert self._sketch is not None
+                if self._sketch.frequency(key) <= self._sketch.frequency(victim):
+                    self.stats.rejections += 1
+                    return False
+                admitted = True
+            self._remove(victim)
+            self.stats.evictions += 1
+
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._entries[key] = _Entry(value, expires_at, size)
+        self.stats.entries += 1
+        self.stats.resident_bytes += size
+        if expires_at is not None:
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+        return True
+
+    def expire(self, key: str, ttl: float | None) -> bool:
+        entry = self._live_entry(key)
+        if entry is None:
+            return False
+        entry.expires_at = time.monotonic() + ttl if ttl else None
+        if entry.expires_at is not None:
+            heapq.heappush(self._expiry_heap, (entry.expires_at, key))
+        return True
+
+    def delete(self, key: str) -> bool:
+        return self._remove(key) is not None
+
+    def clear(self, prefix: str | None = None) -> None:
+        if not prefix:
+            self._entries.clear()
+            self._expiry_heap.clear()
+            self.stats.entries = 0
+            self.stats.resident_bytes = 0
+            return
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            self._remove(key)
+
+    def sweep(self, max_entries: int = default_sweep_batch_size) -> int:
+        """Remove up to max_entries expired entries.
+        Returns the number of removed entries.
+        """
+        now = time.monotonic()
+        heap = self._expiry_heap
+        removed = 0
+        while heap and heap[0][0] <= now and removed < max_entries:
+            expires_at, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            # NOTE: heap items of overwritten entries are stale.
+            if entry is not None and entry.expires_at == expires_at:
+                self._remove(key)
+                self.stats.expirations += 1
+                removed += 1
+
+        if len(heap) > 2 * len(self._entries) + 64:
+            self._expiry_heap = [
+                (entry.expires_at, key)
+                for key, entry in self._entries.items()
+                if entry.expires_at is not None
+            ]
+            heapq.heapify(self._expiry_heap)
+        return removed
+
+
+async def run_sweeps(store: BoundedStore, interval: float, name: str) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = store.sweep()
+            if removed:
+                logger.debug("{}: swept {} expired entries", name, removed)
+        except Exception as e:
+            logger.opt(exception=e).error("{}: sweep failed", name)
+
+
+class BoundedMemoryCache(aiocache.BaseCache):
+    """aiocache memory backend using BoundedStore. Unlike SimpleMemoryCache,
+    expiry does not use a timer per key, call start() to run periodic sweeps.
+    """
+
+    NAME = "bounded_memory"
+
+    def __init__(
+            self,
+            max_entries: int | None = None,
+            max_bytes: int | None = None,
+            eviction: EvictionPolicy = EvictionPolicy.LRU,
+            sweep_interval: float = default_sweep_interval,
+            serializer=None,
+            **kwargs,
+    ):
+        super().__init__(serializer=serializer or NullSerializer(), **kwargs)
+        self.store = BoundedStore(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            eviction=eviction,
+        )
+        self.sweep_interval = sweep_interval
+        self._task: asyncio.Task | None = None
+
+    def stats(self) -> CacheStats:
+        return dataclasses.replace(self.store.stats)
+
+    def start(self) -> None:
+        if self._task is None:
+            name = f"BoundedMemoryCache-{self.namespace}"
+            self._task = asyncio.create_task(
+                run_sweeps(self.store, self.sweep_interval, name),
+                name=name,
+            )
+
+    async def _get(self, key, encoding="utf-8", _conn=None):
+        value = self.store.get(key)
+        return None if value is MISSING else value
+
+    async def _gets(self, key, encoding="utf-8", _conn=None):
+        return await self._get(key, encoding=encoding)
+
+    async def _multi_get(self, keys, encoding="utf-8", _conn=None):
+        return [await self._get(key) for key in keys]
+
+    async def _set(self, key, value, ttl=None, _cas_token=None, _conn=None):
+        if _cas_token is not None and _cas_token != await self._get(key):
+            return 0
+        return self.store.set(key, value, ttl=ttl)
+
+    async def _multi_set(self, pairs, ttl=None, _conn=None):
+        for key, value in pairs:
+            self.store.set(key, value, ttl=ttl)
+        return True
+
+    async def _add(self, key, value, ttl=None, _conn=None):
+        if self.store.contains(key):
+            raise ValueError(f"Key {key} already exists, use .set to update the value")
+        # NOTE: always admitted, add() is used for locks.
+        if not self.store.set(key, value, ttl=ttl, force=True):
+            raise ValueError(f"Key {key} is too large for the cache")
+        return True
+
+    async def _exists(self, key, _conn=None):
+        return self.store.contains(key)
+
+    async def _increment(self, key, delta, _conn=None):
+        entry = self.store._live_entry(key)
+        if entry is None:
+            self.store.set(key, delta, force=True)
+            return delta
+        try:
+            entry.value = int(entry.value) + delta
+        except ValueError:
+            raise TypeError("Value is not an integer") from None
+        return entry.value
+
+    async def _expire(self, key, ttl, _conn=None):
+        return self.store.expire(key, ttl)
+
+    async def _delete(self, key, _conn=None):
+        return int(self.store.delete(key))
+
+    async def _clear(self, namespace=None, _conn=None):
+        self.store.clear(prefix=namespace)
+        return True
+
+    async def _raw(self, command, *args, encoding="utf-8", _conn=None, **kwargs):
+        return getattr(self.store, command)(*args, **kwargs)
+
+    async def _redlock_release(self, key, value):
+        if await self._get(key) == value:
+            return int(self.store.delete(key))
+        return 0
+
+    async def _close(self, *args, _conn=None, **kwargs):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,310 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Two-tier cache with a bounded in-process cache (L1, see
+chatgpt_proxy.cache.memory) in front of a shared cache (L2),
+usually Redis.
+
+Writes go to L2 and are announced on an invalidation channel, which
+every worker subscribes to in order to drop its own L1 copies of the
+changed keys. L1 is bypassed while the subscription is not active, so
+an L1 entry can only outlive its L2 entry by at most l1_ttl seconds.
+"""
+
+import asyncio
+import dataclasses
+import uuid
+from typing import AsyncIterator
+from typing import Protocol
+
+import aiocache
+import redis.asyncio as redis
+from aiocache.serializers import JsonSerializer
+
+from chatgpt_proxy.cache.memory import MISSING
+from chatgpt_proxy.cache.memory import BoundedStore
+from chatgpt_proxy.cache.memory import CacheStats
+from chatgpt_proxy.cache.memory import EvictionPolicy
+from chatgpt_proxy.cache.memory import default_sweep_interval
+from chatgpt_proxy.cache.memory import run_sweeps
+from chatgpt_proxy.log import logger
+
+default_invalidation_channel = "chatgpt_proxy:cache_invalidation"
+default_l1_max_entries = 1024
+default_l1_max_bytes = 8 * 1024 * 1024
+default_l1_ttl = 10.0
+default_resubscribe_delay = 1.0
+default_max_resubscribe_delay = 30.0
+
+class InvalidationChannel(Protocol):
+    async def publish(self, message: str) -> None:
+        ...
+
+    def listen(self) -> AsyncIterator[str | None]:
+        """Yields None once subscribed, then the received messages."""
+        ...
+
+
+class RedisInvalidationChannel:
+    def __init__(self, client: redis.Redis, channel: str = default_invalidation_channel):
+        self.client = client
+        self.channel = channel
+
+    async def publish(self, message: str) -> None:
+        await self.client.publish(self.channel, message)
+
+    async def listen(self) -> AsyncIterator[str | None]:
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(self.channel)
+            async for message in pubsub.listen():
+                if message["type"] == "subscribe":
+                    yield None
+                elif message["type"] == "message":
+                    data = message["data"]
+                    yield data.decode("utf-8") if isinstance(data, bytes) else data
+        finally:
+            await pubsub.aclose()
+
+
+class TieredCache(aiocache.BaseCache):
+    """aiocache backend with an in-process L1 in front of the l2 backend.
+
+    Operations are passed to l2 with keys already namespaced and values
+    already serialized by this cache, l2's own namespace and serializer
+    are not used. If no channel is given, L1 is never invalidated by other
+    processes, which is only safe for single process deployments.
+    """
+
+    NAME = "tiered"
+
+    def __init__(
+            self,
+            l2: aiocache.BaseCache,
+            channel: InvalidationChannel | None = None,
+            l1_max_entries: int = default_l1_max_entries,
+            l1_max_bytes: int = default_l1_max_bytes,
+            l1_eviction: EvictionPolicy = EvictionPolicy.LRU,
+            l1_ttl: float = default_l1_ttl,
+            serializer=None,
+            **kwargs,
+    ):
+        super().__init__(serializer=serializer or JsonSerializer(), **kwargs)
+        self.l2 = l2
+        self.channel = channel
+        self.l1 = BoundedStore(
+            max_entries=l1_max_entries,
+            max_bytes=l1_max_bytes,
+            eviction=l1_eviction,
+        )
+        self.l1_ttl = l1_ttl
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.invalidations_received = 0
+        self._id = uuid.uuid4().hex
+        self._subscribed = False
+        # Incremented for every received invalidation, values read from L2
+        # are not put in L1 if an invalidation arrived during the read.
+        self._generation = 0
+        self._task: asyncio.Task | None = None
+        self._sweep_task: asyncio.Task | None = None
+
+    def stats(self) -> CacheStats:
+        return dataclasses.replace(self.l1.stats)
+
+    @property
+    def l1_enabled(self) -> bool:
+        return self.channel is None or self._subscribed
+
+    def _build_key(self, key, namespace=None):
+        ns = namespace if namespace is not None else self.namespace
+        if ns:
+            return f"{ns}:{key}"
+        return key
+
+    def start(self) -> None:
+        if self._sweep_task is None:
+            name = f"TieredCache-{self.namespace}"
+            self._sweep_task = asyncio.create_task(
+                run_sweeps(self.l1, default_sweep_interval, name),
+                name=f"{name}-sweep",
+            )
+        if self.channel is not None and self._task is None:
+            self._task = asyncio.create_task(self._listen(), name=f"TieredCache-{self.namespace}")
+
+    async def _listen(self) -> None:
+        assert self.channel is not None
+        delay = default_resubscribe_delay
+        while True:
+            try:
+                async for message in self.channel.listen():
+                    if message is None:
+                        self._subscribed = True
+                        delay = default_resubscribe_delay
+                        logger.debug("TieredCache {}: subscribed to invalidations", self.namespace)
+                    else:
+                        self._on_invalidation(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("TieredCache {}: invalidation subscription failed: {}: {}",
+                               self.namespace, type(e).__name__, e)
+            finally:
+                # Invalidations may be missed from now on.
+                self._subscribed = False
+                self.l1.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, default_max_resubscribe_delay)
+
+    def _on_invalidation(self, message: str) -> None:
+        sender, _, keys = message.partition("\n")
+        if sender == self._id:
+            return
+        self.invalidations_received += 1
+        self._generation += 1
+        for key in keys.split("\n"):
+            if key.startswith("*"):
+                self.l1.clear(prefix=key[1:])
+            else:
+                self.l1.delete(key)
+
+    async def _invalidate(self, *keys: str) -> None:
+        for key in keys:
+            if key.startswith("*"):
+                self.l1.clear(prefix=key[1:])
+            else:
+                self.l1.delete(key)
+        if self.channel is not None:
+            try:
+                await self.channel.publish("\n".join((self._id, *keys)))
+            except Exception as e:
+                logger.warning("TieredCache {}: failed to publish invalidation: {}: {}",
+                               self.namespace, type(e).__name__, e)
+
+    def _l1_ttl(self, ttl: float | None) -> float:
+        return self.l1_ttl if ttl is None else min(ttl, self.l1_ttl)
+
+    async def _get(self, key, encoding="utf-8", _conn=None):
+        if self.l1_enabled:
+            value = self.l1.get(key)
+            if value is not MISSING:
+                self.l1_hits += 1
+                return value
+
+        generation = self._generation
+        value = await self.l2._get(key, encoding=encoding)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.l2_hits += 1
+        if self.l1_enabled and generation == self._generation:
+            self.l1.set(key, value, self.l1_ttl)
+        return value
+
+    async def _gets(self, key, encoding="utf-8", _conn=None):
+        return await self._get(key, encoding=encoding)
+
+    async def _multi_get(self, keys, encoding="utf-8", _conn=None):
+        values = [self.l1.get(key) if self.l1_enabled else MISSING for key in keys]
+        missing = [i for i, value in enumerate(values) if value is MISSING]
+        self.l1_hits += len(keys) - len(missing)
+        if missing:
+            generation = self._generation
+            l2_values = await self.l2._multi_get([keys[i] for i in missing], encoding=encoding)
+            cache_l1 = self.l1_enabled and generation == self._generation
+            for i, value in zip(missing, l2_values):
+                values[i] = value
+                if value is None:
+                    self.misses += 1
+                    continue
+                self.l2_hits += 1
+                if cache_l1:
+                    self.l1.set(keys[i], value, self.l1_ttl)
+        return values
+
+    async def _set(self, key, value, ttl=None, _cas_token=None, _conn=None):
+        result = await self.l2._set(key, value, ttl=ttl, _cas_token=_cas_token)
+        await self._invalidate(key)
+        if result and self.l1_enabled:
+            self.l1.set(key, value, self._l1_ttl(ttl))
+        return result
+
+    async def _multi_set(self, pairs, ttl=None, _conn=None):
+        result = await self.l2._multi_set(pairs, ttl=ttl)
+        await self._invalidate(*(key for key, _ in pairs))
+        if self.l1_enabled:
+            for key, value in pairs:
+                self.l1.set(key, value, self._l1_ttl(ttl))
+        return result
+
+    async def _add(self, key, value, ttl=None, _conn=None):
+        result = await self.l2._add(key, value, ttl=ttl)
+        await self._invalidate(key)
+        return result
+
+    async def _exists(self, key, _conn=None):
+        # NOTE: always checked in L2, exists() is used for locks.
+        return await self.l2._exists(key)
+
+    async def _increment(self, key, delta, _conn=None):
+        result = await self.l2._increment(key, delta)
+        await self._invalidate(key)
+        return result
+
+    async def _expire(self, key, ttl, _conn=None):
+        result = await self.l2._expire(key, ttl)
+        await self._invalidate(key)
+        return result
+
+    async def _delete(self, key, _conn=None):
+        result = await self.l2._delete(key)
+        await self._invalidate(key)
+        return result
+
+    async def _clear(self, namespace=None, _conn=None):
+        # NOTE: unlike RedisCache, only clears this cache's namespace by default.
+        ns = namespace if namespace is not None else self.namespace
+        result = await self.l2._clear(ns)
+        await self._invalidate(f"*{ns}:" if ns else "*")
+        return result
+
+    async def _raw(self, command, *args, encoding="utf-8", _conn=None, **kwargs):
+        return await self.l2._raw(command, *args, encoding=encoding, **kwargs)
+
+    async def _redlock_release(self, key, value):
+        result = await self.l2._redlock_release(key, value)
+        await self._invalidate(key)
+        return result
+
+    async def _close(self, *args, _conn=None, **kwargs):
+        for task in (self._task, self._sweep_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._sweep_task = None
+        await self.l2._close()
@@ -1,9 +1,25 @@
 from . import models
+from . import notify
 from . import queries
+from . import statements
+from .buffer import WriteBehindBuffer
 from .db import pool_acquire
+from .locks import KeyedLock
+from .locks import game_event_locks
+from .notify import Invalidation
+from .notify import InvalidationKind
+from .notify import InvalidationListener
 
 __all__ = [
     "models",
+    "notify",
     "queries",
+    "statements",
+    "Invalidation",
+    "InvalidationKind",
+    "InvalidationListener",
+    "KeyedLock",
+    "WriteBehindBuffer",
+    "game_event_locks",
     "pool_acquire",
 ]
@@ -0,0 +1,310 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Write-behind buffering for high volume game event inserts."""
+
+import asyncio
+import datetime
+from collections.abc import Callable
+
+from asyncpg import Connection
+from asyncpg import Pool
+
+from chatgpt_proxy.db import models
+from chatgpt_proxy.db import queries
+from chatgpt_proxy.db.db import pool_acquire
+from chatgpt_proxy.db.locks import game_event_locks
+from chatgpt_proxy.log import logger
+
+default_max_rows = 200
+default_max_delay = 0.250
+
+game_kill_columns = (
+    "game_id",
+    "kill_time",
+    "killer_name",
+    "victim_name",
+    "killer_team",
+    "victim_team",
+    "damage_type",
+    "kill_distance_m",
+)
+
+game_chat_message_columns = (
+    "message",
+    "game_id",
+    "send_time",
+    "sender_name",
+    "sender_team",
+    "channel",
+)
+
+# Column index of game_id in the buffered records.
+_kill_game_id_idx = game_kill_columns.index("game_id")
+_chat_message_game_id_idx = game_chat_message_columns.index("game_id")
+
+# Called with the rows written by a flush, with their IDs.
+FlushCallback = Callable[[list[models.GameKill], list[models.GameChatMessage]], None]
+
+
+class WriteBehindBuffer:
+    """Per-worker buffer that collects game_kill and game_chat_message
+    rows and writes them in bulk with COPY, once max_rows rows are
+    buffered or max_delay seconds have passed, whichever comes first.
+
+    Rows are written on a best effort basis: rows belonging to games
+    that no longer exist are dropped, and so is a whole batch that
+    fails to be written for other reasons.
+
+    Row IDs are allocated from the identity sequences before the COPY,
+    so that on_flush can be told the IDs of the written rows. The games
+    of the rows are locked first, see chatgpt_proxy.db.locks.
+    """
+
+    def __init__(
+            self,
+            pool: Pool,
+            max_rows: int = default_max_rows,
+            max_delay: float = default_max_delay,
+            on_flush: FlushCallback | None = None,
+    ):
+        self.pool = pool
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.on_flush = on_flush
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self._kills: list[tuple] = []
+        self._chat_messages: list[tuple] = []
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._kills) + len(self._chat_messages)
+
+    def _check_open(self) -> None:
+        if self._closed:
+            raise RuntimeError("WriteBehindBuffer is closed")
+
+    def _added(self) -> None:
+        if len(self) >= self.max_rows:
+            self._full.set()
+
+    def add_game_kill(
+            self,
+            game_id: str,
+            kill_time: datetime.datetime,
+            killer_name: str,
+            victim_name: str,
+            killer_team: models.Team,
+            victim_team: models.Team,
+            damage_type: str,
+            kill_distance_m: float,
+    ) -> None:
+        self._check_open()
+        self._kills.append((
+            game_id,
+            kill_time,
+            killer_name,
+            victim_name,
+            int(killer_team),
+            int(victim_team),
+            damage_type,
+            kill_distance_m,
+        ))
+        self._added()
+
+    def add_game_chat_message(
+            self,
+            game_id: str,
+            message: str,
+            send_time: datetime.datetime,
+            sender_name: str,
+            sender_team: models.Team,
+            channel: models.SayType,
+    ) -> None:
+        self._check_open()
+        self._chat_messages.append((
+            message,
+            game_id,
+            send_time,
+            sender_name,
+            int(sender_team),
+            int(channel),
+        ))
+        self._added()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="WriteBehindBufferFlusher")
+
+    async def close(self) -> None:
+        """Stop the background flusher and write all remaining rows."""
+        self._closed = True
+        if self._task is not None:
+            # NOTE: the flusher is not cancelled, it may be in the middle
+            # of writing a batch. It stops after one more flush.
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.max_delay)
+            except TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.opt(exception=e).error("write-behind flush failed")
+
+    async def flush(self) -> int:
+        """Write all buffered rows. Returns the number of rows written."""
+        async with self._flush_lock:
+            self._full.clear()
+            kills, self._kills = self._kills, []
+            chat_messages, self._chat_messages = self._chat_messages, []
+            if not kills and not chat_messages:
+                return 0
+
+            num_rows = len(kills) + len(chat_messages)
+            game_ids = (
+                {kill[_kill_game_id_idx] for kill in kills}
+                | {msg[_chat_message_game_id_idx] for msg in chat_messages}
+            )
+            # NOTE: see chatgpt_proxy.db.locks.
+            async with game_event_locks.hold(game_ids):
+                try:
+                    async with pool_acquire(self.pool) as conn:
+                        async with conn.transaction():
+                            kills, chat_messages = await self._write(
+                                conn, game_ids, kills, chat_messages)
+                except (Exception, asyncio.CancelledError) as e:
+                    # NOTE: the rows were taken out of the buffer, count them
+                    # as dropped even when cancelled. The write may still have
+                    # been committed, but its rows are not reported to on_flush.
+                    self.rows_dropped += num_rows
+                    logger.error("write-behind: dropping {} kills and {} chat messages: {}: {}",
+                                 len(kills), len(chat_messages), type(e).__name__, e)
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    return 0
+
+                written = len(kills) + len(chat_messages)
+                self.rows_written += written
+                if written < num_rows:
+                    self.rows_dropped += num_rows - written
+                    logger.debug("write-behind: dropped {} rows of deleted games",
+                                 num_rows - written)
+
+                if self.on_flush is not None:
+                    try:
+                        self.on_flush(
+                            [_game_kill(kill) for kill in kills],
+                            [_game_chat_message(msg) for msg in chat_messages],
+                        )
+                    except Exception as e:
+                        logger.opt(exception=e).error("write-behind: on_flush failed")
+
+            return written
+
+    async def _write(
+            self,
+            conn: Connection,
+            game_ids: set[str],
+            kills: list[tuple],
+            chat_messages: list[tuple],
+    ) -> tuple[list[tuple], list[tuple]]:
+        """Write the records of the games that still exist, returning
+        the written records, prefixed with their allocated IDs.
+        """
+        existing = await queries.lock_games_for_events(conn=conn, game_ids=list(game_ids))
+        kills = [kill for kill in kills if kill[_kill_game_id_idx] in existing]
+        chat_messages = [
+            msg for msg in chat_messages
+            if msg[_chat_message_game_id_idx] in existing
+        ]
+        kills = await self._allocate_ids(conn, "game_kill", kills)
+        chat_messages = await self._allocate_ids(conn, "game_chat_message", chat_messages)
+        await self._copy_records(conn, kills, chat_messages)
+        return kills, chat_messages
+
+    @staticmethod
+    async def _allocate_ids(
+            conn: Connection,
+            table: str,
+            records: list[tuple],
+    ) -> list[tuple]:
+        if not records:
+            return records
+
+        ids = await conn.fetch(
+            """
+            SELECT nextval(pg_get_serial_sequence($1, 'id')) AS id
+            FROM generate_series(1, $2);
+            """,
+            f'"{table}"',
+            len(records),
+        )
+        return [
+            (record_id["id"], *record)
+            for record_id, record in zip(ids, records, strict=True)
+        ]
+
+    @staticmethod
+    async def _copy_records(
+            conn: Connection,
+            kills: list[tuple],
+            chat_messages: list[tuple],
+    ) -> None:
+        # NOTE: COPY writes the given values to identity
+        # columns, like INSERT with OVERRIDING SYSTEM VALUE.
+        if kills:
+            await conn.copy_records_to_table(
+                "game_kill",
+                records=kills,
+                columns=("id", *game_kill_columns),
+            )
+        if chat_messages:
+            await conn.copy_records_to_table(
+                "game_chat_message",
+                records=chat_messages,
+                columns=("id", *game_chat_message_columns),
+            )
+
+
+def _game_kill(record: tuple) -> models.GameKill:
+    kill = dict(zip(("id", *game_kill_columns), record, strict=True))
+    kill["killer_team"] = models.Team(str(kill["killer_team"]))
+    kill["victim_team"] = models.Team(str(kill["victim_team"]))
+    return models.GameKill(**kill)
+
+
+def _game_chat_message(record: tuple) -> models.GameChatMessage:
+    msg = dict(zip(("id", *game_chat_message_columns), record, strict=True))
+    msg["sender_team"] = models.Team(str(msg["sender_team"]))
+    msg["channel"] = models.SayType(str(msg["channel"]))
+    return models.GameChatMessage(**msg)
@@ -0,0 +1,86 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Ordering of game event writes.
+
+Event IDs are allocated from table-wide identity sequences when the rows
+are inserted, but the rows only become visible when committed. Readers
+keep track of the events they have seen by the highest event ID seen (a
+watermark), which would skip an event that is committed after an event
+with a greater ID has been seen.
+
+To keep the event IDs of a game in commit order, writers lock the game
+row before inserting its events and hold the lock until commit, see
+queries.lock_games_for_events. Within a worker, the writes of a game are
+also serialized with game_event_locks, which are held until the written
+events have been recorded in the in-memory game state, so that the state
+sees the events in commit order too.
+"""
+
+import asyncio
+from collections import Counter
+from collections.abc import AsyncGenerator
+from collections.abc import Iterable
+from contextlib import asynccontextmanager
+
+
+class KeyedLock:
+    """Per-worker asyncio locks by key. The lock of a key
+    only exists while it is held or waited for.
+    """
+
+    def __init__(self):
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._users: Counter[str] = Counter()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, keys: Iterable[str]) -> AsyncGenerator[None]:
+        """Hold the locks of all keys. NOTE: the locks are
+        acquired in sorted order, to avoid deadlocks.
+        """
+        sorted_keys = sorted(set(keys))
+        for key in sorted_keys:
+            self._users[key] += 1
+            if key not in self._locks:
+                self._locks[key] = asyncio.Lock()
+
+        held: list[asyncio.Lock] = []
+        try:
+            for key in sorted_keys:
+                lock = self._locks[key]
+                await lock.acquire()
+                held.append(lock)
+            yield
+        finally:
+            for lock in reversed(held):
+                lock.release()
+            for key in sorted_keys:
+                self._users[key] -= 1
+                if self._users[key] == 0:
+                    del self._users[key]
+                    del self._locks[key]
+
+
+game_event_locks = KeyedLock()
@@ -0,0 +1,121 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Database maintenance: deleting completed games and expired API keys.
+
+Deletes are done in bounded batches, each batch in its own transaction,
+until there is nothing left to delete or the time budget of the cycle
+runs out. The rest is left for the next cycle.
+
+Only a single maintenance cycle runs at a time across all nodes,
+coordinated with a Postgres advisory lock.
+"""
+
+import datetime
+import time
+from dataclasses import dataclass
+from typing import Awaitable
+from typing import Callable
+
+from asyncpg import Connection
+
+from chatgpt_proxy.db import queries
+
+default_batch_size = 500
+default_time_budget = 10.0
+
+# Arbitrary, but constant, key for the maintenance advisory lock.
+_advisory_lock_key = 0x4347_5042_4D41_494E
+
+
+@dataclass(slots=True, frozen=True)
+class MaintenanceResult:
+    deleted_games: int
+    deleted_api_keys: int
+    duration: float
+    # False if the time budget ran out before everything was deleted.
+    complete: bool
+
+
+async def _delete_in_batches(
+        conn: Connection,
+        delete_batch: Callable[[], Awaitable[int]],
+        batch_size: int,
+        deadline: float,
+) -> tuple[int, bool]:
+    deleted = 0
+    while time.monotonic() < deadline:
+        async with conn.transaction():
+            count = await delete_batch()
+        deleted += count
+        if count < batch_size:
+            return deleted, True
+    return deleted, False
+
+
+async def run_db_maintenance(
+        conn: Connection,
+        game_expiration: datetime.timedelta,
+        api_key_deletion_leeway: datetime.timedelta,
+        batch_size: int = default_batch_size,
+        time_budget: float = default_time_budget,
+) -> MaintenanceResult | None:
+    """Run a single maintenance cycle. Returns None if another
+    node is already running maintenance.
+    """
+    locked = await conn.fetchval("SELECT pg_try_advisory_lock($1);", _advisory_lock_key)
+    if not locked:
+        return None
+
+    try:
+        start = time.monotonic()
+        deadline = start + time_budget
+
+        deleted_games, games_complete = await _delete_in_batches(
+            conn,
+            lambda: queries.delete_completed_games(
+                conn,
+                game_expiration=game_expiration,
+                batch_size=batch_size,
+            ),
+            batch_size=batch_size,
+            deadline=deadline,
+        )
+        deleted_api_keys, api_keys_complete = await _delete_in_batches(
+            conn,
+            lambda: queries.delete_old_api_keys(
+                conn,
+                leeway=api_key_deletion_leeway,
+                batch_size=batch_size,
+            ),
+            batch_size=batch_size,
+            deadline=deadline,
+        )
+
+        return MaintenanceResult(
+            deleted_games=deleted_games,
+            deleted_api_keys=deleted_api_keys,
+            duration=time.monotonic() - start,
+            complete=games_complete and api_keys_complete,
+        )
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1);", _advisory_lock_key)
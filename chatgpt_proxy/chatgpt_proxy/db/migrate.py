@@ -0,0 +1,206 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Versioned database schema migrations.
+
+Migrations are SQL files in the migrations directory, named
+<version>_<name>.sql. Pending migrations are applied in version order,
+each in its own transaction, and recorded in the "schema_migration" table.
+
+Databases created from the old db.sql, before versioned migrations were
+introduced, are detected and baselined at version 1, so that they can be
+upgraded in place.
+
+Run with:
+
+    python -m chatgpt_proxy.db.migrate
+"""
+
+import asyncio
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import asyncpg
+import click
+from asyncpg import Connection
+
+from chatgpt_proxy.log import logger
+
+migrations_dir = Path(__file__).resolve().parent / "migrations"
+
+# Version of the schema created by the old db.sql.
+baseline_version = 1
+
+# Arbitrary, but constant, key for the migration advisory lock.
+_advisory_lock_key = 0x4347_5042_4D49_4752
+
+_default_conn_timeout = 60.0
+
+_migration_file_pattern = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+@dataclass(slots=True, frozen=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+
+def load_migrations(path: Path = migrations_dir) -> list[Migration]:
+    migrations: dict[int, Migration] = {}
+    for file in path.iterdir():
+        match = _migration_file_pattern.match(file.name)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"duplicate migration version {version}: '{file.name}'")
+        migrations[version] = Migration(
+            version=version,
+            name=match.group(2),
+            sql=file.read_text(),
+        )
+    return sorted(migrations.values(), key=lambda m: m.version)
+
+
+async def applied_versions(
+        conn: Connection,
+        timeout: float | None = _default_conn_timeout,
+) -> set[int]:
+    records = await conn.fetch(
+        """
+        SELECT version
+        FROM "schema_migration";
+        """,
+        timeout=timeout,
+    )
+    return {record["version"] for record in records}
+
+
+async def _ensure_migration_table(
+        conn: Connection,
+        timeout: float | None = _default_conn_timeout,
+):
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS "schema_migration"
+        (
+            version    INTEGER PRIMARY KEY,
+            name       TEXT        NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """,
+        timeout=timeout,
+    )
+
+
+async def _baseline(
+        conn: Connection,
+        migrations: list[Migration],
+        timeout: float | None = _default_conn_timeout,
+) -> bool:
+    """Mark the initial migration as applied for databases
+    created with the old, unversioned, db.sql.
+    """
+    baselined = await conn.fetchval(
+        """
+        INSERT INTO "schema_migration" (version, name)
+        SELECT $1, $2
+        WHERE NOT EXISTS (SELECT FROM "schema_migration")
+          AND to_regclass('"game"') IS NOT NULL
+        RETURNING TRUE;
+        """,
+        baseline_version,
+        next(m.name for m in migrations if m.version == baseline_version),
+        timeout=timeout,
+    )
+    return bool(baselined)
+
+
+async def migrate(
+        conn: Connection,
+        target_version: int | None = None,
+        timeout: float | None = _default_conn_timeout,
+) -> list[Migration]:
+    """Apply pending migrations, up to and including target_version,
+    or all of them if target_version is None. Returns the applied migrations.
+    Safe to run concurrently, e.g. from multiple workers, the migrations
+    are serialized with an advisory lock.
+    """
+    migrations = load_migrations()
+
+    await conn.execute("SELECT pg_advisory_lock($1);", _advisory_lock_key, timeout=timeout)
+    try:
+        await _ensure_migration_table(conn, timeout=timeout)
+        if await _baseline(conn, migrations, timeout=timeout):
+            logger.info("existing database baselined at version {}", baseline_version)
+
+        applied = await applied_versions(conn, timeout=timeout)
+        done: list[Migration] = []
+        for migration in migrations:
+            if migration.version in applied:
+                continue
+            if target_version is not None and migration.version > target_version:
+                break
+
+            logger.info("applying migration {}: {}", migration.version, migration.name)
+            async with conn.transaction():
+                await conn.execute(migration.sql, timeout=timeout)
+                await conn.execute(
+                    """
+                    INSERT INTO "schema_migration" (version, name)
+                    VALUES ($1, $2);
+                    """,
+                    migration.version,
+                    migration.name,
+                    timeout=timeout,
+                )
+            done.append(migration)
+
+        return done
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1);", _advisory_lock_key, timeout=timeout)
+
+
+async def async_main(target_version: int | None = None) -> list[Migration]:
+    conn: Connection | None = None
+    url = os.environ["DATABASE_URL"]
+    try:
+        conn = await asyncpg.connect(url)
+        return await migrate(conn, target_version=target_version)
+    finally:
+        if conn:
+            await conn.close()
+
+
+@click.command()
+@click.option("--target-version", "-t", type=int, default=None)
+def main(target_version: int | None) -> None:
+    applied = asyncio.run(async_main(target_version=target_version))
+    for migration in applied:
+        print(f"{migration.version}: {migration.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,7 +22,6 @@
 
 CREATE EXTENSION IF NOT EXISTS "timescaledb";
 
--- TODO: enforce only a single token per game_server_address:game_server_port is allowed!
 CREATE TABLE IF NOT EXISTS "game_server_api_key"
 (
     created_at          TIMESTAMPTZ NOT NULL,
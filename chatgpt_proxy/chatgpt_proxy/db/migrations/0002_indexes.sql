@@ -0,0 +1,45 @@
+-- MIT License
+--
+-- Copyright (c) 2025 Tuomo Kriikkula
+--
+-- Permission is hereby granted, free of charge, to any person obtaining a copy
+-- of this software and associated documentation files (the "Software"), to deal
+-- in the Software without restriction, including without limitation the rights
+-- to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+-- copies of the Software, and to permit persons to whom the Software is
+-- furnished to do so, subject to the following conditions:
+--
+-- The above copyright notice and this permission notice shall be included in all
+-- copies or substantial portions of the Software.
+--
+-- THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+-- IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+-- FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+-- AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+-- LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+-- OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+-- SOFTWARE.
+
+-- Prompt queries filter by game and time, cascading deletes from "game" by game.
+CREATE INDEX IF NOT EXISTS "game_kill_game_id_kill_time_idx"
+    ON "game_kill" (game_id, kill_time);
+CREATE INDEX IF NOT EXISTS "game_chat_message_game_id_send_time_idx"
+    ON "game_chat_message" (game_id, send_time);
+
+-- Only a single API key per game server is allowed, keep the latest one.
+-- Also used by check_token to look up the API key of the requesting game server.
+DELETE
+FROM "game_server_api_key" k
+    USING "game_server_api_key" newer
+WHERE k.game_server_address = newer.game_server_address
+  AND k.game_server_port = newer.game_server_port
+  AND (k.created_at, k.ctid) < (newer.created_at, newer.ctid);
+ALTER TABLE "game_server_api_key"
+    ADD CONSTRAINT "game_server_api_key_game_server_key"
+        UNIQUE (game_server_address, game_server_port);
+
+-- Player IDs are only unique within a game (game server), not globally.
+ALTER TABLE "game_player"
+    DROP CONSTRAINT IF EXISTS "game_player_id_key";
+ALTER TABLE "game_player"
+    ADD CONSTRAINT "game_player_pkey" PRIMARY KEY (game_id, id);
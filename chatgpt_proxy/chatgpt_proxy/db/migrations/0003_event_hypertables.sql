@@ -0,0 +1,115 @@
+-- MIT License
+--
+-- Copyright (c) 2025 Tuomo Kriikkula
+--
+-- Permission is hereby granted, free of charge, to any person obtaining a copy
+-- of this software and associated documentation files (the "Software"), to deal
+-- in the Software without restriction, including without limitation the rights
+-- to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+-- copies of the Software, and to permit persons to whom the Software is
+-- furnished to do so, subject to the following conditions:
+--
+-- The above copyright notice and this permission notice shall be included in all
+-- copies or substantial portions of the Software.
+--
+-- THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+-- IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+-- FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+-- AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+-- LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+-- OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+-- SOFTWARE.
+
+-- Events are expired by dropping whole chunks with retention policies,
+-- instead of cascading deletes from "game". The foreign keys to "game"
+-- are replaced with a trigger that checks the game exists on insert.
+-- Events of deleted games are left behind until their chunks are dropped.
+
+CREATE OR REPLACE FUNCTION check_game_exists()
+    RETURNS TRIGGER
+    LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    -- Same lock a foreign key check takes, the game can't be deleted concurrently.
+    PERFORM FROM "game" WHERE id = NEW.game_id FOR KEY SHARE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'insert or update on table "%" violates game_id reference', TG_TABLE_NAME
+            USING ERRCODE = 'foreign_key_violation',
+                DETAIL = format('Key (game_id)=(%s) is not present in table "game".', NEW.game_id);
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+-- game_kill
+
+ALTER TABLE "game_kill"
+    DROP CONSTRAINT "game_kill_game_id_fkey";
+-- Unique constraints of hypertables must include the time column.
+ALTER TABLE "game_kill"
+    DROP CONSTRAINT "game_kill_pkey";
+ALTER TABLE "game_kill"
+    ADD PRIMARY KEY (id, kill_time);
+
+CREATE TRIGGER "game_kill_check_game_exists"
+    BEFORE INSERT OR UPDATE OF game_id
+    ON "game_kill"
+    FOR EACH ROW
+EXECUTE FUNCTION check_game_exists();
+
+SELECT create_hypertable('game_kill', 'kill_time',
+                         chunk_time_interval => INTERVAL '6 hours',
+                         migrate_data => TRUE);
+SELECT add_retention_policy('game_kill', INTERVAL '2 days');
+
+ALTER TABLE "game_kill"
+    SET (
+        timescaledb.compress,
+        timescaledb.compress_segmentby = 'game_id',
+        timescaledb.compress_orderby = 'kill_time, id'
+        );
+
+SELECT add_compression_policy('game_kill', INTERVAL '12 hours');
+
+-- game_chat_message
+
+ALTER TABLE "game_chat_message"
+    DROP CONSTRAINT "game_chat_message_game_id_fkey";
+ALTER TABLE "game_chat_message"
+    DROP CONSTRAINT "game_chat_message_pkey";
+ALTER TABLE "game_chat_message"
+    ADD PRIMARY KEY (id, send_time);
+
+CREATE TRIGGER "game_chat_message_check_game_exists"
+    BEFORE INSERT OR UPDATE OF game_id
+    ON "game_chat_message"
+    FOR EACH ROW
+EXECUTE FUNCTION check_game_exists();
+
+SELECT create_hypertable('game_chat_message', 'send_time',
+                         chunk_time_interval => INTERVAL '6 hours',
+                         migrate_data => TRUE);
+SELECT add_retention_policy('game_chat_message', INTERVAL '2 days');
+
+ALTER TABLE "game_chat_message"
+    SET (
+        timescaledb.compress,
+        timescaledb.compress_segmentby = 'game_id',
+        timescaledb.compress_orderby = 'send_time, id'
+        );
+
+SELECT add_compression_policy('game_chat_message', INTERVAL '12 hours');
+
+-- openai_query
+
+-- Without ON DELETE CASCADE, this blocked deleting games that had queries.
+-- Queries are kept for the retention period of the hypertable instead.
+ALTER TABLE "openai_query"
+    DROP CONSTRAINT "openai_query_game_id_fkey";
+
+CREATE TRIGGER "openai_query_check_game_exists"
+    BEFORE INSERT OR UPDATE OF game_id
+    ON "openai_query"
+    FOR EACH ROW
+EXECUTE FUNCTION check_game_exists();
@@ -0,0 +1,34 @@
+-- MIT License
+--
+-- Copyright (c) 2025 Tuomo Kriikkula
+--
+-- Permission is hereby granted, free of charge, to any person obtaining a copy
+-- of this software and associated documentation files (the "Software"), to deal
+-- in the Software without restriction, including without limitation the rights
+-- to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+-- copies of the Software, and to permit persons to whom the Software is
+-- furnished to do so, subject to the following conditions:
+--
+-- The above copyright notice and this permission notice shall be included in all
+-- copies or substantial portions of the Software.
+--
+-- THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+-- IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+-- FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+-- AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+-- LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+-- OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+-- SOFTWARE.
+
+-- Prompts only include events newer than the ones included in the
+-- previous query of the game, identified by the highest event IDs
+-- the previous query included.
+ALTER TABLE "openai_query"
+    ADD COLUMN IF NOT EXISTS last_game_kill_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE "openai_query"
+    ADD COLUMN IF NOT EXISTS last_game_chat_message_id BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS "game_kill_game_id_id_idx"
+    ON "game_kill" (game_id, id);
+CREATE INDEX IF NOT EXISTS "game_chat_message_game_id_id_idx"
+    ON "game_chat_message" (game_id, id);
@@ -26,6 +26,7 @@ import ast
 import datetime
 import ipaddress
 from dataclasses import dataclass
+from dataclasses import field
 from enum import StrEnum
 
 
@@ -64,6 +65,48 @@ class GamePlayer:
         return f"{self.name}\n{self.team}\n{self.score}"
 
 
+@dataclass(slots=True, frozen=True)
+class GameScoreboard:
+    """Full list of players in a game. Wire format is the
+    player ID followed by GamePlayer wire format, for each player.
+    """
+    game_id: str
+    players: list[GamePlayer]
+
+    def wire_format(self) -> str:
+        return "\n".join(f"{player.id}\n{player.wire_format()}" for player in self.players)
+
+    @staticmethod
+    def from_wire_format(
+            game_id: str,
+            wire_format_data: str,
+    ) -> "GameScoreboard":
+        if not wire_format_data:
+            return GameScoreboard(game_id=game_id, players=[])
+
+        parts = wire_format_data.split("\n")
+        if len(parts) % 4 != 0:
+            raise ValueError(f"expected 4 lines per player, got {len(parts)} lines")
+
+        players: dict[int, GamePlayer] = {}
+        for i in range(0, len(parts), 4):
+            player_id = int(parts[i])
+            if player_id in players:
+                raise ValueError(f"duplicate player ID: {player_id}")
+            players[player_id] = GamePlayer(
+                game_id=game_id,
+                id=player_id,
+                name=parts[i + 1],
+                team=Team(parts[i + 2]),
+                score=int(parts[i + 3]),
+            )
+
+        return GameScoreboard(
+            game_id=game_id,
+            players=list(players.values()),
+        )
+
+
 @dataclass(slots=True, frozen=True)
 class OpenAIQuery:
     time: datetime.datetime
@@ -73,6 +116,10 @@ class OpenAIQuery:
     request_length: int
     response_length: int
     openai_response_id: str
+    # Highest event IDs included in the query, the next
+    # query of the game only includes newer events.
+    last_game_kill_id: int = 0
+    last_game_chat_message_id: int = 0
 
 
 @dataclass(slots=True, frozen=True)
@@ -85,14 +132,6 @@ class GameChatMessage:
     sender_team: Team
     channel: SayType
 
-    def as_markdown_dict(self) -> dict:
-        return {
-            "Message": self.message,
-            "Sender:": self.sender_name,
-            "Team:": self.sender_team,
-            "Channel:": self.channel,
-        }
-
     def wire_format(self) -> str:
         return f"{self.sender_name}\n{self.sender_team}\n{self.channel}\n{self.message}"
 
@@ -160,14 +199,167 @@ class GameKill:
     damage_type: str
     kill_distance_m: float
 
-    def as_markdown_dict(self) -> dict:
-        # TODO: also do this for other well known damage type prefixes?
-        dmg_type = self.damage_type.replace("RODmgType_", "")
-        return {
-            "Killer": self.killer_name,
-            "Victim": self.victim_name,
-            "Killer Team:": self.killer_team,
-            "Victim Team:": self.victim_team,
-            "Damage Type:": dmg_type,
-            "Kill Distance (m):": round(self.kill_distance_m, 1),
-        }
+
+@dataclass(slots=True, frozen=True)
+class GameKillEvent:
+    """New GameKill, not yet stored in the database."""
+    game_id: str
+    kill_time: datetime.datetime
+    killer_name: str
+    victim_name: str
+    killer_team: Team
+    victim_team: Team
+    damage_type: str
+    kill_distance_m: float
+
+    def with_id(self, id_: int) -> GameKill:
+        return GameKill(
+            id=id_,
+            game_id=self.game_id,
+            kill_time=self.kill_time,
+            killer_name=self.killer_name,
+            victim_name=self.victim_name,
+            killer_team=self.killer_team,
+            victim_team=self.victim_team,
+            damage_type=self.damage_type,
+            kill_distance_m=self.kill_distance_m,
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class GameChatMessageEvent:
+    """New GameChatMessage, not yet stored in the database."""
+    game_id: str
+    message: str
+    send_time: datetime.datetime
+    sender_name: str
+    sender_team: Team
+    channel: SayType
+
+    def with_id(self, id_: int) -> GameChatMessage:
+        return GameChatMessage(
+            id=id_,
+            message=self.message,
+            game_id=self.game_id,
+            send_time=self.send_time,
+            sender_name=self.sender_name,
+            sender_team=self.sender_team,
+            channel=self.channel,
+        )
+
+
+class GameEventType(StrEnum):
+    Kill = "K"
+    ChatMessage = "C"
+    Player = "P"
+    DeletePlayer = "D"
+    ObjectiveState = "O"
+
+
+@dataclass(slots=True, frozen=True)
+class GameEventBatch:
+    """Batch of mixed game events sent in a single request.
+
+    Wire format is one event per line, fields separated by tabs. The first
+    field is the GameEventType, the rest are the same fields, in the same
+    order, as in the corresponding single event request:
+
+    K<TAB>world_time<TAB>killer_name<TAB>victim_name<TAB>killer_team<TAB>victim_team
+        <TAB>damage_type<TAB>kill_distance_m
+    C<TAB>sender_name<TAB>sender_team<TAB>channel<TAB>message
+    P<TAB>player_id<TAB>name<TAB>team<TAB>score
+    D<TAB>player_id
+    O<TAB>[('Objective A',0),('Objective B',1),...]
+
+    Player events are reduced to the latest state of each player and
+    only the latest objective state is kept.
+    """
+    game_id: str
+    kills: list[GameKillEvent] = field(default_factory=list)
+    chat_messages: list[GameChatMessageEvent] = field(default_factory=list)
+    players: list[GamePlayer] = field(default_factory=list)
+    deleted_player_ids: list[int] = field(default_factory=list)
+    objective_state: GameObjectiveState | None = None
+
+    def __len__(self) -> int:
+        return (len(self.kills)
+                + len(self.chat_messages)
+                + len(self.players)
+                + len(self.deleted_player_ids)
+                + int(self.objective_state is not None))
+
+    @staticmethod
+    def from_wire_format(
+            game_id: str,
+            game_start_time: datetime.datetime,
+            send_time: datetime.datetime,
+            wire_format_data: str,
+            max_objective_state_size: int,
+    ) -> "GameEventBatch":
+        kills: list[GameKillEvent] = []
+        chat_messages: list[GameChatMessageEvent] = []
+        players: dict[int, GamePlayer | None] = {}
+        objective_state: GameObjectiveState | None = None
+
+        for line in wire_format_data.splitlines():
+            if not line:
+                continue
+
+            event_type, *parts = line.split("\t")
+            match GameEventType(event_type):
+                case GameEventType.Kill:
+                    world_time, killer, victim, killer_team, victim_team, dmg, dist = parts
+                    kills.append(GameKillEvent(
+                        game_id=game_id,
+                        kill_time=game_start_time + datetime.timedelta(seconds=float(world_time)),
+                        killer_name=killer,
+                        victim_name=victim,
+                        killer_team=Team(killer_team),
+                        victim_team=Team(victim_team),
+                        damage_type=dmg,
+                        kill_distance_m=float(dist),
+                    ))
+                case GameEventType.ChatMessage:
+                    sender_name, sender_team, channel, message = parts
+                    chat_messages.append(GameChatMessageEvent(
+                        game_id=game_id,
+                        message=message,
+                        send_time=send_time,
+                        sender_name=sender_name,
+                        sender_team=Team(sender_team),
+                        channel=SayType(channel),
+                    ))
+                case GameEventType.Player:
+                    player_id, name, team, score = parts
+                    players[int(player_id)] = GamePlayer(
+                        game_id=game_id,
+                        id=int(player_id),
+                        name=name,
+                        team=Team(team),
+                        score=int(score),
+                    )
+                case GameEventType.DeletePlayer:
+                    (player_id,) = parts
+                    players[int(player_id)] = None
+                case GameEventType.ObjectiveState:
+                    (objs,) = parts
+                    # Defensive check to avoid passing long strings to literal_eval.
+                    if len(objs) > max_objective_state_size:
+                        raise ValueError(f"objective state too long: {len(objs)}")
+                    objective_state = GameObjectiveState.from_wire_format(
+                        game_id=game_id,
+                        wire_format_data=objs,
+                    )
+
+        return GameEventBatch(
+            game_id=game_id,
+            kills=kills,
+            chat_messages=chat_messages,
+            players=[player for player in players.values() if player is not None],
+            deleted_player_ids=[
+                player_id
+                for player_id, player in players.items()
+                if player is None
+            ],
+            objective_state=objective_state,
+        )
@@ -0,0 +1,240 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Cache invalidation bus using Postgres LISTEN/NOTIFY.
+
+Queries that mutate API keys or games publish an invalidation on the
+invalidation channel, in the same transaction as the mutation. Every
+worker subscribes to the channel through a single dedicated listener
+connection and forwards the invalidations to its in-process caches.
+"""
+
+import asyncio
+import ipaddress
+from dataclasses import dataclass
+from enum import StrEnum
+from inspect import isawaitable
+from typing import Awaitable
+from typing import Callable
+
+import asyncpg
+from asyncpg import Connection
+
+from chatgpt_proxy.log import logger
+
+channel = "chatgpt_proxy_invalidation"
+
+default_reconnect_delay = 1.0
+default_max_reconnect_delay = 30.0
+default_keepalive_interval = 30.0
+default_keepalive_timeout = 5.0
+
+
+class InvalidationKind(StrEnum):
+    # Everything may be stale, e.g. notifications were missed
+    # while the listener connection was down.
+    All = "all"
+    # key: "<game_server_address>:<game_server_port>".
+    ApiKey = "api_key"
+    # key: game ID.
+    Game = "game"
+
+
+@dataclass(slots=True, frozen=True)
+class Invalidation:
+    kind: InvalidationKind
+    key: str = ""
+
+    def payload(self) -> str:
+        return f"{self.kind}:{self.key}"
+
+    @classmethod
+    def from_payload(cls, payload: str) -> "Invalidation":
+        kind, _, key = payload.partition(":")
+        return cls(kind=InvalidationKind(kind), key=key)
+
+    @classmethod
+    def api_key(cls, game_server_address: ipaddress.IPv4Address, game_server_port: int):
+        return cls(InvalidationKind.ApiKey, f"{game_server_address}:{game_server_port}")
+
+    @property
+    def game_server(self) -> tuple[ipaddress.IPv4Address, int]:
+        """Game server address and port of an ApiKey invalidation."""
+        address, _, port = self.key.rpartition(":")
+        return ipaddress.IPv4Address(address), int(port)
+
+
+async def publish(
+        conn: Connection,
+        invalidation: Invalidation,
+        timeout: float | None = None,
+) -> None:
+    # NOTE: NOTIFY is transactional, if called in a transaction
+    # the notification is only delivered once it commits.
+    await conn.execute(
+        "SELECT pg_notify($1, $2);",
+        channel,
+        invalidation.payload(),
+        timeout=timeout,
+    )
+
+
+# Callbacks may be coroutine functions.
+InvalidationCallback = Callable[[Invalidation], Awaitable[None] | None]
+
+
+class InvalidationListener:
+    """Listens to the invalidation channel on a dedicated connection
+    and calls the subscribed callbacks for every invalidation. Awaitables
+    returned by callbacks are run as tasks.
+
+    The connection is re-established with exponential backoff if it is
+    lost. Since notifications sent while disconnected are lost, an
+    InvalidationKind.All invalidation is delivered after reconnecting.
+    """
+
+    def __init__(
+            self,
+            dsn: str | None,
+            reconnect_delay: float = default_reconnect_delay,
+            max_reconnect_delay: float = default_max_reconnect_delay,
+            keepalive_interval: float = default_keepalive_interval,
+            keepalive_timeout: float = default_keepalive_timeout,
+    ):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_timeout = keepalive_timeout
+        self.received = 0
+        self.reconnects = 0
+        self._callbacks: list[InvalidationCallback] = []
+        self._conn: Connection | None = None
+        self._connected = asyncio.Event()
+        self._lost = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._pending: set[asyncio.Future] = set()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    def subscribe(self, callback: InvalidationCallback) -> None:
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="InvalidationListener")
+
+    async def wait_connected(self, timeout: float | None = None) -> None:
+        await asyncio.wait_for(self._connected.wait(), timeout=timeout)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close_conn()
+
+    def _dispatch(self, invalidation: Invalidation) -> None:
+        for callback in self._callbacks:
+            try:
+                result = callback(invalidation)
+                if isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._pending.add(task)
+                    task.add_done_callback(self._callback_done)
+            except Exception as e:
+                logger.opt(exception=e).error("invalidation callback {} failed", callback)
+
+    def _callback_done(self, task: asyncio.Future) -> None:
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).error("invalidation callback failed")
+
+    def _on_notification(self, _conn: Connection, _pid: int, _channel: str, payload: str) -> None:
+        self.received += 1
+        try:
+            invalidation = Invalidation.from_payload(payload)
+        except ValueError:
+            logger.warning("invalid invalidation payload: '{}'", payload)
+            return
+        self._dispatch(invalidation)
+
+    def _on_termination(self, _conn: Connection) -> None:
+        self._lost.set()
+
+    async def _close_conn(self) -> None:
+        self._connected.clear()
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            try:
+                await asyncio.wait_for(conn.close(), timeout=self.keepalive_timeout)
+            except Exception:
+                conn.terminate()
+
+    async def _connect(self) -> None:
+        self._lost.clear()
+        conn = await asyncpg.connect(dsn=self.dsn)
+        conn.add_termination_listener(self._on_termination)
+        await conn.add_listener(channel, self._on_notification)
+        self._conn = conn
+        self._connected.set()
+
+    async def _wait_lost(self) -> None:
+        assert self._conn is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), timeout=self.keepalive_interval)
+                return
+            except TimeoutError:
+                pass
+            # NOTE: detects half-open connections that would
+            # otherwise silently stop delivering notifications.
+            await self._conn.execute("SELECT 1;", timeout=self.keepalive_timeout)
+
+    async def _run(self) -> None:
+        delay = self.reconnect_delay
+        first = True
+        while True:
+            try:
+                await self._connect()
+                if not first:
+                    self.reconnects += 1
+                    logger.info("invalidation listener reconnected")
+                first = False
+                delay = self.reconnect_delay
+                # Anything may have changed while not listening.
+                self._dispatch(Invalidation(InvalidationKind.All))
+                await self._wait_lost()
+                logger.warning("invalidation listener connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("invalidation listener error: {}: {}, retrying in {:.1f} s",
+                               type(e).__name__, e, delay)
+            await self._close_conn()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
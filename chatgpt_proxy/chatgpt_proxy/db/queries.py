@@ -27,11 +27,11 @@ import ipaddress
 
 from asyncpg import Connection
 from asyncpg import Record
-from pypika import Order
-from pypika import Query
-from pypika import Table
 
+from chatgpt_proxy.cache import cached_query
 from chatgpt_proxy.db import models
+from chatgpt_proxy.db import notify
+from chatgpt_proxy.db.statements import registry
 
 _default_conn_timeout = 15.0
 
@@ -43,9 +43,6 @@ class Ignored:
 IGNORED = Ignored()
 
 
-# TODO: add caching layer!
-
-
 async def insert_game(
         conn: Connection,
         game_id: str,
@@ -75,51 +72,77 @@ async def insert_game(
     )
 
 
-def build_update_game_query(
-        game_id: str,
-        stop_time: datetime.datetime | Ignored = IGNORED,
-        openai_previous_response_id: str | Ignored = IGNORED,
-) -> Query:
-    game = Table(name="game")
-    query = game.update()
-    if stop_time is not IGNORED:
-        query = query.set(game.stop_time, stop_time)
-    if openai_previous_response_id is not IGNORED:
-        query = query.set(game.openai_previous_response_id, openai_previous_response_id)
-    query = query.where(game.id == game_id)
-    return query
+_update_game = registry.register(
+    "update_game",
+    """
+    UPDATE "game"
+    SET stop_time                   = CASE WHEN $2::BOOLEAN
+                                          THEN $3::TIMESTAMPTZ
+                                          ELSE stop_time END,
+        openai_previous_response_id = CASE WHEN $4::BOOLEAN
+                                          THEN $5::TEXT
+                                          ELSE openai_previous_response_id END
+    WHERE id = $1
+    RETURNING pg_notify($6, 'game:' || id);
+    """,
+    warmup_args=(None, False, None, False, None, notify.channel),
+)
 
 
 async def update_game(
         conn: Connection,
         game_id: str,
-        stop_time: datetime.datetime | Ignored = IGNORED,
-        openai_previous_response_id: str | Ignored = IGNORED,
+        stop_time: datetime.datetime | None | Ignored = IGNORED,
+        openai_previous_response_id: str | None | Ignored = IGNORED,
         timeout: float | None = _default_conn_timeout,
 ):
-    query = build_update_game_query(
-        game_id=game_id,
-        stop_time=stop_time,
-        openai_previous_response_id=openai_previous_response_id,
+    # NOTE: None is a valid value for the columns, IGNORED
+    # columns are passed as (False, NULL) flag and value pairs.
+    set_stop_time = stop_time is not IGNORED
+    set_openai_previous_response_id = openai_previous_response_id is not IGNORED
+    await _update_game.execute(
+        conn,
+        game_id,
+        set_stop_time,
+        stop_time if set_stop_time else None,
+        set_openai_previous_response_id,
+        openai_previous_response_id if set_openai_previous_response_id else None,
+        notify.channel,
+        timeout=timeout,
     )
-    await conn.execute(str(query), timeout=timeout)
+    # NOTE: other workers invalidate their cached
+    # game when the notification is received.
+    await select_game_cached.invalidate(game_id=game_id)
 
 
 # TODO: what's the best way to handle this? If we make this too dynamic
 #       it's going to cross into ORM territory quickly.
 #       For now, assume we only ever want to select by game_id and
 #       return all columns even if it is wasteful.
+_select_game = registry.register(
+    "select_game",
+    """
+    SELECT id,
+           level,
+           start_time,
+           stop_time,
+           game_server_address,
+           game_server_port,
+           openai_previous_response_id
+    FROM "game"
+    WHERE id = $1;
+    """,
+    warmup_args=(None,),
+)
+
+
 async def select_game(
         conn: Connection,
         game_id: str,
         timeout: float | None = _default_conn_timeout,
 ) -> models.Game | None:
-    record = await conn.fetchrow(
-        """
-        SELECT *
-        FROM "game"
-        WHERE id = $1;
-        """,
+    record = await _select_game.fetchrow(
+        conn,
         game_id,
         timeout=timeout,
     )
@@ -130,6 +153,27 @@ async def select_game(
     return None
 
 
+@cached_query()
+async def select_game_cached(
+        conn: Connection,
+        game_id: str,
+        timeout: float | None = _default_conn_timeout,
+) -> models.Game | None:
+    """select_game, cached in db_cache. The mutable columns (stop_time,
+    openai_previous_response_id) may be stale for up to the cache TTL,
+    use select_game if they are needed.
+    """
+    return await select_game(conn=conn, game_id=game_id, timeout=timeout)
+
+
+async def handle_invalidation(invalidation: notify.Invalidation) -> None:
+    """Callback for InvalidationListener, drops stale cached query results."""
+    if invalidation.kind == notify.InvalidationKind.All:
+        await select_game_cached.cache.clear()
+    elif invalidation.kind == notify.InvalidationKind.Game:
+        await select_game_cached.invalidate(game_id=invalidation.key)
+
+
 async def upsert_game_objective_state(
         conn: Connection,
         state: models.GameObjectiveState,
@@ -153,24 +197,62 @@ async def upsert_game_objective_state(
     return bool(inserted)
 
 
+async def select_game_objective_state(
+        conn: Connection,
+        game_id: str,
+        timeout: float | None = _default_conn_timeout,
+) -> models.GameObjectiveState | None:
+    objectives = await conn.fetchval(
+        """
+        SELECT objectives
+        FROM "game_objective_state"
+        WHERE game_id = $1;
+        """,
+        game_id,
+        timeout=timeout,
+    )
+
+    if objectives is None:
+        return None
+
+    # Stored in the wire format of each objective.
+    return models.GameObjectiveState.from_wire_format(
+        game_id=game_id,
+        wire_format_data=f"[{','.join(objectives)}]",
+    )
+
+
 async def delete_completed_games(
         conn: Connection,
         game_expiration: datetime.timedelta,
+        batch_size: int,
         timeout: float | None = _default_conn_timeout,
-) -> str:
-    return await conn.execute(
+) -> int:
+    """Delete a batch of at most batch_size completed games.
+    Returns the number of deleted games.
+    """
+    deleted = await conn.fetch(
         """
-        DELETE
-        FROM "game"
-        WHERE stop_time IS NOT NULL
-           OR NOW() > (stop_time + $1);
+        WITH deleted AS (
+            DELETE
+            FROM "game"
+            WHERE ctid = ANY (ARRAY(SELECT ctid
+                                    FROM "game"
+                                    WHERE stop_time IS NOT NULL
+                                       OR NOW() > (start_time + $1)
+                                    LIMIT $2))
+            RETURNING id)
+        SELECT pg_notify($3, 'game:' || id)
+        FROM deleted;
         """,
         game_expiration,
+        batch_size,
+        notify.channel,
         timeout=timeout,
     )
+    return len(deleted)
 
 
-# TODO: add the rest of cols here if needed?
 async def select_game_server_api_key(
         conn: Connection,
         game_server_address: ipaddress.IPv4Address,
@@ -217,7 +299,12 @@ async def insert_game_server_api_key(
         """
         INSERT INTO "game_server_api_key"
         (created_at, expires_at, api_key_hash, game_server_address, game_server_port, name)
-        VALUES ($1, $2, $3, $4, $5, $6);
+        VALUES ($1, $2, $3, $4, $5, $6)
+        ON CONFLICT (game_server_address, game_server_port) DO UPDATE
+            SET created_at   = excluded.created_at,
+                expires_at   = excluded.expires_at,
+                api_key_hash = excluded.api_key_hash,
+                name         = excluded.name;
         """,
         issued_at,
         expires_at,
@@ -227,6 +314,11 @@ async def insert_game_server_api_key(
         name,
         timeout=timeout,
     )
+    await notify.publish(
+        conn,
+        notify.Invalidation.api_key(game_server_address, game_server_port),
+        timeout=timeout,
+    )
 
 
 async def game_exists(
@@ -248,17 +340,50 @@ async def game_exists(
 async def delete_old_api_keys(
         conn: Connection,
         leeway: datetime.timedelta,
+        batch_size: int,
         timeout: float | None = _default_conn_timeout,
-) -> str:
-    return await conn.execute(
+) -> int:
+    """Delete a batch of at most batch_size expired API keys.
+    Returns the number of deleted API keys.
+    """
+    deleted = await conn.fetch(
         """
-        DELETE
-        FROM "game_server_api_key"
-        WHERE NOW() > (expires_at + $1);
+        WITH deleted AS (
+            DELETE
+            FROM "game_server_api_key"
+            WHERE ctid = ANY (ARRAY(SELECT ctid
+                                    FROM "game_server_api_key"
+                                    WHERE NOW() > (expires_at + $1)
+                                    LIMIT $2))
+            RETURNING game_server_address, game_server_port)
+        SELECT pg_notify($3, 'api_key:' || host(game_server_address) || ':' || game_server_port)
+        FROM deleted;
         """,
         leeway,
+        batch_size,
+        notify.channel,
         timeout=timeout,
     )
+    return len(deleted)
+
+
+_select_openai_query = registry.register(
+    "select_openai_query",
+    """
+    SELECT time,
+           game_id,
+           game_server_address,
+           game_server_port,
+           request_length,
+           response_length,
+           openai_response_id,
+           last_game_kill_id,
+           last_game_chat_message_id
+    FROM "openai_query"
+    WHERE openai_response_id = $1;
+    """,
+    warmup_args=(None,),
+)
 
 
 async def select_openai_query(
@@ -267,12 +392,8 @@ async def select_openai_query(
         timeout: float | None = _default_conn_timeout,
 ) -> models.OpenAIQuery | None:
     """NOTE: for now, assuming we only want to select by openai_response_id."""
-    record = await conn.fetchrow(
-        """
-        SELECT *
-        FROM "openai_query"
-        WHERE openai_response_id = $1;
-        """,
+    record = await _select_openai_query.fetchrow(
+        conn,
         openai_response_id,
         timeout=timeout,
     )
@@ -292,14 +413,17 @@ async def insert_openai_query(
         request_length: int,
         response_length: int,
         openai_response_id: str,
+        last_game_kill_id: int = 0,
+        last_game_chat_message_id: int = 0,
         timeout: float | None = _default_conn_timeout,
 ) -> None:
     await conn.execute(
         """
         INSERT INTO "openai_query"
         (game_id, time, game_server_address,
-         game_server_port, request_length, response_length, openai_response_id)
-        VALUES ($1, $2, $3, $4, $5, $6, $7);
+         game_server_port, request_length, response_length, openai_response_id,
+         last_game_kill_id, last_game_chat_message_id)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9);
         """,
         game_id,
         time,
@@ -308,10 +432,40 @@ async def insert_openai_query(
         request_length,
         response_length,
         openai_response_id,
+        last_game_kill_id,
+        last_game_chat_message_id,
         timeout=timeout,
     )
 
 
+# NOTE: the rows are locked in ID order, to avoid deadlocks.
+_lock_games_for_events = registry.register(
+    "lock_games_for_events",
+    """
+    SELECT id
+    FROM "game"
+    WHERE id = ANY ($1::TEXT[])
+    ORDER BY id
+        FOR NO KEY UPDATE;
+    """,
+    warmup_args=([],),
+)
+
+
+async def lock_games_for_events(
+        conn: Connection,
+        game_ids: list[str],
+        timeout: float | None = _default_conn_timeout,
+) -> set[str]:
+    """Lock the games for inserting their events, returning the IDs of
+    the games that exist. Must be called in the transaction that inserts
+    the events, before inserting them, so that the event IDs of a game
+    are allocated in commit order, see chatgpt_proxy.db.locks.
+    """
+    records = await _lock_games_for_events.fetch(conn, game_ids, timeout=timeout)
+    return {record["id"] for record in records}
+
+
 async def insert_game_chat_message(
         conn: Connection,
         game_id: str,
@@ -322,6 +476,7 @@ async def insert_game_chat_message(
         channel: models.SayType,
         timeout: float | None = _default_conn_timeout,
 ) -> int:
+    """Lock the game first, see lock_games_for_events."""
     _sender_team = int(sender_team)
     _channel = int(channel)
 
@@ -354,6 +509,7 @@ async def insert_game_kill(
         kill_distance_m: float,
         timeout: float | None = _default_conn_timeout,
 ) -> int:
+    """Lock the game first, see lock_games_for_events."""
     _killer_team = int(killer_team)
     _victim_team = int(victim_team)
 
@@ -377,13 +533,78 @@ async def insert_game_kill(
     )
 
 
+async def insert_game_kills(
+        conn: Connection,
+        kills: list[models.GameKillEvent],
+        timeout: float | None = _default_conn_timeout,
+) -> list[models.GameKill]:
+    """Insert kills, returning them as stored, in the same order.
+    Lock their games first, see lock_games_for_events.
+    """
+    records = await conn.fetch(
+        """
+        INSERT INTO "game_kill"
+        (game_id, kill_time, killer_name, victim_name, killer_team,
+         victim_team, damage_type, kill_distance_m)
+        SELECT *
+        FROM unnest($1::TEXT[], $2::TIMESTAMPTZ[], $3::TEXT[], $4::TEXT[],
+                    $5::INTEGER[], $6::INTEGER[], $7::TEXT[], $8::DOUBLE PRECISION[])
+        RETURNING id;
+        """,
+        [kill.game_id for kill in kills],
+        [kill.kill_time for kill in kills],
+        [kill.killer_name for kill in kills],
+        [kill.victim_name for kill in kills],
+        [int(kill.killer_team) for kill in kills],
+        [int(kill.victim_team) for kill in kills],
+        [kill.damage_type for kill in kills],
+        [kill.kill_distance_m for kill in kills],
+        timeout=timeout,
+    )
+    return [
+        kill.with_id(record["id"])
+        for kill, record in zip(kills, records, strict=True)
+    ]
+
+
+async def insert_game_chat_messages(
+        conn: Connection,
+        chat_messages: list[models.GameChatMessageEvent],
+        timeout: float | None = _default_conn_timeout,
+) -> list[models.GameChatMessage]:
+    """Insert chat messages, returning them as stored, in the same order.
+    Lock their games first, see lock_games_for_events.
+    """
+    records = await conn.fetch(
+        """
+        INSERT INTO "game_chat_message"
+            (message, game_id, send_time, sender_name, sender_team, channel)
+        SELECT *
+        FROM unnest($1::TEXT[], $2::TEXT[], $3::TIMESTAMPTZ[], $4::TEXT[],
+                    $5::INTEGER[], $6::INTEGER[])
+        RETURNING id;
+        """,
+        [msg.message for msg in chat_messages],
+        [msg.game_id for msg in chat_messages],
+        [msg.send_time for msg in chat_messages],
+        [msg.sender_name for msg in chat_messages],
+        [int(msg.sender_team) for msg in chat_messages],
+        [int(msg.channel) for msg in chat_messages],
+        timeout=timeout,
+    )
+    return [
+        msg.with_id(record["id"])
+        for msg, record in zip(chat_messages, records, strict=True)
+    ]
+
+
 async def delete_game_player(
         conn: Connection,
         game_id: str,
         player_id: int,
         timeout: float | None = _default_conn_timeout,
-):
-    await conn.execute(
+) -> bool:
+    result = await conn.execute(
         """
         DELETE
         FROM "game_player"
@@ -394,6 +615,7 @@ async def delete_game_player(
         player_id,
         timeout=timeout,
     )
+    return result != "DELETE 0"
 
 
 async def upsert_game_player(
@@ -409,11 +631,10 @@ async def upsert_game_player(
         """
         INSERT INTO "game_player" (game_id, id, name, team, score)
         VALUES ($1, $2, $3, $4, $5)
-        ON CONFLICT (id) DO UPDATE
-            SET game_id = excluded.game_id,
-                name    = excluded.name,
-                team    = excluded.team,
-                score   = excluded.score
+        ON CONFLICT (game_id, id) DO UPDATE
+            SET name  = excluded.name,
+                team  = excluded.team,
+                score = excluded.score
         RETURNING (xmax = 0) as inserted;
         """,
         game_id,
@@ -426,6 +647,106 @@ async def upsert_game_player(
     return bool(inserted)
 
 
+async def delete_game_players(
+        conn: Connection,
+        game_id: str,
+        player_ids: list[int],
+        timeout: float | None = _default_conn_timeout,
+) -> str:
+    return await conn.execute(
+        """
+        DELETE
+        FROM "game_player"
+        WHERE game_id = $1
+          AND id = ANY ($2::INTEGER[]);
+        """,
+        game_id,
+        player_ids,
+        timeout=timeout,
+    )
+
+
+async def upsert_game_players(
+        conn: Connection,
+        players: list[models.GamePlayer],
+        timeout: float | None = _default_conn_timeout,
+) -> int:
+    """Bulk version of upsert_game_player.
+    Returns the number of inserted (not updated) players.
+    """
+    inserted = await conn.fetchval(
+        """
+        WITH upserted AS (
+            INSERT INTO "game_player" (game_id, id, name, team, score)
+            SELECT *
+            FROM unnest($1::TEXT[], $2::INTEGER[], $3::TEXT[],
+                        $4::INTEGER[], $5::INTEGER[])
+            ON CONFLICT (game_id, id) DO UPDATE
+                SET name  = excluded.name,
+                    team  = excluded.team,
+                    score = excluded.score
+            RETURNING (xmax = 0) as inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted)
+        FROM upserted;
+        """,
+        [player.game_id for player in players],
+        [player.id for player in players],
+        [player.name for player in players],
+        [int(player.team) for player in players],
+        [player.score for player in players],
+        timeout=timeout,
+    )
+    return int(inserted)
+
+
+async def reconcile_game_players(
+        conn: Connection,
+        scoreboard: models.GameScoreboard,
+        timeout: float | None = _default_conn_timeout,
+) -> tuple[int, int, int]:
+    """Make the game's players match the scoreboard: upsert all
+    scoreboard players and delete players missing from it.
+    Returns counts of (created, updated, removed) players.
+    Players whose data did not change are not counted as updated.
+    """
+    players = scoreboard.players
+    row = await conn.fetchrow(
+        """
+        WITH removed AS (
+            DELETE
+            FROM "game_player"
+            WHERE game_id = $1
+              AND id <> ALL ($2::INTEGER[])
+            RETURNING 1
+        ),
+        upserted AS (
+            INSERT INTO "game_player" (game_id, id, name, team, score)
+            SELECT $1, *
+            FROM unnest($2::INTEGER[], $3::TEXT[], $4::INTEGER[], $5::INTEGER[])
+            ON CONFLICT (game_id, id) DO UPDATE
+                SET name  = excluded.name,
+                    team  = excluded.team,
+                    score = excluded.score
+                WHERE (game_player.name, game_player.team, game_player.score)
+                    IS DISTINCT FROM
+                      (excluded.name, excluded.team, excluded.score)
+            RETURNING (xmax = 0) as inserted
+        )
+        SELECT (SELECT count(*) FILTER (WHERE inserted) FROM upserted)     AS created,
+               (SELECT count(*) FILTER (WHERE NOT inserted) FROM upserted) AS updated,
+               (SELECT count(*) FROM removed)                              AS removed;
+        """,
+        scoreboard.game_id,
+        [player.id for player in players],
+        [player.name for player in players],
+        [int(player.team) for player in players],
+        [player.score for player in players],
+        timeout=timeout,
+    )
+    return row["created"], row["updated"], row["removed"]
+
+
 async def select_game_player(
         conn: Connection,
         game_id: str,
@@ -456,6 +777,37 @@ async def select_game_player(
     )
 
 
+async def select_game_players(
+        conn: Connection,
+        game_id: str,
+        timeout: float | None = _default_conn_timeout,
+) -> models.GameScoreboard:
+    records = await conn.fetch(
+        """
+        SELECT *
+        FROM "game_player"
+        WHERE game_id = $1
+        ORDER BY id;
+        """,
+        game_id,
+        timeout=timeout,
+    )
+
+    return models.GameScoreboard(
+        game_id=game_id,
+        players=[
+            models.GamePlayer(
+                game_id=record["game_id"],
+                id=record["id"],
+                name=record["name"],
+                team=models.Team(str(record["team"])),
+                score=record["score"],
+            )
+            for record in records
+        ],
+    )
+
+
 async def game_player_exists(
         conn: Connection,
         game_id: str,
@@ -475,6 +827,29 @@ async def game_player_exists(
     ) is not None
 
 
+# NOTE: NULL parameters disable the optional filters and the limit.
+_select_game_kills = registry.register(
+    "select_game_kills",
+    """
+    SELECT id,
+           game_id,
+           kill_time,
+           killer_name,
+           victim_name,
+           killer_team,
+           victim_team,
+           damage_type,
+           kill_distance_m
+    FROM "game_kill"
+    WHERE ($1::TEXT IS NULL OR game_id = $1::TEXT)
+      AND ($2::TIMESTAMPTZ IS NULL OR kill_time >= $2::TIMESTAMPTZ)
+    ORDER BY id
+    LIMIT $3::BIGINT;
+    """,
+    warmup_args=(None, None, 0),
+)
+
+
 async def select_game_kills(
         conn: Connection,
         game_id: str | None = None,
@@ -482,18 +857,11 @@ async def select_game_kills(
         limit: int | None = None,
         timeout: float | None = _default_conn_timeout,
 ) -> list[models.GameKill]:
-    game_kill = Table(name="game_kill")
-    query = game_kill.select("*")
-    if game_id is not None:
-        query = query.where(game_kill.game_id == game_id)
-    if kill_time_from is not None:
-        query = query.where(game_kill.kill_time >= kill_time_from)
-    if limit is not None:
-        query = query.limit(limit)
-    query = query.orderby("id", order=Order.asc)
-
-    records = await conn.fetch(
-        str(query),
+    records = await _select_game_kills.fetch(
+        conn,
+        game_id,
+        kill_time_from,
+        limit,
         timeout=timeout,
     )
 
@@ -503,6 +871,26 @@ async def select_game_kills(
     ]
 
 
+_select_game_chat_messages = registry.register(
+    "select_game_chat_messages",
+    """
+    SELECT id,
+           message,
+           game_id,
+           send_time,
+           sender_name,
+           sender_team,
+           channel
+    FROM "game_chat_message"
+    WHERE ($1::TEXT IS NULL OR game_id = $1::TEXT)
+      AND ($2::TIMESTAMPTZ IS NULL OR send_time >= $2::TIMESTAMPTZ)
+    ORDER BY id
+    LIMIT $3::BIGINT;
+    """,
+    warmup_args=(None, None, 0),
+)
+
+
 async def select_game_chat_messages(
         conn: Connection,
         game_id: str | None = None,
@@ -510,18 +898,114 @@ async def select_game_chat_messages(
         limit: int | None = None,
         timeout: float | None = _default_conn_timeout,
 ) -> list[models.GameChatMessage]:
-    game_chat_message = Table(name="game_chat_message")
-    query = game_chat_message.select("*")
-    if game_id is not None:
-        query = query.where(game_chat_message.game_id == game_id)
-    if send_time_from is not None:
-        query = query.where(game_chat_message.send_time >= send_time_from)
-    if limit is not None:
-        query = query.limit(limit)
-    query = query.orderby("id", order=Order.asc)
+    records = await _select_game_chat_messages.fetch(
+        conn,
+        game_id,
+        send_time_from,
+        limit,
+        timeout=timeout,
+    )
 
-    records = await conn.fetch(
-        str(query),
+    return [
+        models.GameChatMessage(**record)
+        for record in records
+    ]
+
+
+# NOTE: the newest rows after the given ID, in ascending ID order.
+# The time bound is the game's start time, it only lets the
+# planner skip hypertable chunks older than the game.
+_select_new_game_kills = registry.register(
+    "select_new_game_kills",
+    """
+    SELECT *
+    FROM (SELECT id,
+                 game_id,
+                 kill_time,
+                 killer_name,
+                 victim_name,
+                 killer_team,
+                 victim_team,
+                 damage_type,
+                 kill_distance_m
+          FROM "game_kill"
+          WHERE game_id = $1::TEXT
+            AND id > $2::BIGINT
+            AND kill_time >= $3::TIMESTAMPTZ
+          ORDER BY id DESC
+          LIMIT $4::BIGINT) AS k
+    ORDER BY id;
+    """,
+    warmup_args=("", 0, None, 0),
+)
+
+
+async def select_new_game_kills(
+        conn: Connection,
+        game_id: str,
+        after_id: int,
+        kill_time_from: datetime.datetime,
+        limit: int,
+        timeout: float | None = _default_conn_timeout,
+) -> list[models.GameKill]:
+    """Select at most limit newest kills of the game with
+    an ID greater than after_id, in ascending ID order.
+    """
+    records = await _select_new_game_kills.fetch(
+        conn,
+        game_id,
+        after_id,
+        kill_time_from,
+        limit,
+        timeout=timeout,
+    )
+
+    return [
+        models.GameKill(**record)
+        for record in records
+    ]
+
+
+_select_new_game_chat_messages = registry.register(
+    "select_new_game_chat_messages",
+    """
+    SELECT *
+    FROM (SELECT id,
+                 message,
+                 game_id,
+                 send_time,
+                 sender_name,
+                 sender_team,
+                 channel
+          FROM "game_chat_message"
+          WHERE game_id = $1::TEXT
+            AND id > $2::BIGINT
+            AND send_time >= $3::TIMESTAMPTZ
+          ORDER BY id DESC
+          LIMIT $4::BIGINT) AS m
+    ORDER BY id;
+    """,
+    warmup_args=("", 0, None, 0),
+)
+
+
+async def select_new_game_chat_messages(
+        conn: Connection,
+        game_id: str,
+        after_id: int,
+        send_time_from: datetime.datetime,
+        limit: int,
+        timeout: float | None = _default_conn_timeout,
+) -> list[models.GameChatMessage]:
+    """Select at most limit newest chat messages of the game with
+    an ID greater than after_id, in ascending ID order.
+    """
+    records = await _select_new_game_chat_messages.fetch(
+        conn,
+        game_id,
+        after_id,
+        send_time_from,
+        limit,
         timeout=timeout,
     )
 
@@ -0,0 +1,116 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Registry of fixed, parameterized SQL statements that are
+prepared once per connection.
+
+Statements are executed through asyncpg's per-connection statement
+cache, which is keyed by the query string, so a fixed query is parsed
+and planned by the server only once per connection. The cache is primed
+for all registered statements by the asyncpg pool init hook:
+
+    asyncpg.create_pool(..., init=init_connection)
+
+NOTE: asyncpg PreparedStatement objects are only valid until the connection
+is released back to the pool, which is why they are not used directly here.
+
+Optional filters are implemented with NULL parameter sentinels, e.g.:
+
+    WHERE ($1::TEXT IS NULL OR game_id = $1::TEXT)
+"""
+
+from dataclasses import dataclass
+from typing import Any
+from typing import Iterator
+
+from asyncpg import Connection
+from asyncpg import Record
+
+
+@dataclass(slots=True, frozen=True)
+class Statement:
+    name: str
+    query: str
+    # Arguments the statement is executed with when priming the statement
+    # cache. Should make the statement a no-op, e.g. not match any rows.
+    warmup_args: tuple[Any, ...]
+
+    async def fetch(
+            self,
+            conn: Connection,
+            *args: Any,
+            timeout: float | None = None,
+    ) -> list[Record]:
+        return await conn.fetch(self.query, *args, timeout=timeout)
+
+    async def fetchrow(
+            self,
+            conn: Connection,
+            *args: Any,
+            timeout: float | None = None,
+    ) -> Record | None:
+        return await conn.fetchrow(self.query, *args, timeout=timeout)
+
+    async def execute(
+            self,
+            conn: Connection,
+            *args: Any,
+            timeout: float | None = None,
+    ) -> str:
+        return await conn.execute(self.query, *args, timeout=timeout)
+
+
+class StatementRegistry:
+    def __init__(self):
+        self._statements: dict[str, Statement] = {}
+
+    def __iter__(self) -> Iterator[Statement]:
+        return iter(self._statements.values())
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def register(
+            self,
+            name: str,
+            query: str,
+            warmup_args: tuple[Any, ...],
+    ) -> Statement:
+        if name in self._statements:
+            raise ValueError(f"statement already registered: '{name}'")
+        statement = Statement(name=name, query=query, warmup_args=warmup_args)
+        self._statements[name] = statement
+        return statement
+
+    async def prepare(self, conn: Connection) -> None:
+        # NOTE: Connection.prepare() bypasses the statement
+        # cache, execute the statements to populate it instead.
+        for statement in self._statements.values():
+            await statement.fetch(conn, *statement.warmup_args)
+
+
+registry = StatementRegistry()
+
+
+async def init_connection(conn: Connection) -> None:
+    """asyncpg pool init hook, prepares all registered statements."""
+    await registry.prepare(conn)
@@ -0,0 +1,13 @@
+from .game_state import EventBuffer
+from .game_state import GameState
+from .game_state import GameStateRegistry
+from .game_state import game_states
+from .ring_buffer import RingBuffer
+
+__all__ = [
+    "EventBuffer",
+    "GameState",
+    "GameStateRegistry",
+    "RingBuffer",
+    "game_states",
+]
@@ -0,0 +1,308 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Per-worker in-memory state of recent game events.
+
+Ingestion handlers record kills, chat messages, players and objective
+state here once they are stored, so that prompts can be built without
+reading the same events back from the database moments later. Events are
+identified by their database IDs, the same way prompts keep track of the
+events already sent to the LLM. The state only knows about events stored
+by this worker since the state was created, readers fall back to the
+database when it cannot answer a query.
+
+NOTE: the state is only complete if all requests of a game are handled
+by the same worker, so it is disabled by default. Deployments that route
+all requests of a game to the same worker (e.g. a single worker) can
+enable it with the GAME_STATE config option.
+"""
+
+import datetime
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Generic
+from typing import Protocol
+from typing import TypeVar
+
+from chatgpt_proxy.db.models import GameChatMessage
+from chatgpt_proxy.db.models import GameEventBatch
+from chatgpt_proxy.db.models import GameKill
+from chatgpt_proxy.db.models import GameObjectiveState
+from chatgpt_proxy.db.models import GamePlayer
+from chatgpt_proxy.db.models import GameScoreboard
+from chatgpt_proxy.game_state.ring_buffer import RingBuffer
+
+max_recent_kills = 30
+max_recent_chat_messages = 30
+max_game_states = 2048
+# States of games that have not received events for this long are dropped.
+ttl_game_state = datetime.timedelta(hours=1).total_seconds()
+
+
+class _Event(Protocol):
+    @property
+    def id(self) -> int: ...
+
+
+E = TypeVar("E", bound=_Event)
+
+
+class EventBuffer(Generic[E]):
+    """Ring buffer of the most recent stored events of a game. Knows
+    every event of the game with an ID greater than complete_after_id,
+    or nothing about older events if complete_after_id is None.
+    """
+
+    __slots__ = ("events", "complete_after_id")
+
+    def __init__(self, capacity: int, complete_after_id: int | None = None):
+        self.events: RingBuffer[E] = RingBuffer(capacity)
+        self.complete_after_id = complete_after_id
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def add(self, events: Iterable[E]) -> None:
+        for event in events:
+            # Events stored before the first one seen here
+            # have smaller IDs and are unknown.
+            if self.complete_after_id is None:
+                self.complete_after_id = event.id - 1
+            evicted = self.events.append(event)
+            if evicted is not None and evicted.id > self.complete_after_id:
+                self.complete_after_id = evicted.id
+
+    def seed(self, after_id: int, events: list[E], limit: int) -> None:
+        """Seed an empty buffer with the result of a database query for
+        at most limit newest events with an ID greater than after_id.
+        """
+        if self.complete_after_id is not None:
+            return
+
+        # A full result may have left out older events.
+        if len(events) >= limit:
+            self.complete_after_id = events[0].id - 1
+        else:
+            self.complete_after_id = after_id
+        self.add(events)
+
+    def after(self, after_id: int, limit: int) -> list[E] | None:
+        """Return the newest events with an ID greater than after_id, at
+        most limit of them, in ascending ID order. Returns None if there
+        may be such events this buffer does not know about.
+        """
+        # NOTE: events stored concurrently may be added out of ID order.
+        newer = sorted(
+            (event for event in self.events if event.id > after_id),
+            key=lambda event: event.id,
+        )
+        if len(newer) >= limit:
+            return newer[len(newer) - limit:]
+        if self.complete_after_id is None or after_id < self.complete_after_id:
+            return None
+        return newer
+
+
+class GameState:
+    """Recent events of a single game."""
+
+    __slots__ = (
+        "game_id",
+        "kills",
+        "chat_messages",
+        "players",
+        "players_complete",
+        "objective_state",
+        "updated_at",
+    )
+
+    def __init__(
+            self,
+            game_id: str,
+            new_game: bool = False,
+            max_kills: int = max_recent_kills,
+            max_chat_messages: int = max_recent_chat_messages,
+    ):
+        # A new game has no events yet, otherwise
+        # nothing is known about the earlier events.
+        complete_after_id = 0 if new_game else None
+        self.game_id = game_id
+        self.kills: EventBuffer[GameKill] = EventBuffer(max_kills, complete_after_id)
+        self.chat_messages: EventBuffer[GameChatMessage] = EventBuffer(
+            max_chat_messages, complete_after_id)
+        self.players: dict[int, GamePlayer] = {}
+        # Whether players reflects a full scoreboard, as
+        # opposed to individual player updates only.
+        self.players_complete = False
+        self.objective_state: GameObjectiveState | None = None
+        self.updated_at = time.monotonic()
+
+    def _touch(self) -> None:
+        self.updated_at = time.monotonic()
+
+    def add_kills(self, kills: Iterable[GameKill]) -> None:
+        self.kills.add(kills)
+        self._touch()
+
+    def add_chat_messages(self, chat_messages: Iterable[GameChatMessage]) -> None:
+        self.chat_messages.add(chat_messages)
+        self._touch()
+
+    def set_scoreboard(self, scoreboard: GameScoreboard) -> None:
+        self.players = {player.id: player for player in scoreboard.players}
+        self.players_complete = True
+        self._touch()
+
+    def upsert_players(self, players: Iterable[GamePlayer]) -> None:
+        for player in players:
+            self.players[player.id] = player
+        self._touch()
+
+    def delete_players(self, player_ids: Iterable[int]) -> None:
+        for player_id in player_ids:
+            self.players.pop(player_id, None)
+        self._touch()
+
+    def set_objective_state(self, objective_state: GameObjectiveState) -> None:
+        self.objective_state = objective_state
+        self._touch()
+
+    def apply_batch(
+            self,
+            batch: GameEventBatch,
+            kills: list[GameKill],
+            chat_messages: list[GameChatMessage],
+    ) -> None:
+        """Apply a stored batch. kills and chat_messages are
+        the kills and chat messages of the batch, as stored.
+        """
+        self.kills.add(kills)
+        self.chat_messages.add(chat_messages)
+        if batch.deleted_player_ids:
+            self.delete_players(batch.deleted_player_ids)
+        if batch.players:
+            self.upsert_players(batch.players)
+        if batch.objective_state:
+            self.objective_state = batch.objective_state
+        self._touch()
+
+    def new_kills(self, after_id: int, limit: int) -> list[GameKill] | None:
+        return self.kills.after(after_id, limit)
+
+    def new_chat_messages(self, after_id: int, limit: int) -> list[GameChatMessage] | None:
+        return self.chat_messages.after(after_id, limit)
+
+    @property
+    def scoreboard(self) -> GameScoreboard | None:
+        if not self.players_complete:
+            return None
+        return GameScoreboard(game_id=self.game_id, players=list(self.players.values()))
+
+
+class GameStateRegistry:
+    """Bounded LRU of GameStates, keyed by game ID."""
+
+    def __init__(
+            self,
+            max_size: int = max_game_states,
+            ttl: float = ttl_game_state,
+            max_kills: int = max_recent_kills,
+            max_chat_messages: int = max_recent_chat_messages,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_kills = max_kills
+        self.max_chat_messages = max_chat_messages
+        self.hits = 0
+        self.misses = 0
+        self._states: OrderedDict[str, GameState] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self._states
+
+    def _get(self, game_id: str) -> GameState | None:
+        state = self._states.get(game_id)
+        if state is None:
+            return None
+
+        if time.monotonic() - state.updated_at >= self.ttl:
+            del self._states[game_id]
+            return None
+
+        self._states.move_to_end(game_id)
+        return state
+
+    def get(self, game_id: str) -> GameState | None:
+        """Get the state for reading, counting hits and misses."""
+        state = self._get(game_id)
+        if state is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return state
+
+    def get_or_create(self, game_id: str, new_game: bool = False) -> GameState:
+        """Get the state for recording stored events. If the state does
+        not exist and new_game is False, the events of the game stored
+        before the state was created are unknown to it.
+        """
+        state = self._get(game_id)
+        if state is not None:
+            return state
+
+        state = GameState(
+            game_id=game_id,
+            new_game=new_game,
+            max_kills=self.max_kills,
+            max_chat_messages=self.max_chat_messages,
+        )
+        self._states[game_id] = state
+        while len(self._states) > self.max_size:
+            self._states.popitem(last=False)
+
+        return state
+
+    def add_events(
+            self,
+            kills: Iterable[GameKill],
+            chat_messages: Iterable[GameChatMessage],
+    ) -> None:
+        """Record stored kills and chat messages of any games."""
+        for kill in kills:
+            self.get_or_create(kill.game_id).add_kills([kill])
+        for msg in chat_messages:
+            self.get_or_create(msg.game_id).add_chat_messages([msg])
+
+    def discard(self, game_id: str) -> None:
+        self._states.pop(game_id, None)
+
+    def clear(self) -> None:
+        self._states.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+game_states = GameStateRegistry()
@@ -0,0 +1,78 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Fixed capacity ring buffer for recent game events."""
+
+from collections.abc import Iterator
+from typing import Generic
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class RingBuffer(Generic[T]):
+    """Fixed capacity FIFO backed by a preallocated list. Once full,
+    appending an item overwrites the oldest one. Iteration goes from
+    the oldest item to the newest.
+    """
+
+    __slots__ = ("_items", "_capacity", "_start", "_len")
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive, got {capacity}")
+        self._items: list[T | None] = [None] * capacity
+        self._capacity = capacity
+        self._start = 0
+        self._len = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[T]:
+        for i in range(self._len):
+            yield self._items[(self._start + i) % self._capacity]  # type: ignore[misc]
+
+    def __reversed__(self) -> Iterator[T]:
+        for i in range(self._len - 1, -1, -1):
+            yield self._items[(self._start + i) % self._capacity]  # type: ignore[misc]
+
+    def append(self, item: T) -> T | None:
+        """Append item, returning the overwritten oldest item, if any."""
+        if self._len < self._capacity:
+            self._items[(self._start + self._len) % self._capacity] = item
+            self._len += 1
+            return None
+
+        oldest = self._items[self._start]
+        self._items[self._start] = item
+        self._start = (self._start + 1) % self._capacity
+        return oldest
+
+    def clear(self) -> None:
+        self._items = [None] * self._capacity
+        self._start = 0
+        self._len = 0
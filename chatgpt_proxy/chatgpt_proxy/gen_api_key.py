@@ -38,6 +38,42 @@ from chatgpt_proxy.db import queries
 from chatgpt_proxy.utils import utcnow
 
 
+async def insert_api_key(
+        conn: Connection,
+        game_server_address: ipaddress.IPv4Address,
+        game_server_port: int,
+        secret: str,
+        issuer: str,
+        audience: str,
+        expires_at: datetime.datetime,
+        name: str | None = None,
+) -> str:
+    """Create an API key for the game server, replacing any old one."""
+    iat = utcnow()
+    token = jwt.encode(
+        key=secret,
+        algorithm="HS256",
+        payload={
+            "iss": issuer,
+            "aud": audience,
+            "sub": f"{game_server_address}:{game_server_port}",
+            "exp": int(expires_at.timestamp()),
+            "iat": int(iat.timestamp()),
+        },
+    )
+    token_sha256 = hashlib.sha256(token.encode("utf-8")).digest()
+    await queries.insert_game_server_api_key(
+        conn=conn,
+        issued_at=iat,
+        expires_at=expires_at,
+        token_hash=token_sha256,
+        game_server_address=game_server_address,
+        game_server_port=game_server_port,
+        name=name,
+    )
+    return token
+
+
 async def async_main(
         game_server_address: ipaddress.IPv4Address,
         game_server_port: int,
@@ -50,30 +86,17 @@ async def async_main(
     conn: Connection | None = None
     url = os.environ["DATABASE_URL"]
     try:
-        iat = utcnow()
-        token = jwt.encode(
-            key=secret,
-            algorithm="HS256",
-            payload={
-                "iss": issuer,
-                "aud": audience,
-                "sub": f"{game_server_address}:{game_server_port}",
-                "exp": int(expires_at.timestamp()),
-                "iat": int(iat.timestamp()),
-            },
-        )
-        token_sha256 = hashlib.sha256(token.encode("utf-8")).digest()
         conn = await asyncpg.connect(url)
-        await queries.insert_game_server_api_key(
+        return await insert_api_key(
             conn=conn,
-            issued_at=iat,
-            expires_at=expires_at,
-            token_hash=token_sha256,
             game_server_address=game_server_address,
             game_server_port=game_server_port,
+            secret=secret,
+            issuer=issuer,
+            audience=audience,
+            expires_at=expires_at,
             name=name,
         )
-        return token
     finally:
         if conn:
             await conn.close()
@@ -0,0 +1,55 @@
+from .coordinator import CoordinatorStats
+from .coordinator import RequestCoordinator
+from .governor import GovernorStats
+from .governor import LocalRateBucket
+from .governor import RateBucket
+from .governor import RateGovernor
+from .governor import RateLimitExceeded
+from .governor import RateLimitHeaders
+from .governor import RedisRateBucket
+from .governor import ServerKey
+from .governor import parse_rate_limit_headers
+from .governor import parse_retry_after
+from .jobs import Job
+from .jobs import JobStatus
+from .jobs import get_job
+from .jobs import running_jobs
+from .jobs import start_job
+from .jobs import stop_jobs
+from .resilience import CircuitBreaker
+from .resilience import CircuitOpen
+from .resilience import CircuitState
+from .resilience import LatencyTracker
+from .resilience import ModelRateLimited
+from .resilience import ModelResponse
+from .resilience import ResilienceStats
+from .resilience import ResilientClient
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpen",
+    "CircuitState",
+    "CoordinatorStats",
+    "GovernorStats",
+    "Job",
+    "JobStatus",
+    "LatencyTracker",
+    "LocalRateBucket",
+    "ModelRateLimited",
+    "ModelResponse",
+    "RateBucket",
+    "RateGovernor",
+    "RateLimitExceeded",
+    "RateLimitHeaders",
+    "RedisRateBucket",
+    "RequestCoordinator",
+    "ResilienceStats",
+    "ResilientClient",
+    "ServerKey",
+    "get_job",
+    "parse_rate_limit_headers",
+    "parse_retry_after",
+    "running_jobs",
+    "start_job",
+    "stop_jobs",
+]
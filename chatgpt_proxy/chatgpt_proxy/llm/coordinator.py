@@ -0,0 +1,145 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Per-key coordination of LLM calls.
+
+Each game's LLM conversation is a chain of responses, where every
+query continues from the previous response. Concurrent queries for
+the same game would fork the chain, so the queries of a key are run
+one batch at a time. Requests that arrive within a short merge window,
+or while a previous batch of the key is running, are merged into a
+single batch, which is answered with a single LLM call.
+
+NOTE: the coordination is per-worker, like the game state. Requests
+of a single game spread across multiple workers are not coordinated.
+"""
+
+import asyncio
+import dataclasses
+from collections.abc import Awaitable
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Generic
+from typing import TypeVar
+
+from chatgpt_proxy.log import logger
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Runs a batch of requests of a key, returning a result per request.
+BatchRunner = Callable[[str, list[T]], Awaitable[list[R]]]
+
+
+@dataclass(slots=True)
+class CoordinatorStats:
+    requests: int = 0
+    # Batches run, each with a single LLM call.
+    batches: int = 0
+    # Requests answered by the batch of an earlier request.
+    merged: int = 0
+    # Requests that waited for a running batch of the same key.
+    serialized: int = 0
+    failed: int = 0
+
+
+@dataclass(slots=True, frozen=True)
+class _Request(Generic[T, R]):
+    item: T
+    future: asyncio.Future[R]
+
+
+class RequestCoordinator(Generic[T, R]):
+    def __init__(
+            self,
+            run: BatchRunner[T, R],
+            merge_window: float,
+            max_batch_size: int,
+    ):
+        self.run = run
+        self.merge_window = merge_window
+        self.max_batch_size = max_batch_size
+        self._pending: dict[str, list[_Request[T, R]]] = {}
+        self._workers: dict[str, asyncio.Task[None]] = {}
+        self._running: set[str] = set()
+        self._stats = CoordinatorStats()
+
+    def stats(self) -> CoordinatorStats:
+        return dataclasses.replace(self._stats)
+
+    async def submit(self, key: str, item: T) -> R:
+        """Submit a request, waiting for the result of the batch it is run in."""
+        future: asyncio.Future[R] = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, []).append(_Request(item, future))
+        self._stats.requests += 1
+        if key in self._running:
+            self._stats.serialized += 1
+
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(
+                self._work(key), name=f"RequestCoordinator-{key}")
+
+        return await future
+
+    async def _work(self, key: str) -> None:
+        try:
+            await self._run_batches(key)
+        finally:
+            # NOTE: no awaits between the last check for pending requests
+            # and this, requests submitted after it start a new worker.
+            del self._workers[key]
+
+    async def _run_batches(self, key: str) -> None:
+        # Requests of a single batch arrive at about the same time, give
+        # them a moment. Requests that arrive while a batch is running
+        # have already waited and are run right after it.
+        if self.merge_window > 0:
+            await asyncio.sleep(self.merge_window)
+
+        while pending := self._pending.get(key):
+            batch = [request for request in pending[:self.max_batch_size]
+                     if not request.future.done()]
+            del pending[:self.max_batch_size]
+            if not pending:
+                del self._pending[key]
+            if not batch:
+                continue
+
+            self._stats.batches += 1
+            self._stats.merged += len(batch) - 1
+            self._running.add(key)
+            try:
+                results = await self.run(key, [request.item for request in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"expected {len(batch)} results, got {len(results)}")
+            except Exception as e:
+                logger.debug("{}: batch of {} failed: {}: {}", key, len(batch), type(e).__name__, e)
+                self._stats.failed += len(batch)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            else:
+                for request, result in zip(batch, results):
+                    if not request.future.done():
+                        request.future.set_result(result)
+            finally:
+                self._running.discard(key)
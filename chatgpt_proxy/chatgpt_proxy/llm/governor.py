@@ -0,0 +1,427 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Rate governor for OpenAI API calls.
+
+The OpenAI rate limits, requests and tokens per minute (RPM and TPM),
+are shared by every game server. Calls are admitted by a token bucket
+of both, which is kept in sync with the x-ratelimit-* headers of the
+OpenAI responses. When the bucket runs dry, calls wait in weighted fair
+queues keyed by game server, so that a busy game server mostly delays
+its own calls. Calls are shed with RateLimitExceeded when the queue is
+too long, or the expected wait too long.
+
+The bucket is either per-worker (LocalRateBucket), or shared by all
+workers in Redis (RedisRateBucket). NOTE: the queues are per-worker.
+The rate limits are per model, the bucket only tracks the primary model,
+see chatgpt_proxy.app.create_openai_response.
+"""
+
+import asyncio
+import dataclasses
+import heapq
+import ipaddress
+import itertools
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Protocol
+from typing import TypeAlias
+
+import redis.asyncio as redis
+
+from chatgpt_proxy.log import logger
+
+# Used until the first response headers are seen.
+default_requests_per_minute = 500
+default_tokens_per_minute = 200_000
+default_max_queue_length = 64
+default_max_wait = 30.0
+min_retry_after = 1.0
+default_redis_key = "chatgpt_proxy:openai_rate"
+
+ServerKey: TypeAlias = tuple[ipaddress.IPv4Address, int]
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limit exceeded, retry after {retry_after:.1f} s")
+        self.retry_after = retry_after
+
+
+@dataclass(slots=True, frozen=True)
+class RateLimitHeaders:
+    limit_requests: int
+    limit_tokens: int
+    remaining_requests: int
+    remaining_tokens: int
+
+
+def parse_rate_limit_headers(headers: Mapping[str, str]) -> RateLimitHeaders | None:
+    try:
+        return RateLimitHeaders(
+            limit_requests=int(headers["x-ratelimit-limit-requests"]),
+            limit_tokens=int(headers["x-ratelimit-limit-tokens"]),
+            remaining_requests=int(headers["x-ratelimit-remaining-requests"]),
+            remaining_tokens=int(headers["x-ratelimit-remaining-tokens"]),
+        )
+    except (KeyError, ValueError):
+        return None
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float:
+    """Return the retry-after-ms or retry-after (seconds) header
+    of a rate limited response, at least min_retry_after.
+    """
+    try:
+        if "retry-after-ms" in headers:
+            return max(min_retry_after, float(headers["retry-after-ms"]) / 1000.0)
+        return max(min_retry_after, float(headers["retry-after"]))
+    except (KeyError, ValueError):
+        return min_retry_after
+
+
+class RateBucket(Protocol):
+    # Last known limits.
+    requests_per_minute: float
+    tokens_per_minute: float
+
+    async def take(self, requests: int, tokens: int) -> float:
+        """Take requests and tokens from the bucket and return 0.0,
+        or if there are not enough of them, take nothing and return
+        the time until there are.
+        """
+        ...
+
+    async def adjust(self, tokens: int) -> None:
+        """Take more tokens, or give some back if negative."""
+        ...
+
+    async def sync(self, limits: RateLimitHeaders) -> None:
+        ...
+
+
+class LocalRateBucket:
+    def __init__(
+            self,
+            requests_per_minute: float = default_requests_per_minute,
+            tokens_per_minute: float = default_tokens_per_minute,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + elapsed * self.requests_per_minute / 60.0,
+        )
+        self._tokens = min(
+            self.tokens_per_minute,
+            self._tokens + elapsed * self.tokens_per_minute / 60.0,
+        )
+
+    async def take(self, requests: int, tokens: int) -> float:
+        self._refill()
+        # NOTE: calls larger than the whole bucket get through once it is full.
+        tokens = min(tokens, int(self.tokens_per_minute))
+        if self._requests >= requests and self._tokens >= tokens:
+            self._requests -= requests
+            self._tokens -= tokens
+            return 0.0
+        return max(
+            (requests - self._requests) * 60.0 / self.requests_per_minute,
+            (tokens - self._tokens) * 60.0 / self.tokens_per_minute,
+        )
+
+    async def adjust(self, tokens: int) -> None:
+        self._refill()
+        self._tokens = min(self.tokens_per_minute, self._tokens - tokens)
+
+    async def sync(self, limits: RateLimitHeaders) -> None:
+        self._refill()
+        self.requests_per_minute = limits.limit_requests
+        self.tokens_per_minute = limits.limit_tokens
+        self._requests = min(limits.remaining_requests, limits.limit_requests)
+        self._tokens = min(limits.remaining_tokens, limits.limit_tokens)
+
+
+# Loads and refills the bucket, shared by the scripts below. Time is
+# taken from the Redis server to have the same clock for all workers.
+_redis_refill = """
+local state = redis.call("HMGET", KEYS[1], "rpm", "tpm", "requests", "tokens", "updated_at")
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rpm = tonumber(state[1]) or tonumber(ARGV[1])
+local tpm = tonumber(state[2]) or tonumber(ARGV[2])
+local requests = tonumber(state[3]) or rpm
+local tokens = tonumber(state[4]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[5]) or now))
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+"""
+
+_redis_store = """
+redis.call("HSET", KEYS[1], "rpm", rpm, "tpm", tpm, "requests", requests,
+           "tokens", tokens, "updated_at", now)
+redis.call("EXPIRE", KEYS[1], 3600)
+"""
+
+# ARGV: default rpm, default tpm, requests, tokens.
+# NOTE: Lua numbers are returned as integers, floats as strings.
+_redis_take = _redis_refill + """
+local want_requests = tonumber(ARGV[3])
+local want_tokens = math.min(tonumber(ARGV[4]), tpm)
+local wait = 0
+if requests >= want_requests and tokens >= want_tokens then
+    requests = requests - want_requests
+    tokens = tokens - want_tokens
+else
+    wait = math.max((want_requests - requests) * 60 / rpm, (want_tokens - tokens) * 60 / tpm)
+end
+""" + _redis_store + """
+return {tostring(wait), tostring(rpm), tostring(tpm)}
+"""
+
+# ARGV: default rpm, default tpm, tokens.
+_redis_adjust = _redis_refill + """
+tokens = math.min(tpm, tokens - tonumber(ARGV[3]))
+""" + _redis_store
+
+# ARGV: default rpm, default tpm, limit requests, limit tokens,
+# remaining requests, remaining tokens.
+_redis_sync = _redis_refill + """
+rpm = tonumber(ARGV[3])
+tpm = tonumber(ARGV[4])
+requests = math.min(tonumber(ARGV[5]), rpm)
+tokens = math.min(tonumber(ARGV[6]), tpm)
+""" + _redis_store
+
+
+class RedisRateBucket:
+    """Rate bucket shared by all workers, using the same key."""
+
+    def __init__(
+            self,
+            client: redis.Redis,
+            key: str = default_redis_key,
+            requests_per_minute: float = default_requests_per_minute,
+            tokens_per_minute: float = default_tokens_per_minute,
+    ):
+        self.client = client
+        self.key = key
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._default_limits = (requests_per_minute, tokens_per_minute)
+        self._take = client.register_script(_redis_take)
+        self._adjust = client.register_script(_redis_adjust)
+        self._sync = client.register_script(_redis_sync)
+
+    async def take(self, requests: int, tokens: int) -> float:
+        wait, rpm, tpm = await self._take(
+            keys=[self.key],
+            args=[*self._default_limits, requests, tokens],
+        )
+        self.requests_per_minute = float(rpm)
+        self.tokens_per_minute = float(tpm)
+        return float(wait)
+
+    async def adjust(self, tokens: int) -> None:
+        await self._adjust(keys=[self.key], args=[*self._default_limits, tokens])
+
+    async def sync(self, limits: RateLimitHeaders) -> None:
+        self.requests_per_minute = limits.limit_requests
+        self.tokens_per_minute = limits.limit_tokens
+        await self._sync(keys=[self.key], args=[
+            *self._default_limits,
+            limits.limit_requests,
+            limits.limit_tokens,
+            limits.remaining_requests,
+            limits.remaining_tokens,
+        ])
+
+
+@dataclass(slots=True)
+class GovernorStats:
+    # Calls admitted without waiting.
+    admitted: int = 0
+    # Calls admitted after waiting in the queue.
+    queued: int = 0
+    # Calls rejected with RateLimitExceeded.
+    shed: int = 0
+    # Responses with rate limit headers.
+    syncs: int = 0
+
+
+@dataclass(slots=True, order=True)
+class _Waiter:
+    # Virtual finish time of the call, calls are admitted in this order.
+    finish: float
+    seq: int
+    key: ServerKey = field(compare=False)
+    tokens: int = field(compare=False)
+    future: asyncio.Future[None] = field(compare=False)
+
+
+class RateGovernor:
+    def __init__(
+            self,
+            bucket: RateBucket,
+            max_queue_length: int = default_max_queue_length,
+            max_wait: float = default_max_wait,
+            weights: Mapping[ServerKey, float] | None = None,
+    ):
+        self.bucket = bucket
+        self.max_queue_length = max_queue_length
+        self.max_wait = max_wait
+        # Share of each game server, relative to the others. Defaults to 1.0.
+        self.weights = dict(weights or {})
+        self._queue: list[_Waiter] = []
+        self._queued_tokens = 0
+        # Weighted fair queuing state: virtual time of the latest admitted
+        # call, and the virtual finish time of the latest call of each key.
+        self._virtual_time = 0.0
+        self._finish: dict[ServerKey, float] = {}
+        self._seq = itertools.count()
+        self._dispatcher: asyncio.Task[None] | None = None
+        self._stats = GovernorStats()
+
+    def stats(self) -> GovernorStats:
+        return dataclasses.replace(self._stats)
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._queue)
+
+    def expected_wait(self, tokens: int = 0) -> float:
+        """Expected time until a new call of tokens would be admitted."""
+        if self._dispatcher is None:
+            return 0.0
+        return max(
+            (len(self._queue) + 1) * 60.0 / self.bucket.requests_per_minute,
+            (self._queued_tokens + tokens) * 60.0 / self.bucket.tokens_per_minute,
+        )
+
+    def check(self, tokens: int = 0) -> None:
+        """Raise RateLimitExceeded if a new call would be shed."""
+        expected_wait = self.expected_wait(tokens)
+        if len(self._queue) >= self.max_queue_length or expected_wait > self.max_wait:
+            self._stats.shed += 1
+            raise RateLimitExceeded(retry_after=max(min_retry_after, expected_wait))
+
+    async def acquire(self, key: ServerKey, tokens: int) -> None:
+        """Wait until a call of tokens is allowed, or raise
+        RateLimitExceeded if it would have to wait too long.
+        """
+        self.check(tokens)
+
+        # Nothing is queued, skip the queue.
+        if self._dispatcher is None and await self.bucket.take(1, tokens) == 0.0:
+            self._stats.admitted += 1
+            return
+
+        # NOTE: a call's finish time grows by its cost divided by the weight
+        # of its key. Keys that have been idle start from the current virtual
+        # time, they cannot save up their share for later.
+        weight = self.weights.get(key, 1.0)
+        finish = max(self._virtual_time, self._finish.get(key, 0.0)) + tokens / weight
+        self._finish[key] = finish
+        waiter = _Waiter(
+            finish=finish,
+            seq=next(self._seq),
+            key=key,
+            tokens=tokens,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._queue, waiter)
+        self._queued_tokens += tokens
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="RateGovernor")
+
+        try:
+            await asyncio.wait([waiter.future], timeout=self.max_wait)
+        except asyncio.CancelledError:
+            waiter.future.cancel()
+            raise
+        if not waiter.future.done():
+            waiter.future.cancel()
+            self._stats.shed += 1
+            raise RateLimitExceeded(retry_after=max(min_retry_after, self.expected_wait()))
+        # Raises if the dispatcher failed.
+        waiter.future.result()
+        self._stats.queued += 1
+
+    async def _dispatch(self) -> None:
+        try:
+            while self._queue:
+                waiter = heapq.heappop(self._queue)
+                if waiter.future.done():
+                    self._queued_tokens -= waiter.tokens
+                    continue
+
+                wait = await self.bucket.take(1, waiter.tokens)
+                if wait > 0.0:
+                    heapq.heappush(self._queue, waiter)
+                    await asyncio.sleep(wait)
+                    continue
+
+                self._queued_tokens -= waiter.tokens
+                self._virtual_time = waiter.finish
+                if waiter.future.done():
+                    # Gave up while the tokens were taken.
+                    await self.bucket.adjust(-waiter.tokens)
+                else:
+                    waiter.future.set_result(None)
+        except Exception as e:
+            logger.opt(exception=e).error("rate governor dispatch failed")
+            for waiter in self._queue:
+                if not waiter.future.done():
+                    waiter.future.set_exception(e)
+            self._queue.clear()
+            self._queued_tokens = 0
+        finally:
+            self._dispatcher = None
+            if not self._queue:
+                # NOTE: finish times only matter relative to queued calls.
+                self._finish.clear()
+
+    async def update(
+            self,
+            headers: Mapping[str, str],
+            tokens: int,
+            used_tokens: int | None,
+    ) -> None:
+        """Update the bucket after a call of tokens, from the rate limit
+        headers of the response if any, else from the tokens used.
+        """
+        limits = parse_rate_limit_headers(headers)
+        if limits is not None:
+            self._stats.syncs += 1
+            await self.bucket.sync(limits)
+        elif used_tokens is not None and used_tokens != tokens:
+            await self.bucket.adjust(used_tokens - tokens)
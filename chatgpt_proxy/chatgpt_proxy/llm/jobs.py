@@ -0,0 +1,140 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Asynchronous LLM jobs.
+
+The game server HTTP client gives up on requests after a couple of
+seconds, which is often less than an LLM query takes. Instead of
+waiting for the response, a client may start the query as a job and
+poll for its result. Job state is kept in the shared app cache with
+a TTL, so any worker can answer the polls.
+
+NOTE: the job itself only runs in the worker that started it. Jobs
+still running when the worker stops are cancelled after a grace period
+and are reported as failed.
+"""
+
+import asyncio
+import secrets
+from collections.abc import Awaitable
+from collections.abc import Callable
+from dataclasses import dataclass
+from enum import StrEnum
+
+from chatgpt_proxy.cache import app_cache
+from chatgpt_proxy.log import logger
+
+job_id_length = 16
+# How long job results are kept for polling.
+job_ttl = 300.0
+job_shutdown_timeout = 10.0
+
+_running_jobs: dict[str, asyncio.Task[None]] = {}
+
+
+class JobStatus(StrEnum):
+    Pending = "pending"
+    Done = "done"
+    Failed = "failed"
+
+
+@dataclass(slots=True, frozen=True)
+class Job:
+    status: JobStatus
+    result: str | None = None
+
+
+def _job_key(scope: str, job_id: str) -> str:
+    # NOTE: job IDs are scoped, e.g. by game ID, so that they
+    # can only be polled by the owner of the scope.
+    return f"llm_job:{scope}:{job_id}"
+
+
+async def start_job(
+        scope: str,
+        coro_func: Callable[[], Awaitable[str]],
+        ttl: float = job_ttl,
+) -> str:
+    """Run coro_func in the background, returning the job ID.
+    The result of coro_func is the result of the job.
+    """
+    job_id = secrets.token_hex(job_id_length)
+    key = _job_key(scope, job_id)
+    await app_cache.set(key, {"status": JobStatus.Pending}, ttl=ttl)
+
+    task = asyncio.create_task(_run_job(key, coro_func, ttl), name=key)
+    _running_jobs[key] = task
+    task.add_done_callback(lambda _: _running_jobs.pop(key, None))
+    return job_id
+
+
+async def _run_job(
+        key: str,
+        coro_func: Callable[[], Awaitable[str]],
+        ttl: float,
+) -> None:
+    value: dict[str, str]
+    try:
+        value = {"status": JobStatus.Done, "result": await coro_func()}
+    except asyncio.CancelledError:
+        logger.warning("{}: cancelled", key)
+        await _set_job(key, {"status": JobStatus.Failed}, ttl)
+        raise
+    except Exception as e:
+        logger.opt(exception=e).error("{}: failed", key)
+        value = {"status": JobStatus.Failed}
+
+    await _set_job(key, value, ttl)
+
+
+async def _set_job(key: str, value: dict[str, str], ttl: float) -> None:
+    try:
+        await app_cache.set(key, value, ttl=ttl)
+    except Exception as e:
+        logger.error("{}: failed to store job state: {}: {}", key, type(e).__name__, e)
+
+
+async def get_job(scope: str, job_id: str) -> Job | None:
+    """Return the job, or None if it does not exist or has expired."""
+    value = await app_cache.get(_job_key(scope, job_id))
+    if value is None:
+        return None
+    return Job(status=JobStatus(value["status"]), result=value.get("result"))
+
+
+def running_jobs() -> int:
+    return len(_running_jobs)
+
+
+async def stop_jobs(timeout: float = job_shutdown_timeout) -> None:
+    """Wait for the jobs running in this worker to finish,
+    cancelling the ones still running after timeout.
+    """
+    tasks = list(_running_jobs.values())
+    if not tasks:
+        return
+
+    logger.info("waiting for {} LLM job(s) to finish", len(tasks))
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,357 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Latency-aware and failure-tolerant OpenAI Responses API calls.
+
+The latest call latencies of each model are tracked in a rolling
+window. A call that is still running when the p95 latency of its model
+has passed gets a hedged duplicate, and whichever finishes first wins.
+
+Failing calls (connection errors, timeouts and server errors) trip a
+per-model circuit breaker, which rejects calls to the model until it has
+had some time to recover. Calls are routed to the fallback model when
+the circuit of the primary model is open, when its p95 latency is over
+a threshold, or when the primary call fails. A slow primary model still
+gets a call every probe interval, to notice when it has recovered.
+
+NOTE: the latencies and circuits are per-worker.
+"""
+
+import asyncio
+import dataclasses
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+import httpx
+import openai
+from openai.types.responses import Response
+
+from chatgpt_proxy.log import logger
+
+default_latency_window = 100
+default_min_latency_samples = 20
+# Don't hedge calls faster than this, the duplicate calls cost tokens.
+default_min_hedge_delay = 1.0
+# Primary model p95 latency over which calls are routed to the fallback.
+default_slow_latency = 15.0
+default_probe_interval = 10.0
+default_failure_threshold = 5
+default_reset_timeout = 30.0
+min_retry_after = 1.0
+
+# Failures that count against the circuit of the model.
+# NOTE: rate limit (429) and other client errors are not the model's fault.
+_model_errors = (
+    openai.APIConnectionError,  # Includes timeouts.
+    openai.InternalServerError,
+)
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"all model circuits open, retry after {retry_after:.1f} s")
+        self.retry_after = retry_after
+
+
+class ModelRateLimited(Exception):
+    """The OpenAI API rate limit of the model was exceeded (429)."""
+
+    def __init__(self, model: str, headers: httpx.Headers):
+        super().__init__(f"model {model} rate limited")
+        self.model = model
+        self.headers = headers
+
+
+class LatencyTracker:
+    """Rolling window of the latest call latencies of a model."""
+
+    def __init__(
+            self,
+            window: int = default_latency_window,
+            min_samples: int = default_min_latency_samples,
+    ):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def percentile(self, p: float) -> float | None:
+        """Nearest-rank percentile, p in (0, 1], or None
+        if there are not enough samples yet.
+        """
+        if len(self._samples) < self.min_samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[max(0, math.ceil(p * len(samples)) - 1)]
+
+
+class CircuitState(StrEnum):
+    Closed = "closed"
+    Open = "open"
+    # A single trial call is allowed to check whether the model has recovered.
+    HalfOpen = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(
+            self,
+            failure_threshold: int = default_failure_threshold,
+            reset_timeout: float = default_reset_timeout,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial = False
+
+    @property
+    def state(self) -> CircuitState:
+        if self._opened_at is None:
+            return CircuitState.Closed
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return CircuitState.Open
+        return CircuitState.HalfOpen
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Return whether a call is allowed, taking the trial call if half-open."""
+        state = self.state
+        if state == CircuitState.Closed:
+            return True
+        if state == CircuitState.HalfOpen and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._trial or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._trial = False
+
+    def release(self) -> None:
+        """Release the trial call without a result, e.g. when cancelled."""
+        self._trial = False
+
+
+@dataclass(slots=True, frozen=True)
+class ModelResponse:
+    # The model the call was made to, the response
+    # may name a dated snapshot of it instead.
+    model: str
+    response: Response
+    headers: httpx.Headers
+
+
+@dataclass(slots=True)
+class ResilienceStats:
+    requests: int = 0
+    # Calls that got a hedged duplicate, and of those,
+    # calls where the duplicate finished first.
+    hedged: int = 0
+    hedge_wins: int = 0
+    # Calls made to the fallback model.
+    fallbacks: int = 0
+    # Calls failed with model errors.
+    failures: int = 0
+    # Requests rejected with CircuitOpen.
+    rejected: int = 0
+
+
+class ResilientClient:
+    """Routes Responses API calls between the primary and the fallback
+    model, see module docstring.
+
+    NOTE: retries are done here by falling back to the other model,
+    the client should be created with max_retries=0.
+    """
+
+    def __init__(
+            self,
+            client: openai.AsyncOpenAI,
+            model: str,
+            fallback_model: str | None = None,
+            timeout: float | None = None,
+            hedge: bool = True,
+            min_hedge_delay: float = default_min_hedge_delay,
+            slow_latency: float = default_slow_latency,
+            probe_interval: float = default_probe_interval,
+            failure_threshold: int = default_failure_threshold,
+            reset_timeout: float = default_reset_timeout,
+            latency_window: int = default_latency_window,
+            min_latency_samples: int = default_min_latency_samples,
+    ):
+        self.client = client
+        self.model = model
+        self.fallback_model = fallback_model
+        self.timeout = timeout
+        self.hedge = hedge
+        self.min_hedge_delay = min_hedge_delay
+        self.slow_latency = slow_latency
+        self.probe_interval = probe_interval
+        self.models = [model] if fallback_model is None else [model, fallback_model]
+        self.latencies = {
+            m: LatencyTracker(window=latency_window, min_samples=min_latency_samples)
+            for m in self.models
+        }
+        self.breakers = {
+            m: CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+            for m in self.models
+        }
+        self._last_primary_call = 0.0
+        self._stats = ResilienceStats()
+
+    def stats(self) -> ResilienceStats:
+        return dataclasses.replace(self._stats)
+
+    def latency_percentiles(self) -> dict[str, tuple[float | None, float | None]]:
+        """Return the p50 and p95 latencies of each model."""
+        return {
+            model: (tracker.percentile(0.50), tracker.percentile(0.95))
+            for model, tracker in self.latencies.items()
+        }
+
+    def is_slow(self, model: str) -> bool:
+        p95 = self.latencies[model].percentile(0.95)
+        return p95 is not None and p95 > self.slow_latency
+
+    def check(self) -> None:
+        """Raise CircuitOpen if a new call would be rejected."""
+        if all(breaker.state == CircuitState.Open for breaker in self.breakers.values()):
+            self._stats.rejected += 1
+            raise CircuitOpen(retry_after=self._retry_after())
+
+    def _retry_after(self) -> float:
+        return max(
+            min_retry_after,
+            min(breaker.retry_after() for breaker in self.breakers.values()),
+        )
+
+    def _route(self) -> list[str]:
+        """Return the models to try, in order."""
+        if self.fallback_model is None or not self.is_slow(self.model):
+            return self.models
+        now = time.monotonic()
+        if now - self._last_primary_call >= self.probe_interval:
+            return self.models
+        return [self.fallback_model, self.model]
+
+    async def create(self, **kwargs: Any) -> ModelResponse:
+        """Create a response with the first model that is allowed and
+        does not fail. Raises CircuitOpen if no model is allowed,
+        ModelRateLimited if the model is rate limited, or the error
+        of the last model that failed.
+        """
+        self._stats.requests += 1
+        error: Exception | None = None
+        for model in self._route():
+            if not self.breakers[model].allow():
+                continue
+            if model == self.model:
+                self._last_primary_call = time.monotonic()
+            else:
+                self._stats.fallbacks += 1
+            try:
+                return await self._create_hedged(model, kwargs)
+            except _model_errors as e:
+                logger.info("model {} failed: {}: {}", model, type(e).__name__, e)
+                error = e
+
+        if error is not None:
+            raise error
+        self._stats.rejected += 1
+        raise CircuitOpen(retry_after=self._retry_after())
+
+    async def _create_hedged(self, model: str, kwargs: dict[str, Any]) -> ModelResponse:
+        p95 = self.latencies[model].percentile(0.95)
+        first = asyncio.create_task(self._create(model, kwargs))
+        if not self.hedge or p95 is None:
+            return await first
+
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(self.min_hedge_delay, p95))
+            if not done:
+                self._stats.hedged += 1
+                tasks.add(asyncio.create_task(self._create(model, kwargs)))
+
+            error: BaseException | None = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if (e := task.exception()) is None:
+                        if task is not first:
+                            self._stats.hedge_wins += 1
+                        return task.result()
+                    error = error or e
+            assert error is not None
+            raise error
+        finally:
+            # NOTE: the losing call is cancelled, but OpenAI may still
+            # finish it and bill for it.
+            for task in tasks:
+                task.cancel()
+
+    async def _create(self, model: str, kwargs: dict[str, Any]) -> ModelResponse:
+        breaker = self.breakers[model]
+        start = time.monotonic()
+        try:
+            raw = await self.client.responses.with_raw_response.create(
+                model=model,
+                timeout=self.timeout,
+                **kwargs,
+            )
+            resp = raw.parse()
+        except _model_errors as e:
+            # A timeout is a latency sample too, at least this slow.
+            if isinstance(e, openai.APITimeoutError):
+                self.latencies[model].add(time.monotonic() - start)
+            breaker.record_failure()
+            self._stats.failures += 1
+            raise
+        except openai.RateLimitError as e:
+            breaker.release()
+            raise ModelRateLimited(model, e.response.headers) from e
+        except BaseException:
+            breaker.release()
+            raise
+
+        self.latencies[model].add(time.monotonic() - start)
+        breaker.record_success()
+        return ModelResponse(model=model, response=resp, headers=raw.headers)
@@ -0,0 +1,25 @@
+from .assembler import AssembledPrompt
+from .assembler import AssembledSection
+from .assembler import PromptAssembler
+from .assembler import PromptSection
+from .tables import Table
+from .tables import chat_messages_table
+from .tables import kills_table
+from .tables import objectives_table
+from .tables import players_table
+from .tokens import TokenCounter
+from .tokens import estimate_tokens
+
+__all__ = [
+    "AssembledPrompt",
+    "AssembledSection",
+    "PromptAssembler",
+    "PromptSection",
+    "Table",
+    "TokenCounter",
+    "chat_messages_table",
+    "estimate_tokens",
+    "kills_table",
+    "objectives_table",
+    "players_table",
+]
@@ -0,0 +1,202 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Token budgeted prompt assembly.
+
+A prompt is built from sections, each with a header and candidate rows.
+Required sections, e.g. the instruction, are always included in full.
+The rest of the token budget is shared between the other sections by
+weight, and each section is filled greedily with its highest ranked rows
+that fit in its share. Budget left unused by a section is given to the
+sections that still have rows left, in order of weight.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from chatgpt_proxy.prompt.tokens import TokenCounter
+from chatgpt_proxy.prompt.tokens import estimate_tokens
+
+section_separator = "\n\n"
+
+
+@dataclass(slots=True, frozen=True)
+class PromptSection:
+    name: str
+    header: str = ""
+    # Candidate rows, in the order they are rendered in.
+    rows: Sequence[str] = ()
+    # Rank of each row, higher is more important. Defaults
+    # to the row order, i.e., later rows are more important.
+    ranks: Sequence[float] | None = None
+    weight: float = 1.0
+    # Included in full regardless of the budget, e.g. the instruction.
+    required: bool = False
+
+
+@dataclass(slots=True, frozen=True)
+class AssembledSection:
+    name: str
+    text: str
+    tokens: int
+    rows_included: int
+    rows_total: int
+
+
+@dataclass(slots=True, frozen=True)
+class AssembledPrompt:
+    text: str
+    tokens: int
+    sections: list[AssembledSection]
+
+    def section(self, name: str) -> AssembledSection | None:
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+
+
+class _SectionFill:
+    __slots__ = ("section", "header_tokens", "row_tokens", "candidates", "included", "used")
+
+    def __init__(self, section: PromptSection, token_counter: TokenCounter):
+        self.section = section
+        self.header_tokens = token_counter(section.header) if section.header else 0
+        self.row_tokens = [token_counter(row) for row in section.rows]
+        ranks = section.ranks if section.ranks is not None else range(len(section.rows))
+        if len(ranks) != len(section.rows):
+            raise ValueError(f"section '{section.name}': expected {len(section.rows)} "
+                             f"ranks, got {len(ranks)}")
+        # Indices of the rows not included yet, the highest ranked
+        # first. Of rows with equal rank, the later one goes first.
+        self.candidates = sorted(
+            range(len(section.rows)),
+            key=lambda i: (ranks[i], i),
+            reverse=True,
+        )
+        self.included: list[int] = []
+        self.used = 0
+
+    def fill(self, budget: int) -> int:
+        """Add the highest ranked rows that fit in budget, returning
+        the number of tokens used. Rows that do not fit are skipped,
+        they may still fit in budget given to this section later.
+        """
+        used = 0
+        skipped: list[int] = []
+        for i in self.candidates:
+            # The header is paid for by the first included row.
+            cost = self.row_tokens[i] + (0 if self.included else self.header_tokens)
+            if used + cost <= budget:
+                used += cost
+                self.included.append(i)
+            else:
+                skipped.append(i)
+
+        self.candidates = skipped
+        self.used += used
+        return used
+
+
+class PromptAssembler:
+    def __init__(
+            self,
+            max_tokens: int,
+            token_counter: TokenCounter = estimate_tokens,
+            separator: str = section_separator,
+    ):
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self.separator = separator
+
+    def assemble(self, sections: Sequence[PromptSection]) -> AssembledPrompt:
+        separator_tokens = self.token_counter(self.separator)
+        budget = self.max_tokens
+
+        required: list[AssembledSection] = []
+        for section in sections:
+            if section.required:
+                text = _render(section, range(len(section.rows)))
+                tokens = self.token_counter(text)
+                budget -= tokens + separator_tokens
+                required.append(AssembledSection(
+                    name=section.name,
+                    text=text,
+                    tokens=tokens,
+                    rows_included=len(section.rows),
+                    rows_total=len(section.rows),
+                ))
+
+        fills = [
+            _SectionFill(section, self.token_counter)
+            for section in sections
+            if not section.required and section.rows
+        ]
+        # Every included section costs a separator too.
+        budget -= separator_tokens * len(fills)
+
+        total_weight = sum(fill.section.weight for fill in fills)
+        if budget > 0 and total_weight > 0:
+            for fill in fills:
+                fill.fill(int(budget * fill.section.weight / total_weight))
+
+            # Hand out the leftovers, the heaviest sections first.
+            left = budget - sum(fill.used for fill in fills)
+            for fill in sorted(fills, key=lambda f: f.section.weight, reverse=True):
+                if left <= 0:
+                    break
+                if fill.candidates:
+                    left -= fill.fill(left)
+
+        assembled: dict[str, AssembledSection] = {
+            section.name: section for section in required
+        }
+        for fill in fills:
+            if not fill.included:
+                continue
+            text = _render(fill.section, sorted(fill.included))
+            assembled[fill.section.name] = AssembledSection(
+                name=fill.section.name,
+                text=text,
+                tokens=fill.used,
+                rows_included=len(fill.included),
+                rows_total=len(fill.section.rows),
+            )
+
+        # Sections are rendered in the given order.
+        ordered = [
+            assembled[section.name]
+            for section in sections
+            if section.name in assembled
+        ]
+        text = self.separator.join(section.text for section in ordered)
+        return AssembledPrompt(
+            text=text,
+            tokens=self.token_counter(text),
+            sections=ordered,
+        )
+
+
+def _render(section: PromptSection, rows: Sequence[int]) -> str:
+    lines = [section.header] if section.header else []
+    lines.extend(section.rows[i] for i in rows)
+    return "\n".join(lines)
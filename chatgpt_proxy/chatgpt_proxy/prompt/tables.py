@@ -0,0 +1,115 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Compact table rendering of game data for prompts.
+
+Tables are rendered with the header once, followed by one row per
+line, with the columns separated by pipes and no padding. This takes
+far fewer tokens than padded Markdown tables and is as easy for the
+model to read. Tables are returned as the header and the rows
+separately, so that only some of the rows can be included in a prompt.
+"""
+
+from collections.abc import Iterable
+from typing import TypeAlias
+
+from chatgpt_proxy.db.models import GameChatMessage
+from chatgpt_proxy.db.models import GameChatMessageEvent
+from chatgpt_proxy.db.models import GameKill
+from chatgpt_proxy.db.models import GameKillEvent
+from chatgpt_proxy.db.models import GameObjective
+from chatgpt_proxy.db.models import GamePlayer
+from chatgpt_proxy.db.models import SayType
+from chatgpt_proxy.db.models import Team
+
+Table: TypeAlias = tuple[str, list[str]]
+
+kills_header = "Killer|Killer Team|Victim|Victim Team|Damage Type|Distance (m)"
+chat_messages_header = "Sender|Team|Channel|Message"
+players_header = "Name|Team|Score"
+objectives_header = "Objective|Owner Team"
+
+# Free text may not contain column or row separators.
+_cell_translation = str.maketrans({"|": "/", "\n": " ", "\r": " "})
+
+
+def _cell(text: str) -> str:
+    # NOTE: str.translate is slow, most cells need no changes.
+    if "|" in text or "\n" in text or "\r" in text:
+        return text.translate(_cell_translation)
+    return text
+
+
+# NOTE: models loaded from the database hold plain ints instead of
+# the enums. Plain dict lookups are much faster than enum conversions.
+_team_names: dict[Team | int, str] = {
+    **{team: team.name for team in Team},
+    **{int(team): team.name for team in Team},
+}
+_channel_names: dict[SayType | int, str] = {
+    **{channel: channel.name for channel in SayType},
+    **{int(channel): channel.name for channel in SayType},
+}
+
+
+def _team(team: Team | int) -> str:
+    return _team_names[team]
+
+
+def _channel(channel: SayType | int) -> str:
+    return _channel_names[channel]
+
+
+def _damage_type(damage_type: str) -> str:
+    # TODO: also do this for other well known damage type prefixes?
+    return damage_type.removeprefix("RODmgType_")
+
+
+def kills_table(kills: Iterable[GameKill | GameKillEvent]) -> Table:
+    return kills_header, [
+        f"{_cell(kill.killer_name)}|{_team(kill.killer_team)}|"
+        f"{_cell(kill.victim_name)}|{_team(kill.victim_team)}|"
+        f"{_cell(_damage_type(kill.damage_type))}|{round(kill.kill_distance_m, 1)}"
+        for kill in kills
+    ]
+
+
+def chat_messages_table(msgs: Iterable[GameChatMessage | GameChatMessageEvent]) -> Table:
+    return chat_messages_header, [
+        f"{_cell(msg.sender_name)}|{_team(msg.sender_team)}|"
+        f"{_channel(msg.channel)}|{_cell(msg.message)}"
+        for msg in msgs
+    ]
+
+
+def players_table(players: Iterable[GamePlayer]) -> Table:
+    return players_header, [
+        f"{_cell(player.name)}|{_team(player.team)}|{player.score}"
+        for player in players
+    ]
+
+
+def objectives_table(objectives: Iterable[GameObjective]) -> Table:
+    return objectives_header, [
+        f"{_cell(objective.name)}|{_team(objective.team_state)}"
+        for objective in objectives
+    ]
@@ -0,0 +1,45 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Offline token counting for prompt budgeting."""
+
+import math
+from collections.abc import Callable
+from typing import TypeAlias
+
+TokenCounter: TypeAlias = Callable[[str], int]
+
+# Average characters per token of the OpenAI tokenizers for English text.
+# Game data has more short words, numbers and punctuation than prose,
+# which is why whitespace runs are also counted below.
+chars_per_token = 4.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast token count heuristic, without a tokenizer. Tends to
+    overestimate slightly, which is the safer direction for budgeting.
+    """
+    if not text:
+        return 0
+    # NOTE: str.count is much faster than splitting or regular expressions.
+    separators = text.count(" ") + text.count("\n") + text.count("|")
+    return max(math.ceil(len(text) / chars_per_token), separators + 1)
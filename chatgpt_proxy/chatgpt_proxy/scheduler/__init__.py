@@ -0,0 +1,9 @@
+from .scheduler import Job
+from .scheduler import JobStats
+from .scheduler import Scheduler
+
+__all__ = [
+    "Job",
+    "JobStats",
+    "Scheduler",
+]
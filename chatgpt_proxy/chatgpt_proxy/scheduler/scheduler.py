@@ -0,0 +1,196 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Minimal asyncio scheduler for periodic background jobs."""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+
+from chatgpt_proxy.log import logger
+
+_default_stop_timeout = 10.0
+
+
+@dataclass(slots=True)
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    # Runs skipped because the previous run was still in progress.
+    skipped: int = 0
+    last_duration: float | None = None
+    max_duration: float = 0.0
+    total_duration: float = 0.0
+    last_error: str | None = None
+
+
+@dataclass(slots=True)
+class Job:
+    name: str
+    func: Callable[[], Awaitable[Any]]
+    interval: float
+    # Random delay of [0, jitter] seconds added to every interval.
+    jitter: float = 0.0
+    timeout: float | None = None
+    run_at_start: bool = False
+    stats: JobStats = field(default_factory=JobStats)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def next_delay(self) -> float:
+        return self.interval + random.uniform(0.0, self.jitter)
+
+
+class Scheduler:
+    """Runs each job periodically in its own task. Runs of the same
+    job never overlap, a job that runs longer than its interval is
+    started again only after the previous run has finished.
+    """
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._stop_event = asyncio.Event()
+
+    @property
+    def jobs(self) -> dict[str, Job]:
+        return self._jobs
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not self._stop_event.is_set()
+
+    def stats(self) -> dict[str, JobStats]:
+        return {name: job.stats for name, job in self._jobs.items()}
+
+    def add_job(
+            self,
+            name: str,
+            func: Callable[[], Awaitable[Any]],
+            interval: float,
+            jitter: float = 0.0,
+            timeout: float | None = None,
+            run_at_start: bool = False,
+    ) -> Job:
+        if name in self._jobs:
+            raise ValueError(f"job already exists: '{name}'")
+        if interval <= 0.0:
+            raise ValueError(f"invalid interval: {interval}")
+
+        job = Job(
+            name=name,
+            func=func,
+            interval=interval,
+            jitter=jitter,
+            timeout=timeout,
+            run_at_start=run_at_start,
+        )
+        self._jobs[name] = job
+        if self.running:
+            self._start_job(job)
+        return job
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        for job in self._jobs.values():
+            if job.name not in self._tasks:
+                self._start_job(job)
+
+    async def stop(self, timeout: float = _default_stop_timeout) -> None:
+        """Stop scheduling new runs. Runs in progress are given
+        timeout seconds to finish before they are cancelled.
+        """
+        self._stop_event.set()
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        if not tasks:
+            return
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def run_job(self, name: str) -> bool:
+        """Run a job immediately. Returns False if the
+        job was skipped because it was already running.
+        """
+        return await self._run(self._jobs[name])
+
+    def _start_job(self, job: Job) -> None:
+        self._tasks[job.name] = asyncio.create_task(
+            self._job_loop(job),
+            name=f"scheduler-job-{job.name}",
+        )
+
+    async def _wait_stop(self, delay: float) -> bool:
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+            return True
+        except TimeoutError:
+            return False
+
+    async def _job_loop(self, job: Job) -> None:
+        if job.run_at_start:
+            await self._run(job)
+
+        while not await self._wait_stop(job.next_delay()):
+            await self._run(job)
+
+    async def _run(self, job: Job) -> bool:
+        if job._lock.locked():
+            job.stats.skipped += 1
+            logger.warning("job {}: previous run still in progress, skipping", job.name)
+            return False
+
+        async with job._lock:
+            stats = job.stats
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(job.func(), timeout=job.timeout)
+                stats.last_error = None
+            except TimeoutError:
+                stats.failures += 1
+                stats.timeouts += 1
+                stats.last_error = f"timed out after {job.timeout} s"
+                logger.error("job {}: {}", job.name, stats.last_error)
+            except Exception as e:
+                stats.failures += 1
+                stats.last_error = f"{type(e).__name__}: {e}"
+                logger.opt(exception=e).error("job {}: failed: {}", job.name, stats.last_error)
+            finally:
+                duration = time.monotonic() - start
+                stats.runs += 1
+                stats.last_duration = duration
+                stats.max_duration = max(stats.max_duration, duration)
+                stats.total_duration += duration
+
+            logger.debug(
+                "job {}: finished in {:.3f} s (runs={}, failures={})",
+                job.name, duration, stats.runs, stats.failures,
+            )
+            return True
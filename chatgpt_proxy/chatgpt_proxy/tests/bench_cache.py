@@ -0,0 +1,86 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Benchmark of cache hit latency for the memory-only, Redis-only
+and two-tier (L1 + Redis) cache backends. The Redis benchmarks are
+skipped if REDIS_URL is not set. Run with:
+
+    REDIS_URL=redis://localhost:6379 python -m chatgpt_proxy.tests.bench_cache
+"""
+
+import asyncio
+import os
+import time
+
+import aiocache
+
+from chatgpt_proxy.cache import CacheNamespace
+from chatgpt_proxy.cache import TieredCache
+from chatgpt_proxy.cache import cache as cache_module
+
+_iterations = 20_000
+_num_keys = 100
+_value = {"verified_at": 1750000000.0, "servers": "AAAA" * 16}
+
+
+async def bench(name: str, cache: aiocache.BaseCache, iterations: int = _iterations) -> None:
+    for i in range(_num_keys):
+        await cache.set(f"bench_key_{i}", _value)
+
+    # Warm up, fills L1 of the tiered cache.
+    for i in range(_num_keys):
+        assert await cache.get(f"bench_key_{i}") == _value
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        await cache.get(f"bench_key_{i % _num_keys}")
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {iterations / elapsed:>10.0f} hits/s"
+          f" {elapsed / iterations * 1_000_000:>8.1f} us/hit")
+
+    await cache.clear()
+    await cache.close()
+
+
+async def main() -> None:
+    await bench("memory", cache_module.setup_memory_cache(CacheNamespace.App))
+    # L1 overhead without the Redis round trip on misses.
+    await bench("tiered, memory L2 (L1 hit)", TieredCache(
+        l2=aiocache.SimpleMemoryCache(),
+        namespace=CacheNamespace.App,
+    ))
+
+    if "REDIS_URL" not in os.environ:
+        print("REDIS_URL not set, skipping Redis benchmarks")
+        return
+
+    await bench("redis", cache_module.setup_redis_cache(CacheNamespace.App), _iterations // 10)
+
+    tiered = cache_module.setup_tiered_cache(CacheNamespace.App)
+    tiered.start()
+    while not tiered.l1_enabled:
+        await asyncio.sleep(0.01)
+    await bench("tiered (L1 hit)", tiered)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Benchmark of game message prompt assembly time and the resulting
+prompt size for a full game: a 64 player scoreboard, the objective
+state and a full set of recent kills and chat messages. Also compares
+the CPU time and size of the compact tables to the padded Markdown
+tables that were used in prompts before. Run with:
+
+    python -m chatgpt_proxy.tests.bench_prompt
+"""
+
+import time
+from collections.abc import Callable
+
+from py_markdown_table.markdown_table import markdown_table
+
+from chatgpt_proxy.db.models import GameChatMessage
+from chatgpt_proxy.db.models import GameKill
+from chatgpt_proxy.db.models import GameObjective
+from chatgpt_proxy.db.models import GameObjectiveState
+from chatgpt_proxy.db.models import GamePlayer
+from chatgpt_proxy.db.models import GameScoreboard
+from chatgpt_proxy.db.models import SayType
+from chatgpt_proxy.db.models import Team
+from chatgpt_proxy.game_state.game_state import max_recent_chat_messages
+from chatgpt_proxy.game_state.game_state import max_recent_kills
+from chatgpt_proxy.prompt import PromptAssembler
+from chatgpt_proxy.prompt import Table
+from chatgpt_proxy.prompt import chat_messages_table
+from chatgpt_proxy.prompt import estimate_tokens
+from chatgpt_proxy.prompt import kills_table
+from chatgpt_proxy.prompt import players_table
+from chatgpt_proxy.tests import setup
+from chatgpt_proxy.utils import utcnow
+
+setup.common_test_setup()
+
+from chatgpt_proxy import app  # noqa: E402
+
+_iterations = 200
+_game_id = "bench_game"
+_budgets = [256, 512, 1024, 2048, 4096]
+
+
+def make_scoreboard() -> GameScoreboard:
+    return GameScoreboard(game_id=_game_id, players=[
+        GamePlayer(
+            game_id=_game_id,
+            id=i,
+            name=f"Player {i}",
+            team=Team.North if i % 2 else Team.South,
+            score=(i * 37) % 250,
+        )
+        for i in range(64)
+    ])
+
+
+def make_objective_state() -> GameObjectiveState:
+    return GameObjectiveState(game_id=_game_id, objectives=[
+        GameObjective(name=f"Objective {i}", team_state=Team(str(i % 2)))
+        for i in range(5)
+    ])
+
+
+def make_kills() -> list[GameKill]:
+    now = utcnow()
+    return [
+        GameKill(
+            id=i,
+            game_id=_game_id,
+            kill_time=now,
+            killer_name=f"Player {i % 64}",
+            victim_name=f"Player {(i + 1) % 64}",
+            killer_team=Team.North,
+            victim_team=Team.South,
+            damage_type="RODmgType_MN1891Bullet",
+            kill_distance_m=float(i * 3),
+        )
+        for i in range(max_recent_kills)
+    ]
+
+
+def make_chat_messages() -> list[GameChatMessage]:
+    now = utcnow()
+    return [
+        GameChatMessage(
+            id=i,
+            message=f"chat message number {i}, nice shot!",
+            game_id=_game_id,
+            send_time=now,
+            sender_name=f"Player {i % 64}",
+            sender_team=Team.South,
+            channel=SayType.ALL,
+        )
+        for i in range(max_recent_chat_messages)
+    ]
+
+
+def markdown_table_rows(rows: list[dict]) -> Table:
+    # The Markdown table rendering previously used in prompts.
+    lines = markdown_table(rows).set_params(quote=False).get_markdown().strip("\n").split("\n")
+    header = "\n".join(lines[:3])
+    return header, [f"{lines[i]}\n{lines[i + 1]}" for i in range(3, len(lines) - 1, 2)]
+
+
+def kills_markdown_table(kills: list[GameKill]) -> Table:
+    return markdown_table_rows([
+        {
+            "Killer": kill.killer_name,
+            "Victim": kill.victim_name,
+            "Killer Team:": kill.killer_team,
+            "Victim Team:": kill.victim_team,
+            "Damage Type:": kill.damage_type.replace("RODmgType_", ""),
+            "Kill Distance (m):": round(kill.kill_distance_m, 1),
+        }
+        for kill in kills
+    ])
+
+
+def chat_messages_markdown_table(msgs: list[GameChatMessage]) -> Table:
+    return markdown_table_rows([
+        {
+            "Message": msg.message,
+            "Sender:": msg.sender_name,
+            "Team:": msg.sender_team,
+            "Channel:": msg.channel,
+        }
+        for msg in msgs
+    ])
+
+
+def players_markdown_table(players: list[GamePlayer]) -> Table:
+    return markdown_table_rows([
+        {
+            "Name": player.name,
+            "Team": player.team,
+            "Score": player.score,
+        }
+        for player in players
+    ])
+
+
+def bench_table(name: str, render: Callable[[], Table]) -> None:
+    start = time.process_time()
+    for _ in range(_iterations):
+        header, rows = render()
+    elapsed = time.process_time() - start
+
+    text = "\n".join([header, *rows])
+    print(f"{name:<24} {elapsed / _iterations * 1_000_000:>8.1f} us cpu"
+          f" tokens={estimate_tokens(text):<5} chars={len(text)}")
+
+
+def main() -> None:
+    scoreboard = make_scoreboard()
+    objective_state = make_objective_state()
+    kills = make_kills()
+    msgs = make_chat_messages()
+
+    bench_table("kills, markdown", lambda: kills_markdown_table(kills))
+    bench_table("kills, compact", lambda: kills_table(kills))
+    bench_table("chat, markdown", lambda: chat_messages_markdown_table(msgs))
+    bench_table("chat, compact", lambda: chat_messages_table(msgs))
+    bench_table("scoreboard, markdown", lambda: players_markdown_table(scoreboard.players))
+    bench_table("scoreboard, compact", lambda: players_table(scoreboard.players))
+    print()
+
+    instruction = "Player 1 (North team, ALL chat) says:\nhello, how is the game going?"
+
+    orig_assembler = app.prompt_assembler
+    try:
+        for budget in _budgets:
+            app.prompt_assembler = PromptAssembler(max_tokens=budget)
+            start = time.perf_counter()
+            for _ in range(_iterations):
+                prompt = app.make_game_message_prompt(
+                    instruction, scoreboard, objective_state, kills, msgs)
+            elapsed = time.perf_counter() - start
+
+            rows = " ".join(
+                f"{section.name}={section.rows_included}/{section.rows_total}"
+                for section in prompt.sections
+            )
+            print(f"budget={budget:<5} {elapsed / _iterations * 1_000_000:>8.1f} us/prompt"
+                  f" tokens={prompt.tokens:<5} chars={len(prompt.text):<6} {rows}")
+    finally:
+        app.prompt_assembler = orig_assembler
+
+
+if __name__ == "__main__":
+    main()
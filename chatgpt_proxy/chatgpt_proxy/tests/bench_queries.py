@@ -0,0 +1,168 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Microbenchmark comparing the old pypika query building path with
+the fixed, prepared statements in chatgpt_proxy.db.statements.
+
+Uses the same test database as the tests, run with:
+
+    python -m chatgpt_proxy.tests.bench_queries
+"""
+
+import asyncio
+import datetime
+import time
+from typing import Awaitable
+from typing import Callable
+
+import asyncpg
+from pypika import Order
+from pypika import Table
+
+from chatgpt_proxy.db import pool_acquire
+from chatgpt_proxy.db import queries
+from chatgpt_proxy.db import statements
+from chatgpt_proxy.db.models import Team
+from chatgpt_proxy.tests import setup
+from chatgpt_proxy.utils import utcnow
+
+setup.common_test_setup()
+
+_iterations = 2000
+_num_kills = 500
+
+
+def build_select_game_kills_query_pypika(
+        game_id: str,
+        kill_time_from: datetime.datetime,
+        limit: int,
+) -> str:
+    # Old implementation of queries.select_game_kills.
+    game_kill = Table(name="game_kill")
+    query = game_kill.select("*")
+    query = query.where(game_kill.game_id == game_id)
+    query = query.where(game_kill.kill_time >= kill_time_from)
+    query = query.limit(limit)
+    query = query.orderby("id", order=Order.asc)
+    return str(query)
+
+
+def build_update_game_query_pypika(
+        game_id: str,
+        openai_previous_response_id: str,
+) -> str:
+    # Old implementation of queries.update_game.
+    game = Table(name="game")
+    query = game.update()
+    query = query.set(game.openai_previous_response_id, openai_previous_response_id)
+    query = query.where(game.id == game_id)
+    return str(query)
+
+
+async def bench(
+        name: str,
+        func: Callable[[int], Awaitable[object]],
+        iterations: int = _iterations,
+) -> None:
+    start = time.perf_counter()
+    for i in range(iterations):
+        await func(i)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<48} {iterations / elapsed:>10.0f} ops/s"
+          f" {elapsed / iterations * 1_000_000:>8.1f} us/op")
+
+
+async def main() -> None:
+    start = utcnow()
+
+    async def noop(_: int) -> None:
+        return None
+
+    print("query building only:")
+    await bench("select_game_kills: pypika", lambda i: noop(len(
+        build_select_game_kills_query_pypika(
+            "first_game", start + datetime.timedelta(seconds=i), 50))))
+    await bench("update_game: pypika", lambda i: noop(len(
+        build_update_game_query_pypika("first_game", f"resp_{i}"))))
+
+    base_pool = await asyncpg.create_pool(dsn=setup.db_base_url, min_size=1, max_size=1)
+    async with pool_acquire(base_pool) as conn:
+        await setup.drop_test_db(conn)
+        await setup.create_test_db(conn)
+
+    conn = await asyncpg.connect(dsn=setup.db_test_url)
+    try:
+        async with conn.transaction():
+            await setup.initialize_test_db(conn)
+            await setup.seed_test_db(conn)
+            for i in range(_num_kills):
+                await queries.insert_game_kill(
+                    conn=conn,
+                    game_id="first_game",
+                    kill_time=start + datetime.timedelta(seconds=i),
+                    killer_name="Killer",
+                    victim_name="Victim",
+                    killer_team=Team.North,
+                    victim_team=Team.South,
+                    damage_type="RODmgType_Test",
+                    kill_distance_m=1.0,
+                )
+    finally:
+        await conn.close()
+
+    pool = await asyncpg.create_pool(
+        dsn=setup.db_test_url,
+        min_size=1,
+        max_size=1,
+        init=statements.init_connection,
+    )
+    try:
+        print("query building and execution:")
+        async with pool_acquire(pool) as conn:
+            await bench("select_game_kills: pypika", lambda i: conn.fetch(
+                build_select_game_kills_query_pypika(
+                    "first_game",
+                    start + datetime.timedelta(seconds=i % _num_kills),
+                    50,
+                )))
+            await bench("select_game_kills: prepared", lambda i: queries.select_game_kills(
+                conn=conn,
+                game_id="first_game",
+                kill_time_from=start + datetime.timedelta(seconds=i % _num_kills),
+                limit=50,
+            ))
+            await bench("update_game: pypika", lambda i: conn.execute(
+                build_update_game_query_pypika("first_game", f"resp_{i}")))
+            await bench("update_game: prepared", lambda i: queries.update_game(
+                conn=conn,
+                game_id="first_game",
+                openai_previous_response_id=f"resp_{i}",
+            ))
+    finally:
+        await pool.close()
+        async with pool_acquire(base_pool) as conn:
+            await setup.drop_test_db(conn)
+        await base_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Benchmark comparing per-server Steam Web API verification with the
+local server list snapshot index, using the fake GetServerList endpoint.
+
+Run with:
+
+    python -m chatgpt_proxy.tests.bench_steam_server_list
+"""
+
+import asyncio
+import time
+
+import httpx
+
+from chatgpt_proxy.auth import auth
+from chatgpt_proxy.auth import server_list
+from chatgpt_proxy.bench import FakeSteamWebAPI
+from chatgpt_proxy.cache import app_cache
+
+_num_servers = 5000
+# Simulated Steam Web API round trip time.
+_latency = 0.050
+
+
+def report(name: str, elapsed: float, num_requests: int, num_ops: int | None = None) -> None:
+    per_op = f" {elapsed / num_ops * 1_000_000:>8.1f} us/op" if num_ops else ""
+    print(f"{name:<48} {elapsed * 1000:>10.1f} ms {num_requests:>6} requests{per_op}")
+
+
+async def main() -> None:
+    auth._steam_web_api_key = "bench"
+    servers = FakeSteamWebAPI.make_servers(_num_servers)
+    fake_steam = FakeSteamWebAPI(servers=servers, api_key="bench")
+
+    print(f"refresh, {_num_servers} registered servers, {_latency * 1000:.0f} ms latency:")
+
+    await app_cache.clear()
+    async with httpx.AsyncClient(transport=fake_steam.transport(_latency)) as client:
+        # Old refresh_steam_web_api_cache: one request per API key.
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            auth.revalidate_game_server(client, address, port)
+            for address, port in servers
+        ))
+        report("per-server requests", time.perf_counter() - start,
+               fake_steam.num_requests)
+
+        fake_steam.num_requests = 0
+        start = time.perf_counter()
+        snapshot = await auth.refresh_steam_server_list(client)
+        report("server list snapshot sweep", time.perf_counter() - start,
+               fake_steam.num_requests)
+        assert snapshot is not None and len(snapshot) == _num_servers
+
+        value = snapshot.to_cache_value()
+        print(f"snapshot size in cache: {len(value['servers'])} bytes")
+
+        start = time.perf_counter()
+        server_list.ServerListSnapshot.from_cache_value(value)
+        report("snapshot decode (worker reload)", time.perf_counter() - start, 0)
+
+        print("verification lookups:")
+        fake_steam.num_requests = 0
+        start = time.perf_counter()
+        for address, port in servers:
+            assert await auth.is_real_game_server(client, address, port)
+        report("is_real_game_server: snapshot", time.perf_counter() - start,
+               fake_steam.num_requests, _num_servers)
+
+        server_list.server_list_index.clear()
+        await app_cache.delete(server_list.server_list_cache_key)
+        start = time.perf_counter()
+        for address, port in servers:
+            assert await auth.is_real_game_server(client, address, port)
+        report("is_real_game_server: per-server cache", time.perf_counter() - start,
+               fake_steam.num_requests, _num_servers)
+
+    await app_cache.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -27,6 +27,7 @@ from urllib.parse import urlparse
 import asyncpg
 
 import chatgpt_proxy
+from chatgpt_proxy.db import migrate
 
 
 class Ignored:
@@ -58,8 +59,7 @@ async def initialize_test_db(
         conn: asyncpg.Connection,
         timeout: float | None = _default_db_timeout
 ):
-    init_db_sql = (_pkg_path_db / "db.sql").read_text()
-    await conn.execute(init_db_sql, timeout=timeout)
+    await migrate.migrate(conn, timeout=timeout)
 
 
 async def seed_test_db(
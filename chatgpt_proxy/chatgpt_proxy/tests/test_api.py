@@ -24,21 +24,27 @@ import asyncio
 import datetime
 import hashlib
 import ipaddress
+import json
 import logging
 import os
+import re
+from types import SimpleNamespace
 from typing import AsyncGenerator
 
 import asyncpg
 import httpx
 import jwt
 import nest_asyncio
+import openai
 import openai.types.responses as openai_responses
 import pytest
 import pytest_asyncio
 import respx
+import sanic_testing.testing
 from pytest_loguru.plugin import caplog  # noqa: F401
 from sanic.log import access_logger as sanic_access_logger
 from sanic.log import logger as sanic_logger
+from sanic.response import HTTPResponse
 from sanic_testing.reusable import ReusableClient
 
 from chatgpt_proxy.tests import setup  # noqa: E402
@@ -47,21 +53,34 @@ setup.common_test_setup()
 
 # noinspection PyUnresolvedReferences
 import chatgpt_proxy  # noqa: E402
+from chatgpt_proxy import app as app_module  # noqa: E402
 from chatgpt_proxy import auth  # noqa: E402
 from chatgpt_proxy.app import app  # noqa: E402
 from chatgpt_proxy.app import game_id_length  # noqa: E402
 from chatgpt_proxy.app import make_api_v1_app  # noqa: E402
 from chatgpt_proxy.app import max_ast_literal_eval_size  # noqa: E402
+from chatgpt_proxy.bench import FakeModel  # noqa: E402
+from chatgpt_proxy.bench import FakeResponsesAPI  # noqa: E402
+from chatgpt_proxy.bench import Route  # noqa: E402
+from chatgpt_proxy.bench import format_report  # noqa: E402
+from chatgpt_proxy.bench import run_load  # noqa: E402
 from chatgpt_proxy.cache import app_cache  # noqa: E402
+from chatgpt_proxy.cache import db_cache  # noqa: E402
 from chatgpt_proxy.db import models  # noqa: E402
 from chatgpt_proxy.db import pool_acquire  # noqa: E402
 from chatgpt_proxy.db import queries  # noqa: E402
 from chatgpt_proxy.db.models import SayType  # noqa: E402
 from chatgpt_proxy.db.models import Team  # noqa: E402
+from chatgpt_proxy.game_state import game_states  # noqa: E402
+from chatgpt_proxy.llm import LocalRateBucket  # noqa: E402
+from chatgpt_proxy.llm import RateGovernor  # noqa: E402
+from chatgpt_proxy.llm import RateLimitExceeded  # noqa: E402
+from chatgpt_proxy.llm import ResilientClient  # noqa: E402
 from chatgpt_proxy.log import logger  # noqa: E402
 from chatgpt_proxy.tests.client import SpoofedSanicASGITestClient  # noqa: E402
 from chatgpt_proxy.tests.monkey_patch import monkey_patch_sanic_testing  # noqa: E402
 from chatgpt_proxy.types import App  # noqa: E402
+from chatgpt_proxy.types import RequestContext  # noqa: E402
 from chatgpt_proxy.utils import utcnow  # noqa: E402
 
 logger.level("DEBUG")
@@ -143,14 +162,26 @@ ApiFixtureTuple = tuple[
 ]
 
 
-def patch_openai_response_output_text(
-        mock_router: respx.MockRouter,
+def make_openai_response(
         output_text: str,
-        method: str,
         status_code: int = 200,
-):
+        response_id: str = "testing_0",
+        status: openai_responses.ResponseStatus | None = None,
+        refusal: str | None = None,
+) -> httpx.Response:
+    content: list[openai_responses.ResponseOutputText | openai_responses.ResponseOutputRefusal]
+    if refusal is not None:
+        content = [openai_responses.ResponseOutputRefusal(refusal=refusal, type="refusal")]
+    else:
+        content = [
+            openai_responses.ResponseOutputText(
+                annotations=[],
+                text=output_text,
+                type="output_text",
+            ),
+        ]
     response = openai_responses.Response(
-        id="testing_0",
+        id=response_id,
         model="gpt-4.1",
         created_at=utcnow().timestamp(),
         object="response",
@@ -159,16 +190,15 @@ def patch_openai_response_output_text(
         parallel_tool_calls=False,
         tool_choice="auto",
         tools=[],
+        status=status,
+        incomplete_details=(
+            openai_responses.response.IncompleteDetails(reason="max_output_tokens")
+            if status == "incomplete" else None
+        ),
         output=[
             openai_responses.ResponseOutputMessage(
                 id="msg_0_testing_0",
-                content=[
-                    openai_responses.ResponseOutputText(
-                        annotations=[],
-                        text=output_text,
-                        type="output_text",
-                    ),
-                ],
+                content=content,
                 role="assistant",
                 status="completed",
                 type="message",
@@ -176,11 +206,23 @@ def patch_openai_response_output_text(
         ],
     )
 
+    return httpx.Response(
+        status_code=status_code,
+        json=response.model_dump(mode="json"),
+    )
+
+
+def patch_openai_response_output_text(
+        mock_router: respx.MockRouter,
+        output_text: str,
+        method: str,
+        status_code: int = 200,
+):
     meth = getattr(mock_router, method)
     meth("/v1/responses").mock(
-        return_value=httpx.Response(
+        return_value=make_openai_response(
+            output_text=output_text,
             status_code=status_code,
-            json=response.model_dump(mode="json"),
         ))
 
 
@@ -210,6 +252,14 @@ async def api_fixture(
         loop=loop,
     )
 
+    # Test DB is re-created for every test, don't trust tokens
+    # verified during previous tests.
+    auth.verified_token_cache.clear()
+    auth.server_list_index.clear()
+    await app_cache.clear()
+    await db_cache.clear()
+    game_states.clear()
+
     async with pool_acquire(
             test_db_pool,
             timeout=_db_timeout,
@@ -295,6 +345,8 @@ async def api_fixture(
 
             # NOTE: can't reuse the same app for ReusableClient!
             reusable_app = make_api_v1_app("ChatGPTProxy-Reusable")
+            # The tests run a single worker.
+            reusable_app.config.GAME_STATE = True
             reusable_client = ReusableClient(
                 reusable_app,
                 host=_asgi_host,
@@ -323,7 +375,7 @@ async def test_api_v1_post_game(api_fixture, caplog) -> None:
     req, resp = reusable_client.post("/api/v1/game", data=data)
     assert resp.status == 201
 
-    game_id, greeting = resp.text.split("\n")
+    game_id, greeting, game_token = resp.text.split("\n")
     assert len(game_id) == game_id_length * 2  # Num bytes as hex string.
 
     req, resp = reusable_client.get(f"/api/v1/game/{game_id}")
@@ -331,6 +383,31 @@ async def test_api_v1_post_game(api_fixture, caplog) -> None:
     game = resp.json
     assert game
 
+    token_game = auth.verify_game_token(
+        secret=setup.test_sanic_secret,
+        game_token=game_token,
+        game_id=game_id,
+    )
+    assert token_game
+    assert token_game.id == game_id
+    assert token_game.level == "VNTE-TestSuite"
+    assert token_game.game_server_address == _game_server_address
+    assert token_game.game_server_port == _game_server_port
+    assert token_game.start_time.isoformat() == game["start_time"]
+
+    # Game token is only valid for the game it was issued for.
+    assert auth.verify_game_token(
+        secret=setup.test_sanic_secret,
+        game_token=game_token,
+        game_id="first_game",
+    ) is None
+    # Game token is not an API key.
+    req, resp = reusable_client.get(
+        f"/api/v1/game/{game_id}",
+        headers={"Authorization": f"Bearer {game_token}"},
+    )
+    assert resp.status == 401
+
     # Empty data.
     data = ""
     req, resp = reusable_client.post("/api/v1/game", data=data)
@@ -342,6 +419,42 @@ async def test_api_v1_post_game(api_fixture, caplog) -> None:
     assert resp.status == 400
 
 
+@pytest.mark.asyncio
+async def test_api_v1_post_game_llm_unavailable(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    llm = reusable_client.app.ctx.llm
+    assert llm.fallback_model
+    patch_openai_response_output_text(
+        mock_router=openai_mock_router,
+        output_text="",
+        method="post",
+        status_code=500,
+    )
+
+    try:
+        # Both models fail until their circuits open...
+        data = "VNTE-TestSuite\n7777"
+        for _ in range(llm.breakers[llm.model].failure_threshold):
+            req, resp = reusable_client.post("/api/v1/game", data=data)
+            assert resp.status == 500
+
+        # ...after which calls are rejected without calling OpenAI.
+        def num_llm_calls() -> int:
+            return sum(call.request.url.path == "/v1/responses"
+                       for call in openai_mock_router.calls)
+
+        num_calls = num_llm_calls()
+        req, resp = reusable_client.post("/api/v1/game", data=data)
+        assert resp.status == 503
+        assert int(resp.headers["Retry-After"]) >= 1
+        assert num_llm_calls() == num_calls
+    finally:
+        for breaker in llm.breakers.values():
+            breaker.record_success()
+
+
 @pytest.mark.asyncio
 async def test_api_v1_put_game(api_fixture, caplog) -> None:
     caplog.set_level(logging.DEBUG)
@@ -485,6 +598,91 @@ async def test_api_v1_post_game_invalid_token(api_fixture, caplog) -> None:
     assert resp.status == 401
 
 
+@pytest.mark.asyncio
+async def test_api_v1_verified_token_cache(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    path = "/api/v1/game/first_game"
+    req, resp = reusable_client.get(path)
+    assert resp.status == 200
+    assert auth.verified_token_cache.misses == 1
+    assert auth.verified_token_cache.hits == 0
+    assert len(auth.verified_token_cache) == 1
+
+    # Repeated requests with the same token are served from the cache.
+    for _ in range(3):
+        req, resp = reusable_client.get(path)
+        assert resp.status == 200
+    assert auth.verified_token_cache.misses == 1
+    assert auth.verified_token_cache.hits == 3
+
+    # Cached token used from another address -> 401.
+    spoofed_asgi_client = SpoofedSanicASGITestClient(
+        app=api_app,
+        client_ip="6.0.28.175",
+    )
+    spoofed_asgi_client.headers = _headers
+    auth.verified_token_cache.clear()
+    req, resp = reusable_client.get(path)
+    assert resp.status == 200
+    # noinspection PyTypeChecker
+    req, resp = await spoofed_asgi_client.get(path)
+    assert resp.status == 401
+
+    # Key removed from the DB and cache invalidated -> 401.
+    await db_conn.execute(
+        """
+        DELETE
+        FROM "game_server_api_key"
+        WHERE api_key_hash = $1;
+        """,
+        _token_sha256,
+    )
+    num = auth.invalidate_verified_tokens(
+        game_server_address=_game_server_address,
+        game_server_port=_game_server_port,
+    )
+    assert num == 1
+    assert len(auth.verified_token_cache) == 0
+    req, resp = reusable_client.get(path)
+    assert resp.status == 401
+
+
+def test_verified_token_cache_bounds() -> None:
+    cache = auth.VerifiedTokenCache(max_size=2, ttl=60.0)
+    now = utcnow()
+    exp = now + datetime.timedelta(hours=1)
+
+    for i in range(3):
+        cache.put(
+            token_hash=bytes([i]),
+            game_server_address=_game_server_address,
+            game_server_port=i,
+            token_exp=exp,
+            api_key_expires_at=exp,
+        )
+    assert len(cache) == 2
+    assert cache.get(bytes([0])) is None  # Evicted (LRU).
+    assert cache.get(bytes([1]))
+    assert cache.get(bytes([2]))
+
+    # Already expired API key -> not cached.
+    cache.put(
+        token_hash=bytes([3]),
+        game_server_address=_game_server_address,
+        game_server_port=3,
+        token_exp=exp,
+        api_key_expires_at=now - datetime.timedelta(seconds=1),
+    )
+    assert cache.get(bytes([3])) is None
+
+    assert cache.invalidate(game_server_port=1) == 1
+    assert cache.get(bytes([1])) is None
+    assert cache.invalidate() == 1
+    assert len(cache) == 0
+
+
 @pytest.mark.asyncio
 async def test_api_v1_post_game_chat_message(api_fixture, caplog) -> None:
     # TODO: maybe just parametrize this test.
@@ -634,6 +832,75 @@ async def test_api_v1_put_delete_game_player(api_fixture, caplog) -> None:
     assert resp.status == 400
 
 
+@pytest.mark.asyncio
+async def test_api_v1_put_game_players(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    path = "/api/v1/game/first_game/players"
+
+    def make_scoreboard(scores: dict[int, int]) -> str:
+        return models.GameScoreboard(
+            game_id="first_game",
+            players=[
+                models.GamePlayer(
+                    game_id="first_game",
+                    id=player_id,
+                    name=f"Some Player Name {player_id}",
+                    team=Team(str(player_id % 2)),
+                    score=score,
+                )
+                for player_id, score in scores.items()
+            ],
+        ).wire_format()
+
+    # Full scoreboard, larger than the app wide REQUEST_MAX_SIZE.
+    scores = {player_id: 0 for player_id in range(1000, 1064)}
+    data = make_scoreboard(scores)
+    assert len(data) > api_app.config.REQUEST_MAX_SIZE
+    req, resp = reusable_client.put(path, data=data)
+    assert resp.status == 200
+    assert resp.text == "64\n0\n0"
+
+    # Two scores changed, three players left, one joined.
+    scores[1000] = 50
+    scores[1001] = -10
+    del scores[1061]
+    del scores[1062]
+    del scores[1063]
+    scores[2000] = 0
+    data = make_scoreboard(scores)
+    req, resp = reusable_client.put(path, data=data)
+    assert resp.status == 200
+    assert resp.text == "1\n2\n3"
+
+    player = await queries.select_game_player(conn=db_conn, game_id="first_game", player_id=1000)
+    assert player is not None
+    assert player.score == 50
+    assert not await queries.game_player_exists(
+        conn=db_conn, game_id="first_game", player_id=1061)
+
+    # Same scoreboard again -> nothing to do.
+    req, resp = reusable_client.put(path, data=data)
+    assert resp.status == 200
+    assert resp.text == "0\n0\n0"
+
+    # Duplicate player -> 400.
+    data = "1000\nBob\n0\n0\n1000\nBob\n0\n5"
+    req, resp = reusable_client.put(path, data=data)
+    assert resp.status == 400
+
+    # Bad data -> 400.
+    data = "1000\nBob\n0"
+    req, resp = reusable_client.put(path, data=data)
+    assert resp.status == 400
+
+    # Empty scoreboard -> everyone removed.
+    req, resp = reusable_client.put(path, data="")
+    assert resp.status == 200
+    assert resp.text == f"0\n0\n{len(scores)}"
+
+
 @pytest.mark.asyncio
 async def test_api_v1_put_game_objective_state(api_fixture, caplog) -> None:
     caplog.set_level(logging.DEBUG)
@@ -776,6 +1043,168 @@ async def test_api_v1_post_game_kill(api_fixture, caplog) -> None:
     assert kills
 
 
+@pytest.mark.asyncio
+async def test_api_v1_post_game_events(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    path = "/api/v1/game/first_game/events"
+
+    # Empty batch -> nothing to do -> 204.
+    req, resp = reusable_client.post(path, data="")
+    assert resp.status == 204
+
+    # Unknown event type -> 400.
+    req, resp = reusable_client.post(path, data="X\tasd")
+    assert resp.status == 400
+
+    # Bad event data -> 400, nothing is stored.
+    data = "\n".join([
+        "C\tmy name is dog69\t0\t0\tthis should not be stored",
+        "K\t353.45\tSome guy lmao\tI'mDead:(\t0",
+    ])
+    req, resp = reusable_client.post(path, data=data)
+    assert resp.status == 400
+    msgs = await queries.select_game_chat_messages(conn=db_conn, game_id="first_game")
+    assert not msgs
+
+    # Mixed batch, larger than the app wide REQUEST_MAX_SIZE -> 204.
+    kill = "K\t353.4503560\tSome guy lmao\tI'mDead:(\t0\t1\tRODmgType_SomeTypeLol\t88.53"
+    chat_message = "C\tmy name is dog69\t0\t0\tthis is the actual message!"
+    lines = [kill] * 20 + [chat_message] * 20 + [
+        "P\t5001\tBob\t1\t-50",
+        "P\t5002\tAlice\t0\t10",
+        "P\t5003\tEve\t0\t0",
+        "P\t5001\tBob\t1\t100",
+        "D\t5003",
+        "O\t[('BlaBla',0),('SomeObjective',1)]",
+    ]
+    data = "\n".join(lines)
+    assert len(data) > api_app.config.REQUEST_MAX_SIZE
+    req, resp = reusable_client.post(path, data=data)
+    assert resp.status == 204
+
+    kills = await queries.select_game_kills(conn=db_conn, game_id="first_game")
+    assert len(kills) == 20
+    msgs = await queries.select_game_chat_messages(conn=db_conn, game_id="first_game")
+    assert len(msgs) == 20
+    assert msgs[0].message == "this is the actual message!"
+
+    player = await queries.select_game_player(conn=db_conn, game_id="first_game", player_id=5001)
+    assert player == models.GamePlayer(
+        game_id="first_game",
+        id=5001,
+        name="Bob",
+        team=Team.South,
+        score=100,
+    )
+    assert await queries.game_player_exists(conn=db_conn, game_id="first_game", player_id=5002)
+    assert not await queries.game_player_exists(
+        conn=db_conn, game_id="first_game", player_id=5003)
+
+    # Delete an existing player in a later batch.
+    req, resp = reusable_client.post(path, data="D\t5002")
+    assert resp.status == 204
+    assert not await queries.game_player_exists(
+        conn=db_conn, game_id="first_game", player_id=5002)
+
+    # Too much objective state data -> 400.
+    data = "O\t" + "*" * (max_ast_literal_eval_size + 1)
+    req, resp = reusable_client.post(path, data=data)
+    assert resp.status == 400
+
+    # Game does not exist -> 404.
+    req, resp = reusable_client.post("/api/v1/game/this_game_does_not_exist/events", data=kill)
+    assert resp.status == 404
+
+    # Larger than EVENTS_REQUEST_MAX_SIZE -> 413.
+    # NOTE: the server closes the connection after this since the
+    # rest of the body is not read, keep this as the last request.
+    data = "\n".join([kill] * (api_app.config.EVENTS_REQUEST_MAX_SIZE // len(kill) + 1))
+    req, resp = reusable_client.post(path, data=data)
+    assert resp.status == 413
+
+
+@pytest.mark.asyncio
+async def test_api_v1_write_behind(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    try:
+        api_app.config.WRITE_BEHIND = True
+
+        # NOTE: the ASGI client stops the server after every request,
+        # which flushes the buffer.
+        data = "353.4503560\nSome guy lmao\nI'mDead:(\n0\n1\nRODmgType_SomeTypeLol\n88.53"
+        req, resp = await api_app.asgi_client.post("/api/v1/game/first_game/kill", data=data)
+        assert resp.status == 204
+
+        data = "my name is dog69\n0\n0\nthis is the actual message!"
+        req, resp = await api_app.asgi_client.post(
+            "/api/v1/game/first_game/chat_message", data=data)
+        assert resp.status == 204
+    finally:
+        api_app.config.WRITE_BEHIND = False
+
+    kills = await queries.select_game_kills(conn=db_conn, game_id="first_game")
+    assert len(kills) == 1
+    msgs = await queries.select_game_chat_messages(conn=db_conn, game_id="first_game")
+    assert len(msgs) == 1
+
+
+@pytest.mark.asyncio
+async def test_api_v1_game_token(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    data = "VNTE-TestSuite\n7777"
+    req, resp = reusable_client.post("/api/v1/game", data=data)
+    assert resp.status == 201
+    game_id, _, game_token = resp.text.split("\n")
+    game_headers = _headers | {auth.game_token_header: game_token}
+
+    data = "353.4503560\nSome guy lmao\nI'mDead:(\n0\n1\nRODmgType_SomeTypeLol\n88.53"
+    path = f"/api/v1/game/{game_id}/kill"
+    req, resp = reusable_client.post(path, data=data, headers=game_headers)
+    assert resp.status == 204
+    kills = await queries.select_game_kills(conn=db_conn, game_id=game_id)
+    assert len(kills) == 1
+
+    # Game token for another game -> 401.
+    path = "/api/v1/game/first_game/kill"
+    req, resp = reusable_client.post(path, data=data, headers=game_headers)
+    assert resp.status == 401
+
+    # Garbage game token -> 401.
+    path = f"/api/v1/game/{game_id}/kill"
+    req, resp = reusable_client.post(
+        path,
+        data=data,
+        headers=_headers | {auth.game_token_header: "asdasdasdasd"},
+    )
+    assert resp.status == 401
+
+    # Valid game token, but the game was already deleted -> 404.
+    await db_conn.execute(
+        """
+        DELETE
+        FROM "openai_query"
+        WHERE game_id = $1;
+        """,
+        game_id,
+    )
+    await db_conn.execute(
+        """
+        DELETE
+        FROM "game"
+        WHERE id = $1;
+        """,
+        game_id,
+    )
+    req, resp = reusable_client.post(path, data=data, headers=game_headers)
+    assert resp.status == 404
+
+
 @pytest.mark.asyncio
 async def test_api_v1_game_message(api_fixture, caplog) -> None:
     caplog.set_level(logging.DEBUG)
@@ -787,8 +1216,8 @@ async def test_api_v1_game_message(api_fixture, caplog) -> None:
     req, resp = reusable_client.post(path, data=data)
     assert resp.status == 404
 
-    # Game was not initialized -> 503 (data does not matter here).
-    data = ""
+    # Game was not initialized -> 503.
+    data = f"{SayType.ALL}\n{Team.North}\nI AM SOME GUY LOL\nhello?"
     path = "/api/v1/game/first_game/message"
     req, resp = reusable_client.post(path, data=data)
     assert resp.status == 503
@@ -804,7 +1233,6 @@ async def test_api_v1_game_message(api_fixture, caplog) -> None:
     )
 
     # Sneak in a request here -> should be 503 since the query does not exist!
-    data = ""
     path = "/api/v1/game/first_game/message"
     req, resp = reusable_client.post(path, data=data)
     assert resp.status == 503
@@ -887,3 +1315,584 @@ async def test_api_v1_game_message(api_fixture, caplog) -> None:
     req, resp = reusable_client.post(path, data=data)
     assert resp.status == 200
     assert resp.text.split("\n")[-1] == output_text.replace("\n", " ")
+
+
+@pytest.mark.asyncio
+async def test_api_v1_game_message_async(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    req, resp = reusable_client.post("/api/v1/game", data="VNTE-TestSuite\n7777")
+    assert resp.status == 201
+    game_id, _, game_token = resp.text.split("\n")
+    game_headers = _headers | {auth.game_token_header: game_token}
+    async_headers = game_headers | {"Prefer": "respond-async"}
+
+    llm_done = asyncio.Event()
+
+    async def slow_llm(_: httpx.Request) -> httpx.Response:
+        await asyncio.wait_for(llm_done.wait(), timeout=_db_timeout)
+        return make_openai_response(output_text="async\nhello", response_id="testing_1")
+
+    openai_mock_router.post("/v1/responses").mock(side_effect=slow_llm)
+
+    data = f"{SayType.ALL}\n{Team.North}\nI AM SOME GUY LOL\nhello?"
+    path = f"/api/v1/game/{game_id}/message"
+    req, resp = reusable_client.post(path, data=data, headers=async_headers)
+    assert resp.status == 202
+    assert resp.headers["Preference-Applied"] == "respond-async"
+    job_id = resp.text
+    job_path = f"{path}/{job_id}"
+    assert resp.headers["Location"] == job_path
+
+    req, resp = reusable_client.get(job_path, headers=game_headers)
+    assert resp.status == 202
+    assert resp.text == "pending"
+
+    async def poll(job_path_: str) -> sanic_testing.testing.TestingResponse:
+        for _ in range(100):
+            _, resp_ = reusable_client.get(job_path_, headers=game_headers)
+            if resp_.status != 202:
+                return resp_
+            await asyncio.sleep(0.01)
+        raise TimeoutError(job_path_)
+
+    llm_done.set()
+    resp = await poll(job_path)
+    assert resp.status == 200
+    assert resp.text == f"{SayType.ALL}\n{Team.North}\nI AM SOME GUY LOL\nasync hello"
+    # Results can be polled again until they expire.
+    req, resp = reusable_client.get(job_path, headers=game_headers)
+    assert resp.status == 200
+
+    # The query was stored like a synchronous one.
+    game = await queries.select_game(conn=db_conn, game_id=game_id)
+    assert game is not None
+    assert game.openai_previous_response_id == "testing_1"
+
+    # Unknown job, or a job of another game.
+    req, resp = reusable_client.get(f"{path}/asdasdasd", headers=game_headers)
+    assert resp.status == 404
+    req, resp = reusable_client.get(f"/api/v1/game/first_game/message/{job_id}")
+    assert resp.status == 404
+
+    # Failed LLM query.
+    patch_openai_response_output_text(
+        mock_router=openai_mock_router,
+        output_text="bad request",
+        method="post",
+        status_code=400,
+    )
+    req, resp = reusable_client.post(path, data=data, headers=async_headers)
+    assert resp.status == 202
+    resp = await poll(f"{path}/{resp.text}")
+    assert resp.status == 503
+
+    # Synchronous requests are not affected.
+    patch_openai_response_output_text(
+        mock_router=openai_mock_router,
+        output_text="sync hello",
+        method="post",
+    )
+    req, resp = reusable_client.post(path, data=data, headers=game_headers)
+    assert resp.status == 200
+    assert resp.text.split("\n")[-1] == "sync hello"
+
+
+@pytest.mark.asyncio
+async def test_api_v1_game_message_new_events(api_fixture, caplog, monkeypatch) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    db_reads = 0
+    select_new_game_kills = queries.select_new_game_kills
+    select_new_game_chat_messages = queries.select_new_game_chat_messages
+
+    async def counting_select_new_game_kills(*args, **kwargs):
+        nonlocal db_reads
+        db_reads += 1
+        return await select_new_game_kills(*args, **kwargs)
+
+    async def counting_select_new_game_chat_messages(*args, **kwargs):
+        nonlocal db_reads
+        db_reads += 1
+        return await select_new_game_chat_messages(*args, **kwargs)
+
+    monkeypatch.setattr(queries, "select_new_game_kills", counting_select_new_game_kills)
+    monkeypatch.setattr(
+        queries, "select_new_game_chat_messages", counting_select_new_game_chat_messages)
+
+    # Events included in each prompt, by killer name and message.
+    sent_kills: list[str] = []
+    sent_msgs: list[str] = []
+
+    # Unique response IDs, the previous query is looked up by it.
+    num_responses = 0
+
+    def unique_response(request: httpx.Request) -> httpx.Response:
+        nonlocal num_responses
+        num_responses += 1
+        prompt = json.loads(request.content)["input"]
+        sent_kills.extend(re.findall(r"\b(?:k|many)\d+\b", prompt))
+        sent_msgs.extend(re.findall(r"\bm\d+\b", prompt))
+        return make_openai_response(output_text="hello", response_id=f"testing_{num_responses}")
+
+    openai_mock_router.post("/v1/responses").mock(side_effect=unique_response)
+
+    req, resp = reusable_client.post("/api/v1/game", data="VNTE-TestSuite\n7777")
+    assert resp.status == 201
+    game_id, _, game_token = resp.text.split("\n")
+    game_headers = _headers | {auth.game_token_header: game_token}
+
+    def post_kill(killer_name: str) -> None:
+        data = f"353.45\n{killer_name}\nVictim\n0\n1\nRODmgType_SomeTypeLol\n88.53"
+        _, kill_resp = reusable_client.post(
+            f"/api/v1/game/{game_id}/kill", data=data, headers=game_headers)
+        assert kill_resp.status == 204
+
+    def post_chat_message(msg: str) -> None:
+        data = f"my name is dog69\n0\n0\n{msg}"
+        _, msg_resp = reusable_client.post(
+            f"/api/v1/game/{game_id}/chat_message", data=data, headers=game_headers)
+        assert msg_resp.status == 204
+
+    def post_message() -> tuple[list[str], list[str]]:
+        sent_kills.clear()
+        sent_msgs.clear()
+        data = f"{SayType.ALL}\n{Team.North}\nI AM SOME GUY LOL\nhello"
+        _, msg_resp = reusable_client.post(
+            f"/api/v1/game/{game_id}/message", data=data, headers=game_headers)
+        assert msg_resp.status == 200
+        return list(sent_kills), list(sent_msgs)
+
+    post_kill("k1")
+    post_kill("k2")
+    post_chat_message("m1")
+    # Recent events are read from the game state.
+    assert post_message() == (["k1", "k2"], ["m1"])
+    assert db_reads == 0
+
+    # Nothing new happened.
+    assert post_message() == ([], [])
+
+    post_kill("k3")
+    kill = "K\t353.45\tk4\tVictim\t0\t1\tRODmgType_SomeTypeLol\t88.53"
+    chat_message = "C\tmy name is dog69\t0\t0\tm2"
+    req, resp = reusable_client.post(
+        f"/api/v1/game/{game_id}/events",
+        data=f"{kill}\n{chat_message}",
+        headers=game_headers,
+    )
+    assert resp.status == 204
+    assert post_message() == (["k3", "k4"], ["m2"])
+    assert db_reads == 0
+
+    # Lost game state, e.g. after a restart. The kill stored right after
+    # the previously sent one is enough to know there are no others, the
+    # chat messages are read from the database.
+    game_states.clear()
+    post_kill("k5")
+    assert post_message() == (["k5"], [])
+    assert db_reads == 1
+
+    # The state was seeded by the database read.
+    post_chat_message("m3")
+    assert post_message() == ([], ["m3"])
+    assert post_message() == ([], [])
+    assert db_reads == 1
+
+    # Without the game state, every event is still sent exactly once.
+    # NOTE: the reusable client runs a separate app.
+    reusable_client.app.config.GAME_STATE = False
+    try:
+        post_kill("k6")
+        post_chat_message("m4")
+        assert post_message() == (["k6"], ["m4"])
+        assert post_message() == ([], [])
+        assert db_reads == 5
+    finally:
+        reusable_client.app.config.GAME_STATE = True
+
+    # Only the newest events are sent if there are too many of
+    # them, as many as fit in the prompt token budget.
+    num_kills = app_module.prompt_max_game_kills + 5
+    for i in range(num_kills):
+        post_kill(f"many{i}")
+    kills, _ = post_message()
+    assert 0 < len(kills) <= app_module.prompt_max_game_kills
+    assert kills == [f"many{i}" for i in range(num_kills - len(kills), num_kills)]
+    assert post_message() == ([], [])
+
+
+def make_handler_request(
+        body: str,
+        headers: dict[str, str] | None = None,
+) -> SimpleNamespace:
+    """Minimal stand-in for a Sanic request, for calling
+    handlers directly, bypassing the HTTP layer.
+    """
+    return SimpleNamespace(
+        body=body.encode("utf-8"),
+        client_ip=str(_game_server_address),
+        headers=headers or {},
+        token=_token,
+        app=SimpleNamespace(
+            config=SimpleNamespace(SECRET=setup.test_sanic_secret, GAME_STATE=True),
+        ),
+        ctx=RequestContext(
+            jwt_game_server_address=_game_server_address,
+            jwt_game_server_port=_game_server_port,
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_llm_calls_do_not_hold_db_connections(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    # Far more concurrent LLM calls than there are pool connections. If any
+    # handler held its connection while waiting for the LLM, the calls
+    # could never all be in flight at once and the test would time out.
+    pool_max_size = 2
+    num_requests = 16
+
+    pg_pool = await asyncpg.create_pool(
+        dsn=setup.db_test_url,
+        min_size=1,
+        max_size=pool_max_size,
+        timeout=_db_timeout,
+    )
+    client = openai.AsyncOpenAI(api_key="dummy")
+    llm_client = ResilientClient(client, model=app_module.openai_model)
+    governor = RateGovernor(LocalRateBucket())
+
+    in_flight = 0
+    all_in_flight = asyncio.Event()
+    conns_in_use: list[int] = []
+
+    async def slow_llm(_: httpx.Request) -> httpx.Response:
+        nonlocal in_flight
+        in_flight += 1
+        if in_flight == num_requests:
+            conns_in_use.append(pg_pool.get_size() - pg_pool.get_idle_size())
+            all_in_flight.set()
+        await asyncio.wait_for(all_in_flight.wait(), timeout=_db_timeout)
+        in_flight -= 1
+        return make_openai_response("slow but steady")
+
+    try:
+        openai_mock_router.post("/v1/responses").mock(side_effect=slow_llm)
+
+        # Concurrent new games.
+        resps = await asyncio.gather(*(
+            app_module.post_game(  # type: ignore[operator]
+                make_handler_request("VNTE-TestSuite\n7777"),  # type: ignore[arg-type]
+                pg_pool=pg_pool,
+                llm=llm_client,
+                governor=governor,
+            )
+            for _ in range(num_requests)
+        ))
+        assert all(r.status == 201 for r in resps)
+
+        # Concurrent messages for different games. NOTE: messages
+        # of the same game are serialized, see test_game_message_coordinator.
+        all_in_flight.clear()
+        msg = f"{SayType.ALL}\n{Team.North}\nSomeGuy\nhello?"
+        games = [r.body.decode("utf-8").split("\n") for r in resps]
+        resps = await asyncio.gather(*(
+            app_module.post_game_message(  # type: ignore[operator]
+                make_handler_request(  # type: ignore[arg-type]
+                    msg, {auth.game_token_header: game_token}),
+                game_id=game_id,
+                pg_pool=pg_pool,
+                llm=llm_client,
+                governor=governor,
+            )
+            for game_id, _, game_token in games
+        ))
+        assert all(r.status == 200 for r in resps)
+
+        # No connections were in use while all the LLM calls were in flight.
+        assert conns_in_use == [0, 0]
+        assert pg_pool.get_size() <= pool_max_size
+    finally:
+        await client.close()
+        await pg_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_game_message_coordinator(api_fixture, caplog) -> None:
+    caplog.set_level(logging.DEBUG)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    pg_pool = await asyncpg.create_pool(
+        dsn=setup.db_test_url,
+        min_size=1,
+        max_size=2,
+        timeout=_db_timeout,
+    )
+    client = openai.AsyncOpenAI(api_key="dummy")
+    # NOTE: the held LLM call would get a hedged duplicate.
+    llm_client = ResilientClient(client, model=app_module.openai_model, hedge=False)
+    governor = RateGovernor(LocalRateBucket())
+
+    first_call = asyncio.Event()
+    release = asyncio.Event()
+    llm_requests: list[dict] = []
+
+    async def llm(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        llm_requests.append(body)
+        response_id = f"testing_{len(llm_requests)}"
+        if len(llm_requests) == 1:
+            first_call.set()
+            await asyncio.wait_for(release.wait(), timeout=_db_timeout)
+            return make_openai_response("hi A", response_id=response_id)
+        # Merged messages, reply to each sender by name.
+        names = re.findall(r"^Message \d+: (\w+) \(", body["input"], re.MULTILINE)
+        replies = {f"reply_{i}": f"hi\n{name}" for i, name in enumerate(names, start=1)}
+        return make_openai_response(json.dumps(replies), response_id=response_id)
+
+    async def post_message(name: str) -> HTTPResponse:
+        msg = f"{SayType.ALL}\n{Team.North}\n{name}\nhello?"
+        return await app_module.post_game_message(  # type: ignore[operator]
+            make_handler_request(msg, game_headers),  # type: ignore[arg-type]
+            game_id=game_id,
+            pg_pool=pg_pool,
+            llm=llm_client,
+            governor=governor,
+        )
+
+    try:
+        patch_openai_response_output_text(
+            mock_router=openai_mock_router,
+            output_text="hello",
+            method="post",
+        )
+        resp = await app_module.post_game(  # type: ignore[operator]
+            make_handler_request("VNTE-TestSuite\n7777"),  # type: ignore[arg-type]
+            pg_pool=pg_pool,
+            llm=llm_client,
+            governor=governor,
+        )
+        assert resp.status == 201
+        game_id, _, game_token = resp.body.decode("utf-8").split("\n")
+        game_headers = {auth.game_token_header: game_token}
+
+        openai_mock_router.post("/v1/responses").mock(side_effect=llm)
+        stats = app_module.message_coordinator.stats()
+
+        # Messages arriving while the LLM call of the game is running
+        # wait for it, and are then answered with a single LLM call.
+        task_a = asyncio.create_task(post_message("A"))
+        await asyncio.wait_for(first_call.wait(), timeout=_db_timeout)
+        tasks = [asyncio.create_task(post_message(name)) for name in ("B", "C")]
+        await asyncio.sleep(0.1)
+        assert len(llm_requests) == 1
+        release.set()
+
+        resps = await asyncio.gather(task_a, *tasks)
+        assert [r.status for r in resps] == [200, 200, 200]
+        bodies = []
+        for r in resps:
+            assert r.body is not None
+            bodies.append(r.body.decode("utf-8").split("\n")[-2:])
+        assert bodies == [
+            ["A", "hi A"],
+            ["B", "hi B"],
+            ["C", "hi C"],
+        ]
+
+        # The conversation continues from the previous response, without forking.
+        assert len(llm_requests) == 2
+        assert llm_requests[0]["previous_response_id"] == "testing_0"
+        assert "text" not in llm_requests[0]
+        assert llm_requests[1]["previous_response_id"] == "testing_1"
+        assert llm_requests[1]["text"]["format"]["type"] == "json_schema"
+        assert llm_requests[1]["text"]["format"]["schema"]["required"] == ["reply_1", "reply_2"]
+
+        game = await queries.select_game(conn=db_conn, game_id=game_id)
+        assert game is not None
+        assert game.openai_previous_response_id == "testing_2"
+
+        new_stats = app_module.message_coordinator.stats()
+        assert new_stats.requests - stats.requests == 3
+        assert new_stats.batches - stats.batches == 2
+        assert new_stats.merged - stats.merged == 1
+        assert new_stats.serialized - stats.serialized == 2
+    finally:
+        await client.close()
+        await pg_pool.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "response_kwargs",
+    [
+        # Cut off by max_output_tokens, truncated JSON.
+        {"output_text": '{"reply_1": "hi B", "rep', "status": "incomplete"},
+        # Malformed JSON, without the response status.
+        {"output_text": '{"reply_1": "hi B"'},
+        # Valid JSON, but missing a reply.
+        {"output_text": '{"reply_1": "hi B"}'},
+        # Valid JSON, but not a string reply.
+        {"output_text": '{"reply_1": "hi B", "reply_2": null}'},
+        # Refused, no output text.
+        {"output_text": "", "refusal": "I can't help with that.", "status": "completed"},
+    ],
+)
+async def test_game_message_coordinator_invalid_replies(api_fixture, response_kwargs) -> None:
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    pg_pool = await asyncpg.create_pool(
+        dsn=setup.db_test_url,
+        min_size=1,
+        max_size=2,
+        timeout=_db_timeout,
+    )
+    client = openai.AsyncOpenAI(api_key="dummy")
+    llm_client = ResilientClient(client, model=app_module.openai_model, hedge=False)
+    governor = RateGovernor(LocalRateBucket())
+
+    first_call = asyncio.Event()
+    release = asyncio.Event()
+    llm_requests: list[dict] = []
+
+    async def llm(request: httpx.Request) -> httpx.Response:
+        llm_requests.append(json.loads(request.content))
+        response_id = f"testing_{len(llm_requests)}"
+        if len(llm_requests) == 1:
+            first_call.set()
+            await asyncio.wait_for(release.wait(), timeout=_db_timeout)
+            return make_openai_response("hi A", response_id=response_id)
+        return make_openai_response(response_id=response_id, **response_kwargs)
+
+    async def post_message(name: str) -> HTTPResponse:
+        msg = f"{SayType.ALL}\n{Team.North}\n{name}\nhello?"
+        return await app_module.post_game_message(  # type: ignore[operator]
+            make_handler_request(msg, game_headers),  # type: ignore[arg-type]
+            game_id=game_id,
+            pg_pool=pg_pool,
+            llm=llm_client,
+            governor=governor,
+        )
+
+    try:
+        patch_openai_response_output_text(
+            mock_router=openai_mock_router,
+            output_text="hello",
+            method="post",
+        )
+        resp = await app_module.post_game(  # type: ignore[operator]
+            make_handler_request("VNTE-TestSuite\n7777"),  # type: ignore[arg-type]
+            pg_pool=pg_pool,
+            llm=llm_client,
+            governor=governor,
+        )
+        assert resp.status == 201
+        game_id, _, game_token = resp.body.decode("utf-8").split("\n")
+        game_headers = {auth.game_token_header: game_token}
+
+        openai_mock_router.post("/v1/responses").mock(side_effect=llm)
+
+        task_a = asyncio.create_task(post_message("A"))
+        await asyncio.wait_for(first_call.wait(), timeout=_db_timeout)
+        tasks = [asyncio.create_task(post_message(name)) for name in ("B", "C")]
+        await asyncio.sleep(0.1)
+        release.set()
+
+        # The merged messages fail together, without delivering any replies.
+        resps = await asyncio.gather(task_a, *tasks)
+        assert [r.status for r in resps] == [200, 503, 503]
+        assert len(llm_requests) == 2
+        assert llm_requests[1]["text"]["format"]["schema"]["required"] == ["reply_1", "reply_2"]
+
+        # The game still continues from the last delivered response.
+        game = await queries.select_game(conn=db_conn, game_id=game_id)
+        assert game is not None
+        assert game.openai_previous_response_id == "testing_1"
+        assert await queries.select_openai_query(
+            conn=db_conn, openai_response_id="testing_2") is None
+    finally:
+        await client.close()
+        await pg_pool.close()
+
+
+@pytest.mark.asyncio
+async def test_create_openai_response_rate_limits_per_model(monkeypatch) -> None:
+    api = FakeResponsesAPI(models={"primary": FakeModel(error_rate=1.0)})
+    client = api.client()
+    llm = ResilientClient(
+        client=client,
+        model="primary",
+        fallback_model="fallback",
+        hedge=False,
+        failure_threshold=1,
+    )
+    governor = RateGovernor(LocalRateBucket())
+    updates = 0
+
+    async def update(*args, **kwargs) -> None:
+        nonlocal updates
+        updates += 1
+
+    monkeypatch.setattr(governor, "update", update)
+    key = (_game_server_address, _game_server_port)
+    try:
+        # The rate limits of the fallback model don't update
+        # the governor, it tracks the primary model.
+        resp = await app_module.create_openai_response(
+            llm, governor, key, tokens=10, input="hello")
+        assert resp.model == "fallback"
+        assert updates == 0
+
+        api.models["fallback"] = FakeModel(rate_limit_rate=1.0)
+        with pytest.raises(RateLimitExceeded):
+            await app_module.create_openai_response(
+                llm, governor, key, tokens=10, input="hello")
+        assert api.requests == {"primary": 1, "fallback": 2}
+        assert updates == 0
+
+        api.models.clear()
+        llm.breakers["primary"].record_success()
+        resp = await app_module.create_openai_response(
+            llm, governor, key, tokens=10, input="hello")
+        assert resp.model == "primary"
+        assert updates == 1
+
+        api.models["primary"] = FakeModel(rate_limit_rate=1.0)
+        with pytest.raises(RateLimitExceeded):
+            await app_module.create_openai_response(
+                llm, governor, key, tokens=10, input="hello")
+        assert updates == 2
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_load_generator(api_fixture, caplog) -> None:
+    caplog.set_level(logging.INFO)
+    api_app, reusable_client, openai_mock_router, steam_mock_router, db_conn = api_fixture
+
+    # NOTE: Steam verification is only mocked for the pytest game server.
+    result = await run_load(
+        base_url=f"http://{reusable_client.host}:{reusable_client.port}/api/v1/",
+        servers=[(_game_server_port, _token)],
+        duration=1.0,
+        players=4,
+        think_time=0.0,
+        requests_per_game=20,
+        seed=1,
+    )
+
+    assert set(result.stats) == set(Route)
+    assert all(not stats.errors for stats in result.stats.values())
+    # Several games were played.
+    assert len(result.stats[Route.PostGame].latencies) > 1
+    assert len(result.stats[Route.PutGame].latencies) > 1
+
+    report = format_report(result)
+    logger.info("load generator report:\n{}", report)
+    assert all(route in report for route in Route)
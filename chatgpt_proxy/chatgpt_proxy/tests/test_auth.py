@@ -0,0 +1,227 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import ipaddress
+import time
+
+import httpx
+import pytest
+import pytest_asyncio
+import respx
+
+from chatgpt_proxy.auth import auth
+from chatgpt_proxy.auth import server_list
+from chatgpt_proxy.bench import FakeSteamWebAPI
+from chatgpt_proxy.cache import app_cache
+
+_addr = ipaddress.IPv4Address("127.0.0.1")
+_port = 7777
+_key = auth._steam_cache_key(_addr, _port)
+
+_servers_found = {"response": {"servers": [{"addr": f"{_addr}:27015", "gameport": _port}]}}
+_servers_not_found: dict = {"response": {"servers": []}}
+
+
+@pytest.fixture
+def steam_mock(monkeypatch):
+    monkeypatch.setattr(auth, "_steam_web_api_key", "pytest")
+    monkeypatch.setattr(auth, "_steam_lock_poll_interval", 0.01)
+    with respx.MockRouter(
+            base_url="https://api.steampowered.com",
+            assert_all_called=False,
+    ) as router:
+        yield router.get("IGameServersService/GetServerList/v1/")
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def clear_cache():
+    await app_cache.clear()
+    server_list.server_list_index.clear()
+    yield
+    await app_cache.clear()
+    server_list.server_list_index.clear()
+
+
+async def _slow_response(json: dict, delay: float = 0.05) -> httpx.Response:
+    await asyncio.sleep(delay)
+    return httpx.Response(200, json=json)
+
+
+@pytest.mark.asyncio
+async def test_is_real_game_server_single_flight(steam_mock) -> None:
+    steam_mock.side_effect = lambda _: _slow_response(_servers_found)
+
+    async with httpx.AsyncClient() as client:
+        results = await asyncio.gather(*(
+            auth.is_real_game_server(client, _addr, _port)
+            for _ in range(20)
+        ))
+        assert all(results)
+        assert steam_mock.call_count == 1
+
+        # Served from the shared cache.
+        assert await auth.is_real_game_server(client, _addr, _port)
+        assert steam_mock.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_is_real_game_server_not_cached_when_not_found(steam_mock) -> None:
+    steam_mock.return_value = httpx.Response(200, json=_servers_not_found)
+
+    async with httpx.AsyncClient() as client:
+        assert not await auth.is_real_game_server(client, _addr, _port)
+        assert not await auth.is_real_game_server(client, _addr, _port)
+    assert steam_mock.call_count == 2
+    assert await app_cache.get(_key) is None
+
+
+@pytest.mark.asyncio
+async def test_is_real_game_server_waits_for_other_worker(steam_mock) -> None:
+    steam_mock.return_value = httpx.Response(200, json=_servers_found)
+
+    # Simulate another worker holding the verification lock.
+    await app_cache.add(f"{_key}:lock", 1, ttl=auth._steam_lock_ttl)
+
+    async def other_worker():
+        await asyncio.sleep(0.05)
+        await app_cache.set(_key, time.time())
+        await app_cache.delete(f"{_key}:lock")
+
+    async with httpx.AsyncClient() as client:
+        result, _ = await asyncio.gather(
+            auth.is_real_game_server(client, _addr, _port),
+            other_worker(),
+        )
+    assert result
+    assert steam_mock.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_is_real_game_server_takes_over_released_lock(steam_mock) -> None:
+    steam_mock.return_value = httpx.Response(200, json=_servers_found)
+
+    # The other worker releases the lock without a verified result.
+    await app_cache.add(f"{_key}:lock", 1, ttl=auth._steam_lock_ttl)
+
+    async def other_worker():
+        await asyncio.sleep(0.05)
+        await app_cache.delete(f"{_key}:lock")
+
+    async with httpx.AsyncClient() as client:
+        result, _ = await asyncio.gather(
+            auth.is_real_game_server(client, _addr, _port),
+            other_worker(),
+        )
+    assert result
+    assert steam_mock.call_count == 1
+    assert not await app_cache.exists(f"{_key}:lock")
+
+
+@pytest.mark.asyncio
+async def test_is_real_game_server_stale_while_revalidate(steam_mock) -> None:
+    steam_mock.side_effect = lambda _: _slow_response(_servers_found)
+    stale_time = time.time() - auth.ttl_is_real_game_server - 1
+    await app_cache.set(_key, stale_time)
+
+    async with httpx.AsyncClient() as client:
+        # Stale entry is served immediately, revalidated in the background once.
+        results = await asyncio.gather(*(
+            auth.is_real_game_server(client, _addr, _port)
+            for _ in range(10)
+        ))
+        assert all(results)
+        assert await app_cache.get(_key) == stale_time
+
+        await asyncio.gather(*auth._steam_inflight.values())
+        assert steam_mock.call_count == 1
+        assert float(await app_cache.get(_key)) > stale_time
+
+
+@pytest.mark.asyncio
+async def test_revalidate_game_server(steam_mock) -> None:
+    stale_time = time.time() - auth.ttl_is_real_game_server - 1
+    await app_cache.set(_key, stale_time)
+
+    async with httpx.AsyncClient() as client:
+        # Steam Web API errors keep the stale entry.
+        steam_mock.return_value = httpx.Response(500)
+        assert await auth.revalidate_game_server(client, _addr, _port) is None
+        assert await app_cache.get(_key) == stale_time
+
+        # Servers no longer listed by Steam are removed.
+        steam_mock.return_value = httpx.Response(200, json=_servers_not_found)
+        assert await auth.revalidate_game_server(client, _addr, _port) is False
+        assert await app_cache.get(_key) is None
+        assert not await auth.is_real_game_server(client, _addr, _port)
+
+
+@pytest.mark.asyncio
+async def test_refresh_steam_server_list(monkeypatch) -> None:
+    monkeypatch.setattr(auth, "_steam_web_api_key", "pytest")
+    fake_steam = FakeSteamWebAPI(
+        servers=FakeSteamWebAPI.make_servers(100) + [(_addr, _port)],
+        api_key="pytest",
+    )
+
+    async with httpx.AsyncClient(transport=fake_steam.transport()) as client:
+        snapshot = await auth.refresh_steam_server_list(client)
+        assert snapshot is not None
+        assert len(snapshot) == 101
+        assert fake_steam.num_requests == 1
+
+        # Served by the local snapshot, no per-server requests.
+        assert await auth.is_real_game_server(client, _addr, _port)
+        assert await auth.is_real_game_server(
+            client, ipaddress.IPv4Address("10.0.0.50"), 7777)
+        assert fake_steam.num_requests == 1
+        assert await app_cache.get(_key) is None
+
+        # Unknown servers fall back to a per-server request.
+        assert not await auth.is_real_game_server(
+            client, ipaddress.IPv4Address("10.0.0.50"), 7778)
+        assert fake_steam.num_requests == 2
+
+        # A recent enough shared snapshot is reused.
+        assert await auth.refresh_steam_server_list(client, min_age=60.0) is not None
+        assert fake_steam.num_requests == 2
+
+
+@pytest.mark.asyncio
+async def test_server_list_snapshot_shared_and_expired() -> None:
+    snapshot = server_list.ServerListSnapshot.from_steam_servers(
+        [FakeSteamWebAPI().server_info(_addr, _port), {"addr": "garbage"}],
+        updated_at=time.time(),
+    )
+    assert len(snapshot) == 1
+    assert (_addr, _port) in snapshot
+    assert server_list.ServerListSnapshot.from_cache_value(snapshot.to_cache_value()) == snapshot
+
+    # Another worker stored the snapshot.
+    await app_cache.set(server_list.server_list_cache_key, snapshot.to_cache_value())
+    index = server_list.ServerListIndex()
+    assert await index.contains(_addr, _port)
+    assert not await index.contains(_addr, _port + 1)
+
+    index = server_list.ServerListIndex(max_age=0.0)
+    assert await index.get() is None
+    assert not await index.contains(_addr, _port)
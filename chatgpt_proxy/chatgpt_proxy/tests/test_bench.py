@@ -0,0 +1,135 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import random
+import statistics
+
+import openai
+import pytest
+
+from chatgpt_proxy.bench import FakeModel
+from chatgpt_proxy.bench import FakeResponsesAPI
+from chatgpt_proxy.bench import FakeSteamWebAPI
+from chatgpt_proxy.bench import LoadResult
+from chatgpt_proxy.bench import Route
+from chatgpt_proxy.bench import RouteStats
+from chatgpt_proxy.bench import format_report
+from chatgpt_proxy.bench import lognormal_latency
+from chatgpt_proxy.bench import make_fake_server_app
+from chatgpt_proxy.bench import uniform_latency
+
+
+def test_latency_distributions() -> None:
+    rng = random.Random(1)
+    samples = [lognormal_latency(median=1.0, p99=8.0)(rng) for _ in range(10_000)]
+    assert statistics.median(samples) == pytest.approx(1.0, rel=0.1)
+    assert statistics.quantiles(samples, n=100)[98] == pytest.approx(8.0, rel=0.2)
+
+    samples = [uniform_latency(0.5, 1.0)(rng) for _ in range(1000)]
+    assert all(0.5 <= sample <= 1.0 for sample in samples)
+
+
+@pytest.mark.asyncio
+async def test_fake_responses_api() -> None:
+    api = FakeResponsesAPI(
+        models={"flaky": FakeModel(error_rate=0.2, rate_limit_rate=0.1)},
+        seed=1,
+    )
+    client = api.client()
+    try:
+        resp = await client.responses.create(model="good", input="hello")
+        assert resp.output_text == "good says hello"
+        assert resp.usage and resp.usage.total_tokens > 0
+
+        # Structured output follows the schema properties.
+        resp = await client.responses.create(
+            model="good",
+            input="hello",
+            text={"format": {
+                "type": "json_schema",
+                "name": "replies",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {"reply_1": {"type": "string"}, "reply_2": {"type": "string"}},
+                    "required": ["reply_1", "reply_2"],
+                    "additionalProperties": False,
+                },
+            }},
+        )
+        assert json.loads(resp.output_text).keys() == {"reply_1", "reply_2"}
+
+        errors = {"ok": 0, "server": 0, "rate_limit": 0}
+        for _ in range(500):
+            try:
+                await client.responses.create(model="flaky", input="hello")
+                errors["ok"] += 1
+            except openai.RateLimitError:
+                errors["rate_limit"] += 1
+            except openai.InternalServerError:
+                errors["server"] += 1
+        assert errors["server"] == pytest.approx(100, abs=30)
+        assert errors["rate_limit"] == pytest.approx(50, abs=25)
+        assert api.requests == {"good": 2, "flaky": 500}
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_fake_server_app() -> None:
+    api = FakeResponsesAPI()
+    steam = FakeSteamWebAPI(servers=FakeSteamWebAPI.make_servers(3))
+    app = make_fake_server_app(api, steam, name="ChatGPTProxyBenchFakesTest")
+
+    _, resp = await app.asgi_client.post(
+        "/v1/responses",
+        json={"model": "good", "input": "hello"},
+    )
+    assert resp.status == 200
+    assert resp.json["output"][0]["content"][0]["text"] == "good says hello"
+
+    _, resp = await app.asgi_client.get(
+        "/IGameServersService/GetServerList/v1/",
+        params={"filter": "\\gamedir\\rs2", "limit": 2},
+    )
+    assert resp.status == 200
+    assert len(resp.json["response"]["servers"]) == 2
+    assert steam.num_requests == 1
+
+
+def test_format_report() -> None:
+    result = LoadResult(
+        stats={
+            Route.PostKill: RouteStats(latencies=[0.001 * i for i in range(1, 101)], errors=2),
+            Route.PostMessage: RouteStats(latencies=[1.0, 2.0]),
+        },
+        elapsed=10.0,
+    )
+    assert result.stats[Route.PostKill].percentile(0.50) == pytest.approx(0.050)
+    assert result.stats[Route.PostKill].percentile(0.99) == pytest.approx(0.099)
+
+    lines = format_report(result).splitlines()
+    assert len(lines) == 4
+    assert lines[1].split() == [*Route.PostKill.split(), "100", "2", "10.0", "50.0", "99.0"]
+    assert lines[2].split() == [*Route.PostMessage.split(), "2", "0", "0.2", "1000.0", "2000.0"]
+    assert lines[3].split() == ["total", "102", "2", "10.2", "51.0", "1000.0"]
@@ -0,0 +1,265 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+from typing import AsyncIterator
+
+import aiocache
+import pytest
+
+from chatgpt_proxy.cache import BoundedMemoryCache
+from chatgpt_proxy.cache import EvictionPolicy
+from chatgpt_proxy.cache import TieredCache
+from chatgpt_proxy.cache.memory import MISSING
+from chatgpt_proxy.cache.memory import BoundedStore
+from chatgpt_proxy.cache import cached_query
+
+
+class LocalInvalidationChannel:
+    """In-process stand-in for RedisInvalidationChannel."""
+
+    def __init__(self):
+        self.queues: list[asyncio.Queue[str]] = []
+
+    async def publish(self, message: str) -> None:
+        for queue in self.queues:
+            queue.put_nowait(message)
+
+    async def listen(self) -> AsyncIterator[str | None]:
+        queue: asyncio.Queue[str] = asyncio.Queue()
+        self.queues.append(queue)
+        try:
+            yield None
+            while True:
+                yield await queue.get()
+        finally:
+            self.queues.remove(queue)
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    async def wait():
+        while not condition():
+            await asyncio.sleep(0.001)
+
+    await asyncio.wait_for(wait(), timeout=timeout)
+
+
+def make_workers(num: int, **kwargs) -> list[TieredCache]:
+    l2 = aiocache.SimpleMemoryCache()
+    channel = LocalInvalidationChannel()
+    return [
+        TieredCache(l2=l2, channel=channel, namespace="test", **kwargs)
+        for _ in range(num)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_cross_worker_invalidation() -> None:
+    worker_a, worker_b = make_workers(2)
+    for worker in (worker_a, worker_b):
+        worker.start()
+    await wait_for(lambda: worker_a.l1_enabled and worker_b.l1_enabled)
+
+    try:
+        await worker_a.set("key", {"value": 1})
+        assert await worker_b.get("key") == {"value": 1}
+        assert worker_b.l2_hits == 1
+        assert await worker_b.get("key") == {"value": 1}
+        assert worker_b.l1_hits == 1
+
+        await worker_a.set("key", {"value": 2})
+        await wait_for(lambda: worker_b.invalidations_received == 2)
+        assert await worker_b.get("key") == {"value": 2}
+        # Own writes are served from L1.
+        assert await worker_a.get("key") == {"value": 2}
+        assert worker_a.l1_hits == 1
+
+        await worker_a.delete("key")
+        await wait_for(lambda: worker_b.invalidations_received == 3)
+        assert await worker_b.get("key") is None
+
+        await worker_a.multi_set([("x", 1), ("y", 2)])
+        assert await worker_b.multi_get(["x", "y", "z"]) == [1, 2, None]
+        await worker_a.clear()
+        await wait_for(lambda: worker_b.invalidations_received == 5)
+        assert len(worker_b.l1) == 0
+        assert await worker_b.multi_get(["x", "y"]) == [None, None]
+    finally:
+        for worker in (worker_a, worker_b):
+            await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_l1_limits() -> None:
+    worker, = make_workers(1, l1_max_entries=2)
+
+    # Not subscribed to invalidations -> L1 is bypassed.
+    await worker.set("key", 1)
+    assert await worker.get("key") == 1
+    assert worker.l1_hits == 0
+    assert len(worker.l1) == 0
+
+    worker.start()
+    await wait_for(lambda: worker.l1_enabled)
+    for i in range(3):
+        await worker.set(f"key{i}", i)
+    assert len(worker.l1) == 2
+    assert await worker.get("key0") == 0
+    assert worker.l1_hits == 0
+    assert worker.l2_hits == 2
+
+    # L1 entries never outlive the L2 TTL.
+    await worker.set("short", 1, ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await worker.get("short") is None
+
+    await worker.close()
+    assert not worker.l1_enabled
+
+
+@pytest.mark.asyncio
+async def test_cached_query() -> None:
+    cache = aiocache.SimpleMemoryCache()
+    calls: list[str] = []
+
+    @cached_query(cache=cache)
+    async def select_thing(conn: object, thing_id: str, timeout: float | None = 1.0) -> str | None:
+        calls.append(thing_id)
+        return None if thing_id == "missing" else f"thing {thing_id}"
+
+    assert await select_thing(object(), "a") == "thing a"
+    assert await select_thing(conn=object(), thing_id="a", timeout=2.0) == "thing a"
+    assert calls == ["a"]
+    assert select_thing.cache_key(thing_id="a") == "select_thing(thing_id=a)"
+
+    # None is not cached.
+    assert await select_thing(object(), "missing") is None
+    assert await select_thing(object(), "missing") is None
+    assert calls == ["a", "missing", "missing"]
+
+    await select_thing.invalidate(thing_id="a")
+    assert await select_thing(object(), "a") == "thing a"
+    assert calls == ["a", "missing", "missing", "a"]
+
+
+def test_bounded_store_limits() -> None:
+    store = BoundedStore(max_entries=3)
+    for i in range(3):
+        assert store.set(f"key{i}", i)
+    # key0 becomes the most recently used.
+    assert store.get("key0") == 0
+    assert store.set("key3", 3)
+    assert store.get("key1") is MISSING
+    assert [store.get(f"key{i}") for i in (0, 2, 3)] == [0, 2, 3]
+    assert store.stats.evictions == 1
+    assert store.stats.entries == 3
+
+    store = BoundedStore(max_bytes=1000, sizeof=lambda v: len(v) if isinstance(v, str) else 0)
+    assert store.set("a", "x" * 400)
+    assert store.set("b", "x" * 400)
+    # Keys are included in the size.
+    assert store.stats.resident_bytes == 802
+    assert store.set("c", "x" * 400)
+    assert store.get("a") is MISSING
+    assert store.stats.resident_bytes == 802
+    # Larger than the whole cache.
+    assert not store.set("d", "x" * 1001)
+    assert store.stats.rejections == 1
+    assert len(store) == 2
+
+    store.clear()
+    assert store.stats.entries == 0
+    assert store.stats.resident_bytes == 0
+
+
+def test_bounded_store_tinylfu() -> None:
+    store = BoundedStore(max_entries=10, eviction=EvictionPolicy.TinyLFU)
+    for i in range(10):
+        store.set(f"hot{i}", i)
+        for _ in range(5):
+            store.get(f"hot{i}")
+
+    # A scan of one-off keys does not flush the frequently used entries.
+    for i in range(1000):
+        store.set(f"scan{i}", i)
+        for j in range(3):
+            store.get(f"hot{(i + j) % 10}")
+    assert all(store.get(f"hot{i}") == i for i in range(10))
+    assert store.stats.rejections >= 990
+
+    # Unless forced, e.g. for locks.
+    assert store.set("lock", 1, force=True)
+    assert store.get("lock") == 1
+    assert len(store) == 10
+
+
+def test_bounded_store_expiry(monkeypatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr("chatgpt_proxy.cache.memory.time.monotonic", lambda: now)
+
+    store = BoundedStore()
+    store.set("short", 1, ttl=1.0)
+    store.set("long", 2, ttl=100.0)
+    store.set("forever", 3)
+    store.set("overwritten", 4, ttl=1.0)
+    store.set("overwritten", 5, ttl=100.0)
+
+    now += 10.0
+    # Lazy expiry on access.
+    assert store.get("short") is MISSING
+    assert store.stats.expirations == 1
+
+    store.set("short", 6, ttl=1.0)
+    now += 10.0
+    assert store.sweep() == 1
+    assert store.stats.expirations == 2
+    assert store.get("overwritten") == 5
+    assert store.get("forever") == 3
+
+    now += 1000.0
+    assert store.sweep() == 2
+    assert len(store) == 1
+
+
+@pytest.mark.asyncio
+async def test_bounded_memory_cache() -> None:
+    cache = BoundedMemoryCache(max_entries=2, namespace="test")
+    await cache.set("a", 1)
+    await cache.add("lock", 1, ttl=10)
+    with pytest.raises(ValueError):
+        await cache.add("lock", 1)
+    await cache.set("b", 2)
+    assert await cache.get("a") is None
+    assert await cache.exists("lock")
+    assert await cache.increment("counter", 2) == 2
+    assert await cache.increment("counter", 3) == 5
+    assert await cache.raw("get", cache.build_key("counter")) == 5
+
+    stats = cache.stats()
+    assert stats.entries == 2
+    assert stats.evictions == 2
+    assert stats.misses == 1
+    assert stats.resident_bytes > 0
+
+    await cache.clear()
+    assert cache.stats().entries == 0
+    await cache.close()
@@ -0,0 +1,870 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import datetime
+import ipaddress
+from typing import AsyncGenerator
+
+import asyncpg
+import pytest
+import pytest_asyncio
+
+from chatgpt_proxy.cache import db_cache
+from chatgpt_proxy.db import Invalidation
+from chatgpt_proxy.db import InvalidationKind
+from chatgpt_proxy.db import InvalidationListener
+from chatgpt_proxy.db import KeyedLock
+from chatgpt_proxy.db import WriteBehindBuffer
+from chatgpt_proxy.db import maintenance
+from chatgpt_proxy.db import migrate
+from chatgpt_proxy.db import models
+from chatgpt_proxy.db import notify
+from chatgpt_proxy.db import pool_acquire
+from chatgpt_proxy.db import queries
+from chatgpt_proxy.db import statements
+from chatgpt_proxy.db.models import SayType
+from chatgpt_proxy.db.models import Team
+from chatgpt_proxy.tests import setup
+from chatgpt_proxy.utils import utcnow
+
+setup.common_test_setup()
+
+_db_timeout = 30.0
+
+DbFixtureTuple = tuple[
+    asyncpg.Pool,
+    asyncpg.Connection,
+]
+
+
+@pytest_asyncio.fixture
+async def db_fixture() -> AsyncGenerator[DbFixtureTuple]:
+    db_fixture_pool = await asyncpg.create_pool(
+        dsn=setup.db_base_url,
+        min_size=1,
+        max_size=1,
+        timeout=_db_timeout,
+    )
+
+    async with pool_acquire(db_fixture_pool, timeout=_db_timeout) as conn:
+        await setup.drop_test_db(conn, timeout=_db_timeout)
+        await setup.create_test_db(conn, timeout=_db_timeout)
+
+    test_db_pool = await asyncpg.create_pool(
+        dsn=setup.db_test_url,
+        min_size=1,
+        max_size=2,
+        timeout=_db_timeout,
+    )
+
+    # Test DB is re-created for every test.
+    await db_cache.clear()
+
+    async with pool_acquire(
+            test_db_pool,
+            timeout=_db_timeout,
+    ) as conn:
+        async with conn.transaction():
+            await setup.initialize_test_db(conn, timeout=_db_timeout)
+            await setup.seed_test_db(conn, timeout=_db_timeout)
+
+        yield test_db_pool, conn
+
+    await test_db_pool.close()
+
+    async with pool_acquire(db_fixture_pool, timeout=_db_timeout) as conn:
+        await setup.drop_test_db(conn, timeout=_db_timeout)
+
+    await db_fixture_pool.close()
+
+
+def add_kill(buffer: WriteBehindBuffer, game_id: str = "first_game") -> None:
+    buffer.add_game_kill(
+        game_id=game_id,
+        kill_time=utcnow(),
+        killer_name="Killer",
+        victim_name="Victim",
+        killer_team=Team.North,
+        victim_team=Team.South,
+        damage_type="RODmgType_Test",
+        kill_distance_m=12.5,
+    )
+
+
+def add_chat_message(buffer: WriteBehindBuffer, game_id: str = "first_game") -> None:
+    buffer.add_game_chat_message(
+        game_id=game_id,
+        message="hello",
+        send_time=utcnow(),
+        sender_name="Sender",
+        sender_team=Team.South,
+        channel=SayType.TEAM,
+    )
+
+
+async def wait_for_rows_written(buffer: WriteBehindBuffer, num_rows: int) -> None:
+    async def wait():
+        while buffer.rows_written < num_rows:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(wait(), timeout=5.0)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_buffer_max_rows(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    buffer = WriteBehindBuffer(pool=pool, max_rows=4, max_delay=60.0)
+    buffer.start()
+    try:
+        add_kill(buffer)
+        add_kill(buffer)
+        add_chat_message(buffer)
+        await asyncio.sleep(0.05)
+        assert buffer.rows_written == 0
+        assert len(buffer) == 3
+
+        add_chat_message(buffer)
+        await wait_for_rows_written(buffer, 4)
+        assert len(buffer) == 0
+    finally:
+        await buffer.close()
+
+    kills = await queries.select_game_kills(conn=conn, game_id="first_game")
+    assert len(kills) == 2
+    assert kills[0].killer_team == int(Team.North)
+    assert kills[0].kill_distance_m == 12.5
+    msgs = await queries.select_game_chat_messages(conn=conn, game_id="first_game")
+    assert len(msgs) == 2
+    assert msgs[0].channel == int(SayType.TEAM)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_buffer_max_delay(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    buffer = WriteBehindBuffer(pool=pool, max_rows=1000, max_delay=0.05)
+    buffer.start()
+    try:
+        add_kill(buffer)
+        await wait_for_rows_written(buffer, 1)
+    finally:
+        await buffer.close()
+
+    kills = await queries.select_game_kills(conn=conn, game_id="first_game")
+    assert len(kills) == 1
+
+
+@pytest.mark.asyncio
+async def test_write_behind_buffer_close(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    buffer = WriteBehindBuffer(pool=pool, max_rows=1000, max_delay=60.0)
+    buffer.start()
+    add_kill(buffer)
+    add_chat_message(buffer)
+    await buffer.close()
+    assert buffer.rows_written == 2
+
+    with pytest.raises(RuntimeError):
+        add_kill(buffer)
+    with pytest.raises(RuntimeError):
+        add_chat_message(buffer)
+    assert len(buffer) == 0
+
+    kills = await queries.select_game_kills(conn=conn, game_id="first_game")
+    assert len(kills) == 1
+    msgs = await queries.select_game_chat_messages(conn=conn, game_id="first_game")
+    assert len(msgs) == 1
+
+    # Closing while the flusher is writing a batch does not lose it.
+    buffer = WriteBehindBuffer(pool=pool, max_rows=2, max_delay=60.0)
+    buffer.start()
+    add_kill(buffer)
+    add_chat_message(buffer)
+    await asyncio.sleep(0.001)
+    await buffer.close()
+    assert buffer.rows_written == 2
+    assert buffer.rows_dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_write_behind_buffer_deleted_game(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    buffer = WriteBehindBuffer(pool=pool, max_rows=1000, max_delay=60.0)
+    add_kill(buffer)
+    add_kill(buffer, game_id="this_game_does_not_exist")
+    add_chat_message(buffer, game_id="this_game_does_not_exist")
+    add_chat_message(buffer)
+    assert await buffer.flush() == 2
+    assert buffer.rows_written == 2
+    assert buffer.rows_dropped == 2
+
+    kills = await queries.select_game_kills(conn=conn)
+    assert len(kills) == 1
+    msgs = await queries.select_game_chat_messages(conn=conn)
+    assert len(msgs) == 1
+
+
+@pytest.mark.asyncio
+async def test_write_behind_buffer_on_flush(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    flushed: list[tuple[list[models.GameKill], list[models.GameChatMessage]]] = []
+    buffer = WriteBehindBuffer(
+        pool=pool,
+        max_rows=1000,
+        max_delay=60.0,
+        on_flush=lambda kills, msgs: flushed.append((kills, msgs)),
+    )
+    add_kill(buffer)
+    add_kill(buffer, game_id="this_game_does_not_exist")
+    add_chat_message(buffer)
+    assert await buffer.flush() == 2
+
+    # The callback gets the written rows, with their IDs.
+    assert len(flushed) == 1
+    kills, msgs = flushed[0]
+    db_kills = await queries.select_game_kills(conn=conn)
+    assert [kill.id for kill in kills] == [kill.id for kill in db_kills]
+    assert kills[0].kill_time == db_kills[0].kill_time
+    assert kills[0].killer_team == Team.North
+    db_msgs = await queries.select_game_chat_messages(conn=conn)
+    assert [msg.id for msg in msgs] == [msg.id for msg in db_msgs]
+    assert msgs[0].message == db_msgs[0].message
+    assert msgs[0].channel == SayType.TEAM
+
+    # IDs keep increasing after the IDs allocated by the buffer.
+    kill_id = await queries.insert_game_kill(
+        conn=conn,
+        game_id="first_game",
+        kill_time=utcnow(),
+        killer_name="Killer",
+        victim_name="Victim",
+        killer_team=Team.North,
+        victim_team=Team.South,
+        damage_type="RODmgType_Test",
+        kill_distance_m=1.0,
+    )
+    assert kill_id > kills[0].id
+
+
+@pytest.mark.asyncio
+async def test_statements_prepared_by_pool_init(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    init_pool = await asyncpg.create_pool(
+        dsn=setup.db_test_url,
+        min_size=1,
+        max_size=1,
+        timeout=_db_timeout,
+        init=statements.init_connection,
+    )
+    try:
+        async with pool_acquire(init_pool, timeout=_db_timeout) as init_conn:
+            prepared = {
+                record["statement"]
+                for record in await init_conn.fetch(
+                    "SELECT statement FROM pg_prepared_statements;")
+            }
+    finally:
+        await init_pool.close()
+
+    assert len(statements.registry) > 0
+    for statement in statements.registry:
+        assert statement.query in prepared, statement.name
+
+
+@pytest.mark.asyncio
+async def test_select_game_kills_optional_filters(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    start = utcnow()
+    async with conn.transaction():
+        for i in range(5):
+            await queries.insert_game_kill(
+                conn=conn,
+                game_id="first_game",
+                kill_time=start + datetime.timedelta(seconds=i),
+                killer_name="Killer",
+                victim_name=f"Victim {i}",
+                killer_team=Team.North,
+                victim_team=Team.South,
+                damage_type="RODmgType_Test",
+                kill_distance_m=1.0,
+            )
+
+    kills = await queries.select_game_kills(conn=conn)
+    assert len(kills) == 5
+    kills = await queries.select_game_kills(conn=conn, game_id="first_game")
+    assert [kill.victim_name for kill in kills] == [f"Victim {i}" for i in range(5)]
+    kills = await queries.select_game_kills(conn=conn, game_id="this_game_does_not_exist")
+    assert not kills
+    kills = await queries.select_game_kills(
+        conn=conn,
+        game_id="first_game",
+        kill_time_from=start + datetime.timedelta(seconds=3),
+    )
+    assert [kill.victim_name for kill in kills] == ["Victim 3", "Victim 4"]
+    kills = await queries.select_game_kills(conn=conn, game_id="first_game", limit=2)
+    assert [kill.victim_name for kill in kills] == ["Victim 0", "Victim 1"]
+
+
+@pytest.mark.asyncio
+async def test_select_new_game_events(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    game = await queries.select_game(conn=conn, game_id="first_game")
+    assert game
+
+    kills = await queries.insert_game_kills(conn=conn, kills=[
+        models.GameKillEvent(
+            game_id="first_game",
+            kill_time=game.start_time + datetime.timedelta(seconds=i),
+            killer_name="Killer",
+            victim_name=f"Victim {i}",
+            killer_team=Team.North,
+            victim_team=Team.South,
+            damage_type="RODmgType_Test",
+            kill_distance_m=1.0,
+        )
+        for i in range(5)
+    ])
+    assert [kill.victim_name for kill in kills] == [f"Victim {i}" for i in range(5)]
+    db_kills = await queries.select_game_kills(conn=conn, game_id="first_game")
+    assert [kill.id for kill in kills] == [kill.id for kill in db_kills]
+
+    async def new_kills(after_id: int, limit: int) -> list[str]:
+        return [
+            kill.victim_name
+            for kill in await queries.select_new_game_kills(
+                conn=conn,
+                game_id="first_game",
+                after_id=after_id,
+                kill_time_from=game.start_time,
+                limit=limit,
+            )
+        ]
+
+    assert await new_kills(0, limit=10) == [f"Victim {i}" for i in range(5)]
+    assert await new_kills(kills[2].id, limit=10) == ["Victim 3", "Victim 4"]
+    assert await new_kills(kills[-1].id, limit=10) == []
+    # The newest ones, in ascending ID order.
+    assert await new_kills(0, limit=2) == ["Victim 3", "Victim 4"]
+
+    msgs = await queries.insert_game_chat_messages(conn=conn, chat_messages=[
+        models.GameChatMessageEvent(
+            game_id="first_game",
+            message=f"Message {i}",
+            send_time=utcnow(),
+            sender_name="Sender",
+            sender_team=Team.South,
+            channel=SayType.ALL,
+        )
+        for i in range(3)
+    ])
+    new_msgs = await queries.select_new_game_chat_messages(
+        conn=conn,
+        game_id="first_game",
+        after_id=msgs[0].id,
+        send_time_from=game.start_time,
+        limit=10,
+    )
+    assert [msg.id for msg in new_msgs] == [msg.id for msg in msgs[1:]]
+    assert [msg.message for msg in new_msgs] == ["Message 1", "Message 2"]
+
+
+@pytest.mark.asyncio
+async def test_game_event_ids_in_commit_order(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    game = await queries.select_game(conn=conn, game_id="first_game")
+    assert game
+
+    async def insert_kill(conn_: asyncpg.Connection, victim_name: str) -> int:
+        await queries.lock_games_for_events(conn=conn_, game_ids=["first_game"])
+        return await queries.insert_game_kill(
+            conn=conn_,
+            game_id="first_game",
+            kill_time=utcnow(),
+            killer_name="Killer",
+            victim_name=victim_name,
+            killer_team=Team.North,
+            victim_team=Team.South,
+            damage_type="RODmgType_Test",
+            kill_distance_m=1.0,
+        )
+
+    async def new_kills(after_id: int) -> list[models.GameKill]:
+        return await queries.select_new_game_kills(
+            conn=conn,
+            game_id="first_game",
+            after_id=after_id,
+            kill_time_from=game.start_time,
+            limit=10,
+        )
+
+    conn_a = await asyncpg.connect(setup.db_test_url, timeout=_db_timeout)
+    conn_b = await asyncpg.connect(setup.db_test_url, timeout=_db_timeout)
+    try:
+        async def insert_b() -> int:
+            async with conn_b.transaction():
+                return await insert_kill(conn_b, "B")
+
+        # Writer B starts after writer A, but would commit first.
+        async with conn_a.transaction():
+            id_a = await insert_kill(conn_a, "A")
+            task_b = asyncio.create_task(insert_b())
+            await asyncio.sleep(0.1)
+            # B waits for A to commit, it can't commit a greater ID first,
+            # which a reader would use as its watermark, skipping A.
+            assert not task_b.done()
+            assert await new_kills(0) == []
+        id_b = await task_b
+        assert id_b > id_a
+    finally:
+        await conn_a.close()
+        await conn_b.close()
+
+    assert [kill.victim_name for kill in await new_kills(0)] == ["A", "B"]
+    assert [kill.victim_name for kill in await new_kills(id_a)] == ["B"]
+
+    # Games that don't exist are not locked.
+    async with conn.transaction():
+        assert await queries.lock_games_for_events(
+            conn=conn, game_ids=["first_game", "this_game_does_not_exist"]) == {"first_game"}
+
+
+@pytest.mark.asyncio
+async def test_keyed_lock() -> None:
+    locks = KeyedLock()
+    entered: list[str] = []
+
+    async def hold(name: str, keys: list[str]) -> None:
+        async with locks.hold(keys):
+            entered.append(name)
+            await asyncio.sleep(0.02)
+
+    first = asyncio.create_task(hold("first", ["a", "b"]))
+    await asyncio.sleep(0)
+    # Waits for the first holder of "b", the other key is free.
+    second = asyncio.create_task(hold("second", ["b", "c"]))
+    other = asyncio.create_task(hold("other", ["c"]))
+    await asyncio.sleep(0.01)
+    assert entered == ["first", "other"]
+
+    await asyncio.gather(first, second, other)
+    assert entered == ["first", "other", "second"]
+    assert len(locks) == 0
+
+
+@pytest.mark.asyncio
+async def test_update_game_ignored_columns(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    stop_time = utcnow()
+    await queries.update_game(conn=conn, game_id="first_game", stop_time=stop_time)
+    await queries.update_game(
+        conn=conn,
+        game_id="first_game",
+        openai_previous_response_id="resp_123",
+    )
+    game = await queries.select_game(conn=conn, game_id="first_game")
+    assert game
+    assert game.stop_time == stop_time
+    assert game.openai_previous_response_id == "resp_123"
+
+    # Explicit None is not ignored.
+    await queries.update_game(conn=conn, game_id="first_game", stop_time=None)
+    game = await queries.select_game(conn=conn, game_id="first_game")
+    assert game
+    assert game.stop_time is None
+    assert game.openai_previous_response_id == "resp_123"
+
+
+@pytest.mark.asyncio
+async def test_migrate_up_to_date(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    assert not await migrate.migrate(conn)
+    versions = await migrate.applied_versions(conn)
+    assert versions == {m.version for m in migrate.load_migrations()}
+
+
+@pytest.mark.asyncio
+async def test_migrate_existing_database(db_fixture) -> None:
+    _ = db_fixture
+
+    db_name = f"{setup.test_db}_migrate"
+    base_conn = await asyncpg.connect(dsn=setup.db_base_url)
+    try:
+        await base_conn.execute(f"DROP DATABASE IF EXISTS {db_name} WITH (FORCE);")
+        await base_conn.execute(f"CREATE DATABASE {db_name};")
+        conn = await asyncpg.connect(dsn=f"{setup.db_base_url.rstrip("/")}/{db_name}")
+        try:
+            # Database created with the old db.sql, before versioned migrations.
+            initial = migrate.load_migrations()[0]
+            assert initial.version == migrate.baseline_version
+            await conn.execute(initial.sql)
+            await conn.execute(
+                """
+                INSERT INTO "game_server_api_key"
+                (created_at, expires_at, api_key_hash, game_server_address,
+                 game_server_port, name)
+                VALUES (NOW() - INTERVAL '1 day', NOW(), 'old', '127.0.0.1', 7777, 'old'),
+                       (NOW(), NOW(), 'new', '127.0.0.1', 7777, 'new'),
+                       (NOW(), NOW(), 'other', '127.0.0.1', 7778, 'other');
+                """
+            )
+
+            applied = await migrate.migrate(conn, target_version=2)
+            assert [m.version for m in applied] == [2]
+            assert await migrate.applied_versions(conn) == {1, 2}
+
+            names = await conn.fetch(
+                """
+                SELECT name
+                FROM "game_server_api_key"
+                ORDER BY game_server_port;
+                """
+            )
+            assert [record["name"] for record in names] == ["new", "other"]
+
+            # Same player ID is allowed in different games.
+            for game_id in ("game_1", "game_2"):
+                await queries.insert_game(
+                    conn=conn,
+                    game_id=game_id,
+                    level="VNTE-Resort",
+                    game_server_address=ipaddress.IPv4Address("127.0.0.1"),
+                    game_server_port=7777,
+                    start_time=utcnow(),
+                )
+                assert await queries.upsert_game_player(
+                    conn=conn,
+                    game_id=game_id,
+                    player_id=1,
+                    name="Bob",
+                    team_index=0,
+                    score=0,
+                )
+        finally:
+            await conn.close()
+    finally:
+        await base_conn.execute(f"DROP DATABASE IF EXISTS {db_name} WITH (FORCE);")
+        await base_conn.close()
+
+
+@pytest.mark.asyncio
+async def test_event_tables_check_game_exists(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    with pytest.raises(asyncpg.ForeignKeyViolationError):
+        await queries.insert_game_kill(
+            conn=conn,
+            game_id="this_game_does_not_exist",
+            kill_time=utcnow(),
+            killer_name="Killer",
+            victim_name="Victim",
+            killer_team=Team.North,
+            victim_team=Team.South,
+            damage_type="RODmgType_Test",
+            kill_distance_m=12.5,
+        )
+
+    with pytest.raises(asyncpg.ForeignKeyViolationError):
+        await queries.insert_game_chat_message(
+            conn=conn,
+            game_id="this_game_does_not_exist",
+            message="hello",
+            send_time=utcnow(),
+            sender_name="Sender",
+            sender_team=Team.North,
+            channel=SayType.ALL,
+        )
+
+
+@pytest.mark.asyncio
+async def test_delete_game_with_events(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    game = await queries.select_game(conn=conn, game_id="first_game")
+    assert game
+    await queries.insert_game_kill(
+        conn=conn,
+        game_id=game.id,
+        kill_time=utcnow(),
+        killer_name="Killer",
+        victim_name="Victim",
+        killer_team=Team.North,
+        victim_team=Team.South,
+        damage_type="RODmgType_Test",
+        kill_distance_m=12.5,
+    )
+    await queries.insert_openai_query(
+        conn=conn,
+        time=utcnow(),
+        game_id=game.id,
+        game_server_address=game.game_server_address,
+        game_server_port=game.game_server_port,
+        request_length=1,
+        response_length=1,
+        openai_response_id="resp_123",
+    )
+
+    # Events no longer block or cascade game deletes, they
+    # are expired separately by the retention policies.
+    await conn.execute("""DELETE FROM "game" WHERE id = 'first_game';""")
+    assert not await queries.game_exists(conn=conn, game_id="first_game")
+    assert await queries.select_game_kills(conn=conn, game_id="first_game")
+
+
+async def insert_maintenance_test_data(conn: asyncpg.Connection) -> None:
+    now = utcnow()
+    for i in range(23):
+        await queries.insert_game(
+            conn=conn,
+            game_id=f"stopped_game_{i}",
+            level="VNTE-Resort",
+            game_server_address=ipaddress.IPv4Address("127.0.0.1"),
+            game_server_port=7777,
+            start_time=now - datetime.timedelta(minutes=30),
+            stop_time=now,
+        )
+    # Never stopped, but expired.
+    await queries.insert_game(
+        conn=conn,
+        game_id="stale_game",
+        level="VNTE-Resort",
+        game_server_address=ipaddress.IPv4Address("127.0.0.1"),
+        game_server_port=7777,
+        start_time=now - datetime.timedelta(hours=6),
+    )
+    for i in range(3):
+        await queries.insert_game_server_api_key(
+            conn=conn,
+            issued_at=now - datetime.timedelta(days=2),
+            expires_at=now - datetime.timedelta(days=1),
+            token_hash=f"expired_{i}".encode(),
+            game_server_address=ipaddress.IPv4Address("127.0.0.1"),
+            game_server_port=8000 + i,
+        )
+
+
+@pytest.mark.asyncio
+async def test_run_db_maintenance(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    await insert_maintenance_test_data(conn)
+
+    result = await maintenance.run_db_maintenance(
+        conn,
+        game_expiration=datetime.timedelta(hours=5),
+        api_key_deletion_leeway=datetime.timedelta(minutes=5),
+        batch_size=10,
+    )
+    assert result
+    # 23 stopped + 1 stale + 2 stopped games in the seed data.
+    assert result.deleted_games == 26
+    assert result.deleted_api_keys == 3
+    assert result.complete
+
+    assert await queries.game_exists(conn=conn, game_id="first_game")
+    assert not await queries.game_exists(conn=conn, game_id="stale_game")
+    assert not await queries.game_exists(conn=conn, game_id="old_game_1")
+
+    result = await maintenance.run_db_maintenance(
+        conn,
+        game_expiration=datetime.timedelta(hours=5),
+        api_key_deletion_leeway=datetime.timedelta(minutes=5),
+        batch_size=10,
+    )
+    assert result is not None
+    assert result == maintenance.MaintenanceResult(
+        deleted_games=0,
+        deleted_api_keys=0,
+        duration=result.duration,
+        complete=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_db_maintenance_time_budget(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    await insert_maintenance_test_data(conn)
+
+    result = await maintenance.run_db_maintenance(
+        conn,
+        game_expiration=datetime.timedelta(hours=5),
+        api_key_deletion_leeway=datetime.timedelta(minutes=5),
+        batch_size=10,
+        time_budget=0.0,
+    )
+    assert result
+    assert result.deleted_games == 0
+    assert result.deleted_api_keys == 0
+    assert not result.complete
+
+
+@pytest.mark.asyncio
+async def test_run_db_maintenance_lock(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    await insert_maintenance_test_data(conn)
+
+    async with pool_acquire(pool, timeout=_db_timeout) as other_conn:
+        async with other_conn.transaction():
+            # Maintenance in progress on another node.
+            await other_conn.execute(
+                "SELECT pg_advisory_xact_lock($1);",
+                maintenance._advisory_lock_key,
+            )
+            result = await maintenance.run_db_maintenance(
+                conn,
+                game_expiration=datetime.timedelta(hours=5),
+                api_key_deletion_leeway=datetime.timedelta(minutes=5),
+            )
+            assert result is None
+
+    assert await queries.game_exists(conn=conn, game_id="stale_game")
+
+
+async def wait_for_invalidations(received: list[Invalidation], num: int) -> None:
+    async def wait():
+        while len(received) < num:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(wait(), timeout=5.0)
+
+
+@pytest.mark.asyncio
+async def test_invalidation_listener(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    received: list[Invalidation] = []
+    listener = InvalidationListener(dsn=setup.db_test_url)
+    listener.subscribe(received.append)
+    listener.start()
+    try:
+        await listener.wait_connected(timeout=5.0)
+        await wait_for_invalidations(received, 1)
+        assert received.pop() == Invalidation(InvalidationKind.All)
+
+        address = ipaddress.IPv4Address("10.0.0.1")
+        async with conn.transaction():
+            await queries.insert_game_server_api_key(
+                conn=conn,
+                issued_at=utcnow() - datetime.timedelta(days=2),
+                expires_at=utcnow() - datetime.timedelta(days=1),
+                token_hash=b"\x00" * 32,
+                game_server_address=address,
+                game_server_port=7777,
+            )
+            # Only delivered once committed.
+            await asyncio.sleep(0.1)
+            assert not received
+        await wait_for_invalidations(received, 1)
+        assert received.pop() == Invalidation.api_key(address, 7777)
+        assert not received
+
+        await queries.update_game(
+            conn=conn,
+            game_id="first_game",
+            stop_time=utcnow(),
+        )
+        await wait_for_invalidations(received, 1)
+        assert received.pop() == Invalidation(InvalidationKind.Game, "first_game")
+
+        deleted = await queries.delete_old_api_keys(
+            conn=conn,
+            leeway=datetime.timedelta(minutes=5),
+            batch_size=10,
+        )
+        assert deleted >= 1
+        await wait_for_invalidations(received, deleted)
+        assert Invalidation.api_key(address, 7777) in received
+        received.clear()
+
+        deleted = await queries.delete_completed_games(
+            conn=conn,
+            game_expiration=datetime.timedelta(hours=5),
+            batch_size=100,
+        )
+        await wait_for_invalidations(received, deleted)
+        assert Invalidation(InvalidationKind.Game, "first_game") in received
+    finally:
+        await listener.stop()
+    assert not listener.connected
+
+
+@pytest.mark.asyncio
+async def test_invalidation_listener_reconnect(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    received: list[Invalidation] = []
+    listener = InvalidationListener(dsn=setup.db_test_url, reconnect_delay=0.05)
+    listener.subscribe(received.append)
+    listener.start()
+    try:
+        await listener.wait_connected(timeout=5.0)
+        await wait_for_invalidations(received, 1)
+        received.clear()
+
+        assert listener._conn is not None
+        await conn.execute(
+            "SELECT pg_terminate_backend($1);",
+            listener._conn.get_server_pid(),
+        )
+
+        # Possibly missed notifications, everything is invalidated.
+        await wait_for_invalidations(received, 1)
+        assert received.pop() == Invalidation(InvalidationKind.All)
+        assert listener.reconnects == 1
+        assert listener.connected
+
+        await notify.publish(conn, Invalidation(InvalidationKind.Game, "second_game"))
+        await wait_for_invalidations(received, 1)
+        assert received.pop() == Invalidation(InvalidationKind.Game, "second_game")
+    finally:
+        await listener.stop()
+
+
+@pytest.mark.asyncio
+async def test_select_game_cached(db_fixture) -> None:
+    pool, conn = db_fixture
+
+    game = await queries.select_game_cached(conn=conn, game_id="first_game")
+    assert game
+    assert game.stop_time is None
+    assert await db_cache.exists(queries.select_game_cached.cache_key(game_id="first_game"))
+
+    stop_time = utcnow()
+    await queries.update_game(conn=conn, game_id="first_game", stop_time=stop_time)
+    game = await queries.select_game_cached(conn=conn, game_id="first_game")
+    assert game
+    assert game.stop_time == stop_time
+
+    await queries.handle_invalidation(Invalidation(InvalidationKind.Game, "first_game"))
+    assert not await db_cache.exists(queries.select_game_cached.cache_key(game_id="first_game"))
@@ -0,0 +1,248 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import datetime
+
+import pytest
+
+from chatgpt_proxy.db.models import GameChatMessage
+from chatgpt_proxy.db.models import GameEventBatch
+from chatgpt_proxy.db.models import GameKill
+from chatgpt_proxy.db.models import GameObjective
+from chatgpt_proxy.db.models import GameObjectiveState
+from chatgpt_proxy.db.models import GamePlayer
+from chatgpt_proxy.db.models import GameScoreboard
+from chatgpt_proxy.db.models import SayType
+from chatgpt_proxy.db.models import Team
+from chatgpt_proxy.game_state import EventBuffer
+from chatgpt_proxy.game_state import GameState
+from chatgpt_proxy.game_state import GameStateRegistry
+from chatgpt_proxy.game_state import RingBuffer
+
+_t0 = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def make_kill(kill_id: int, game_id: str = "game") -> GameKill:
+    return GameKill(
+        id=kill_id,
+        game_id=game_id,
+        kill_time=_t0 + datetime.timedelta(seconds=kill_id),
+        killer_name=f"killer{kill_id}",
+        victim_name=f"victim{kill_id}",
+        killer_team=Team.North,
+        victim_team=Team.South,
+        damage_type="RODmgType_Test",
+        kill_distance_m=10.0,
+    )
+
+
+def make_chat_message(msg_id: int, game_id: str = "game") -> GameChatMessage:
+    return GameChatMessage(
+        id=msg_id,
+        game_id=game_id,
+        message=f"message{msg_id}",
+        send_time=_t0 + datetime.timedelta(seconds=msg_id),
+        sender_name="sender",
+        sender_team=Team.North,
+        channel=SayType.ALL,
+    )
+
+
+def make_player(player_id: int, score: int = 0) -> GamePlayer:
+    return GamePlayer(
+        game_id="game",
+        id=player_id,
+        name=f"player{player_id}",
+        team=Team.North,
+        score=score,
+    )
+
+
+def test_ring_buffer() -> None:
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+    ring: RingBuffer[int] = RingBuffer(3)
+    assert len(ring) == 0
+    assert list(ring) == []
+
+    assert ring.append(1) is None
+    assert ring.append(2) is None
+    assert list(ring) == [1, 2]
+
+    # Oldest items are overwritten.
+    assert ring.append(3) is None
+    assert ring.append(4) == 1
+    assert ring.append(5) == 2
+    assert len(ring) == 3
+    assert list(ring) == [3, 4, 5]
+    assert list(reversed(ring)) == [5, 4, 3]
+
+    for i in range(100):
+        ring.append(i)
+    assert list(ring) == [97, 98, 99]
+
+    ring.clear()
+    assert len(ring) == 0
+    ring.append(1)
+    assert list(ring) == [1]
+
+
+def test_event_buffer() -> None:
+    # Nothing known about the events before the first one seen.
+    buffer: EventBuffer[GameKill] = EventBuffer(capacity=5)
+    assert buffer.after(0, limit=5) is None
+    buffer.add([make_kill(10), make_kill(12)])
+    assert buffer.complete_after_id == 9
+    assert buffer.after(8, limit=5) is None
+    assert buffer.after(9, limit=5) == [make_kill(10), make_kill(12)]
+    assert buffer.after(10, limit=5) == [make_kill(12)]
+    assert buffer.after(12, limit=5) == []
+    # Enough newer events known to fill the limit.
+    assert buffer.after(0, limit=2) == [make_kill(10), make_kill(12)]
+    assert buffer.after(0, limit=1) == [make_kill(12)]
+
+    # Evicted events are no longer known.
+    buffer = EventBuffer(capacity=5, complete_after_id=0)
+    buffer.add([make_kill(i) for i in range(1, 9)])
+    assert len(buffer) == 5
+    assert buffer.complete_after_id == 3
+    assert buffer.after(2, limit=10) is None
+    assert buffer.after(3, limit=10) == [make_kill(i) for i in range(4, 9)]
+    assert buffer.after(2, limit=3) == [make_kill(i) for i in range(6, 9)]
+
+    # Seeded from a database query.
+    buffer = EventBuffer(capacity=5)
+    buffer.seed(after_id=7, events=[make_kill(9)], limit=3)
+    assert buffer.after(7, limit=3) == [make_kill(9)]
+    assert buffer.after(6, limit=3) is None
+    # A full result may have left out older events.
+    buffer = EventBuffer(capacity=5)
+    buffer.seed(after_id=0, events=[make_kill(5), make_kill(6)], limit=2)
+    assert buffer.after(0, limit=3) is None
+    assert buffer.after(4, limit=3) == [make_kill(5), make_kill(6)]
+    # Only an empty buffer is seeded.
+    buffer.seed(after_id=0, events=[make_kill(1)], limit=2)
+    assert buffer.after(4, limit=3) == [make_kill(5), make_kill(6)]
+
+    # Events added out of ID order are returned in ID order.
+    buffer = EventBuffer(capacity=5, complete_after_id=0)
+    buffer.add([make_kill(2), make_kill(1), make_kill(3)])
+    assert buffer.after(0, limit=5) == [make_kill(1), make_kill(2), make_kill(3)]
+
+
+def test_game_state_new_events() -> None:
+    state = GameState(game_id="game", new_game=True, max_kills=5, max_chat_messages=5)
+    assert state.new_kills(0, limit=5) == []
+    assert state.new_chat_messages(0, limit=5) == []
+
+    kills = [make_kill(i) for i in range(1, 4)]
+    state.add_kills(kills)
+    assert state.new_kills(0, limit=5) == kills
+    assert state.new_kills(2, limit=5) == kills[-1:]
+
+    msgs = [make_chat_message(i) for i in range(1, 3)]
+    state.add_chat_messages(msgs)
+    assert state.new_chat_messages(0, limit=1) == msgs[-1:]
+    assert state.new_chat_messages(2, limit=5) == []
+
+    # Existing game, nothing is known about the events before the state.
+    state = GameState(game_id="game")
+    assert state.new_kills(0, limit=5) is None
+    assert state.new_chat_messages(0, limit=5) is None
+
+
+def test_game_state_players_and_objectives() -> None:
+    state = GameState(game_id="game", new_game=True)
+
+    # Individual player updates are not a full scoreboard.
+    state.upsert_players([make_player(1)])
+    assert state.scoreboard is None
+
+    state.set_scoreboard(GameScoreboard(game_id="game", players=[make_player(2), make_player(3)]))
+    assert state.scoreboard == GameScoreboard(
+        game_id="game",
+        players=[make_player(2), make_player(3)],
+    )
+
+    objective_state = GameObjectiveState(
+        game_id="game",
+        objectives=[GameObjective(name="A", team_state=Team.North)],
+    )
+    state.apply_batch(
+        GameEventBatch(
+            game_id="game",
+            players=[make_player(2, score=100), make_player(4)],
+            deleted_player_ids=[3],
+            objective_state=objective_state,
+        ),
+        kills=[make_kill(1)],
+        chat_messages=[make_chat_message(1)],
+    )
+    assert state.scoreboard is not None
+    assert state.scoreboard.players == [make_player(2, score=100), make_player(4)]
+    assert state.objective_state == objective_state
+    assert state.new_kills(0, limit=30) == [make_kill(1)]
+    assert state.new_chat_messages(0, limit=30) == [make_chat_message(1)]
+
+    state.delete_players([2, 4, 999])
+    assert state.scoreboard is not None
+    assert state.scoreboard.players == []
+
+
+def test_game_state_registry() -> None:
+    registry = GameStateRegistry(max_size=2, ttl=60.0)
+
+    assert registry.get("a") is None
+    assert registry.misses == 1
+
+    a = registry.get_or_create("a", new_game=True)
+    assert a.new_kills(0, limit=1) == []
+    assert registry.get_or_create("a") is a
+    assert registry.get("a") is a
+    assert registry.hits == 1
+
+    # Least recently used state is evicted.
+    registry.get_or_create("b")
+    registry.get("a")
+    registry.get_or_create("c")
+    assert len(registry) == 2
+    assert "a" in registry
+    assert "b" not in registry
+
+    registry.discard("a")
+    assert "a" not in registry
+
+    registry.add_events(
+        kills=[make_kill(1, game_id="c"), make_kill(2, game_id="d")],
+        chat_messages=[make_chat_message(3, game_id="d")],
+    )
+    assert registry.get_or_create("c").new_kills(0, limit=5) == [make_kill(1, game_id="c")]
+    d = registry.get_or_create("d")
+    assert d.new_kills(1, limit=5) == [make_kill(2, game_id="d")]
+    assert d.new_chat_messages(2, limit=5) == [make_chat_message(3, game_id="d")]
+
+    # Idle states expire.
+    registry.ttl = 0.0
+    assert registry.get("c") is None
+    assert registry.get("d") is None
+    assert len(registry) == 0
@@ -0,0 +1,466 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import ipaddress
+import os
+import time
+
+import openai
+import pytest
+
+from chatgpt_proxy.bench import FakeModel
+from chatgpt_proxy.bench import FakeResponsesAPI
+from chatgpt_proxy.bench import constant_latency
+from chatgpt_proxy.cache.cache import make_redis_client
+from chatgpt_proxy.llm import CircuitBreaker
+from chatgpt_proxy.llm import CircuitOpen
+from chatgpt_proxy.llm import CircuitState
+from chatgpt_proxy.llm import LatencyTracker
+from chatgpt_proxy.llm import LocalRateBucket
+from chatgpt_proxy.llm import RateGovernor
+from chatgpt_proxy.llm import RateLimitExceeded
+from chatgpt_proxy.llm import RateLimitHeaders
+from chatgpt_proxy.llm import RedisRateBucket
+from chatgpt_proxy.llm import RequestCoordinator
+from chatgpt_proxy.llm import ResilientClient
+from chatgpt_proxy.llm import ServerKey
+from chatgpt_proxy.llm import parse_rate_limit_headers
+from chatgpt_proxy.llm import parse_retry_after
+
+busy_server: ServerKey = (ipaddress.IPv4Address("10.0.0.1"), 7777)
+quiet_server: ServerKey = (ipaddress.IPv4Address("10.0.0.2"), 7777)
+
+
+@pytest.mark.asyncio
+async def test_request_coordinator() -> None:
+    batches: list[tuple[str, list[int]]] = []
+    running: set[str] = set()
+    release = asyncio.Event()
+
+    async def run(key: str, items: list[int]) -> list[int]:
+        # Batches of a key never run concurrently.
+        assert key not in running
+        running.add(key)
+        batches.append((key, items))
+        await release.wait()
+        running.discard(key)
+        return [item * 2 for item in items]
+
+    coordinator = RequestCoordinator(run=run, merge_window=0.01, max_batch_size=3)
+
+    # Requests within the merge window are merged.
+    first = [asyncio.create_task(coordinator.submit("a", i)) for i in range(2)]
+    other = asyncio.create_task(coordinator.submit("b", 100))
+    await asyncio.sleep(0.05)
+    assert batches == [("a", [0, 1]), ("b", [100])]
+
+    # Requests arriving while a batch of the key is running wait for it.
+    second = [asyncio.create_task(coordinator.submit("a", i)) for i in range(2, 6)]
+    await asyncio.sleep(0.05)
+    assert len(batches) == 2
+
+    release.set()
+    assert await asyncio.gather(*first) == [0, 2]
+    assert await other == 200
+    assert await asyncio.gather(*second) == [4, 6, 8, 10]
+    # Up to max_batch_size requests are merged.
+    assert batches[2:] == [("a", [2, 3, 4]), ("a", [5])]
+
+    stats = coordinator.stats()
+    assert stats.requests == 7
+    assert stats.batches == 4
+    assert stats.merged == 3
+    assert stats.serialized == 4
+    assert stats.failed == 0
+
+    # Idle keys are forgotten.
+    assert not coordinator._pending
+    assert not coordinator._workers
+
+
+@pytest.mark.asyncio
+async def test_request_coordinator_failures() -> None:
+    async def run(key: str, items: list[int]) -> list[int]:
+        if key == "fail":
+            raise RuntimeError("LLM is down")
+        return items[1:]
+
+    coordinator = RequestCoordinator(run=run, merge_window=0.01, max_batch_size=4)
+
+    with pytest.raises(RuntimeError):
+        await coordinator.submit("fail", 1)
+
+    # Every request of a batch gets a result.
+    results = await asyncio.gather(
+        coordinator.submit("short", 1),
+        coordinator.submit("short", 2),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    assert coordinator.stats().failed == 3
+
+    # Cancelled requests are left out of batches.
+    async def echo(key: str, items: list[int]) -> list[int]:
+        return items
+
+    coordinator.run = echo
+    cancelled = asyncio.create_task(coordinator.submit("a", 1))
+    task = asyncio.create_task(coordinator.submit("a", 2))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    assert await task == 2
+    assert coordinator.stats().batches == 3
+    assert coordinator.stats().merged == 1
+
+
+class FakeRateBucket:
+    """Admits calls only when allowed to."""
+
+    def __init__(self):
+        self.requests_per_minute = 60.0
+        self.tokens_per_minute = 6000.0
+        self.allowed = 0
+        self.adjusted = 0
+        self.synced: list[RateLimitHeaders] = []
+
+    async def take(self, requests: int, tokens: int) -> float:
+        if self.allowed > 0:
+            self.allowed -= 1
+            return 0.0
+        return 0.01
+
+    async def adjust(self, tokens: int) -> None:
+        self.adjusted += tokens
+
+    async def sync(self, limits: RateLimitHeaders) -> None:
+        self.synced.append(limits)
+
+
+def test_parse_rate_limit_headers() -> None:
+    headers = {
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-limit-tokens": "200000",
+        "x-ratelimit-remaining-requests": "499",
+        "x-ratelimit-remaining-tokens": "199000",
+        "x-ratelimit-reset-requests": "120ms",
+    }
+    assert parse_rate_limit_headers(headers) == RateLimitHeaders(
+        limit_requests=500,
+        limit_tokens=200000,
+        remaining_requests=499,
+        remaining_tokens=199000,
+    )
+    assert parse_rate_limit_headers({}) is None
+    assert parse_rate_limit_headers(headers | {"x-ratelimit-limit-tokens": "lots"}) is None
+
+    assert parse_retry_after({"retry-after": "20"}) == 20.0
+    assert parse_retry_after({"retry-after-ms": "2500", "retry-after": "3"}) == 2.5
+    assert parse_retry_after({"retry-after": "0"}) == 1.0
+    assert parse_retry_after({}) == 1.0
+
+
+@pytest.mark.asyncio
+async def test_local_rate_bucket() -> None:
+    bucket = LocalRateBucket(requests_per_minute=6000, tokens_per_minute=60_000)
+    assert await bucket.take(1, 60_000) == 0.0
+    # Out of tokens, 100 tokens take 0.1 seconds to refill.
+    wait = await bucket.take(1, 100)
+    assert 0.05 < wait <= 0.1
+    await asyncio.sleep(wait)
+    assert await bucket.take(1, 100) == 0.0
+
+    # Calls larger than the bucket get through once it is full.
+    await bucket.sync(RateLimitHeaders(
+        limit_requests=6000,
+        limit_tokens=1000,
+        remaining_requests=6000,
+        remaining_tokens=1000,
+    ))
+    assert bucket.tokens_per_minute == 1000
+    assert await bucket.take(1, 5000) == 0.0
+
+    # Used tokens are given back.
+    await bucket.adjust(-1000)
+    assert await bucket.take(1, 1000) == 0.0
+
+
+@pytest.mark.skipif("REDIS_URL" not in os.environ, reason="REDIS_URL not set")
+@pytest.mark.asyncio
+async def test_redis_rate_bucket() -> None:
+    client = make_redis_client()
+    key = "chatgpt_proxy:test_openai_rate"
+    try:
+        await client.delete(key)
+        bucket = RedisRateBucket(
+            client, key=key, requests_per_minute=6000, tokens_per_minute=60_000)
+        other_worker = RedisRateBucket(
+            client, key=key, requests_per_minute=6000, tokens_per_minute=60_000)
+
+        assert await bucket.take(1, 60_000) == 0.0
+        # The bucket is shared.
+        wait = await other_worker.take(1, 100)
+        assert 0.05 < wait <= 0.1
+
+        await bucket.sync(RateLimitHeaders(
+            limit_requests=6000,
+            limit_tokens=1000,
+            remaining_requests=6000,
+            remaining_tokens=1000,
+        ))
+        assert await other_worker.take(1, 1000) == 0.0
+        assert other_worker.tokens_per_minute == 1000
+        await other_worker.adjust(-500)
+        assert await bucket.take(1, 500) == 0.0
+    finally:
+        await client.delete(key)
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_rate_governor_fair_queuing() -> None:
+    bucket = FakeRateBucket()
+    governor = RateGovernor(bucket, weights={busy_server: 2.0})
+    admitted: list[str] = []
+
+    async def call(name: str, key: ServerKey, tokens: int) -> None:
+        await governor.acquire(key, tokens)
+        admitted.append(name)
+
+    # The bucket is empty, calls are queued.
+    tasks = [asyncio.create_task(call(f"busy{i}", busy_server, 100)) for i in range(6)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(call("quiet0", quiet_server, 100)))
+    tasks.append(asyncio.create_task(call("quiet1", quiet_server, 100)))
+    await asyncio.sleep(0.02)
+    assert admitted == []
+    assert governor.queue_length == 8
+
+    bucket.allowed = 8
+    await asyncio.gather(*tasks)
+    # The quiet server is not stuck behind the busy one, which
+    # still gets twice the share due to its weight.
+    assert admitted == ["busy0", "busy1", "quiet0", "busy2", "busy3", "quiet1", "busy4", "busy5"]
+    assert governor.stats().queued == 8
+
+    # Nothing queued, calls are admitted right away.
+    bucket.allowed = 1
+    await governor.acquire(quiet_server, 100)
+    assert governor.stats().admitted == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_governor_shedding() -> None:
+    bucket = FakeRateBucket()
+    governor = RateGovernor(bucket, max_queue_length=2, max_wait=0.05)
+
+    tasks = [asyncio.create_task(governor.acquire(busy_server, 100)) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(RateLimitExceeded) as e:
+        await governor.acquire(quiet_server, 100)
+    assert e.value.retry_after >= 1.0
+
+    # Waited too long.
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, RateLimitExceeded) for result in results)
+    assert governor.stats().shed == 3
+
+    # Expected wait too long.
+    governor = RateGovernor(bucket, max_wait=1.0)
+    task = asyncio.create_task(governor.acquire(busy_server, 100))
+    await asyncio.sleep(0)
+    with pytest.raises(RateLimitExceeded):
+        governor.check(tokens=6000)
+    bucket.allowed = 1
+    await task
+
+    # Rate limit headers are preferred over the token counts.
+    await governor.update({}, tokens=100, used_tokens=150)
+    assert bucket.adjusted == 50
+    await governor.update({
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-limit-tokens": "200000",
+        "x-ratelimit-remaining-requests": "499",
+        "x-ratelimit-remaining-tokens": "199000",
+    }, tokens=100, used_tokens=150)
+    assert bucket.adjusted == 50
+    assert len(bucket.synced) == 1
+
+
+@pytest.mark.asyncio
+async def test_latency_tracker_and_circuit_breaker() -> None:
+    tracker = LatencyTracker(window=10, min_samples=5)
+    for latency in (5.0, 1.0, 4.0, 2.0):
+        tracker.add(latency)
+    assert tracker.percentile(0.5) is None
+    tracker.add(3.0)
+    assert tracker.percentile(0.5) == 3.0
+    assert tracker.percentile(0.95) == 5.0
+    # Old samples roll out of the window.
+    for _ in range(10):
+        tracker.add(0.1)
+    assert len(tracker) == 10
+    assert tracker.percentile(0.95) == 0.1
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.Closed
+    breaker.record_failure()
+    assert breaker.state == CircuitState.Open
+    assert not breaker.allow()
+    assert 0.0 < breaker.retry_after() <= 0.05
+
+    await asyncio.sleep(0.05)
+    assert breaker.state == CircuitState.HalfOpen
+    # Only a single trial call.
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    # A failed trial opens the circuit again.
+    breaker.record_failure()
+    assert breaker.state == CircuitState.Open
+
+    await asyncio.sleep(0.05)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitState.Closed
+    assert breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_resilient_client_hedging() -> None:
+    api = FakeResponsesAPI()
+    client = api.client()
+    llm = ResilientClient(
+        client=client,
+        model="primary",
+        min_latency_samples=5,
+        min_hedge_delay=0.05,
+    )
+    try:
+        # Not hedged until there are enough latency samples.
+        api.next_latencies = [0.1]
+        for _ in range(5):
+            await llm.create(input="hello")
+        assert llm.stats().hedged == 0
+        assert llm.latency_percentiles()["primary"][1] is not None
+
+        # The slow call gets a hedged duplicate, which finishes first.
+        api.next_latencies = [5.0]
+        start = time.monotonic()
+        resp = await llm.create(input="hello")
+        assert time.monotonic() - start < 2.0
+        assert resp.response.output_text == "primary says hello"
+        assert resp.response.id == "fake_7"
+        assert llm.stats().hedged == 1
+        assert llm.stats().hedge_wins == 1
+        assert api.requests["primary"] == 7
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_resilient_client_fallback() -> None:
+    api = FakeResponsesAPI(models={"primary": FakeModel(error_rate=1.0)})
+    client = api.client()
+    llm = ResilientClient(
+        client=client,
+        model="primary",
+        fallback_model="fallback",
+        failure_threshold=2,
+        reset_timeout=0.1,
+    )
+    try:
+        # Failed calls are retried with the fallback model.
+        for _ in range(2):
+            resp = await llm.create(input="hello")
+            assert resp.response.model == "fallback"
+        assert api.requests == {"primary": 2, "fallback": 2}
+
+        # The primary circuit is open, calls go straight to the fallback.
+        resp = await llm.create(input="hello")
+        assert resp.response.model == "fallback"
+        assert api.requests == {"primary": 2, "fallback": 3}
+
+        # Both failing.
+        api.models["fallback"] = FakeModel(error_rate=1.0)
+        for _ in range(2):
+            with pytest.raises(openai.InternalServerError):
+                await llm.create(input="hello")
+        with pytest.raises(CircuitOpen) as e:
+            llm.check()
+        assert e.value.retry_after >= 1.0
+        with pytest.raises(CircuitOpen):
+            await llm.create(input="hello")
+        assert api.requests == {"primary": 2, "fallback": 5}
+
+        # Recovered, the primary model gets a trial call.
+        api.models.clear()
+        await asyncio.sleep(0.1)
+        llm.check()
+        resp = await llm.create(input="hello")
+        assert resp.response.model == "primary"
+        assert llm.breakers["primary"].state == CircuitState.Closed
+
+        stats = llm.stats()
+        assert stats.requests == 7
+        assert stats.fallbacks == 5
+        assert stats.failures == 4
+        assert stats.rejected == 2
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_resilient_client_slow_primary() -> None:
+    api = FakeResponsesAPI(models={"primary": FakeModel(latency=constant_latency(0.05))})
+    client = api.client()
+    llm = ResilientClient(
+        client=client,
+        model="primary",
+        fallback_model="fallback",
+        hedge=False,
+        slow_latency=0.02,
+        probe_interval=0.2,
+        min_latency_samples=3,
+    )
+    try:
+        for _ in range(3):
+            await llm.create(input="hello")
+        assert llm.is_slow("primary")
+
+        # Routed to the faster fallback model...
+        resp = await llm.create(input="hello")
+        assert resp.response.model == "fallback"
+
+        # ...except for a probe call every now and then.
+        await asyncio.sleep(0.2)
+        resp = await llm.create(input="hello")
+        assert resp.response.model == "primary"
+        resp = await llm.create(input="hello")
+        assert resp.response.model == "fallback"
+        assert api.requests == {"primary": 4, "fallback": 2}
+    finally:
+        await client.close()
@@ -0,0 +1,175 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+
+from chatgpt_proxy.db import models
+from chatgpt_proxy.prompt import PromptAssembler
+from chatgpt_proxy.prompt import PromptSection
+from chatgpt_proxy.prompt import chat_messages_table
+from chatgpt_proxy.prompt import estimate_tokens
+from chatgpt_proxy.prompt import kills_table
+from chatgpt_proxy.prompt import objectives_table
+from chatgpt_proxy.prompt import players_table
+from chatgpt_proxy.utils import utcnow
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def test_estimate_tokens() -> None:
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a") == 1
+    assert estimate_tokens("abcdefgh") == 2
+    # Short words count at least a token each.
+    assert estimate_tokens("a b c d e f") == 6
+    assert estimate_tokens("|a|b|c|") == 5
+
+
+def test_prompt_assembler_required_sections() -> None:
+    assembler = PromptAssembler(max_tokens=5, token_counter=count_words, separator="\n")
+    prompt = assembler.assemble([
+        PromptSection(name="events", header="events:", rows=["one event"] * 10),
+        PromptSection(name="instruction", header="this is longer than the budget", required=True),
+    ])
+    # Required sections are always included, even if over the budget.
+    assert prompt.text == "this is longer than the budget"
+    assert prompt.section("events") is None
+    assert prompt.tokens == 6
+
+
+def test_prompt_assembler_weights() -> None:
+    assembler = PromptAssembler(max_tokens=23, token_counter=count_words, separator="\n")
+    prompt = assembler.assemble([
+        PromptSection(name="a", header="a:", rows=[f"a{i}" for i in range(20)], weight=3.0),
+        PromptSection(name="b", header="b:", rows=[f"b{i}" for i in range(20)], weight=1.0),
+        PromptSection(name="empty", header="empty:", rows=[], weight=10.0),
+        PromptSection(name="instruction", header="do something", required=True),
+    ])
+    # 23 - 2 (instruction) = 21 tokens shared 3:1, headers
+    # included, rounded down -> 15 and 5 tokens.
+    a = prompt.section("a")
+    b = prompt.section("b")
+    assert a is not None and b is not None
+    assert prompt.section("empty") is None
+    # The leftover token is given to the heavier section.
+    assert (a.rows_included, a.rows_total) == (15, 20)
+    assert (b.rows_included, b.rows_total) == (4, 20)
+    # Rows are rendered in their original order, the
+    # latest rows ranked highest by default.
+    assert a.text == "\n".join(["a:"] + [f"a{i}" for i in range(5, 20)])
+    assert prompt.text == "\n".join([a.text, b.text, "do something"])
+    assert prompt.tokens == 23
+
+
+def test_prompt_assembler_leftovers() -> None:
+    assembler = PromptAssembler(max_tokens=100, token_counter=count_words, separator="\n")
+    prompt = assembler.assemble([
+        PromptSection(name="small", header="small:", rows=["s"], weight=10.0),
+        PromptSection(name="large", header="large:", rows=[f"l{i}" for i in range(50)]),
+    ])
+    # The budget the small section did not need is used by the large one.
+    large = prompt.section("large")
+    assert large is not None
+    assert large.rows_included == 50
+
+
+def test_prompt_assembler_ranks() -> None:
+    assembler = PromptAssembler(max_tokens=100, token_counter=count_words, separator="\n")
+    rows = ["low", "a very long row that does not fit anymore", "high", "mid"]
+    prompt = assembler.assemble([
+        PromptSection(name="rows", header="rows:", rows=rows, ranks=[1, 3, 4, 2]),
+        PromptSection(name="filler", header="filler", required=True, rows=["x " * 89]),
+    ])
+    # 100 - 90 (filler) = 10 tokens, header included. The long row does not fit and is skipped,
+    # lower ranked rows that fit are still included.
+    section = prompt.section("rows")
+    assert section is not None
+    assert section.text == "rows:\nlow\nhigh\nmid"
+
+    with pytest.raises(ValueError):
+        assembler.assemble([PromptSection(name="rows", rows=rows, ranks=[1])])
+
+
+def test_tables() -> None:
+    now = utcnow()
+    kills = [
+        models.GameKill(
+            id=1,
+            game_id="game",
+            kill_time=now,
+            killer_name="killer|1",
+            victim_name="victim",
+            killer_team=models.Team.North,
+            victim_team=models.Team.South,
+            damage_type="RODmgType_MN1891Bullet",
+            kill_distance_m=12.345,
+        ),
+        models.GameKill(
+            id=2,
+            game_id="game",
+            kill_time=now,
+            killer_name="killer",
+            victim_name="victim",
+            # Models loaded from the database hold plain ints.
+            killer_team=0,  # type: ignore[arg-type]
+            victim_team=3,  # type: ignore[arg-type]
+            damage_type="DmgType_Fell",
+            kill_distance_m=0.0,
+        ),
+    ]
+    header, rows = kills_table(kills)
+    assert header == "Killer|Killer Team|Victim|Victim Team|Damage Type|Distance (m)"
+    assert rows == [
+        "killer/1|North|victim|South|MN1891Bullet|12.3",
+        "killer|North|victim|Neutral|DmgType_Fell|0.0",
+    ]
+
+    msgs = [
+        models.GameChatMessage(
+            id=1,
+            message="hello\nthere | friend",
+            game_id="game",
+            send_time=now,
+            sender_name="sender",
+            sender_team=models.Team.South,
+            channel=models.SayType.TEAM,
+        ),
+    ]
+    header, rows = chat_messages_table(msgs)
+    assert header == "Sender|Team|Channel|Message"
+    assert rows == ["sender|South|TEAM|hello there / friend"]
+
+    header, rows = players_table([
+        models.GamePlayer(game_id="game", id=1, name="player", team=models.Team.North, score=5),
+    ])
+    assert header == "Name|Team|Score"
+    assert rows == ["player|North|5"]
+
+    header, rows = objectives_table([
+        models.GameObjective(name="A", team_state=models.Team.Neutral),
+    ])
+    assert header == "Objective|Owner Team"
+    assert rows == ["A|Neutral"]
+
+    assert kills_table([])[1] == []
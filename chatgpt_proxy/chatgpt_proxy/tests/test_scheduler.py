@@ -0,0 +1,137 @@
+# MIT License
+#
+# Copyright (c) 2025 Tuomo Kriikkula
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+
+import pytest
+
+from chatgpt_proxy.scheduler import Scheduler
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_jobs() -> None:
+    scheduler = Scheduler()
+    calls = 0
+
+    async def job() -> None:
+        nonlocal calls
+        calls += 1
+
+    scheduler.add_job("job", job, interval=0.01, run_at_start=True)
+    scheduler.start()
+    await asyncio.sleep(0.1)
+    await scheduler.stop()
+
+    stats = scheduler.stats()["job"]
+    assert calls >= 3
+    assert stats.runs == calls
+    assert stats.failures == 0
+    assert stats.last_duration is not None
+    assert not scheduler.running
+
+    # No runs after stop.
+    await asyncio.sleep(0.05)
+    assert stats.runs == calls
+
+
+@pytest.mark.asyncio
+async def test_scheduler_job_failures() -> None:
+    scheduler = Scheduler()
+
+    async def failing_job() -> None:
+        raise ValueError("this job always fails")
+
+    async def slow_job() -> None:
+        await asyncio.sleep(10.0)
+
+    scheduler.add_job("failing", failing_job, interval=60.0)
+    scheduler.add_job("slow", slow_job, interval=60.0, timeout=0.01)
+
+    assert await scheduler.run_job("failing")
+    assert await scheduler.run_job("slow")
+
+    stats = scheduler.stats()
+    assert stats["failing"].failures == 1
+    assert stats["failing"].last_error == "ValueError: this job always fails"
+    assert stats["slow"].failures == 1
+    assert stats["slow"].timeouts == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_no_overlap() -> None:
+    scheduler = Scheduler()
+    running = 0
+    max_running = 0
+
+    async def job() -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    # Interval shorter than the run time.
+    scheduler.add_job("job", job, interval=0.001, run_at_start=True)
+    scheduler.start()
+    await asyncio.sleep(0.01)
+    assert not await scheduler.run_job("job")
+    await asyncio.sleep(0.1)
+    await scheduler.stop()
+
+    assert max_running == 1
+    assert scheduler.stats()["job"].skipped == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_stop_cancels_long_runs() -> None:
+    scheduler = Scheduler()
+    cancelled = asyncio.Event()
+
+    async def job() -> None:
+        try:
+            await asyncio.sleep(10.0)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    scheduler.add_job("job", job, interval=60.0, run_at_start=True)
+    scheduler.start()
+    await asyncio.sleep(0.01)
+    await scheduler.stop(timeout=0.01)
+
+    assert cancelled.is_set()
+
+
+def test_scheduler_job_jitter() -> None:
+    scheduler = Scheduler()
+
+    async def job() -> None:
+        pass
+
+    added = scheduler.add_job("job", job, interval=1.0, jitter=0.5)
+    for _ in range(100):
+        assert 1.0 <= added.next_delay() <= 1.5
+
+    with pytest.raises(ValueError):
+        scheduler.add_job("job", job, interval=1.0)
+    with pytest.raises(ValueError):
+        scheduler.add_job("another_job", job, interval=0.0)
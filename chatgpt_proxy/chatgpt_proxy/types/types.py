@@ -31,13 +31,23 @@ import httpx
 import openai
 import sanic
 
+from chatgpt_proxy.db import InvalidationListener
+from chatgpt_proxy.db import WriteBehindBuffer
 from chatgpt_proxy.db import models
+from chatgpt_proxy.llm import RateGovernor
+from chatgpt_proxy.llm import ResilientClient
+from chatgpt_proxy.scheduler import Scheduler
 
 
 class Context(SimpleNamespace):
     client: openai.AsyncOpenAI | None
+    llm: ResilientClient | None
     pg_pool: asyncpg.Pool | None
     http_client: httpx.AsyncClient | None
+    write_behind_buffer: WriteBehindBuffer | None
+    scheduler: Scheduler | None
+    invalidation_listener: InvalidationListener | None
+    rate_governor: RateGovernor | None
 
 
 class RequestContext(SimpleNamespace):
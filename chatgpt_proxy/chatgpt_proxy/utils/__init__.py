@@ -1,9 +1,11 @@
 from .utils import get_remote_addr
 from .utils import is_prod_env
+from .utils import read_body
 from .utils import utcnow
 
 __all__ = [
     "get_remote_addr",
     "is_prod_env",
+    "read_body",
     "utcnow",
 ]
@@ -25,13 +25,17 @@
 import datetime
 import ipaddress
 import os
+from typing import TYPE_CHECKING
 
-from chatgpt_proxy.types import Request
+if TYPE_CHECKING:
+    # NOTE: only imported for type checking, chatgpt_proxy.types
+    # depends on modules that depend on this module.
+    from chatgpt_proxy.types import Request
 
 is_prod_env: bool = "FLY_APP_NAME" in os.environ
 
 
-def get_remote_addr(request: Request) -> ipaddress.IPv4Address:
+def get_remote_addr(request: "Request") -> ipaddress.IPv4Address:
     """Ignoring IPv6 since Steam game servers should always
     be IPv4, and this API only expects requests from Steam GSs.
     """
@@ -43,3 +47,16 @@ def get_remote_addr(request: Request) -> ipaddress.IPv4Address:
 
 def utcnow() -> datetime.datetime:
     return datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+async def read_body(request: "Request", max_size: int) -> bytes | None:
+    """Read the body of a streamed request (route defined with stream=True).
+    Returns None if the body is larger than max_size bytes. Allows routes
+    to use a different limit than the app wide REQUEST_MAX_SIZE.
+    """
+    body = bytearray()
+    while (chunk := await request.stream.read()) is not None:  # type: ignore[union-attr]
+        body += chunk
+        if len(body) > max_size:
+            return None
+    return bytes(body)